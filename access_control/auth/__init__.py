@@ -3,3 +3,4 @@ from .domain import AbstractUserRepository
 from .domain import AbstractUserManagmentService, AbstractAuthenticationService
 from .repositories import UserSQLRepository, UserInMemoryRepository
 from .services import UserManagementService, AuthService, EncryptionService, UserExists, UserDoesNotExist
+from .caches import CredentialCache
@@ -0,0 +1,90 @@
+import hashlib
+import hmac
+import os
+import time
+from collections import OrderedDict
+from .domain import UserDescriptor
+
+
+class CredentialCache:
+    # LRU cache of verified credentials: the keyed digest of the Authorization header -> UserDescriptor. The headers
+    # are not kept in memory, the key of the digest is random and lives only in the process. Only successful
+    # authentications are cached, an entry expires after ttl seconds, so the changes of the users made bypassing
+    # UserManagementService are seen after ttl at the latest.
+    # The cache has a generation which is incremented by invalidation. The result of an authentication is cached only if
+    # the generation did not change while the user was loaded, otherwise an invalidation that happened during the
+    # repository request would be lost.
+    def __init__(self, max_size: int = 10000, ttl: float = 60.0, time_counter=time.monotonic):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._time_counter = time_counter
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()  # digest -> (UserDescriptor, expiration time)
+        self._user_digests = {}  # user id -> set of digests
+        self._generation = 0
+        self.on_user_invalidated = []  # callables with the user id, e.g. to invalidate the caches of other processes
+        self.hit_count = 0
+        self.miss_count = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @property
+    def size(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hit_count + self.miss_count
+        return self.hit_count / total if total else 0.0
+
+    def get_digest(self, auth_header: str) -> bytes:
+        return hmac.new(self._key, auth_header.encode('utf-8'), hashlib.sha256).digest()
+
+    def get(self, digest: bytes):
+        entry = self._entries.get(digest)
+        if entry is not None:
+            user, expiration_time = entry
+            if expiration_time > self._time_counter():
+                self._entries.move_to_end(digest)
+                self.hit_count += 1
+                return user
+            self._remove(digest)
+        self.miss_count += 1
+        return None
+
+    def put(self, digest: bytes, user: UserDescriptor, generation: int):
+        # generation is the value of the generation property before the user was loaded
+        if generation != self._generation:
+            return
+        if digest in self._entries:
+            self._remove(digest)
+        self._entries[digest] = (user, self._time_counter() + self._ttl)
+        self._user_digests.setdefault(user.id, set()).add(digest)
+        while len(self._entries) > self._max_size:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, digest: bytes):
+        user, expiration_time = self._entries.pop(digest)
+        digests = self._user_digests.get(user.id)
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._user_digests[user.id]
+
+    def invalidate_user(self, user_id):
+        self._generation += 1
+        for digest in self._user_digests.pop(user_id, ()):
+            del self._entries[digest]
+        for callback in self.on_user_invalidated:
+            callback(user_id)
+
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
+        self._user_digests.clear()
+
+    def as_dict(self) -> dict:
+        return {'size': self.size, 'max_size': self._max_size, 'ttl': self._ttl, 'hit_count': self.hit_count,
+                'miss_count': self.miss_count, 'hit_ratio': self.hit_ratio}
@@ -3,6 +3,7 @@ import hashlib
 from .domain import AbstractUserRepository, UserDescriptor, UserDoesNotExist, UserExists
 from . import AbstractUserManagmentService, AbstractAuthenticationService
 from . import UserFactory
+from .caches import CredentialCache
 
 
 class AbstractEncryptionService(ABC):
@@ -24,10 +25,13 @@ class EncryptionService(AbstractEncryptionService):
 
 
 class UserManagementService(AbstractUserManagmentService):
-    def __init__(self, user_repository: AbstractUserRepository, encryption_service: AbstractEncryptionService):
+    # The verified credentials of a changed or deleted user are removed from credential_cache
+    def __init__(self, user_repository: AbstractUserRepository, encryption_service: AbstractEncryptionService,
+                 credential_cache: CredentialCache = None):
         self._repo = user_repository
         self._user_factory = UserFactory()
         self._encryption_service = encryption_service
+        self._credential_cache = credential_cache
 
     async def create_new_user(self, login: str, email: str, password: str, info: str, is_active: bool):
         password = self._encryption_service.encrypt(password)
@@ -51,12 +55,18 @@ class UserManagementService(AbstractUserManagmentService):
         if password:
             user.password = self._encryption_service.encrypt(password)
         await self._repo.update(user)
+        self._invalidate_credentials(user_id)
 
     async def delete_user(self, user_id):
         try:
             await self._repo.delete(user_id)
         except UserDoesNotExist as e:
             raise e
+        self._invalidate_credentials(user_id)
+
+    def _invalidate_credentials(self, user_id):
+        if self._credential_cache is not None:
+            self._credential_cache.invalidate_user(user_id)
 
     async def get_user(self, user_id):
         return (await self._repo.get(user_id)).get_descriptor()
@@ -1,6 +1,6 @@
 from aiohttp import web, hdrs, BasicAuth
 from aiohttp_security import AbstractAuthorizationPolicy
-from .auth import AbstractAuthenticationService
+from .auth import AbstractAuthenticationService, CredentialCache
 from . import AbstractAttributesCalculation
 
 
@@ -30,6 +30,11 @@ class BasicAuthMiddleware:
             raise web.HTTPInternalServerError(text='The app permission calculation strategy is not set')
         return calc_strategy
 
+    @staticmethod
+    def _get_credential_cache(request) -> CredentialCache:
+        # The cache is optional, without it the credentials are verified by the authentication service every request
+        return request.app.get('credential_cache')
+
     def _get_resource_id(self, request):
         strategy = self._get_access_attr_calc_strategy(request)
         return strategy.get_resource_id(request)
@@ -43,6 +48,25 @@ class BasicAuthMiddleware:
         auth_header = request.headers.get(hdrs.AUTHORIZATION)
         if not auth_header:
             raise web.HTTPUnauthorized
+        credential_cache = self._get_credential_cache(request)
+        if credential_cache is None:
+            user = await self._authenticate(request, auth_header)
+        else:
+            digest = credential_cache.get_digest(auth_header)
+            user = credential_cache.get(digest)
+            if user is None:
+                generation = credential_cache.generation
+                user = await self._authenticate(request, auth_header)
+                credential_cache.put(digest, user, generation)
+        # The access is checked every request, the policies are not cached
+        access = await self._get_app_authorization_policy(request).permits(user.id, self._get_resource_id(request),
+                                                                           self._get_context(request))
+        if not access:
+            raise web.HTTPForbidden
+        request['user'] = user
+        return await handler(request)
+
+    async def _authenticate(self, request, auth_header: str):
         try:
             credentials = BasicAuth.decode(auth_header=auth_header)
         except ValueError as e:
@@ -52,10 +76,5 @@ class BasicAuthMiddleware:
         user = await auth_service.authenticate(login=credentials.login, passwd=credentials.password)
         if not user:
             raise web.HTTPUnauthorized
-        access = await self._get_app_authorization_policy(request).permits(user.id, self._get_resource_id(request),
-                                                                           self._get_context(request))
-        if not access:
-            raise web.HTTPForbidden
-        request['user'] = user
-        return await handler(request)
+        return user
 
@@ -7,9 +7,10 @@ from aiohttp_session import AbstractStorage, session_middleware
 import aiohttp_jinja2
 import jinja2
 from hardware import (AbstractAvailableDriversInformationService, AbstractDeviceGroupManager, AbstractDeviceCreationService)
-from access_control.auth import AbstractUserManagmentService, AbstractAuthenticationService
+from access_control.auth import AbstractUserManagmentService, AbstractAuthenticationService, CredentialCache
 from access_control.services import AccessAdministrationService
 from apps.service_group.facades import AbstractFiscalServiceGroupFacade
+from receipt.receipt_read import ProjectionLagMonitor
 from .di_containers import AppContainer
 from .urls import get_routes
 
@@ -24,7 +25,9 @@ def create_app(device_group_manager: AbstractDeviceGroupManager,
                device_creation_service: AbstractDeviceCreationService,
                drivers_information_service: Union[AbstractAvailableDriversInformationService, None] = None,
                session_storage: Union[AbstractStorage, None] = None,
-               middlewares: Union[list, None] = None):
+               middlewares: Union[list, None] = None,
+               projection_monitor: Union[ProjectionLagMonitor, None] = None,
+               credential_cache: Union[CredentialCache, None] = None):
 
     app = web.Application()
     template_loader = jinja2.FileSystemLoader('{}/templates/'.format(pathlib.Path(__file__).parent))
@@ -51,6 +54,8 @@ def create_app(device_group_manager: AbstractDeviceGroupManager,
     app['access_administration_service'] = access_administration_service
     app['authentication_service'] = authentication_service
     app['admin_access_attr_calc_strategy'] = AppContainer.access_attr_calc_strategy()
+    app['projection_monitor'] = projection_monitor
+    app['credential_cache'] = credential_cache
 
     app.add_routes(get_routes())
     app.router.add_static('/static/', '{}/static/'.format(pathlib.Path(__file__).parent), show_index=True,
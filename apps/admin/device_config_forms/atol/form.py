@@ -1,5 +1,5 @@
 from wtforms import Form as BaseForm, StringField, BooleanField, IntegerField, SelectField
-from wtforms.validators import InputRequired
+from wtforms.validators import InputRequired, Optional
 
 import wtforms_json
 wtforms_json.init()
@@ -16,9 +16,13 @@ _baudrates = [1200, 2400, 4800, 9600, 19200, 38400, 57600, 115200, 230400, 46080
 
 _ports = ('COM','USB', 'TCP/IP', 'BLUETOOTH')
 
+_registration_modes = [('json', 'Одним JSON-заданием'), ('classic', 'Поочередная передача реквизитов')]
+
 
 class Form(BaseForm):
     shift_duration = IntegerField('Длительность смены в секундах')
+    document_close_timeout = IntegerField('Время ожидания закрытия смены в секундах', validators=[Optional()],
+                                          default=5)
     cr_model = SelectField(u'Модель', choices=_models, validators=[required, ], coerce=int)
     cr_port = SelectField(u'Порт', choices=list(enumerate(_ports)), validators=[required, ], coerce=int)
     cr_ofd_channel = SelectField(u'ОФД Канал', choices=((0, 'Неактивирван'), (2, 'Авто')), coerce=int,
@@ -26,5 +30,7 @@ class Form(BaseForm):
     cr_baudrate = SelectField(u'Скорость порта', choices=_baudrates, validators=[required, ], coerce=int)
     cr_passwd = StringField(u'Пароль пользователя', validators=[required, ])
     test_mode = BooleanField(default=False)
+    registration_mode = SelectField(u'Способ регистрации чека', choices=_registration_modes, default='json')
+    trace_driver_calls = BooleanField(u'Измерять длительность вызовов драйвера', default=False)
 
 
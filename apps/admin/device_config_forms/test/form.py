@@ -1,9 +1,35 @@
-from wtforms import Form as BaseForm, IntegerField
+from wtforms import Form as BaseForm, IntegerField, FloatField, TextAreaField, StringField
+from wtforms.validators import Optional, NumberRange, ValidationError
+from hardware.adapters.test.simulation import DeviceSimulator
 
 import wtforms_json
 wtforms_json.init()
 
+rate_range = NumberRange(0, 1, 'Значение должно быть от 0 до 1')
+positive = NumberRange(0, message='Значение не может быть отрицательным')
+
+
+class LatencyValidator:
+    # Описание длительности операций проверяется созданием имитатора устройства
+    def __call__(self, form, field):
+        try:
+            DeviceSimulator(field.data)
+        except ValueError as e:
+            raise ValidationError(str(e))
+        except OSError as e:
+            # Файл с трассой длительностей не удалось прочитать
+            raise ValidationError('Файл трассы не прочитан: {}'.format(e))
+
 
 class Form(BaseForm):
     shift_duration = IntegerField('Длительность смены в секундах')
-    pass
+    latency = TextAreaField('Длительность операций (JSON)', validators=[Optional(), LatencyValidator()],
+                            description='Например: {"register_receipt": {"type": "lognormal", "median": 0.8, '
+                                        '"sigma": 0.4}, "default": 0.05}')
+    per_item_cost = FloatField('Длительность регистрации товара в секундах', validators=[Optional(), positive],
+                               default=0)
+    failure_rate = FloatField('Вероятность ошибки операции', validators=[Optional(), rate_range], default=0)
+    hang_rate = FloatField('Вероятность зависания устройства', validators=[Optional(), rate_range], default=0)
+    hang_duration = FloatField('Длительность зависания в секундах', validators=[Optional(), positive], default=30)
+    seed = IntegerField('Начальное значение генератора случайных чисел', validators=[Optional()])
+    serial_number = StringField('Заводской номер устройства', validators=[Optional()])
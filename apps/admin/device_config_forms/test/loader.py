@@ -3,5 +3,5 @@ from .form import Form
 
 
 class Loader(AbstractModuleLoader):
-    def load(self, *args, **kwargs):
-        return Form(*args, **kwargs)
\ No newline at end of file
+    def load(self, **kwargs):
+        return Form.from_json(kwargs)
\ No newline at end of file
@@ -2,17 +2,81 @@ from wtforms import (Form, StringField, validators, BooleanField, FormField, Sel
 from wtforms.fields.html5 import EmailField
 from wtforms.widgets import HiddenInput
 import wtforms_json
+from core.commands import CommandPriority
 wtforms_json.init()
 
 required = validators.DataRequired()
 
 
+def _parse_priority(value: str) -> int:
+    return CommandPriority.names[value.lower()]
+
+
+def _parse_weight(value: str) -> float:
+    weight = float(value)
+    if weight <= 0:
+        raise ValueError
+    return weight
+
+
+def parse_user_mapping(value: str, value_parser) -> dict:
+    # Parses the string like "1: high, 5: low" to the dictionary {1: CommandPriority.HIGH, 5: CommandPriority.LOW}
+    result = {}
+    if not value:
+        return result
+    for pair in value.split(','):
+        user_id, item_value = pair.split(':')
+        result[int(user_id)] = value_parser(item_value.strip())
+    return result
+
+
+def parse_user_priorities(value: str) -> dict:
+    return parse_user_mapping(value, _parse_priority)
+
+
+def parse_user_weights(value: str) -> dict:
+    return parse_user_mapping(value, _parse_weight)
+
+
+class UserMappingValidator:
+    def __init__(self, parser, message):
+        self._parser = parser
+        self._message = message
+
+    def __call__(self, form, field):
+        try:
+            self._parser(field.data)
+        except (ValueError, KeyError):
+            raise validators.ValidationError(self._message)
+
+
 class DriverForm(Form):
     driver_name = SelectField(label=u'')
 
 
+class QueueSettingsForm(Form):
+    max_size = IntegerField(u'Максимальное количество чеков в очереди',
+                            validators=[validators.Optional(), validators.NumberRange(min=1)])
+    max_wait_time = IntegerField(u'Максимальное расчетное время ожидания регистрации чека, сек',
+                                 validators=[validators.Optional(), validators.NumberRange(min=1)])
+    user_priorities = StringField(u'Классы приоритета пользователей (id: high/normal/low через запятую)',
+                                  validators=[UserMappingValidator(parse_user_priorities,
+                                                                   u'Формат: id: high/normal/low через запятую')])
+    user_weights = StringField(u'Веса пользователей в очереди (id: вес через запятую)',
+                               validators=[UserMappingValidator(parse_user_weights,
+                                                                u'Формат: id: положительное число через запятую')])
+
+
+class WebhookSettingsForm(Form):
+    url = StringField(u'Адрес для отправки результатов регистрации чеков',
+                      validators=[validators.Optional(), validators.URL(require_tld=False)])
+    secret = StringField(u'Ключ подписи запросов')
+
+
 class SettingsForm(Form):
     driver = FormField(DriverForm, label=u'', render_kw={'class': 'settings-driver-name'})
+    queue = FormField(QueueSettingsForm, label=u'Очередь чеков')
+    webhook = FormField(WebhookSettingsForm, label=u'Уведомления о регистрации чеков')
 
 
 class ServiceGroupForm(Form):
@@ -18,6 +18,13 @@ def get_routes():
             web.delete('/service_groups/{service_group_id}', view.delete_service_group),
             web.get('/driver_forms/{driver_name}', view.get_settings_form, name='driver_forms'),
             web.post('/service_groups/{service_group_id}/fiscal_device/', view.fiscal_device_change_state),
+            web.get('/service_groups/{service_group_id}/fiscal_device/pool/', view.get_pool_members,
+                    name='fiscal_device_pool'),
+            web.post('/service_groups/{service_group_id}/fiscal_device/pool/', view.post_pool_member),
+            web.delete('/service_groups/{service_group_id}/fiscal_device/pool/{device_id}', view.delete_pool_member),
+            web.get('/metrics/driver_calls', view.get_driver_call_metrics, name='driver_call_metrics'),
+            web.get('/metrics/projection', view.get_projection_metrics, name='projection_metrics'),
+            web.get('/metrics/credential_cache', view.get_credential_cache_metrics, name='credential_cache_metrics'),
             web.get('/service_groups/{service_group_id}/allowed_users/', sg_access_view.get_service_group_allowed_users,
                     name='service_group_allowed_users'),
             web.post('/service_groups/{service_group_id}/allowed_users/',
@@ -1,17 +1,25 @@
 from typing import Union, Iterable
+from logging import getLogger
 from aiohttp.web import (HTTPNotFound, HTTPBadRequest, Request, HTTPOk, json_response, HTTPFound, HTTPMethodNotAllowed,
-                         HTTPInternalServerError)
+                         HTTPInternalServerError, Response)
 from aiohttp_jinja2 import render_template
 from aiohttp_security import remember, forget
-from hardware.services import AbstractDeviceCreationService, AbstractAvailableDriversInformationService
-from hardware.fiscal_device_group_managers import AbstractDeviceGroupManager, DeviceAvailabilityCheck
+from hardware.services import (AbstractDeviceCreationService, AbstractAvailableDriversInformationService,
+                               DeviceCreationError)
+from hardware.fiscal_device_group_managers import (AbstractDeviceGroupManager, DeviceAvailabilityCheck, DeviceIsRunning,
+                                                   DeviceIsNotAttached, DevicePoolError)
 from access_control.auth import AbstractUserManagmentService, UserExists, UserDoesNotExist
 from access_control.services import AbstractAccessAdministrationService, PolicyDoesNotExist, PolicyExistsError
 from apps.service_group.facades import ServiceGroupNotExists, AbstractFiscalServiceGroupFacade, ServiceGroup
-from .forms import LoginForm, ServiceGroupForm, UserForm, AdminPermissionsForm
+from core.metrics import render_prometheus
+from .forms import (LoginForm, ServiceGroupForm, UserForm, AdminPermissionsForm, parse_user_priorities,
+                    parse_user_weights)
 from .device_config_forms import create_fiscal_device_config_form
 
 
+logger = getLogger(__name__)
+
+
 class ServiceGroupDescriptor:
     __slots__ = '_service_group', '_device_group_manager'
 
@@ -124,16 +132,33 @@ class FiscalServicesManagementView:
             raise HTTPBadRequest(text='The service group {} is not enabled'.format(service_group.id))
         return service_group
 
-    async def _run_fiscal_device(self, request, service_group, device_group_manager):
-        if device_group_manager.is_device_provided_for_group(service_group.id):
-            raise HTTPBadRequest(text='The device has been already attached to group id {}'.format(service_group.id))
+    async def _create_device(self, request, driver_name, device_settings):
         device_creation_service = self.get_device_creation_service(request)
-        driver_conf = service_group.settings['driver']
-        device_adapter = await device_creation_service.create_device(driver_conf['driver_name'], driver_conf['settings'])
+        device_adapter = await device_creation_service.create_device(driver_name, device_settings)
         if not device_adapter.id:
             # Device creation service must set device id
             raise HTTPInternalServerError
-        device_group_manager.add_device(service_group.id, device_adapter)
+        return device_adapter
+
+    async def _run_fiscal_device(self, request, service_group, device_group_manager):
+        if device_group_manager.is_device_provided_for_group(service_group.id):
+            raise HTTPBadRequest(text='The device has been already attached to group id {}'.format(service_group.id))
+        driver_conf = service_group.settings['driver']
+        device_adapter = await self._create_device(request, driver_conf['driver_name'], driver_conf['settings'])
+        queue_conf = service_group.settings.get('queue') or {}
+        device_group_manager.add_device(service_group.id, device_adapter, queue_conf.get('max_size'),
+                                        queue_conf.get('max_wait_time'),
+                                        parse_user_priorities(queue_conf.get('user_priorities')),
+                                        parse_user_weights(queue_conf.get('user_weights')))
+        for member_conf in service_group.settings.get('pool', []):
+            # The group works without the pool members which can not be started
+            try:
+                member_adapter = await self._create_device(request, driver_conf['driver_name'],
+                                                           member_conf['settings'])
+                await device_group_manager.add_pool_member(service_group.id, member_adapter)
+            except (DeviceCreationError, DeviceIsRunning, HTTPInternalServerError) as e:
+                logger.error('The pool member %s of service group %s was not started: %s',
+                             member_conf.get('device_id'), service_group.id, repr(e))
         return json_response(data={'csrf_token': request['csrf'].csrf_token.current_token})
 
     @staticmethod
@@ -158,6 +183,106 @@ class FiscalServicesManagementView:
         else:
             raise HTTPBadRequest
 
+    async def _get_running_service_group(self, request) -> ServiceGroup:
+        service_group = await self._get_enabled_service_group(request)
+        if not self.get_device_group_manager(request).is_device_provided_for_group(service_group.id):
+            raise HTTPBadRequest(text='The device is not attached to group id {}'.format(service_group.id))
+        return service_group
+
+    async def get_pool_members(self, request: Request):
+        service_group = await self._get_running_service_group(request)
+        pool_information = self.get_device_group_manager(request).get_pool_information(service_group.id)
+        return json_response(data={'members': [item.as_dict() for item in pool_information]})
+
+    async def get_driver_call_metrics(self, request: Request):
+        # Exports the driver call latency histograms of all running devices in the Prometheus text format
+        device_group_manager = self.get_device_group_manager(request)
+        histogram_sets = []
+        for service_group in await self.get_fiscal_service_group_facade(request).get_service_groups():
+            if not device_group_manager.is_device_provided_for_group(service_group.id):
+                continue
+            for member in device_group_manager.get_pool_information(service_group.id):
+                if member.driver_call_statistics:
+                    histogram_sets.append(({'service_group': service_group.id, 'device': member.device_id},
+                                           member.driver_call_statistics))
+        text = render_prometheus('cr_server_driver_call_seconds', 'Fiscal device driver call latency',
+                                 histogram_sets)
+        return Response(text=text, content_type='text/plain', charset='utf-8')
+
+    async def get_projection_metrics(self, request: Request):
+        # Exports how far the receipt read model trails the event stream in the Prometheus text format
+        monitor = request.app['projection_monitor']
+        if monitor is None:
+            raise HTTPNotFound()
+        text = render_prometheus('cr_server_projection_apply_seconds',
+                                 'Time from the event to its change in the read model', [({}, monitor.statistics)])
+        text += ('# TYPE cr_server_projection_pending_events gauge\n'
+                 'cr_server_projection_pending_events {}\n'
+                 '# TYPE cr_server_projection_lag_seconds gauge\n'
+                 'cr_server_projection_lag_seconds {}\n').format(monitor.pending_count, monitor.lag)
+        return Response(text=text, content_type='text/plain', charset='utf-8')
+
+    async def get_credential_cache_metrics(self, request: Request):
+        # Exports the statistics of the verified credential cache of the service group API in the Prometheus text format
+        credential_cache = request.app['credential_cache']
+        if credential_cache is None:
+            raise HTTPNotFound()
+        text = ('# TYPE cr_server_credential_cache_hits_total counter\n'
+                'cr_server_credential_cache_hits_total {}\n'
+                '# TYPE cr_server_credential_cache_misses_total counter\n'
+                'cr_server_credential_cache_misses_total {}\n'
+                '# TYPE cr_server_credential_cache_hit_ratio gauge\n'
+                'cr_server_credential_cache_hit_ratio {}\n'
+                '# TYPE cr_server_credential_cache_entries gauge\n'
+                'cr_server_credential_cache_entries {}\n').format(credential_cache.hit_count,
+                                                                   credential_cache.miss_count,
+                                                                   credential_cache.hit_ratio, credential_cache.size)
+        return Response(text=text, content_type='text/plain', charset='utf-8')
+
+    async def post_pool_member(self, request: Request):
+        # Adds a fiscal device to the pool of the running service group. The device uses the driver of the group, the
+        # request data is the driver settings form of the new device
+        service_group = await self._get_running_service_group(request)
+        driver_name = service_group.settings['driver']['driver_name']
+        device_config_form = create_fiscal_device_config_form(driver_name, await request.post())
+        if not device_config_form.validate():
+            return json_response(data={'errors': device_config_form.errors}, status=400)
+        try:
+            device_adapter = await self._create_device(request, driver_name, device_config_form.data)
+        except DeviceCreationError:
+            raise HTTPBadRequest(text='The device can not be created with the settings provided')
+        try:
+            await self.get_device_group_manager(request).add_pool_member(service_group.id, device_adapter)
+        except DeviceIsRunning as e:
+            await device_adapter.close()
+            raise HTTPBadRequest(text=str(e))
+        pool_conf = [item for item in service_group.settings.get('pool', []) if item['device_id'] != device_adapter.id]
+        pool_conf.append({'device_id': device_adapter.id, 'settings': device_config_form.data})
+        await self._save_pool_settings(request, service_group, pool_conf)
+        return json_response(data={'device_id': device_adapter.id,
+                                   'csrf_token': request['csrf'].csrf_token.current_token})
+
+    async def delete_pool_member(self, request: Request):
+        service_group = await self._get_running_service_group(request)
+        try:
+            device_id = int(request.match_info['device_id'])
+        except ValueError:
+            raise HTTPBadRequest
+        try:
+            await self.get_device_group_manager(request).remove_pool_member(service_group.id, device_id)
+        except DeviceIsNotAttached:
+            raise HTTPNotFound
+        except DevicePoolError as e:
+            raise HTTPBadRequest(text=str(e))
+        pool_conf = [item for item in service_group.settings.get('pool', []) if item['device_id'] != device_id]
+        await self._save_pool_settings(request, service_group, pool_conf)
+        return json_response(data={'csrf_token': request['csrf'].csrf_token.current_token})
+
+    async def _save_pool_settings(self, request, service_group: ServiceGroup, pool_conf: list):
+        service_group_data = service_group.as_dict()
+        service_group_data['settings']['pool'] = pool_conf
+        await self.get_fiscal_service_group_facade(request).update_service_group_information(**service_group_data)
+
     async def post_service_group(self, request: Request):
         data = await request.post()
         main_form = ServiceGroupForm(data)
@@ -181,6 +306,10 @@ class FiscalServicesManagementView:
             service_group = await group_facade.register_new_service_group(**service_group_data)
             service_group_id = service_group.id
         else:
+            service_group = await group_facade.get_service_group(service_group_id)
+            if service_group.settings['driver']['driver_name'] == driver_conf['driver_name']:
+                # The pool members are managed separately and use the driver of the group
+                service_group_data['settings']['pool'] = service_group.settings.get('pool', [])
             await group_facade.update_service_group_information(**service_group_data)
         return json_response(data={'service_group_id': service_group_id}, status=200)
 
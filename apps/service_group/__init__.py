@@ -1,3 +1,4 @@
 from .app import create_app
 from .facades import AbstractFiscalServiceGroupFacade, FiscalServiceGroupFacade
-from .service_group import ServiceGroup
\ No newline at end of file
+from .service_group import ServiceGroup
+from .caches import ServiceGroupStateCache
\ No newline at end of file
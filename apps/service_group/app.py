@@ -1,30 +1,47 @@
 from typing import Union
 from aiohttp.web import Application
 from aiohttp_security import AbstractAuthorizationPolicy, AbstractIdentityPolicy, setup as security_setup
-from access_control.auth import AbstractAuthenticationService
+from access_control.auth import AbstractAuthenticationService, CredentialCache
 from core.events import AbstractEventDispatcher
+from core.id_allocators import BlockIdAllocator, InMemoryIdBlockStorage
 from receipt.services import AbstractReceiptProcessingService
-from receipt.receipt_read import AbstractReceiptRepository
+from receipt.receipt_read import (AbstractReceiptRepository, ReceiptDocumentCache, ReceiptNotificationHub,
+                                  ProjectionLagMonitor)
 from receipt.registrator_info_storages import AbstractRegistratorDataStorage
-from receipt.receipt_read.event_handlers import (ReceiptCreatedHandler, ReceiptReceiptRegisteredHandler,
+from receipt.webhooks import WebhookDispatcher
+from receipt.receipt_read.event_handlers import (ReceiptCreatedHandler, ReceiptsCreatedHandler,
+                                                 ReceiptReceiptRegisteredHandler,
                                                  ReceiptReceiptRegistationFailedHandler)
 from hardware.fiscal_device_group_managers import (AbstractDeviceGroupManager, CommandProcessorInterface,
                                                    DeviceAvailabilityCheck)
 from .access_control import AccessAttributesCalculation
 from .facades import AbstractFiscalServiceGroupFacade
+from .caches import ServiceGroupStateCache
 from .di_containers import AppContainer
 from .urls import get_routes
 
 
-def gen(value):
-    while True:
-        value = value + 1
-        yield value
-
-
 async def context(app):
-    app['receipt_id_generator'] = gen(await app['receipt_read_repository'].get_last_id())
+    # The ids of the receipts saved before the shared id storage was used are skipped
+    app['receipt_id_allocator'].set_minimum(await app['receipt_read_repository'].get_last_id())
     yield
+    await app['receipt_id_allocator'].close()
+    # The buffered changes of the read model are written before the server stops
+    await app['receipt_read_repository'].close()
+
+
+async def close_notification_streams(app):
+    # Open notification streams are finished, otherwise the server waits for them until the shutdown timeout
+    app['receipt_notification_hub'].close()
+
+
+async def close_event_dispatcher(app):
+    # The queued events are handled before the notification streams and the webhook deliveries are closed
+    await app['event_dispatcher'].close()
+
+
+async def close_webhook_dispatcher(app):
+    await app['webhook_dispatcher'].close()
 
 
 def create_app(authentication_service: AbstractAuthenticationService,
@@ -34,24 +51,54 @@ def create_app(authentication_service: AbstractAuthenticationService,
                service_group_facade: AbstractFiscalServiceGroupFacade,
                registrator_data_storage: AbstractRegistratorDataStorage,
                device_manager: Union[AbstractDeviceGroupManager, CommandProcessorInterface, DeviceAvailabilityCheck],
-               event_dispatcher: AbstractEventDispatcher):
+               event_dispatcher: AbstractEventDispatcher,
+               receipt_document_cache: ReceiptDocumentCache = None,
+               receipt_notification_hub: ReceiptNotificationHub = None,
+               receipt_notification_heartbeat: float = 15,
+               webhook_dispatcher: WebhookDispatcher = None,
+               receipt_bulk_max_size: int = 1000,
+               receipt_bulk_max_body_size: int = 16 * 1024 * 1024,
+               projection_monitor: ProjectionLagMonitor = None,
+               receipt_id_allocator: BlockIdAllocator = None,
+               credential_cache: CredentialCache = None,
+               service_group_state_cache: ServiceGroupStateCache = None):
 
     app = Application()
     if getattr(AppContainer, 'middlewares', None):
         app.middlewares.extend(AppContainer.middlewares())
     app['receipt_read_repository'] = receipt_read_repository
+    app['receipt_id_allocator'] = receipt_id_allocator or BlockIdAllocator(InMemoryIdBlockStorage(), 'receipt')
+    app['receipt_document_cache'] = receipt_document_cache or ReceiptDocumentCache()
+    app['receipt_notification_hub'] = receipt_notification_hub or ReceiptNotificationHub()
+    app['receipt_notification_heartbeat'] = receipt_notification_heartbeat
+    app['receipt_bulk_max_size'] = receipt_bulk_max_size
+    app['receipt_bulk_max_body_size'] = receipt_bulk_max_body_size
     app['authentication_service'] = authentication_service
+    app['credential_cache'] = credential_cache
     app['access_attr_calc_strategy'] = AccessAttributesCalculation()
     app['receipt_creation_service'] = AppContainer.receipt_creation_service()
     app['receipt_processing_service'] = receipt_processing_service
     app['fiscal_service_group_facade'] = service_group_facade
+    app['service_group_state_cache'] = service_group_state_cache
     app['device_manager'] = device_manager
     app['registrator_data_storage'] = registrator_data_storage
     app['event_dispatcher'] = event_dispatcher
+    app.on_shutdown.append(close_event_dispatcher)
 
-    app['event_handlers'] = [ReceiptCreatedHandler(receipt_read_repository),
-                             ReceiptReceiptRegisteredHandler(receipt_read_repository, registrator_data_storage),
-                             ReceiptReceiptRegistationFailedHandler(receipt_read_repository)]
+    app['event_handlers'] = [ReceiptCreatedHandler(receipt_read_repository, projection_monitor),
+                             ReceiptsCreatedHandler(receipt_read_repository, projection_monitor),
+                             ReceiptReceiptRegisteredHandler(receipt_read_repository, registrator_data_storage,
+                                                             app['receipt_document_cache'], projection_monitor),
+                             ReceiptReceiptRegistationFailedHandler(receipt_read_repository,
+                                                                    app['receipt_document_cache'],
+                                                                    projection_monitor),
+                             app['receipt_notification_hub']]
+    if projection_monitor is not None:
+        app['event_handlers'].append(projection_monitor)
+    if webhook_dispatcher is not None:
+        app['webhook_dispatcher'] = webhook_dispatcher
+        app['event_handlers'].append(webhook_dispatcher)
+        app.on_shutdown.append(close_webhook_dispatcher)
 
     app['authorization_policy'] = authorization_policy
 
@@ -59,6 +106,7 @@ def create_app(authentication_service: AbstractAuthenticationService,
         handler.subscribe(event_dispatcher)
 
     app.cleanup_ctx.append(context)
+    app.on_shutdown.append(close_notification_streams)
     app.add_routes(get_routes())
 
     return app
@@ -0,0 +1,45 @@
+import time
+from lru import LRU
+
+
+class ServiceGroupStateCache:
+    # The enabled flags of the service groups for the requests which read the receipts: the clients poll the receipts
+    # frequently and the service group storage may be remote (e.g. the owner process of cr_server --workers). A group
+    # which does not exist is cached as disabled. FiscalServiceGroupFacade invalidates the group when it is registered,
+    # changed or deleted, the changes made bypassing the facade are seen after ttl at the latest.
+    # The cache has a generation which is incremented by invalidation. A loaded state is cached only if the generation
+    # did not change while the group was loaded, otherwise an invalidation that happened during the storage request
+    # would be lost.
+    def __init__(self, capacity: int = 1000, ttl: float = 5.0, time_counter=time.monotonic):
+        self._states = LRU(capacity)  # service group id -> (is enabled, expiration time)
+        self._ttl = ttl
+        self._time_counter = time_counter
+        self._generation = 0
+        self.on_invalidated = []  # callables with the group id, e.g. to invalidate the caches of other processes
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, service_group_id: int):
+        # None if the state of the group is not cached
+        state = self._states.get(service_group_id)
+        if state is None:
+            return None
+        is_enabled, expiration_time = state
+        if expiration_time <= self._time_counter():
+            del self._states[service_group_id]
+            return None
+        return is_enabled
+
+    def put(self, service_group_id: int, is_enabled: bool, generation: int):
+        # generation is the value of the generation property before the group was loaded
+        if generation == self._generation:
+            self._states[service_group_id] = (is_enabled, self._time_counter() + self._ttl)
+
+    def invalidate(self, service_group_id: int):
+        self._generation += 1
+        if service_group_id in self._states:
+            del self._states[service_group_id]
+        for callback in self.on_invalidated:
+            callback(service_group_id)
@@ -2,6 +2,7 @@ from abc import ABC, abstractmethod
 from typing import Iterable
 from .storages.storages import AbstractServiceGroupStorage, ServiceGroupNotExists
 from .service_group import ServiceGroup
+from .caches import ServiceGroupStateCache
 
 
 class AbstractFiscalServiceGroupFacade(ABC):
@@ -27,8 +28,10 @@ class AbstractFiscalServiceGroupFacade(ABC):
 
 
 class FiscalServiceGroupFacade(AbstractFiscalServiceGroupFacade):
-    def __init__(self, storage: AbstractServiceGroupStorage):
+    # The state of a registered, changed or deleted service group is removed from state_cache
+    def __init__(self, storage: AbstractServiceGroupStorage, state_cache: ServiceGroupStateCache = None):
         self._storage = storage
+        self._state_cache = state_cache
 
     def _create_service_group(self, name: str, is_enabled: bool, settings: dict) -> ServiceGroup:
         return ServiceGroup(None, name, is_enabled, settings)
@@ -36,6 +39,7 @@ class FiscalServiceGroupFacade(AbstractFiscalServiceGroupFacade):
     async def register_new_service_group(self, name: str, is_enabled: bool, settings: dict):
         service_group = self._create_service_group(name, is_enabled, settings)
         await self._storage.add(service_group)
+        self._invalidate_state(service_group.id)
         return service_group
 
     async def update_service_group_information(self, id, name: str, is_enabled: bool, settings: dict):
@@ -44,6 +48,7 @@ class FiscalServiceGroupFacade(AbstractFiscalServiceGroupFacade):
         service_group.is_enabled = is_enabled
         service_group.settings = settings
         await self._storage.update(service_group)
+        self._invalidate_state(id)
 
     async def get_service_group(self, service_group_id) -> ServiceGroup:
         try:
@@ -57,4 +62,9 @@ class FiscalServiceGroupFacade(AbstractFiscalServiceGroupFacade):
 
     async def delete_service_group(self, group_id):
         await self._storage.delete(group_id)
+        self._invalidate_state(group_id)
+
+    def _invalidate_state(self, service_group_id):
+        if self._state_cache is not None:
+            self._state_cache.invalidate(int(service_group_id))
 
@@ -33,7 +33,7 @@ class ServiceGroup:
 
     @is_enabled.setter
     def is_enabled(self, value):
-        _is_enabled = value
+        self._is_enabled = value
 
     @property
     def settings(self):
@@ -1,11 +1,16 @@
 from aiohttp import web
-from .views import ReceiptRegisterServiceView, ReceiptReadServiceView
+from .views import ReceiptRegisterServiceView, ReceiptBulkRegisterServiceView, ReceiptReadServiceView
 
 
 def get_routes():
     receipt_read_view = ReceiptReadServiceView()
     return [web.view('/{service_group_id}/receipts/', ReceiptRegisterServiceView,
                       name='receipt_register'),
+            web.view('/{service_group_id}/receipts/bulk', ReceiptBulkRegisterServiceView,
+                     name='receipt_bulk_register'),
+            # Registered before the receipt route, which would match "events" as a receipt id
+            web.get('/{service_group_id}/receipts/events', receipt_read_view.get_notifications,
+                    name='receipt_notifications'),
             web.get('/{service_group_id}/receipts/{receipt_id}', receipt_read_view.get_receipt,
                     name='receipt_get'),
             ]
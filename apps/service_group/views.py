@@ -1,17 +1,18 @@
-from aiohttp.web import View, HTTPNotFound, json_response, HTTPBadRequest
+from aiohttp.web import (View, HTTPNotFound, json_response, HTTPBadRequest, HTTPTooManyRequests, HTTPServiceUnavailable,
+                         HTTPNotModified, HTTPRequestEntityTooLarge, StreamResponse)
+import asyncio
 import datetime
-from typing import Generator
 import json
 from core.events import AbstractEventDispatcher
-from receipt.events import ReceiptCreated
-from receipt.serializers import ReceiptSerializer
+from core.id_allocators import BlockIdAllocator
+from receipt.events import ReceiptCreated, ReceiptsCreated
+from receipt.serializers import receipt_validator
 from receipt.services import AbstractReceiptProcessingService, AbstractReceiptCreationService
-from receipt.receipt_read import ReceiptNotExists
-from .facades import AbstractFiscalServiceGroupFacade
-
-
-class ServiceGroupNotExists(Exception):
-    pass
+from receipt.receipt_read import ReceiptNotExists, ReceiptDocumentCache, ReceiptNotificationHub, ReceiptSubscription
+from hardware import CommandQueueOverflow, CommandQueueIsFull
+from core.commands import CommandPriority
+from .facades import AbstractFiscalServiceGroupFacade, ServiceGroupNotExists
+from .caches import ServiceGroupStateCache
 
 
 class ReceiptRegisterServiceView(View):
@@ -24,42 +25,182 @@ class ReceiptRegisterServiceView(View):
         return self.request.app['receipt_creation_service']
 
     @property
-    def receipt_id_generator(self) -> Generator:
-        return self.request.app['receipt_id_generator']
+    def receipt_id_allocator(self) -> BlockIdAllocator:
+        return self.request.app['receipt_id_allocator']
 
     @property
     def receipt_processing_service(self) -> AbstractReceiptProcessingService:
         return self.request.app['receipt_processing_service']
 
-    async def post(self):
+    def _check_capacity(self, service_group_id, count=1):
+        # The receipt is rejected before an id is allocated, so the client can safely retry it or send it elsewhere
         try:
-            service_group_id = self.request.match_info['service_group_id']
+            self.receipt_processing_service.check_capacity(service_group_id, count)
+        except CommandQueueOverflow as e:
+            error_class = HTTPServiceUnavailable if isinstance(e, CommandQueueIsFull) else HTTPTooManyRequests
+            raise error_class(text=json.dumps({'errors': str(e)}), content_type='application/json',
+                              headers={'Retry-After': str(e.retry_after)})
+
+    def _get_priority(self):
+        # The client may choose the priority class of the receipt: high, normal or low
+        priority_name = self.request.headers.get('X-Receipt-Priority')
+        if priority_name is None:
+            return None
+        try:
+            return CommandPriority.names[priority_name.strip().lower()]
         except KeyError:
+            raise HTTPBadRequest(text='Unknown receipt priority {}'.format(priority_name))
+
+    async def post(self):
+        try:
+            service_group_id = int(self.request.match_info['service_group_id'])
+        except (KeyError, ValueError):
             raise HTTPNotFound
-        if self.receipt_processing_service.is_service_provided(service_group_id):
+        if not self.receipt_processing_service.is_service_provided(service_group_id):
             raise HTTPNotFound
-        deserializer = ReceiptSerializer.from_json(await self.request.json())
-        if not deserializer.validate():
-            return json_response(data={'errors': deserializer.errors}, status=400)
+        self._check_capacity(service_group_id)
+        priority = self._get_priority()
+        data, errors = receipt_validator.validate(await self.request.json())
+        if errors:
+            return json_response(data={'errors': errors}, status=400)
         user = self.request['user']
         try:
             # Receipt Data must be validated with domain logic. If data is not valid ValueError exception must be raised
-            receipt = self.receipt_creation_service.create_receipt(user.id, int(service_group_id), deserializer.data)
+            receipt = self.receipt_creation_service.create_receipt(user.id, service_group_id, data)
         except ValueError as e:
             return json_response(data={'errors': str(e)}, status=400)
-        receipt.id = next(self.receipt_id_generator)
+        receipt.id, = await self.receipt_id_allocator.allocate()
         await self.event_dispatcher.handle(ReceiptCreated(receipt))
-        await self.receipt_processing_service.proccess(receipt)
+        await self.receipt_processing_service.proccess(receipt, priority)
         receipt_view_location = '{}{}'.format(self.request.url, receipt.id)
         return json_response({'receipt_id': receipt.id, 'location': receipt_view_location})
 
 
+class ReceiptBulkRegisterServiceView(ReceiptRegisterServiceView):
+    # Registers up to receipt_bulk_max_size receipts of one service group sent as a JSON array or as NDJSON (one
+    # receipt per line, Content-Type: application/x-ndjson) which is parsed as it is received. Every item gets its own
+    # status: accepted with the receipt id and location or error with the validation errors. The valid receipts are
+    # accepted together: the device queue must have room for all of them, their ids are allocated in one block, they
+    # are saved to the read model by one ReceiptsCreated event and put to the device queue together.
+    ndjson_content_type = 'application/x-ndjson'
+
+    @property
+    def max_size(self) -> int:
+        return self.request.config_dict['receipt_bulk_max_size']
+
+    @property
+    def max_body_size(self) -> int:
+        return self.request.config_dict['receipt_bulk_max_body_size']
+
+    def _raise_too_large(self, message):
+        raise HTTPRequestEntityTooLarge(self.max_body_size, self.request.content_length or 0,
+                                        text=json.dumps({'errors': message}), content_type='application/json')
+
+    async def _read_ndjson(self) -> list:
+        items, size = [], 0
+        async for line in self.request.content:
+            size += len(line)
+            if size > self.max_body_size:
+                self._raise_too_large('The request body exceeds {} bytes'.format(self.max_body_size))
+            line = line.strip()
+            if not line:
+                continue
+            if len(items) == self.max_size:
+                self._raise_too_large('The request contains more than {} receipts'.format(self.max_size))
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(None)
+        return items
+
+    async def _read_json(self) -> list:
+        chunks, size = [], 0
+        async for chunk in self.request.content.iter_chunked(64 * 1024):
+            size += len(chunk)
+            if size > self.max_body_size:
+                self._raise_too_large('The request body exceeds {} bytes'.format(self.max_body_size))
+            chunks.append(chunk)
+        try:
+            items = json.loads(b''.join(chunks))
+        except ValueError:
+            raise HTTPBadRequest(text='The request body is not valid JSON')
+        if not isinstance(items, list):
+            raise HTTPBadRequest(text='The request body must be a JSON array of receipts')
+        if len(items) > self.max_size:
+            self._raise_too_large('The request contains more than {} receipts'.format(self.max_size))
+        return items
+
+    def _create_receipts(self, service_group_id, items: list):
+        # Returns the item results and the receipts created from the valid items with their item indexes
+        user_id = self.request['user'].id
+        results, receipts = [], []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results.append({'index': index, 'status': 'error', 'errors': 'The receipt must be a JSON object'})
+                continue
+            data, errors = receipt_validator.validate(item)
+            if errors:
+                results.append({'index': index, 'status': 'error', 'errors': errors})
+                continue
+            try:
+                receipt = self.receipt_creation_service.create_receipt(user_id, service_group_id, data)
+            except ValueError as e:
+                results.append({'index': index, 'status': 'error', 'errors': str(e)})
+                continue
+            result = {'index': index, 'status': 'accepted'}
+            results.append(result)
+            receipts.append((receipt, result))
+        return results, receipts
+
+    async def post(self):
+        try:
+            service_group_id = int(self.request.match_info['service_group_id'])
+        except (KeyError, ValueError):
+            raise HTTPNotFound
+        if not self.receipt_processing_service.is_service_provided(service_group_id):
+            raise HTTPNotFound
+        priority = self._get_priority()
+        if self.request.content_type == self.ndjson_content_type:
+            items = await self._read_ndjson()
+        else:
+            items = await self._read_json()
+        results, receipts = self._create_receipts(service_group_id, items)
+        if not receipts:
+            return json_response({'results': results, 'accepted': 0}, status=400)
+        self._check_capacity(service_group_id, len(receipts))
+        location = '{}/'.format(self.request.url.parent)
+        for (receipt, result), receipt_id in zip(receipts, await self.receipt_id_allocator.allocate(len(receipts))):
+            receipt.id = receipt_id
+            result['receipt_id'] = receipt_id
+            result['location'] = '{}{}'.format(location, receipt_id)
+        receipts = [receipt for receipt, result in receipts]
+        await self.event_dispatcher.handle(ReceiptsCreated(receipts))
+        await self.receipt_processing_service.proccess_many(receipts, priority)
+        return json_response({'results': results, 'accepted': len(receipts)})
+
+
 class ReceiptReadServiceView:
     @staticmethod
     def _get_service_group_facade(request) -> AbstractFiscalServiceGroupFacade:
         return request.app['fiscal_service_group_facade']
 
+    @staticmethod
+    def _get_service_group_state_cache(request) -> ServiceGroupStateCache:
+        # The cache is optional, without it the service group is loaded every request
+        return request.app.get('service_group_state_cache')
+
     async def _is_reading_available(self, request, service_group_id):
+        state_cache = self._get_service_group_state_cache(request)
+        if state_cache is None:
+            return await self._is_service_group_enabled(request, service_group_id)
+        is_enabled = state_cache.get(service_group_id)
+        if is_enabled is None:
+            generation = state_cache.generation
+            is_enabled = await self._is_service_group_enabled(request, service_group_id)
+            state_cache.put(service_group_id, is_enabled, generation)
+        return is_enabled
+
+    async def _is_service_group_enabled(self, request, service_group_id):
         fiscal_service_facade = self._get_service_group_facade(request)
         try:
             service_group = await fiscal_service_facade.get_service_group(int(service_group_id))
@@ -73,6 +214,19 @@ class ReceiptReadServiceView:
     def _get_receipt_repository(request):
         return request.config_dict['receipt_read_repository']
 
+    @staticmethod
+    def _get_document_cache(request) -> ReceiptDocumentCache:
+        return request.config_dict['receipt_document_cache']
+
+    @staticmethod
+    def _is_not_modified(request, etag):
+        # Weak comparison as required for If-None-Match, the list of tags may contain W/ prefixes or *
+        if_none_match = request.headers.get('If-None-Match')
+        if not if_none_match:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags or 'W/' + etag in tags
+
     @staticmethod
     def _get_service_group_id(request):
         return request.match_info['service_group_id']
@@ -89,11 +243,79 @@ class ReceiptReadServiceView:
 
         repository = self._get_receipt_repository(request)
 
-        try:
+        async def load_document():
             receipt_data = await repository.get(receipt_id, service_group_id)
+            if receipt_data is None:
+                raise ReceiptNotExists
+            return receipt_data
+
+        # The state of the group is cached, the facade invalidates it when the group is disabled or deleted
+        try:
+            document = await self._get_document_cache(request).load(receipt_id, service_group_id, load_document)
         except ReceiptNotExists:
             raise HTTPNotFound
-        return json_response(text=json.dumps(receipt_data, default=str))
+        headers = {'ETag': document.etag}
+        if self._is_not_modified(request, document.etag):
+            raise HTTPNotModified(headers=headers)
+        return json_response(text=document.body, headers=headers)
+
+    @staticmethod
+    def _get_last_event_id(request):
+        # EventSource sends the header when it reconnects, the query parameter is used for the first connection. An
+        # unknown id is answered with the resync event by the notification hub
+        return request.headers.get('Last-Event-ID') or request.query.get('last_event_id') or None
+
+    async def get_notifications(self, request):
+        # Server-Sent Events stream of registration results of the service group receipts, or of one receipt if
+        # the receipt_id query parameter is set. A comment line is sent when there were no events for
+        # the heartbeat interval, so proxies keep the connection open and a broken connection is noticed.
+        service_group_id = int(self._get_service_group_id(request))
+        if not await self._is_reading_available(request, service_group_id):
+            raise HTTPNotFound
+        receipt_id = request.query.get('receipt_id')
+        try:
+            receipt_id = int(receipt_id) if receipt_id is not None else None
+        except ValueError:
+            raise HTTPBadRequest
+        last_event_id = self._get_last_event_id(request)
+
+        hub: ReceiptNotificationHub = request.config_dict['receipt_notification_hub']
+        subscription = hub.open_subscription(service_group_id, receipt_id, last_event_id)
+        try:
+            response = StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache',
+                                               'X-Accel-Buffering': 'no'})
+            await response.prepare(request)
+            heartbeat = request.config_dict['receipt_notification_heartbeat']
+            await self._send_notifications(response, subscription, heartbeat)
+        finally:
+            hub.unsubscribe(subscription)
+        return response
+
+    @staticmethod
+    async def _send_notifications(response: StreamResponse, subscription: ReceiptSubscription, heartbeat: float):
+        # The pending get is reused after a heartbeat, cancelling it could lose a notification
+        getter = None
+        try:
+            while True:
+                if getter is None:
+                    getter = asyncio.ensure_future(subscription.get())
+                done, pending = await asyncio.wait((getter,), timeout=heartbeat)
+                if not done:
+                    await response.write(b': heartbeat\n\n')
+                    continue
+                notification = getter.result()
+                getter = None
+                if notification is None:
+                    return
+                if notification.id is None:
+                    message = 'event: {}\ndata: {}\n\n'.format(notification.event, notification.body)
+                else:
+                    message = 'id: {}\nevent: {}\ndata: {}\n\n'.format(notification.id, notification.event,
+                                                                      notification.body)
+                await response.write(message.encode())
+        finally:
+            if getter is not None:
+                getter.cancel()
 
     async def get_receipts(self, request):
         date_start = request.query.get('date_start', 0)
@@ -0,0 +1,19 @@
+from receipt.webhooks import AbstractWebhookEndpointProvider, WebhookEndpoint
+from .facades import AbstractFiscalServiceGroupFacade
+from .storages.storages import ServiceGroupNotExists
+
+
+class ServiceGroupWebhookEndpointProvider(AbstractWebhookEndpointProvider):
+    # The endpoint is configured in the webhook section of the service group settings: {"url": ..., "secret": ...}
+    def __init__(self, service_group_facade: AbstractFiscalServiceGroupFacade):
+        self._service_group_facade = service_group_facade
+
+    async def get_endpoint(self, service_group_id):
+        try:
+            service_group = await self._service_group_facade.get_service_group(service_group_id)
+        except ServiceGroupNotExists:
+            return None
+        webhook_conf = service_group.settings.get('webhook') or {}
+        if not service_group.is_enabled or not webhook_conf.get('url'):
+            return None
+        return WebhookEndpoint(webhook_conf['url'], webhook_conf.get('secret') or '')
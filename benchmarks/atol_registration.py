@@ -0,0 +1,98 @@
+import argparse
+import datetime
+import decimal
+import json
+import time
+from hardware.adapters.atol.adapter import AtlCashRegister
+from hardware.adapters.atol.libfptr10 import IFptr
+from hardware.adapters.base import DefaultTimeCounter
+from receipt.domain.factories import get_default_receipt_factory
+
+
+# Compares the per-receipt latency of the Atol adapter registration modes: the classic mode makes a driver call for
+# every receipt field, product and payment, the json mode submits the whole receipt as one processJson task.
+# The driver is simulated: every call which is an exchange with the device takes the given latency, setting
+# parameters is local to the driver library and takes no time.
+# Usage: python -m benchmarks.atol_registration --receipts 200 --products 5 --latency 0.005
+
+
+class SimulatedDriver:
+    _device_calls = {'checkDocumentClosed', 'openReceipt', 'registration', 'payment', 'receiptTotal', 'closeReceipt',
+                     'fnQueryData', 'operatorLogin', 'processJson', 'cancelReceipt'}
+
+    def __init__(self, latency, json_latency):
+        self.latency = latency
+        self.json_latency = json_latency
+        self.calls_count = 0
+        self._params = {}
+
+    def __getattr__(self, name):
+        if name.startswith('LIBFPTR_'):
+            return getattr(IFptr, name)
+        if name not in self._device_calls:
+            raise AttributeError(name)
+
+        def call():
+            self.calls_count += 1
+            latency = self.json_latency if name == 'processJson' else self.latency
+            if latency:
+                time.sleep(latency)
+            if name == 'processJson':
+                self._params[IFptr.LIBFPTR_PARAM_JSON_DATA] = json.dumps({'fiscalParams': {
+                    'fiscalDocumentSign': '0123456789', 'fiscalDocumentDateTime': datetime.datetime.now().isoformat(),
+                    'shiftNumber': 1, 'fiscalReceiptNumber': 1, 'fiscalDocumentNumber': 1}})
+            return 0
+        return call
+
+    def isOpened(self):
+        return True
+
+    def setParam(self, param, value):
+        self._params[param] = value
+
+    def getParamString(self, param):
+        return str(self._params.get(param, ''))
+
+    def getParamInt(self, param):
+        return 1
+
+    def getParamDateTime(self, param):
+        return datetime.datetime.now()
+
+
+def create_receipt(products_count):
+    data = {'receiptType': 1, 'tax_system': '1', 'email': 'ivan@mail.ru',
+            'products': [{'name': 'Товар {}'.format(i), 'quantity': decimal.Decimal('1'),
+                          'price': decimal.Decimal('100.00'), 'commodity_type_int': 1, 'payment_state_int': 4,
+                          'quantity_prec': 0, 'quantity_unit': 'шт', 'tax_type_int': 6} for i in range(products_count)],
+            'payments': [{'payment_type_int': 1, 'payment_sum': decimal.Decimal(100 * products_count)}]}
+    return get_default_receipt_factory().create_receipt(1, 1, data)
+
+
+def measure(registration_mode, receipts_count, products_count, latency, json_latency):
+    driver = SimulatedDriver(latency, json_latency)
+    cash_register = AtlCashRegister(driver, DefaultTimeCounter(), registration_mode=registration_mode)
+    receipts = [create_receipt(products_count) for i in range(receipts_count)]
+    started_at = time.perf_counter()
+    for receipt in receipts:
+        cash_register.register_receipt(receipt)
+    return time.perf_counter() - started_at, driver.calls_count
+
+
+def run(receipts_count, products_count, latency, json_latency):
+    for registration_mode in (AtlCashRegister.REGISTRATION_MODE_CLASSIC, AtlCashRegister.REGISTRATION_MODE_JSON):
+        elapsed, calls_count = measure(registration_mode, receipts_count, products_count, latency, json_latency)
+        print('{:<8} {:>6} receipts {:>10.3f} s {:>10.2f} ms/receipt {:>8.1f} device calls/receipt'.format(
+            registration_mode, receipts_count, elapsed, elapsed * 1000 / receipts_count, calls_count / receipts_count))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Atol receipt registration benchmark')
+    parser.add_argument('--receipts', type=int, default=200)
+    parser.add_argument('--products', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.005, help='device exchange latency, seconds')
+    parser.add_argument('--json-latency', type=float, default=None,
+                        help='processJson latency, seconds (the device exchange latency by default)')
+    args = parser.parse_args()
+    run(args.receipts, args.products, args.latency,
+        args.latency if args.json_latency is None else args.json_latency)
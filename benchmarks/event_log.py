@@ -0,0 +1,89 @@
+import argparse
+import asyncio
+import datetime
+import random
+import shutil
+import tempfile
+import time
+from core.events.event_storages import InMemoryEventStorage, FileEventStorage
+from receipt.events import ReceiptRegistationFailed, ReceiptRegistered
+
+
+# Compares the event storages: the append throughput and the latency of get_by_time queries of short time ranges
+# at random points of the stored history.
+# Usage: python -m benchmarks.event_log --events 100000 --queries 200 --range 60
+
+
+class Receipt:
+    def __init__(self, receipt_id):
+        self.id = receipt_id
+        self.user_id = 1
+        self.service_id = 1
+        self.registrator_id = 1
+        self.fiscal_sign = '1234567890'
+        self.registration_datetime = datetime.datetime(2020, 1, 1)
+        self.cashier = None
+        self.shift_num = 1
+        self.receipt_in_shift_num = receipt_id
+        self.tax_system = None
+
+
+def create_events(count):
+    # One event per 100 ms of the history
+    started_at = datetime.datetime(2020, 1, 1)
+    events = []
+    for i in range(count):
+        event_type = ReceiptRegistered if i % 10 else ReceiptRegistationFailed
+        event = event_type(Receipt(i))
+        event._date_time = started_at + datetime.timedelta(milliseconds=100 * i)
+        events.append(event)
+    return events
+
+
+async def measure(storage, events, queries_count, range_seconds):
+    started_at = time.perf_counter()
+    for event in events:
+        await storage.add(event)
+    append_elapsed = time.perf_counter() - started_at
+
+    first, last = events[0].date_time, events[-1].date_time
+    span = (last - first).total_seconds() - range_seconds
+    latencies = []
+    found = 0
+    for i in range(queries_count):
+        start = first + datetime.timedelta(seconds=random.uniform(0, max(span, 0)))
+        query_started_at = time.perf_counter()
+        found += len(await storage.get_by_time(start, start + datetime.timedelta(seconds=range_seconds)))
+        latencies.append(time.perf_counter() - query_started_at)
+    latencies.sort()
+    return append_elapsed, latencies, found / queries_count
+
+
+def print_result(name, count, append_elapsed, latencies, average_found):
+    print('{:<12} append {:>10.1f} events/s   get_by_time p50 {:>8.3f} ms p99 {:>8.3f} ms ({:.0f} events)'.format(
+        name, count / append_elapsed, latencies[len(latencies) // 2] * 1000,
+        latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, average_found))
+
+
+async def run(events_count, queries_count, range_seconds):
+    events = create_events(events_count)
+    random.seed(1)
+    print_result('in memory', events_count, *await measure(InMemoryEventStorage(), events, queries_count,
+                                                           range_seconds))
+    directory = tempfile.mkdtemp()
+    try:
+        storage = FileEventStorage(directory, asyncio.get_event_loop(), segment_size=16 * 1024 * 1024)
+        random.seed(1)
+        print_result('file', events_count, *await measure(storage, events, queries_count, range_seconds))
+        await storage.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Event storage benchmark')
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--range', type=float, default=60, help='the time range of a query in seconds')
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(run(args.events, args.queries, args.range))
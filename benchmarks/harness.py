@@ -0,0 +1,137 @@
+import asyncio
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+
+
+# Microbenchmark runner. Every case is calibrated to run a batch of calls lasting at least min_batch_time, then
+# the batch is repeated and the per-call time of every batch is recorded. The median of the batches is the main
+# result, it is less affected by scheduling noise than the mean. Results are written as JSON and can be compared
+# with a previous results file: a case is reported as a regression if its median grew more than the threshold.
+
+
+class BenchmarkCase:
+    # func is called without arguments, it may be a coroutine function. setup is called before every batch outside
+    # of the measured time, its result is not used.
+    __slots__ = ('name', 'func', 'setup', 'params')
+
+    def __init__(self, name: str, func, setup=None, **params):
+        self.name = name
+        self.func = func
+        self.setup = setup
+        self.params = params
+
+
+class BenchmarkRunner:
+    def __init__(self, repeat: int = 7, min_batch_time: float = 0.05, loop: asyncio.AbstractEventLoop = None):
+        self._repeat = repeat
+        self._min_batch_time = min_batch_time
+        self._loop = loop or asyncio.get_event_loop()
+
+    def _run_batch(self, case: BenchmarkCase, count: int) -> float:
+        if case.setup:
+            case.setup()
+        func = case.func
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            if asyncio.iscoroutinefunction(func):
+                async def batch():
+                    started_at = time.perf_counter()
+                    for i in range(count):
+                        await func()
+                    return time.perf_counter() - started_at
+                return self._loop.run_until_complete(batch())
+            started_at = time.perf_counter()
+            for i in range(count):
+                func()
+            return time.perf_counter() - started_at
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def _calibrate(self, case: BenchmarkCase) -> int:
+        count = 1
+        while True:
+            elapsed = self._run_batch(case, count)
+            if elapsed >= self._min_batch_time:
+                return count
+            count = count * 10 if elapsed < self._min_batch_time / 10 else count * 2
+
+    def run_case(self, case: BenchmarkCase) -> dict:
+        count = self._calibrate(case)
+        times = [self._run_batch(case, count) / count for i in range(self._repeat)]
+        return dict(case.params, calls_per_batch=count, median=statistics.median(times), min=min(times),
+                    mean=statistics.mean(times), stdev=statistics.stdev(times) if len(times) > 1 else 0.0)
+
+    def run(self, cases, verbose=True) -> dict:
+        results = {}
+        for case in cases:
+            results[case.name] = self.run_case(case)
+            if verbose:
+                print('{:<44} {:>12.2f} us'.format(case.name, results[case.name]['median'] * 1e6), file=sys.stderr)
+        return {'environment': get_environment(), 'results': results}
+
+
+def get_environment() -> dict:
+    return {'python': platform.python_version(), 'implementation': platform.python_implementation(),
+            'machine': platform.machine(), 'platform': platform.platform()}
+
+
+def save_results(results: dict, path: str):
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+
+
+def load_results(path: str) -> dict:
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def compare_results(results: dict, baseline: dict, threshold: float = 0.1) -> list:
+    # Returns (name, baseline median, current median, relative change, is regression) for the cases present in
+    # both results
+    comparison = []
+    for name, result in results['results'].items():
+        baseline_result = baseline['results'].get(name)
+        if not baseline_result:
+            continue
+        change = result['median'] / baseline_result['median'] - 1
+        comparison.append((name, baseline_result['median'], result['median'], change, change > threshold))
+    return comparison
+
+
+def print_comparison(comparison: list, file=sys.stderr):
+    print('{:<44} {:>12} {:>12} {:>9}'.format('case', 'baseline us', 'current us', 'change'), file=file)
+    for name, baseline_median, median, change, is_regression in comparison:
+        print('{:<44} {:>12.2f} {:>12.2f} {:>+8.1%}{}'.format(name, baseline_median * 1e6, median * 1e6, change,
+                                                                ' REGRESSION' if is_regression else ''), file=file)
+
+
+def add_arguments(parser):
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare the results with this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown which is reported as a regression (default 0.1)')
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--filter', default='', help='run only the cases which names contain this string')
+
+
+def main(cases, args) -> int:
+    # Runs the cases with the command line arguments added by add_arguments, returns the process exit code:
+    # 1 if there are regressions against the baseline
+    cases = [case for case in cases if args.filter in case.name]
+    results = BenchmarkRunner(repeat=args.repeat).run(cases)
+    if args.output:
+        save_results(results, args.output)
+    else:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    if args.baseline:
+        comparison = compare_results(results, load_results(args.baseline), args.threshold)
+        print_comparison(comparison)
+        if any(item[4] for item in comparison):
+            return 1
+    return 0
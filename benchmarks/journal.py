@@ -0,0 +1,87 @@
+import argparse
+import asyncio
+import decimal
+import shutil
+import tempfile
+import time
+from receipt.commands import RegisterReceiptCommand, RegisterReceiptCommandSerializer
+from receipt.domain.factories import get_default_receipt_factory
+from hardware.journals import FileCommandJournal
+
+
+# Measures the command journal overhead: the append throughput with sequential and concurrent clients (the concurrent
+# appends share fsync calls) and the replay throughput of unfinished commands on startup.
+# Usage: python -m benchmarks.journal --commands 2000 --concurrency 50
+
+
+class NullEventDispatcher:
+    async def handle(self, event):
+        pass
+
+
+def create_command(receipt_id, event_dispatcher):
+    data = {'receiptType': 1, 'order_id': str(receipt_id), 'tax_system': '1', 'email': 'ivan@mail.ru',
+            'products': [{'name': 'Товар {}'.format(i), 'quantity': decimal.Decimal('1'),
+                          'price': decimal.Decimal('100.00'), 'commodity_type_int': 1, 'payment_state_int': 4,
+                          'quantity_prec': 0, 'quantity_unit': 'шт', 'tax_type_int': 6} for i in range(5)],
+            'payments': [{'payment_type_int': 1, 'payment_sum': decimal.Decimal('500.00')}]}
+    receipt = get_default_receipt_factory().create_receipt(1, 1, data)
+    receipt.id = receipt_id
+    return RegisterReceiptCommand(receipt, event_dispatcher)
+
+
+async def measure_append(directory, serializer, commands, concurrency):
+    journal = FileCommandJournal(directory, serializer, asyncio.get_event_loop())
+    journal.load()
+    queue = list(commands)
+
+    async def client():
+        while queue:
+            await journal.append(queue.pop())
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*[client() for i in range(concurrency)])
+    elapsed = time.perf_counter() - started_at
+    await journal.close()
+    return elapsed
+
+
+def measure_replay(directory, serializer):
+    journal = FileCommandJournal(directory, serializer, asyncio.get_event_loop())
+    started_at = time.perf_counter()
+    commands = journal.load()
+    elapsed = time.perf_counter() - started_at
+    return len(commands), elapsed
+
+
+def print_result(name, count, elapsed):
+    print('{:<32} {:>8} commands {:>10.3f} s {:>12.1f} commands/s {:>10.3f} ms/command'.format(
+        name, count, elapsed, count / elapsed, elapsed * 1000 / count))
+
+
+async def run(commands_count, concurrency):
+    event_dispatcher = NullEventDispatcher()
+    serializer = RegisterReceiptCommandSerializer(event_dispatcher)
+    commands = [create_command(i + 1, event_dispatcher) for i in range(commands_count)]
+
+    started_at = time.perf_counter()
+    for command in commands:
+        serializer.serialize(command)
+    print_result('serialization only', commands_count, time.perf_counter() - started_at)
+
+    for name, clients in (('append, 1 client', 1), ('append, {} clients'.format(concurrency), concurrency)):
+        directory = tempfile.mkdtemp()
+        try:
+            print_result(name, commands_count, await measure_append(directory, serializer, commands, clients))
+            count, elapsed = measure_replay(directory, serializer)
+            print_result('replay', count, elapsed)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Command journal benchmark')
+    parser.add_argument('--commands', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(run(args.commands, args.concurrency))
@@ -0,0 +1,438 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import aiohttp
+
+
+# End-to-end load generator for the receipt API. Clients post receipts to /service_groups/{id}/receipts/ with Basic
+# authentication according to an arrival pattern, then poll every accepted receipt until its state is success or
+# failed. The report contains the accept latency, the time to fiscalization and the throughput per service group.
+#
+# With --boot the tool starts "python -m cr_server" with the test configuration and an empty command journal, logs
+# into the admin app, switches the service groups to the simulated test driver (see hardware.adapters.test) with
+# --devices devices in the pool of every group, grants the user access to the groups and starts the devices.
+#
+# Usage:
+#   python -m benchmarks.load_generator --boot --groups 2,3 --devices 2 --pattern steady --rate 20 --duration 60 \
+#       --latency '{"register_receipt": {"type": "lognormal", "median": 0.8, "sigma": 0.4}}' --per-item-cost 0.02
+#   python -m benchmarks.load_generator --url http://127.0.0.1:8080 --no-setup --pattern replay --replay-file day.csv
+#   python -m benchmarks.load_generator --boot --workers 4 --groups 2,3 --rate 200 --duration 60
+#
+# The replay file has one arrival per line: "offset seconds[,service group id[,receipt lines]]".
+
+
+def percentile(values: list, quantile: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, math.ceil(quantile * len(values)) - 1))]
+
+
+def parse_lines_distribution(value: str) -> list:
+    # "1:0.6,10:0.3,500:0.1" -> [(1, 0.6), (10, 0.3), (500, 0.1)], receipt lines count and its probability weight
+    result = []
+    for item in value.split(','):
+        lines, weight = item.split(':')
+        result.append((int(lines), float(weight)))
+    return result
+
+
+def create_receipt_data(lines_count: int, order_id: int) -> dict:
+    return {'receiptType': 1, 'order_id': str(order_id), 'email': 'load@test.ru',
+            'products': [{'name': 'Товар {}'.format(i), 'quantity': 1, 'price': 100, 'commodity_type_int': 1,
+                          'payment_state_int': 4, 'tax_type_int': 6} for i in range(lines_count)],
+            'payments': [{'payment_type_int': 1, 'payment_sum': 100 * lines_count}]}
+
+
+class Arrival:
+    __slots__ = ('offset', 'service_group_id', 'lines_count')
+
+    def __init__(self, offset: float, service_group_id: int, lines_count: int):
+        self.offset = offset
+        self.service_group_id = service_group_id
+        self.lines_count = lines_count
+
+
+def create_steady_arrivals(rate: float, duration: float, rng: random.Random) -> list:
+    # Poisson arrivals with the given average rate
+    offsets, offset = [], rng.expovariate(rate)
+    while offset < duration:
+        offsets.append(offset)
+        offset += rng.expovariate(rate)
+    return offsets
+
+
+def create_bursty_arrivals(rate: float, duration: float, burst_size: int) -> list:
+    # Bursts of burst_size receipts sent at once, the average rate is the given rate
+    interval = burst_size / rate
+    return [burst * interval for burst in range(int(duration / interval) + 1) if burst * interval < duration
+            for i in range(burst_size)]
+
+
+def create_arrivals(args, service_group_ids: list, rng: random.Random) -> list:
+    lines_distribution = parse_lines_distribution(args.lines)
+    lines_values = [lines for lines, weight in lines_distribution]
+    lines_weights = [weight for lines, weight in lines_distribution]
+
+    def choose_lines():
+        return rng.choices(lines_values, lines_weights)[0]
+
+    if args.pattern == 'replay':
+        arrivals = []
+        with open(args.replay_file, 'r') as file:
+            for line in file:
+                fields = [field.strip() for field in line.split(',')]
+                if not fields[0] or fields[0].startswith('#'):
+                    continue
+                service_group_id = int(fields[1]) if len(fields) > 1 and fields[1] else rng.choice(service_group_ids)
+                lines_count = int(fields[2]) if len(fields) > 2 and fields[2] else choose_lines()
+                arrivals.append(Arrival(float(fields[0]), service_group_id, lines_count))
+        return sorted(arrivals, key=lambda arrival: arrival.offset)
+    arrivals = []
+    for service_group_id in service_group_ids:
+        # The rate is set per service group
+        if args.pattern == 'steady':
+            offsets = create_steady_arrivals(args.rate, args.duration, rng)
+        else:
+            offsets = create_bursty_arrivals(args.rate, args.duration, args.burst_size)
+        arrivals.extend(Arrival(offset, service_group_id, choose_lines()) for offset in offsets)
+    return sorted(arrivals, key=lambda arrival: arrival.offset)
+
+
+class GroupStatistics:
+    def __init__(self):
+        self.sent = 0
+        self.accepted = 0
+        self.rejected = {}  # HTTP status -> count
+        self.errors = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.accept_latencies = []
+        self.fiscalization_times = []
+        self.first_sent_at = None
+        self.last_completed_at = None
+
+    def as_dict(self) -> dict:
+        completed = self.succeeded + self.failed
+        period = (self.last_completed_at - self.first_sent_at) if completed else 0
+
+        def quantiles(values):
+            return {name: percentile(values, quantile) for name, quantile in (('p50', 0.5), ('p95', 0.95),
+                                                                              ('p99', 0.99))}
+        return dict(sent=self.sent, accepted=self.accepted, rejected=self.rejected, errors=self.errors,
+                    succeeded=self.succeeded, failed=self.failed, timed_out=self.timed_out,
+                    accept_latency=quantiles(self.accept_latencies),
+                    time_to_fiscalization=quantiles(self.fiscalization_times),
+                    throughput=completed / period if period > 0 else None)
+
+
+class AdminClient:
+    # Configures the server through the admin app like the admin web pages do: the session cookie and a CSRF token
+    # from a rendered page are sent with every POST request
+    _csrf_pattern = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+    _user_pattern = re.compile(r'id="user-(\d+)"[^>]*>([^<]+)<')
+
+    def __init__(self, session: aiohttp.ClientSession, base_url: str):
+        self._session = session
+        self._base_url = base_url.rstrip('/') + '/admin'
+        self._csrf_token = None
+
+    async def _get_page(self, path: str) -> str:
+        async with self._session.get(self._base_url + path) as response:
+            text = await response.text()
+        match = self._csrf_pattern.search(text)
+        if match:
+            self._csrf_token = match.group(1)
+        return text
+
+    async def _post(self, path: str, data: dict = None, json_data: dict = None):
+        if json_data is not None:
+            request = self._session.post(self._base_url + path, json=dict(json_data, csrf_token=self._csrf_token))
+        else:
+            request = self._session.post(self._base_url + path, data=dict(data, csrf_token=self._csrf_token))
+        async with request as response:
+            text = await response.text()
+            if response.status >= 400:
+                raise RuntimeError('POST {} failed with status {}: {}'.format(path, response.status, text[:300]))
+            if response.content_type == 'application/json':
+                token = json.loads(text).get('csrf_token') if text.startswith('{') else None
+                self._csrf_token = token or self._csrf_token
+
+    async def login(self, login: str, password: str):
+        await self._get_page('/login/')
+        await self._post('/login/', {'login': login, 'password': password})
+
+    async def configure_test_driver(self, service_group_id: int, driver_settings: dict):
+        await self._get_page('/service_groups/{}'.format(service_group_id))
+        data = {'id': str(service_group_id), 'name': 'load {}'.format(service_group_id), 'is_enabled': 'y',
+                'settings-driver-driver_name': 'test'}
+        data.update(driver_settings)
+        await self._post('/service_groups/{}'.format(service_group_id), data)
+
+    async def allow_user(self, service_group_id: int, login: str):
+        page = await self._get_page('/service_groups/{}/allowed_users/'.format(service_group_id))
+        user_ids = [user_id for user_id, user_login in self._user_pattern.findall(page)
+                    if user_login.strip() == login]
+        await self._post('/service_groups/{}/allowed_users/'.format(service_group_id),
+                         json_data={'resource_users': user_ids})
+
+    async def start_device(self, service_group_id: int):
+        await self._post('/service_groups/{}/fiscal_device/'.format(service_group_id), json_data={'state': 'running'})
+
+    async def add_pool_member(self, service_group_id: int, driver_settings: dict):
+        await self._post('/service_groups/{}/fiscal_device/pool/'.format(service_group_id), driver_settings)
+
+
+class LoadGenerator:
+    def __init__(self, base_url: str, auth: aiohttp.BasicAuth, clients: int, poll_interval: float,
+                 completion_timeout: float):
+        self._base_url = base_url.rstrip('/')
+        self._auth = auth
+        self._clients = asyncio.Semaphore(clients)
+        self._poll_interval = poll_interval
+        self._completion_timeout = completion_timeout
+        self.statistics = {}
+        self._order_id = 0
+
+    def _get_statistics(self, service_group_id) -> GroupStatistics:
+        if service_group_id not in self.statistics:
+            self.statistics[service_group_id] = GroupStatistics()
+        return self.statistics[service_group_id]
+
+    async def run(self, arrivals: list):
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(auth=self._auth, connector=connector) as session:
+            started_at = time.perf_counter()
+            tasks = []
+            for arrival in arrivals:
+                delay = started_at + arrival.offset - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.ensure_future(self._send(session, arrival)))
+            await asyncio.gather(*tasks)
+
+    async def _send(self, session: aiohttp.ClientSession, arrival: Arrival):
+        statistics = self._get_statistics(arrival.service_group_id)
+        self._order_id += 1
+        data = create_receipt_data(arrival.lines_count, self._order_id)
+        url = '{}/service_groups/{}/receipts/'.format(self._base_url, arrival.service_group_id)
+        async with self._clients:
+            sent_at = time.perf_counter()
+            if statistics.first_sent_at is None:
+                statistics.first_sent_at = sent_at
+            statistics.sent += 1
+            try:
+                async with session.post(url, json=data) as response:
+                    body = await response.json() if response.status == 200 else None
+                    status = response.status
+            except aiohttp.ClientError:
+                statistics.errors += 1
+                return
+            statistics.accept_latencies.append(time.perf_counter() - sent_at)
+        if status != 200:
+            statistics.rejected[status] = statistics.rejected.get(status, 0) + 1
+            return
+        statistics.accepted += 1
+        await self._wait_completion(session, arrival.service_group_id, body['receipt_id'], sent_at, statistics)
+
+    async def _wait_completion(self, session, service_group_id, receipt_id, sent_at, statistics: GroupStatistics):
+        url = '{}/service_groups/{}/receipts/{}'.format(self._base_url, service_group_id, receipt_id)
+        deadline = sent_at + self._completion_timeout
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(self._poll_interval)
+            try:
+                async with session.get(url) as response:
+                    if response.status != 200:
+                        continue
+                    state = (await response.json()).get('state')
+            except aiohttp.ClientError:
+                continue
+            if state in ('success', 'failed'):
+                completed_at = time.perf_counter()
+                statistics.fiscalization_times.append(completed_at - sent_at)
+                if state == 'success':
+                    statistics.succeeded += 1
+                else:
+                    statistics.failed += 1
+                statistics.last_completed_at = max(statistics.last_completed_at or 0, completed_at)
+                return
+        statistics.timed_out += 1
+
+
+class ServerProcess:
+    # Starts cr_server with the test configuration in a child process, the command journal, the event log, the
+    # projection checkpoint and the receipt id blocks are written to a temporary directory so the commands and the
+    # events of the previous runs are not replayed. With workers > 0 the receipt API is served by the worker processes and the admin app by the
+    # owner process on the next port.
+    def __init__(self, port: int, workers: int = 0):
+        self._port = port
+        self._workers = workers
+        self._process = None
+        self._directory = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self._port)
+
+    @property
+    def admin_url(self):
+        return 'http://127.0.0.1:{}'.format(self._port + 1 if self._workers else self._port)
+
+    async def start(self, timeout: float = 30):
+        self._directory = tempfile.TemporaryDirectory()
+        env = dict(os.environ, CR_SERVER_COMMAND_JOURNAL_DIR=os.path.join(self._directory.name, 'command_journal'),
+                   CR_SERVER_EVENT_LOG_DIR=os.path.join(self._directory.name, 'event_log'),
+                   CR_SERVER_PROJECTION_CHECKPOINT=os.path.join(self._directory.name, 'projection_checkpoint.json'),
+                   CR_SERVER_ID_BLOCK_DIR=os.path.join(self._directory.name, 'id_blocks'))
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        command = [sys.executable, '-m', 'cr_server', '--port', str(self._port), '--configuration', 'test',
+                   '--log-level', 'WARNING', '--log-file', os.path.join(self._directory.name, 'cr_server.log')]
+        if self._workers:
+            command += ['--workers', str(self._workers)]
+        self._process = subprocess.Popen(command, cwd=root, env=env)
+        deadline = time.perf_counter() + timeout
+        async with aiohttp.ClientSession() as session:
+            while time.perf_counter() < deadline:
+                if self._process.poll() is not None:
+                    raise RuntimeError('cr_server exited with code {}'.format(self._process.returncode))
+                try:
+                    async with session.get(self.admin_url + '/admin/login/') as response:
+                        admin_status = response.status
+                    # Any response of the receipt API means that a worker accepts connections
+                    async with session.get(self.url + '/service_groups/'):
+                        pass
+                    if admin_status == 200:
+                        return
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise RuntimeError('cr_server did not start in {} seconds'.format(timeout))
+
+    def stop(self):
+        if self._process and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        if self._directory:
+            self._directory.cleanup()
+
+
+def get_driver_settings(args, serial_number: str) -> dict:
+    settings = {'shift_duration': '86400', 'per_item_cost': str(args.per_item_cost),
+                'failure_rate': str(args.failure_rate), 'hang_rate': str(args.hang_rate),
+                'hang_duration': str(args.hang_duration), 'serial_number': serial_number}
+    if args.latency:
+        settings['latency'] = args.latency
+    return settings
+
+
+async def set_up_server(base_url: str, args, service_group_ids: list):
+    # The cookie jar must accept cookies of the servers addressed by IP
+    async with aiohttp.ClientSession(cookie_jar=aiohttp.CookieJar(unsafe=True)) as session:
+        admin = AdminClient(session, base_url)
+        await admin.login(args.login, args.password)
+        for service_group_id in service_group_ids:
+            await admin.configure_test_driver(service_group_id,
+                                              get_driver_settings(args, 'LOAD-{}-0'.format(service_group_id)))
+            await admin.allow_user(service_group_id, args.login)
+            await admin.start_device(service_group_id)
+            for device_number in range(1, args.devices):
+                await admin.add_pool_member(service_group_id, get_driver_settings(
+                    args, 'LOAD-{}-{}'.format(service_group_id, device_number)))
+
+
+def print_report(statistics: dict, file=sys.stderr):
+    def format_seconds(value):
+        return '{:.3f}'.format(value) if value is not None else '-'
+
+    print('{:>6} {:>7} {:>8} {:>8} {:>7} {:>7} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8} {:>9}'.format(
+        'group', 'sent', 'accepted', 'rejected', 'success', 'failed', 'acc p50', 'acc p99', 'fisc p50', 'fisc p95',
+        'fisc p99', 'timeout', 'rcpt/s'), file=file)
+    for service_group_id, group_statistics in sorted(statistics.items()):
+        data = group_statistics.as_dict()
+        print('{:>6} {:>7} {:>8} {:>8} {:>7} {:>7} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8} {:>9}'.format(
+            service_group_id, data['sent'], data['accepted'], sum(data['rejected'].values()), data['succeeded'],
+            data['failed'], format_seconds(data['accept_latency']['p50']),
+            format_seconds(data['accept_latency']['p99']), format_seconds(data['time_to_fiscalization']['p50']),
+            format_seconds(data['time_to_fiscalization']['p95']),
+            format_seconds(data['time_to_fiscalization']['p99']), data['timed_out'],
+            '{:.2f}'.format(data['throughput']) if data['throughput'] else '-'), file=file)
+
+
+async def run(args) -> dict:
+    service_group_ids = [int(item) for item in args.groups.split(',')]
+    server = ServerProcess(args.port, args.workers) if args.boot else None
+    try:
+        if server:
+            await server.start()
+        base_url = server.url if server else args.url
+        if not args.no_setup:
+            await set_up_server(server.admin_url if server else args.admin_url or base_url, args, service_group_ids)
+        arrivals = create_arrivals(args, service_group_ids, random.Random(args.seed))
+        generator = LoadGenerator(base_url, aiohttp.BasicAuth(args.login, args.password), args.clients,
+                                  args.poll_interval, args.completion_timeout)
+        await generator.run(arrivals)
+    finally:
+        if server:
+            server.stop()
+    print_report(generator.statistics)
+    return {str(service_group_id): group_statistics.as_dict()
+            for service_group_id, group_statistics in generator.statistics.items()}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Receipt API load generator')
+    parser.add_argument('--url', default='http://127.0.0.1:8080', help='the server URL if --boot is not used')
+    parser.add_argument('--boot', action='store_true', help='start cr_server with the test configuration')
+    parser.add_argument('--port', type=int, default=8089, help='the port of the server started with --boot')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='HTTP worker processes of the server started with --boot (cr_server --workers)')
+    parser.add_argument('--admin-url', help='the admin app URL of a server with workers if --boot is not used')
+    parser.add_argument('--no-setup', action='store_true',
+                        help='use the service groups as they are configured on the server')
+    parser.add_argument('--login', default='admin')
+    parser.add_argument('--password', default='admin')
+    parser.add_argument('--groups', default='2,3', help='comma separated service group ids')
+    parser.add_argument('--devices', type=int, default=1, help='simulated devices in the pool of every group')
+    parser.add_argument('--latency', help='the test driver latency settings, JSON')
+    parser.add_argument('--per-item-cost', type=float, default=0)
+    parser.add_argument('--failure-rate', type=float, default=0)
+    parser.add_argument('--hang-rate', type=float, default=0)
+    parser.add_argument('--hang-duration', type=float, default=30)
+    parser.add_argument('--pattern', choices=('steady', 'bursty', 'replay'), default='steady')
+    parser.add_argument('--rate', type=float, default=10, help='receipts per second per group')
+    parser.add_argument('--duration', type=float, default=30, help='seconds')
+    parser.add_argument('--burst-size', type=int, default=50)
+    parser.add_argument('--replay-file')
+    parser.add_argument('--lines', default='1:0.6,10:0.35,500:0.05',
+                        help='receipt lines count distribution, "lines:weight" pairs')
+    parser.add_argument('--clients', type=int, default=50, help='concurrent HTTP clients')
+    parser.add_argument('--poll-interval', type=float, default=0.2)
+    parser.add_argument('--completion-timeout', type=float, default=120)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--output', help='write the report to this JSON file')
+    args = parser.parse_args(argv)
+    if args.pattern == 'replay' and not args.replay_file:
+        parser.error('--replay-file is required for the replay pattern')
+    return args
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    report = asyncio.get_event_loop().run_until_complete(run(arguments))
+    if arguments.output:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
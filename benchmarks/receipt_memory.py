@@ -0,0 +1,83 @@
+import argparse
+import gc
+import json
+import sys
+import tracemalloc
+from unittest.mock import Mock
+from receipt.commands import RegisterReceiptCommand
+from receipt.domain.factories import get_default_receipt_factory
+from receipt.serializers import receipt_validator
+from hardware.schedulers import FairCommandScheduler
+from hardware.fiscal_device_group_managers import QueuedCommand
+from .harness import get_environment, save_results, load_results
+from .receipt_path import create_request_data
+
+
+# Memory retained by receipts waiting in a device command queue. Receipts are created from request data the same way
+# the receipt API does it, wrapped in registration commands and put into the scheduler queue; the memory allocated
+# while the queue is filled and still alive afterwards is measured with tracemalloc.
+# Usage: python -m benchmarks.receipt_memory --output results.json
+#        python -m benchmarks.receipt_memory --baseline results.json --threshold 0.1  (exit code 1 on regressions)
+
+RECEIPT_SIZES = (('small', 1), ('typical', 10), ('wholesale', 100), ('large', 500))
+
+
+def measure(lines_count: int, receipts_count: int) -> dict:
+    receipt_data = receipt_validator.validate(create_request_data(lines_count))[0]
+    receipt_factory = get_default_receipt_factory()
+    event_dispatcher = Mock()
+    queue = FairCommandScheduler()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        started_at = tracemalloc.take_snapshot()
+        for i in range(receipts_count):
+            receipt = receipt_factory.create_receipt(1, 1, receipt_data)
+            receipt.id = i + 1
+            queue.put_nowait(QueuedCommand(RegisterReceiptCommand(receipt, event_dispatcher), 0.0))
+        gc.collect()
+        retained = sum(item.size_diff for item in tracemalloc.take_snapshot().compare_to(started_at, 'filename'))
+    finally:
+        tracemalloc.stop()
+    return dict(lines=lines_count, receipts=receipts_count, bytes_per_receipt=retained / receipts_count,
+                bytes_per_line=retained / receipts_count / lines_count)
+
+
+def run(receipts_count: int) -> dict:
+    results = {}
+    for size_name, lines_count in RECEIPT_SIZES:
+        # The number of receipts is limited for big receipts to keep the run short
+        results[size_name] = measure(lines_count, max(1, min(receipts_count, receipts_count * 10 // lines_count)))
+        print('{:<12} {:>12.0f} bytes per receipt {:>10.0f} bytes per line'.format(
+            size_name, results[size_name]['bytes_per_receipt'], results[size_name]['bytes_per_line']), file=sys.stderr)
+    return {'environment': get_environment(), 'results': results}
+
+
+def main(args) -> int:
+    results = run(args.receipts)
+    if args.output:
+        save_results(results, args.output)
+    else:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    if args.baseline:
+        is_regression = False
+        for size_name, baseline_result in load_results(args.baseline)['results'].items():
+            result = results['results'].get(size_name)
+            if not result:
+                continue
+            change = result['bytes_per_receipt'] / baseline_result['bytes_per_receipt'] - 1
+            is_regression = is_regression or change > args.threshold
+            print('{:<12} {:>+8.1%}{}'.format(size_name, change, ' REGRESSION' if change > args.threshold else ''),
+                  file=sys.stderr)
+        return 1 if is_regression else 0
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Memory retained by queued receipts')
+    parser.add_argument('--receipts', type=int, default=200, help='number of queued receipts of every size')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare the results with this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative growth which is reported as a regression (default 0.1)')
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,83 @@
+import argparse
+import sys
+from receipt.serializers import ReceiptSerializer, receipt_validator
+from receipt.domain.factories import get_default_receipt_factory
+from receipt.events import ReceiptCreated
+from receipt.receipt_read import InMemoryReceiptRepository
+from receipt.receipt_read.event_handlers import ReceiptCreatedHandler
+from hardware.adapters.atol.adapter import AtlCashRegister
+from hardware.adapters.base import DefaultTimeCounter
+from core.events import EventDispatcher
+from core.events.event_storages import InMemoryEventStorage
+from .atol_registration import SimulatedDriver
+from .harness import BenchmarkCase, add_arguments, main
+
+
+# Per-receipt CPU cost of every stage of the receipt registration path, for receipts of 1, 10 and 500 lines.
+# The device driver is a stub without latency, so the Atol cases measure only the adapter overhead.
+# Usage: python -m benchmarks.receipt_path --output results.json
+#        python -m benchmarks.receipt_path --baseline results.json --threshold 0.1  (exit code 1 on regressions)
+
+RECEIPT_SIZES = (('small', 1), ('typical', 10), ('large', 500))
+
+
+def create_request_data(lines_count: int) -> dict:
+    # Receipt data as it is decoded from the request JSON
+    return {'receiptType': 1, 'order_id': '1543', 'email': 'ivan@mail.ru',
+            'products': [{'name': 'Товар {}'.format(i), 'quantity': 1.5, 'price': 100.35, 'commodity_type_int': 1,
+                          'payment_state_int': 4, 'quantity_prec': 1, 'quantity_unit': 'кг', 'tax_type_int': 6}
+                         for i in range(lines_count)],
+            'payments': [{'payment_type_int': 1, 'payment_sum': 150.53 * lines_count}]}
+
+
+def create_cases(size_name: str, lines_count: int) -> list:
+    request_data = create_request_data(lines_count)
+    serializer = ReceiptSerializer.from_json(request_data)
+    serializer.validate()
+    receipt_data = serializer.data
+    receipt_factory = get_default_receipt_factory()
+    receipt = receipt_factory.create_receipt(1, 1, receipt_data)
+    receipt.id = 1
+    event = ReceiptCreated(receipt)
+
+    dispatcher_state = {}
+
+    def reset_dispatcher():
+        # The in-memory storages grow with every event, they are recreated before every batch
+        event_dispatcher = EventDispatcher(InMemoryEventStorage())
+        ReceiptCreatedHandler(InMemoryReceiptRepository()).subscribe(event_dispatcher)
+        dispatcher_state['dispatcher'] = event_dispatcher
+
+    async def handle_event():
+        await dispatcher_state['dispatcher'].handle(event)
+
+    def validate():
+        ReceiptSerializer.from_json(request_data).validate()
+
+    classic_register = AtlCashRegister(SimulatedDriver(0, 0), DefaultTimeCounter(),
+                                       registration_mode=AtlCashRegister.REGISTRATION_MODE_CLASSIC)
+    json_register = AtlCashRegister(SimulatedDriver(0, 0), DefaultTimeCounter())
+    params = dict(stage=None, receipt_size=size_name, lines=lines_count)
+    stages = (('serializer_validation', validate, None),
+              ('compiled_validation', lambda: receipt_validator.validate(request_data), None),
+              ('receipt_factory', lambda: receipt_factory.create_receipt(1, 1, receipt_data), None),
+              ('receipt_as_dict', receipt.as_dict, None),
+              ('receipt_created_event', lambda: ReceiptCreated(receipt), None),
+              ('event_dispatcher_handle', handle_event, reset_dispatcher),
+              ('atol_register_classic', lambda: classic_register._register_receipt(receipt), None),
+              ('atol_register_json', lambda: json_register._register_receipt_json(receipt), None))
+    return [BenchmarkCase('{}/{}'.format(stage, size_name), func, setup, **dict(params, stage=stage))
+            for stage, func, setup in stages]
+
+
+def get_cases() -> list:
+    cases = []
+    for size_name, lines_count in RECEIPT_SIZES:
+        cases.extend(create_cases(size_name, lines_count))
+    return cases
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Receipt registration path microbenchmarks')
+    add_arguments(parser)
+    sys.exit(main(get_cases(), parser.parse_args()))
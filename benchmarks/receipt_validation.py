@@ -0,0 +1,40 @@
+import argparse
+import sys
+from receipt.serializers import ReceiptSerializer, receipt_validator
+from .harness import BenchmarkCase, add_arguments, main
+from .receipt_path import create_request_data
+
+
+# Receipt request validation throughput: the WTForms serializer against the compiled validator, for receipts of
+# 1, 20 and 500 lines.
+# Usage: python -m benchmarks.receipt_validation --output results.json
+
+RECEIPT_SIZES = (('small', 1), ('typical', 20), ('large', 500))
+
+
+def validate_with_form(request_data):
+    form = ReceiptSerializer.from_json(request_data)
+    form.validate()
+    return form.data, form.errors
+
+
+def create_cases(size_name: str, lines_count: int) -> list:
+    request_data = create_request_data(lines_count)
+    params = dict(receipt_size=size_name, lines=lines_count)
+    return [BenchmarkCase('form_validation/{}'.format(size_name), lambda: validate_with_form(request_data),
+                          validator='form', **params),
+            BenchmarkCase('compiled_validation/{}'.format(size_name), lambda: receipt_validator.validate(request_data),
+                          validator='compiled', **params)]
+
+
+def get_cases() -> list:
+    cases = []
+    for size_name, lines_count in RECEIPT_SIZES:
+        cases.extend(create_cases(size_name, lines_count))
+    return cases
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Receipt request validation microbenchmarks')
+    add_arguments(parser)
+    sys.exit(main(get_cases(), parser.parse_args()))
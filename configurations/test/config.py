@@ -1,3 +1,43 @@
+import os
+
 AUTH_ENCRYPTION_SALT = 'gfdgdhgh543534gsgs'
 SESSION_SECRET = b'5265AeC4dE7348d2BDfCc6DDEbDBfD10'
-ADMIN_USER = {'login': 'admin', 'email': 'test@cr_server_test.py', 'password': 'admin', 'info':'', 'is_active': True}
\ No newline at end of file
+ADMIN_USER = {'login': 'admin', 'email': 'test@cr_server_test.py', 'password': 'admin', 'info':'', 'is_active': True}
+# Write-behind buffer of the receipt read model: receipts written together and the flush delay in seconds
+RECEIPT_READ_MAX_BUFFER_SIZE = 500
+RECEIPT_READ_FLUSH_INTERVAL = 0.1
+RECEIPT_DOCUMENT_CACHE_SIZE = 10000  # serialized receipt documents kept for polling clients
+# Receipt notifications: retained per service group for resuming, buffered per connection, heartbeat in seconds
+RECEIPT_NOTIFICATION_HISTORY_SIZE = 1000
+RECEIPT_NOTIFICATION_BUFFER_SIZE = 100
+RECEIPT_NOTIFICATION_HEARTBEAT = 15
+# Webhook delivery of receipt results: batch window and backoff in seconds
+WEBHOOK_BATCH_WINDOW = 0.5
+WEBHOOK_MAX_BATCH_SIZE = 100
+WEBHOOK_MAX_CONCURRENCY = 4
+WEBHOOK_MAX_ATTEMPTS = 5
+WEBHOOK_BACKOFF = 1.0
+# Queued event dispatch: tasks per event handler, events queued per task, 'wait' or 'drop' when a queue is full
+EVENT_DISPATCH_WORKERS = 4
+EVENT_QUEUE_SIZE = 1000
+EVENT_QUEUE_OVERFLOW = 'wait'
+RECEIPT_BULK_MAX_SIZE = 1000  # receipts in one bulk request
+RECEIPT_BULK_MAX_BODY_SIZE = 16 * 1024 * 1024
+COMMAND_JOURNAL_DIR = os.environ.get('CR_SERVER_COMMAND_JOURNAL_DIR', 'command_journal')  # device command journals
+# Event log: segment size and total size in bytes, events older than EVENT_LOG_MAX_AGE seconds are removed
+EVENT_LOG_DIR = os.environ.get('CR_SERVER_EVENT_LOG_DIR', 'event_log')
+EVENT_LOG_SEGMENT_SIZE = 64 * 1024 * 1024
+EVENT_LOG_MAX_SIZE = 1024 * 1024 * 1024
+EVENT_LOG_MAX_AGE = 30 * 24 * 3600
+# Verified API credentials: cached Authorization headers and their lifetime in seconds
+CREDENTIAL_CACHE_SIZE = 10000
+CREDENTIAL_CACHE_TTL = 60.0
+# Enabled flags of the service groups checked by the receipt polls: cached groups and their lifetime in seconds
+SERVICE_GROUP_STATE_CACHE_SIZE = 1000
+SERVICE_GROUP_STATE_TTL = 5.0
+PROJECTION_CHECKPOINT_PATH = os.environ.get('CR_SERVER_PROJECTION_CHECKPOINT', 'projection_checkpoint.json')
+# Receipt ids are reserved by the server processes in blocks which last about RECEIPT_ID_BLOCK_DURATION seconds
+ID_BLOCK_DIR = os.environ.get('CR_SERVER_ID_BLOCK_DIR', 'id_blocks')
+RECEIPT_ID_MIN_BLOCK_SIZE = 10
+RECEIPT_ID_MAX_BLOCK_SIZE = 100000
+RECEIPT_ID_BLOCK_DURATION = 10.0
@@ -2,20 +2,27 @@ from asyncio import get_event_loop
 from aiohttp_security.session_identity import SessionIdentityPolicy
 from aiohttp_session.cookie_storage import EncryptedCookieStorage
 from dependency_injector import containers, providers
-from access_control.auth import UserManagementService, UserInMemoryRepository, AuthService, EncryptionService
+from access_control.auth import (UserManagementService, UserInMemoryRepository, AuthService, EncryptionService,
+                                 CredentialCache)
 from access_control.services import AccessAdministrationService
 from access_control.authorization_policies import AbacAuthorizationPolicy
 from access_control.abac.pbp import AsyncPDB
 from access_control.abac.storages.in_memory.storages import InMemoryStorage
 from hardware.fiscal_device_group_managers import DeviceGroupManager
+from hardware.journals import FileCommandJournalFactory
 from hardware import DefaultFiscalDeviceCreationService
-from apps.service_group.facades import FiscalServiceGroupFacade
+from apps.service_group import FiscalServiceGroupFacade, ServiceGroupStateCache
 from apps.service_group.storages.in_memory import ServiceGroupInMemoryStorage
-from receipt.receipt_read import InMemoryReceiptRepository
+from apps.service_group.webhooks import ServiceGroupWebhookEndpointProvider
+from receipt.receipt_read import (InMemoryReceiptRepository, WriteBehindReceiptRepository, ReceiptDocumentCache,
+                                  ReceiptNotificationHub, ProjectionLagMonitor, FileCheckpointStorage)
 from receipt.services import ReceiptProcessingService
+from receipt.commands import RegisterReceiptCommandSerializer
 from receipt.registrator_info_storages import InMemoryRegistratorInfoStorage
-from core.events import EventDispatcher
-from core.events.event_storages import InMemoryEventStorage
+from receipt.webhooks import WebhookDispatcher, InMemoryDeadLetterStorage
+from core.events import QueuedEventDispatcher
+from core.id_allocators import BlockIdAllocator, FileIdBlockStorage
+from core.events.event_storages import FileEventStorage
 from .config import *
 
 
@@ -34,12 +41,17 @@ async def admin_app_context(app):
 class MainContainer(containers.DeclarativeContainer):
     loop = providers.Singleton(get_event_loop)
     service_group_storage = providers.Singleton(ServiceGroupInMemoryStorage)
-    service_group_facade = providers.Singleton(FiscalServiceGroupFacade, service_group_storage)
+    service_group_state_cache = providers.Singleton(ServiceGroupStateCache, SERVICE_GROUP_STATE_CACHE_SIZE,
+                                                    SERVICE_GROUP_STATE_TTL)
+    service_group_facade = providers.Singleton(FiscalServiceGroupFacade, service_group_storage,
+                                               service_group_state_cache)
 
     user_repository = providers.Singleton(UserInMemoryRepository)
     abac_storage = providers.Singleton(InMemoryStorage)
     encryption_service = providers.Singleton(EncryptionService, AUTH_ENCRYPTION_SALT)
-    users_management_service = providers.Singleton(UserManagementService, user_repository, encryption_service)
+    credential_cache = providers.Singleton(CredentialCache, CREDENTIAL_CACHE_SIZE, CREDENTIAL_CACHE_TTL)
+    users_management_service = providers.Singleton(UserManagementService, user_repository, encryption_service,
+                                                   credential_cache)
     authentication_service = providers.Singleton(AuthService, user_repository, encryption_service)
     pdp = providers.Singleton(AsyncPDB, abac_storage)
     authorization_policy = providers.Singleton(AbacAuthorizationPolicy, pdp, authentication_service)
@@ -50,13 +62,43 @@ class MainContainer(containers.DeclarativeContainer):
 
     session_storage = providers.Singleton(EncryptedCookieStorage, SESSION_SECRET,  cookie_name="SSID")
 
-    receipt_read_repository = providers.Singleton(InMemoryReceiptRepository)
-    device_group_manager = providers.Singleton(DeviceGroupManager, 'f_devices', loop)
-    event_storage = providers.Singleton(InMemoryEventStorage)
-    event_dispatcher = providers.Singleton(EventDispatcher, event_storage)
+    receipt_read_storage = providers.Singleton(InMemoryReceiptRepository)
+    receipt_read_repository = providers.Singleton(WriteBehindReceiptRepository, receipt_read_storage, loop,
+                                                  RECEIPT_READ_MAX_BUFFER_SIZE, RECEIPT_READ_FLUSH_INTERVAL)
+    id_block_storage = providers.Singleton(FileIdBlockStorage, ID_BLOCK_DIR, loop)
+    receipt_id_allocator = providers.Singleton(BlockIdAllocator, id_block_storage, 'receipt', loop,
+                                               min_block_size=RECEIPT_ID_MIN_BLOCK_SIZE,
+                                               max_block_size=RECEIPT_ID_MAX_BLOCK_SIZE,
+                                               block_duration=RECEIPT_ID_BLOCK_DURATION)
+    receipt_document_cache = providers.Singleton(ReceiptDocumentCache, RECEIPT_DOCUMENT_CACHE_SIZE)
+    projection_monitor = providers.Singleton(ProjectionLagMonitor)
+    projection_checkpoint_storage = providers.Singleton(FileCheckpointStorage, PROJECTION_CHECKPOINT_PATH)
+    receipt_notification_hub = providers.Singleton(ReceiptNotificationHub, RECEIPT_NOTIFICATION_HISTORY_SIZE,
+                                                   RECEIPT_NOTIFICATION_BUFFER_SIZE)
+    receipt_notification_heartbeat = providers.Object(RECEIPT_NOTIFICATION_HEARTBEAT)
+    receipt_bulk_max_size = providers.Object(RECEIPT_BULK_MAX_SIZE)
+    receipt_bulk_max_body_size = providers.Object(RECEIPT_BULK_MAX_BODY_SIZE)
+    webhook_endpoint_provider = providers.Singleton(ServiceGroupWebhookEndpointProvider, service_group_facade)
+    webhook_dead_letter_storage = providers.Singleton(InMemoryDeadLetterStorage)
+    webhook_dispatcher = providers.Singleton(WebhookDispatcher, webhook_endpoint_provider, webhook_dead_letter_storage,
+                                             loop, batch_window=WEBHOOK_BATCH_WINDOW,
+                                             max_batch_size=WEBHOOK_MAX_BATCH_SIZE,
+                                             max_concurrency=WEBHOOK_MAX_CONCURRENCY,
+                                             max_attempts=WEBHOOK_MAX_ATTEMPTS, backoff=WEBHOOK_BACKOFF)
+    event_storage = providers.Singleton(FileEventStorage, EVENT_LOG_DIR, loop, segment_size=EVENT_LOG_SEGMENT_SIZE,
+                                        max_age=EVENT_LOG_MAX_AGE, max_size=EVENT_LOG_MAX_SIZE)
+    event_dispatcher = providers.Singleton(QueuedEventDispatcher, event_storage, loop, EVENT_DISPATCH_WORKERS,
+                                           EVENT_QUEUE_SIZE, EVENT_QUEUE_OVERFLOW)
+    command_serializer = providers.Singleton(RegisterReceiptCommandSerializer, event_dispatcher)
+    command_journal_factory = providers.Singleton(FileCommandJournalFactory, COMMAND_JOURNAL_DIR, command_serializer,
+                                                  loop)
+    device_group_manager = providers.Singleton(DeviceGroupManager, 'f_devices', loop, command_journal_factory)
     receipt_processing_service = providers.Singleton(ReceiptProcessingService, device_group_manager, event_dispatcher)
 
     registrator_info_storage = providers.Singleton(InMemoryRegistratorInfoStorage)
     device_creation_service = providers.Singleton(DefaultFiscalDeviceCreationService, loop, registrator_info_storage)
 
-    admin_app_context=admin_app_context
\ No newline at end of file
+    admin_app_context=admin_app_context
+    # The in-memory storages live in the owner process when the server is started with --workers
+    shared_objects = ('service_group_storage', 'user_repository', 'abac_storage', 'receipt_read_storage',
+                      'registrator_info_storage')
@@ -6,11 +6,29 @@ class ExecutionFailedError(Exception):
     pass
 
 
+class CommandPriority:
+    # Priority classes of commands, the lower value is the more urgent class
+    HIGH = 1
+    NORMAL = 5
+    LOW = 9
+
+    names = {'high': HIGH, 'normal': NORMAL, 'low': LOW}
+
+    @classmethod
+    def get_name(cls, priority: int) -> str:
+        for name, value in cls.names.items():
+            if value == priority:
+                return name
+        return str(priority)
+
+
 class AbstractCommand(ABC):
-    user_id: int
+    user_id: int = None
     _income_data_id: int
     datetime: datetime.datetime
     _priority: int
+    # True if the priority class was chosen by the caller, otherwise the scheduler may apply the user default class
+    is_priority_requested = False
 
     @property
     def priority(self):
@@ -42,4 +60,24 @@ class AbstractCommand(ABC):
 class AbstractInvoker(ABC):
     @abstractmethod
     def put(self, command: AbstractCommand):
-        pass
\ No newline at end of file
+        pass
+
+    @abstractmethod
+    def start(self):
+        pass
+
+    @abstractmethod
+    async def stop(self):
+        pass
+
+
+class AbstractCommandSerializer(ABC):
+    # Converts commands to JSON compatible dictionaries (see core.serialization) and back, it is used to store
+    # the queued commands
+    @abstractmethod
+    def serialize(self, command: AbstractCommand) -> dict:
+        pass
+
+    @abstractmethod
+    def deserialize(self, data: dict) -> AbstractCommand:
+        pass
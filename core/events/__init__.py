@@ -1,4 +1,5 @@
 from core.events.events import Event
-from core.events.event_dispatchers import AbstractEventDispatcher, EventDispatcher
+from core.events.event_dispatchers import (AbstractEventDispatcher, EventDispatcher, QueuedEventDispatcher,
+                                          OVERFLOW_WAIT, OVERFLOW_DROP)
 from core.events.event_storages import AbstractEventStorage
 
@@ -1,6 +1,9 @@
+import asyncio
+import time
 from abc import ABC, abstractmethod
 from core.events.event_storages import AbstractEventStorage
 from core.events.events import AbstractEventHandler
+from core.metrics import HistogramSet
 from logging import getLogger
 
 logger = getLogger(__name__)
@@ -19,6 +22,10 @@ class AbstractEventDispatcher(ABC):
     async def handle(self, command):
         pass
 
+    async def close(self):
+        # Finishes the handling of the dispatched events before the server stops
+        pass
+
 
 class EventDispatcher(AbstractEventDispatcher):
     def __init__(self, event_storage: AbstractEventStorage):
@@ -41,6 +48,9 @@ class EventDispatcher(AbstractEventDispatcher):
             return
         return subscribers[subscriber]
 
+    async def close(self):
+        await self._event_storage.close()
+
     async def handle(self, event):
         logger.debug('%s handled by %s', str(event), str(self))
 
@@ -53,3 +63,116 @@ class EventDispatcher(AbstractEventDispatcher):
             except Exception as e:
                 logger.error('Error during handling the event %s, by the handler %s: %s', str(event), str(subscriber),
                              str(e))
+
+
+OVERFLOW_WAIT = 'wait'
+OVERFLOW_DROP = 'drop'
+
+
+class QueuedEventDispatcher(EventDispatcher):
+    # The event is written to the event storage and handed to the subscribers without waiting for them: every
+    # subscriber has `workers` bounded queues served by one task each. The events of one entity always go to the same
+    # queue, so they are handled in order, while the events of different entities are handled concurrently.
+    # A subscriber with the attribute synchronous = True is awaited inline as by EventDispatcher, e.g. the read model
+    # which must contain the receipt when its location is returned to the client.
+    # When a queue is full the caller waits for it (OVERFLOW_WAIT) or the event is not delivered to the subscriber
+    # (OVERFLOW_DROP). After close() the events are handled inline.
+    # statistics contains the histogram of the time from the dispatch to the end of handling for each subscriber.
+    def __init__(self, event_storage: AbstractEventStorage, loop: asyncio.AbstractEventLoop = None, workers: int = 4,
+                 max_queue_size: int = 1000, overflow: str = OVERFLOW_WAIT, time_counter=time.monotonic):
+        if overflow not in (OVERFLOW_WAIT, OVERFLOW_DROP):
+            raise ValueError('Unknown overflow behaviour: {}'.format(overflow))
+        super().__init__(event_storage)
+        self._loop = loop or asyncio.get_event_loop()
+        self._workers = workers
+        self._max_queue_size = max_queue_size
+        self._overflow = overflow
+        self._time_counter = time_counter
+        self._queues = dict()  # subscriber -> list of queues
+        self._tasks = dict()  # queue -> the task serving the queue
+        self._is_closed = False
+        self.statistics = HistogramSet()
+        self.dropped_count = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(queue.qsize() for queues in self._queues.values() for queue in queues)
+
+    async def handle(self, event):
+        logger.debug('%s handled by %s', str(event), str(self))
+
+        await self._event_storage.add(event)
+        for subscriber in self._event_subscribers.get(type(event), ()):
+            if self._is_closed or getattr(subscriber, 'synchronous', False) is True:
+                await self._handle_by(subscriber, event)
+            else:
+                await self._enqueue(subscriber, event)
+
+    async def _handle_by(self, subscriber, event):
+        try:
+            await subscriber.handle(event)
+        except Exception as e:
+            logger.error('Error during handling the event %s, by the handler %s: %s', str(event), str(subscriber),
+                         str(e))
+
+    async def _enqueue(self, subscriber, event):
+        queues = self._queues.get(subscriber)
+        if queues is None:
+            queues = self._queues[subscriber] = self._start_workers(subscriber)
+        queue = queues[hash((event.entity, event.entity_id)) % len(queues)]
+        if queue.full() and self._overflow == OVERFLOW_DROP:
+            self.dropped_count += 1
+            logger.warning('The event queue of the handler %s is full, the event %s is dropped', str(subscriber),
+                           str(event))
+            return
+        await queue.put((self._time_counter(), event))
+
+    def _start_workers(self, subscriber) -> list:
+        queues = []
+        for i in range(self._workers):
+            queue = asyncio.Queue(self._max_queue_size, loop=self._loop)
+            self._tasks[queue] = self._loop.create_task(self._work(subscriber, queue))
+            queues.append(queue)
+        return queues
+
+    async def _work(self, subscriber, queue: asyncio.Queue):
+        histogram = self.statistics.get_histogram(type(subscriber).__name__)
+        while True:
+            dispatched_at, event = await queue.get()
+            try:
+                await subscriber.handle(event)
+            except Exception as e:
+                histogram.observe(self._time_counter() - dispatched_at, 'exception')
+                logger.error('Error during handling the event %s, by the handler %s: %s', str(event), str(subscriber),
+                             str(e))
+            else:
+                histogram.observe(self._time_counter() - dispatched_at)
+            finally:
+                queue.task_done()
+
+    async def join(self):
+        # Waits until the queued events are handled
+        await asyncio.gather(*(queue.join() for queues in list(self._queues.values()) for queue in queues))
+
+    async def close(self):
+        self._is_closed = True
+        await asyncio.gather(*(self._drain(subscriber, queue) for subscriber, queues in list(self._queues.items())
+                               for queue in queues))
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks = dict()
+        self._queues = dict()
+        await super().close()
+
+    async def _drain(self, subscriber, queue: asyncio.Queue):
+        # Waits until the task of the queue handles the queued events. The task can be already cancelled (web.run_app
+        # cancels all the tasks during the cleanup of the app), then the events left in the queue are handled inline.
+        task = self._tasks[queue]
+        join = self._loop.create_task(queue.join())
+        await asyncio.wait([join, task], return_when=asyncio.FIRST_COMPLETED)
+        while not join.done() and not queue.empty():
+            dispatched_at, event = queue.get_nowait()
+            await self._handle_by(subscriber, event)
+            queue.task_done()
+        await join
@@ -1,5 +1,18 @@
+import asyncio
+import bisect
+import collections
+import datetime
+import heapq
+import itertools
+import mmap
+import os
 from abc import ABC, abstractmethod
-from core.events.events import Event
+from logging import getLogger
+from core.events.events import Event, get_timestamp
+from core.serialization import dumps, loads
+
+
+logger = getLogger(__name__)
 
 
 class AbstractEventStorage(ABC):
@@ -15,18 +28,358 @@ class AbstractEventStorage(ABC):
     async def get_last_record(self):
         pass
 
+    async def read(self, position=None, count: int = 1000) -> tuple:
+        # Reads the stored events in the order of writing: returns (events, position of the next event), the position
+        # None is the beginning of the storage. The position can be saved as JSON to continue reading later.
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
 
 class InMemoryEventStorage(AbstractEventStorage):
-    def __init__(self):
-        self._events = []
+    # max_size limits the kept events, the oldest events are removed
+    def __init__(self, max_size: int = None):
+        self._events = collections.deque(maxlen=max_size)
+        self._added_count = 0
 
     async def add(self, event: Event):
         self._events.append(event)
+        self._added_count += 1
+
+    async def read(self, position=None, count: int = 1000) -> tuple:
+        # The position is the number of the events added before
+        first_position = self._added_count - len(self._events)
+        start = max(position or 0, first_position)
+        events = list(itertools.islice(self._events, start - first_position, start - first_position + count))
+        return events, start + len(events)
+
+    async def get_last_record(self):
+        return self._events[-1] if self._events else None
+
+    async def get_by_time(self, datetime_start, datetime_finish, event_types: list = None):
+        return [event for event in self._events if datetime_start <= event.date_time <= datetime_finish and
+                (not event_types or type(event) in event_types)]
+
+
+def _get_type_name(event_type: type) -> str:
+    return '{}.{}'.format(event_type.__module__, event_type.__qualname__)
+
+
+class StoredEvent(Event):
+    # The event of a type which is not imported by the process
+    def __init__(self, event_type: str):
+        self.event_type = event_type
+
+
+class _Segment:
+    __slots__ = ('number', 'path', 'keys', 'offsets', 'size', 'first_key', 'last_key', 'last_offset',
+                 'indexed_offset')
+
+    def __init__(self, number: int, path: str):
+        self.number = number
+        self.path = path
+        self.keys = []  # the sparse index: the key of the record -> its offset
+        self.offsets = []
+        self.size = 0
+        self.first_key = None
+        self.last_key = None
+        self.last_offset = None
+        self.indexed_offset = None
+
+    def add_record(self, key: float, offset: int, length: int, index_interval: int):
+        if self.indexed_offset is None or offset - self.indexed_offset >= index_interval:
+            self.keys.append(key)
+            self.offsets.append(offset)
+            self.indexed_offset = offset
+        if self.first_key is None:
+            self.first_key = key
+        self.last_key = key
+        self.last_offset = offset
+        self.size = offset + length
+
+    def get_offset(self, key: float) -> int:
+        # Offset of the last indexed record with a lesser key, the previous records are skipped
+        position = bisect.bisect_left(self.keys, key) - 1
+        return self.offsets[position] if position >= 0 else 0
+
+
+class FileEventStorage(AbstractEventStorage):
+    # Append-only event log in segment files with one JSON record per line:
+    # {"k":<key>,"e":"<module>.<event class>","t":<date and time>,"n":<entity>,"i":<entity id>,"u":<user id>,
+    # "c":<client id>,"d":<data>}.
+    # The key is the POSIX time of the event, but not less than the key of the previous record, so the keys of
+    # a segment are sorted even if the events are written not exactly in the order of their time. Every segment keeps
+    # in memory a sparse index with the key and the offset of a record per index_interval bytes, get_by_time finds the
+    # first record with the binary search and reads the memory-mapped segment from there. Records are read until the
+    # key exceeds the finish by max_delay seconds, the events written later than that are not found.
+    # A new segment is created when the current one exceeds segment_size. Closed segments are removed when their
+    # last event is older than max_age seconds or when the log is larger than max_size bytes.
+    # The records are written to the file without fsync, the log is not used to recover the state of the devices.
+    _segment_suffix = '.events'
+
+    def __init__(self, directory: str, loop: asyncio.AbstractEventLoop = None, segment_size: int = 64 * 1024 * 1024,
+                 index_interval: int = 64 * 1024, max_age: float = None, max_size: int = None,
+                 max_delay: float = 1.0):
+        self._directory = directory
+        self._loop = loop or asyncio.get_event_loop()
+        self._segment_size = segment_size
+        self._index_interval = index_interval
+        self._max_age = max_age
+        self._max_size = max_size
+        self._max_delay = max_delay
+        self._segments = []
+        self._file = None
+        self._last_key = None
+        self._event_types = {}
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    def _get_segment_path(self, segment: int) -> str:
+        return os.path.join(self._directory, '{:010d}{}'.format(segment, self._segment_suffix))
+
+    def open(self):
+        os.makedirs(self._directory, exist_ok=True)
+        numbers = sorted(int(name[:-len(self._segment_suffix)]) for name in os.listdir(self._directory)
+                         if name.endswith(self._segment_suffix) and name[:-len(self._segment_suffix)].isdigit())
+        self._segments = [self._load_segment(number) for number in numbers]
+        for segment in self._segments:
+            if segment.last_key is not None:
+                self._last_key = segment.last_key
+        if not self._segments or self._segments[-1].size >= self._segment_size:
+            number = numbers[-1] + 1 if numbers else 1
+            self._segments.append(_Segment(number, self._get_segment_path(number)))
+        self._file = open(self._segments[-1].path, 'ab')
+        self._apply_retention()
+
+    def _load_segment(self, number: int) -> _Segment:
+        segment = _Segment(number, self._get_segment_path(number))
+        for offset, line in self._read_lines(segment.path, 0):
+            try:
+                key = loads(line)['k']
+            except (ValueError, KeyError, TypeError):
+                # The record which was not written completely when the process was stopped
+                logger.warning('The broken record was skipped in the event log %s', segment.path)
+                continue
+            segment.add_record(key, offset, len(line), self._index_interval)
+        size = os.path.getsize(segment.path)
+        if size != segment.size:
+            # The broken record at the end is cut off, the next record starts on a new line
+            with open(segment.path, 'r+b') as file:
+                file.truncate(segment.size)
+        return segment
+
+    @staticmethod
+    def _read_lines(path: str, offset: int, size: int = None):
+        with open(path, 'rb') as file:
+            if size is None:
+                size = os.fstat(file.fileno()).st_size
+            if size <= offset:
+                return
+            with mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ) as data:
+                while offset < size:
+                    end = data.find(b'\n', offset, size)
+                    if end == -1:
+                        return
+                    yield offset, data[offset:end + 1]
+                    offset = end + 1
+
+    def _serialize(self, event: Event) -> tuple:
+        key = get_timestamp(event.date_time)
+        if self._last_key is not None and key < self._last_key:
+            key = self._last_key
+        record = {'k': key, 'e': _get_type_name(type(event)), 't': event.date_time, 'n': event.entity,
+                  'i': event.entity_id, 'u': event.user_id, 'c': event.client_id, 'd': event.data}
+        return key, (dumps(record) + '\n').encode()
+
+    def _deserialize(self, record: dict) -> Event:
+        event_type = self._get_event_type(record['e'])
+        if event_type is None:
+            event = StoredEvent(record['e'])
+        else:
+            # The event is restored without calling the constructor, which takes the domain objects
+            event = event_type.__new__(event_type)
+        event._date_time = record['t']
+        event._entity = record['n']
+        event._entity_id = record['i']
+        event._user_id = record['u']
+        event._client_id = record['c']
+        event._data = record['d']
+        return event
+
+    def _get_event_type(self, name: str):
+        if name not in self._event_types:
+            self._event_types.clear()
+            event_types = [Event]
+            while event_types:
+                for event_type in event_types.pop().__subclasses__():
+                    self._event_types[_get_type_name(event_type)] = event_type
+                    event_types.append(event_type)
+        return self._event_types.get(name)
+
+    async def add(self, event: Event):
+        if self._file is None:
+            self.open()
+        try:
+            key, line = self._serialize(event)
+        except TypeError as e:
+            logger.error('The event %s is not written to the event log: %s', str(event), str(e))
+            return
+        segment = self._segments[-1]
+        offset = segment.size
+        self._file.write(line)
+        # The record is visible to the readers of the file
+        self._file.flush()
+        segment.add_record(key, offset, len(line), self._index_interval)
+        self._last_key = key
+        if segment.size >= self._segment_size:
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        number = self._segments[-1].number + 1
+        self._segments.append(_Segment(number, self._get_segment_path(number)))
+        self._file = open(self._segments[-1].path, 'ab')
+        self._apply_retention()
+
+    def _apply_retention(self):
+        closed_segments = self._segments[:-1]
+        removed = 0
+        if self._max_age is not None:
+            min_key = get_timestamp(datetime.datetime.utcnow()) - self._max_age
+            while removed < len(closed_segments) and (closed_segments[removed].last_key is None or
+                                                      closed_segments[removed].last_key < min_key):
+                removed += 1
+        if self._max_size is not None:
+            size = sum(segment.size for segment in self._segments[removed:])
+            while removed < len(closed_segments) and size > self._max_size:
+                size -= closed_segments[removed].size
+                removed += 1
+        for segment in closed_segments[:removed]:
+            # The file which is read at the moment is removed after the reader closes it
+            os.remove(segment.path)
+        del self._segments[:removed]
+
+    async def get_last_record(self):
+        if self._file is None:
+            self.open()
+        for segment in reversed(self._segments):
+            if segment.last_offset is not None:
+                for offset, line in self._read_lines(segment.path, segment.last_offset, segment.size):
+                    return self._deserialize(loads(line))
+        return None
+
+    async def get_by_time(self, datetime_start, datetime_finish, event_types: list = None):
+        if self._file is None:
+            self.open()
+        start, finish = get_timestamp(datetime_start), get_timestamp(datetime_finish)
+        # The sizes are taken in the event loop, the records written later are not read
+        segments = [(segment.path, segment.get_offset(start), segment.size) for segment in self._segments
+                    if segment.last_key is not None and segment.last_key >= start and
+                    segment.first_key <= finish + self._max_delay]
+        type_names = {_get_type_name(event_type) for event_type in event_types} if event_types else None
+        return await self._loop.run_in_executor(None, self._read_events, segments, datetime_start, datetime_finish,
+                                                finish + self._max_delay, type_names)
+
+    async def read(self, position=None, count: int = 1000) -> tuple:
+        # The position is [segment number, offset of the record]. The events of the segments removed by the retention
+        # are skipped.
+        if self._file is None:
+            self.open()
+        number, offset = position or (0, 0)
+        segments = []
+        for segment in self._segments:
+            if segment.number > number:
+                segments.append((segment.number, segment.path, 0, segment.size))
+            elif segment.number == number and offset < segment.size:
+                segments.append((segment.number, segment.path, offset, segment.size))
+        return await self._loop.run_in_executor(None, self._read_records, segments, [number, offset], count)
+
+    def _read_records(self, segments: list, position: list, count: int) -> tuple:
+        events = []
+        for number, path, offset, size in segments:
+            try:
+                for offset, line in self._read_lines(path, offset, size):
+                    events.append(self._deserialize(loads(line)))
+                    position = [number, offset + len(line)]
+                    if len(events) == count:
+                        return events, position
+            except FileNotFoundError:
+                continue
+        return events, position
+
+    def _read_events(self, segments: list, datetime_start, datetime_finish, max_key: float, type_names: set) -> list:
+        events = []
+        for path, offset, size in segments:
+            try:
+                for offset, line in self._read_lines(path, offset, size):
+                    record = loads(line)
+                    if record['k'] > max_key:
+                        break
+                    if type_names is not None and record['e'] not in type_names:
+                        continue
+                    if datetime_start <= record['t'] <= datetime_finish:
+                        events.append(self._deserialize(record))
+            except FileNotFoundError:
+                # The segment was removed by the retention
+                continue
+        return events
+
+    async def close(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+
+class MergedEventStorage(AbstractEventStorage):
+    # Reads several event logs as one, e.g. the logs of the server worker processes. The storages are given by name,
+    # the position is {storage name: position in the storage}. A position which is not a dict is the position of the
+    # first storage, so a checkpoint saved while there was one log is continued. read merges the events of the logs by
+    # their time, the events of every log stay in the order of writing.
+    def __init__(self, storages: dict):
+        self._storages = storages
+
+    async def add(self, event: Event):
+        raise NotImplementedError('The events are added to one of the merged storages')
+
+    async def read(self, position=None, count: int = 1000) -> tuple:
+        if position is not None and not isinstance(position, dict):
+            position = {next(iter(self._storages)): position}
+        positions = dict(position or {})
+        parts = []
+        for name, storage in self._storages.items():
+            events, next_position = await storage.read(positions.get(name), count)
+            parts.append((name, events, next_position))
+        merged = heapq.merge(*([(name, event) for event in events] for name, events, next_position in parts),
+                             key=lambda item: get_timestamp(item[1].date_time))
+        events = []
+        used_counts = dict.fromkeys(self._storages, 0)
+        for name, event in itertools.islice(merged, count):
+            events.append(event)
+            used_counts[name] += 1
+        for name, storage_events, next_position in parts:
+            if used_counts[name] == len(storage_events):
+                positions[name] = next_position
+            elif used_counts[name]:
+                # The position after the used events is found by reading them again
+                positions[name] = (await self._storages[name].read(positions.get(name), used_counts[name]))[1]
+        return events, positions
 
     async def get_last_record(self):
-        return self._events[-1]
+        records = [record for record in [await storage.get_last_record() for storage in self._storages.values()]
+                   if record is not None]
+        return max(records, key=lambda record: get_timestamp(record.date_time)) if records else None
 
     async def get_by_time(self, datetime_start, datetime_finish, event_types: list = None):
-        type_compare = lambda event: type(event) in event_types if event_types else True
-        date_compare = lambda event, start, finish: type_compare(event) if start<= event._datetime<=finish else False
-        return list(filter(date_compare, self._events))
\ No newline at end of file
+        events = []
+        for storage in self._storages.values():
+            events.extend(await storage.get_by_time(datetime_start, datetime_finish, event_types))
+        return sorted(events, key=lambda event: get_timestamp(event.date_time))
+
+    async def close(self):
+        for storage in self._storages.values():
+            await storage.close()
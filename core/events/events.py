@@ -3,7 +3,7 @@ import datetime
 
 
 class Event(ABC):
-    _datetime: datetime.datetime
+    _date_time: datetime.datetime
     _entity: str
     _data: dict
     _entity_id: int
@@ -22,13 +22,17 @@ class Event(ABC):
     def entity_id(self):
         return self._entity_id
 
+    @property
+    def client_id(self):
+        return self._client_id
+
     @property
     def user_id(self):
         return self._user_id
 
     @property
     def date_time(self):
-        return self._datetime
+        return self._date_time
 
 
 class AbstractEventHandler(ABC):
@@ -41,7 +45,11 @@ class AbstractEventHandler(ABC):
         pass
 
 
+_EPOCH = datetime.datetime(1970, 1, 1)
 
 
-
-
+def get_timestamp(value: datetime.datetime) -> float:
+    # The naive date and time of the events is UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH).total_seconds()
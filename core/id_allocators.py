@@ -0,0 +1,161 @@
+import asyncio
+import collections
+import fcntl
+import os
+import time
+from abc import ABC, abstractmethod
+from logging import getLogger
+from pymongo import ReturnDocument
+
+
+logger = getLogger(__name__)
+
+
+class AbstractIdBlockStorage(ABC):
+    # Shared counters of the issued ids, every process reserves blocks of ids from the storage
+    @abstractmethod
+    async def reserve(self, name: str, count: int, minimum: int = 0) -> int:
+        # Reserves count ids following the ids reserved before and greater than minimum, returns the first one
+        pass
+
+
+class InMemoryIdBlockStorage(AbstractIdBlockStorage):
+    # For one process
+    def __init__(self):
+        self._values = {}
+
+    async def reserve(self, name: str, count: int, minimum: int = 0) -> int:
+        value = max(self._values.get(name, 0), minimum)
+        self._values[name] = value + count
+        return value + 1
+
+
+class FileIdBlockStorage(AbstractIdBlockStorage):
+    # For the processes of one host: the last reserved id is kept in the file <directory>/<name>.id, the file is
+    # locked while the value is changed. The value is written in place with a fixed width, so the file never
+    # contains a partially written number.
+    _width = 20
+
+    def __init__(self, directory: str, loop: asyncio.AbstractEventLoop = None):
+        self._directory = directory
+        self._loop = loop or asyncio.get_event_loop()
+
+    async def reserve(self, name: str, count: int, minimum: int = 0) -> int:
+        # The lock may wait for other processes, so the file is changed in the executor
+        return await self._loop.run_in_executor(None, self._reserve, os.path.join(self._directory, name + '.id'),
+                                                count, minimum)
+
+    def _reserve(self, path: str, count: int, minimum: int) -> int:
+        os.makedirs(self._directory, exist_ok=True)
+        descriptor = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(descriptor, fcntl.LOCK_EX)
+            data = os.pread(descriptor, self._width, 0).strip()
+            value = max(int(data) if data else 0, minimum)
+            os.pwrite(descriptor, '{:0{}d}'.format(value + count, self._width).encode(), 0)
+            os.fsync(descriptor)
+        finally:
+            # Closing the file releases the lock
+            os.close(descriptor)
+        return value + 1
+
+
+class MongoIdBlockStorage(AbstractIdBlockStorage):
+    # For the processes of several hosts: the counters are documents {_id: name, value: last reserved id}, a block is
+    # reserved by one atomic findAndModify with $inc
+    def __init__(self, database):
+        self._collection = database.id_blocks
+
+    async def reserve(self, name: str, count: int, minimum: int = 0) -> int:
+        if minimum:
+            await self._collection.update_one({'_id': name}, {'$max': {'value': minimum}}, upsert=True)
+        document = await self._collection.find_one_and_update({'_id': name}, {'$inc': {'value': count}}, upsert=True,
+                                                               return_document=ReturnDocument.AFTER)
+        return document['value'] - count + 1
+
+
+class BlockIdAllocator:
+    # Issues ids from blocks reserved in the storage (hi/lo), so the processes which share the storage never issue
+    # the same id and an allocation usually doesn't leave the process. The next block is reserved in the background
+    # when less than prefetch_ratio of a block is left. The block size follows the allocation rate: a block lasts
+    # about block_duration seconds, within min_block_size and max_block_size. The ids of the blocks which are not
+    # used up before the process stops are skipped.
+    def __init__(self, storage: AbstractIdBlockStorage, name: str, loop: asyncio.AbstractEventLoop = None,
+                 min_block_size: int = 10, max_block_size: int = 100000, block_duration: float = 10.0,
+                 prefetch_ratio: float = 0.25, time_counter=time.monotonic):
+        self._storage = storage
+        self._name = name
+        self._loop = loop or asyncio.get_event_loop()
+        self._min_block_size = min_block_size
+        self._max_block_size = max_block_size
+        self._block_duration = block_duration
+        self._prefetch_ratio = prefetch_ratio
+        self._time_counter = time_counter
+        self._blocks = collections.deque()  # ranges of the reserved ids
+        self._available_count = 0
+        self._minimum = 0
+        self._block_size = min_block_size
+        self._rate_started_at = None
+        self._allocated_count = 0  # since _rate_started_at
+        self._reserve_task = None
+        self.reserved_blocks_count = 0
+
+    def set_minimum(self, value: int):
+        # The ids up to the value were issued before the storage was used, e.g. the last id of the read model
+        self._minimum = value
+
+    async def allocate(self, count: int = 1) -> list:
+        while self._available_count < count:
+            await self._wait_for_block(count - self._available_count)
+        ids = []
+        while len(ids) < count:
+            block = self._blocks[0]
+            taken = block[:count - len(ids)]
+            ids.extend(taken)
+            if len(taken) < len(block):
+                self._blocks[0] = block[len(taken):]
+            else:
+                self._blocks.popleft()
+        self._available_count -= count
+        self._allocated_count += count
+        if self._available_count < self._block_size * self._prefetch_ratio and self._reserve_task is None:
+            self._start_reserve(self._get_block_size())
+        return ids
+
+    def _get_block_size(self) -> int:
+        now = self._time_counter()
+        if self._rate_started_at is not None and now > self._rate_started_at:
+            rate = self._allocated_count / (now - self._rate_started_at)
+            self._block_size = round(min(max(rate * self._block_duration, self._min_block_size),
+                                         self._max_block_size))
+        self._rate_started_at = now
+        self._allocated_count = 0
+        return self._block_size
+
+    async def _wait_for_block(self, count: int):
+        if self._reserve_task is None:
+            self._start_reserve(max(count, self._get_block_size()))
+        # The waiters don't cancel the reservation which is shared by them
+        await asyncio.shield(self._reserve_task)
+
+    def _start_reserve(self, size: int):
+        self._reserve_task = self._loop.create_task(self._reserve(size))
+        self._reserve_task.add_done_callback(self._on_reserved)
+
+    async def _reserve(self, size: int):
+        first_id = await self._storage.reserve(self._name, size, self._minimum)
+        self._blocks.append(range(first_id, first_id + size))
+        self._available_count += size
+        self.reserved_blocks_count += 1
+
+    def _on_reserved(self, task: asyncio.Task):
+        if self._reserve_task is task:
+            self._reserve_task = None
+        if not task.cancelled() and task.exception() is not None:
+            # The reservation is retried by the next allocation
+            logger.error('Unable to reserve the block of %s ids: %s', self._name, str(task.exception()))
+
+    async def close(self):
+        if self._reserve_task is not None:
+            self._reserve_task.cancel()
+            await asyncio.gather(self._reserve_task, return_exceptions=True)
@@ -0,0 +1,308 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import itertools
+import os
+import pickle
+import struct
+from logging import getLogger
+
+
+logger = getLogger(__name__)
+
+# Local IPC between the processes of one server. A message is a pickled tuple prefixed with its length:
+#   ('call', call id, object name, method name, args, kwargs) - calls a method of an object of the server process
+#   ('result', call id, value), ('error', call id, exception) - the result of the call
+#   ('push', topic, payload) - a message of the server process which is not a result of a call
+# Only the processes of the server connect to the Unix socket, the socket file is accessible only to its user.
+
+_HEADER = struct.Struct('>I')
+
+# The connection of the client which made the call, it is set while the method of the object is called
+current_connection = contextvars.ContextVar('ipc_connection', default=None)
+
+
+class RemoteCallError(Exception):
+    # The call failed with an exception which can not be passed to the client
+    pass
+
+
+def pack_message(message) -> bytes:
+    data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    return _HEADER.pack(len(data)) + data
+
+
+async def read_message(reader: asyncio.StreamReader):
+    length, = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return pickle.loads(await reader.readexactly(length))
+
+
+def _get_transferable_error(error: Exception) -> Exception:
+    try:
+        pickle.loads(pickle.dumps(error, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return RemoteCallError('{}: {}'.format(type(error).__name__, error))
+    return error
+
+
+class IpcConnection:
+    def __init__(self, connection_id: int, writer: asyncio.StreamWriter):
+        self.id = connection_id
+        self._writer = writer
+
+    @property
+    def is_closed(self) -> bool:
+        return self._writer.is_closing()
+
+    def write(self, data: bytes):
+        # The data is buffered by the transport, the peers are local and read all messages without a delay
+        if not self.is_closed:
+            self._writer.write(data)
+
+    def send(self, message):
+        self.write(pack_message(message))
+
+    def push(self, topic: str, payload):
+        self.send(('push', topic, payload))
+
+    def close(self):
+        self._writer.close()
+
+
+class IpcServer:
+    # Serves the calls of the objects registered by name. Coroutine methods are awaited, the items of async generator
+    # methods are returned as a list. The callbacks of on_connected and on_disconnected are called with the
+    # IpcConnection.
+    def __init__(self, path: str, objects: dict = None, loop: asyncio.AbstractEventLoop = None):
+        self._path = path
+        self._objects = dict(objects or {})
+        self._loop = loop or asyncio.get_event_loop()
+        self.on_connected = []
+        self.on_disconnected = []
+        self._connections = {}
+        self._connection_ids = itertools.count(1)
+        self._tasks = set()
+        self._server = None
+        self._is_closing = False
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def connections(self) -> list:
+        return list(self._connections.values())
+
+    def register(self, name: str, obj):
+        self._objects[name] = obj
+
+    async def start(self):
+        self._is_closing = False
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        self._server = await asyncio.start_unix_server(self._serve, self._path)
+        os.chmod(self._path, 0o600)
+
+    def broadcast(self, topic: str, payload):
+        data = pack_message(('push', topic, payload))
+        for connection in self.connections:
+            connection.write(data)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if self._is_closing:
+            # The connection was accepted before the server was closed
+            writer.close()
+            return
+        connection = IpcConnection(next(self._connection_ids), writer)
+        self._connections[connection.id] = connection
+        for callback in self.on_connected:
+            callback(connection)
+        try:
+            while True:
+                kind, call_id, name, method, args, kwargs = await read_message(reader)
+                # The calls are handled concurrently, a slow call does not delay the others
+                task = self._loop.create_task(self._handle_call(connection, call_id, name, method, args, kwargs))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error('The IPC connection %d is closed: %s', connection.id, str(e))
+        finally:
+            del self._connections[connection.id]
+            writer.close()
+            for callback in self.on_disconnected:
+                callback(connection)
+
+    async def _handle_call(self, connection: IpcConnection, call_id: int, name: str, method: str, args, kwargs):
+        current_connection.set(connection)
+        try:
+            result = getattr(self._objects[name], method)(*args, **kwargs)
+            if inspect.isasyncgen(result):
+                result = [item async for item in result]
+            elif inspect.isawaitable(result):
+                result = await result
+            message = ('result', call_id, result)
+        except Exception as e:
+            message = ('error', call_id, _get_transferable_error(e))
+        try:
+            connection.send(message)
+        except Exception as e:
+            # The result can not be pickled
+            connection.send(('error', call_id, RemoteCallError('{}: {}'.format(type(e).__name__, e))))
+
+    async def close(self):
+        # The server waits for the connections to be closed
+        self._is_closing = True
+        for connection in self.connections:
+            connection.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+
+
+class IpcClient:
+    # Calls the objects of the server process. on_push is called with the topic and the payload of the messages pushed
+    # by the server, on_disconnected is called when the server closes the connection.
+    def __init__(self, path: str, loop: asyncio.AbstractEventLoop = None, on_push=None, on_disconnected=None):
+        self._path = path
+        self._loop = loop or asyncio.get_event_loop()
+        self.on_push = on_push
+        self.on_disconnected = on_disconnected
+        self._call_ids = itertools.count(1)
+        self._calls = {}
+        self._writer = None
+        self._read_task = None
+
+    @property
+    def is_connected(self) -> bool:
+        return self._writer is not None
+
+    async def connect(self, timeout: float = 10.0, retry_interval: float = 0.1):
+        # The server process may be still starting, the connection is retried until the timeout
+        deadline = self._loop.time() + timeout
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self._path)
+                break
+            except (FileNotFoundError, ConnectionError):
+                if self._loop.time() >= deadline:
+                    raise
+                await asyncio.sleep(retry_interval)
+        self._writer = writer
+        self._read_task = self._loop.create_task(self._read(reader))
+
+    async def call(self, name: str, method: str, *args, **kwargs):
+        if self._writer is None:
+            raise ConnectionError('There is not a connection to the IPC server {}'.format(self._path))
+        call_id = next(self._call_ids)
+        future = self._calls[call_id] = self._loop.create_future()
+        try:
+            self._writer.write(pack_message(('call', call_id, name, method, args, kwargs)))
+        except Exception:
+            del self._calls[call_id]
+            raise
+        return await future
+
+    async def _read(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                message = await read_message(reader)
+                if message[0] == 'push':
+                    if self.on_push:
+                        self.on_push(message[1], message[2])
+                    continue
+                kind, call_id, value = message
+                future = self._calls.pop(call_id, None)
+                if future is None or future.done():
+                    continue
+                if kind == 'result':
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error('The IPC connection to %s is closed: %s', self._path, str(e))
+        finally:
+            self._disconnect()
+
+    def _disconnect(self):
+        if self._writer is None:
+            return
+        self._writer.close()
+        self._writer = None
+        calls, self._calls = self._calls, {}
+        for future in calls.values():
+            if not future.done():
+                future.set_exception(ConnectionError('The connection to the IPC server is lost'))
+        if self.on_disconnected:
+            self.on_disconnected()
+
+    async def close(self):
+        on_disconnected, self.on_disconnected = self.on_disconnected, None
+        if self._read_task is not None:
+            self._read_task.cancel()
+            try:
+                await self._read_task
+            except asyncio.CancelledError:
+                pass
+            self._read_task = None
+        self._disconnect()
+        self.on_disconnected = on_disconnected
+
+
+class _RemoteCall:
+    # The call is sent when it is awaited, "async for" iterates the items returned by an async generator method
+    __slots__ = ('_client', '_name', '_method', '_args', '_kwargs')
+
+    def __init__(self, client: IpcClient, name: str, method: str, *args, **kwargs):
+        self._client = client
+        self._name = name
+        self._method = method
+        self._args = args
+        self._kwargs = kwargs
+
+    def __await__(self):
+        return self._client.call(self._name, self._method, *self._args, **self._kwargs).__await__()
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for item in await self:
+            yield item
+
+
+class IpcObjectProxy:
+    # An object of the server process: its coroutine and async generator methods are called remotely, other methods
+    # of object_type are called locally with the proxy as self, so they must not use the state of the object
+    def __init__(self, client: IpcClient, name: str, object_type: type):
+        self._client = client
+        self._name = name
+        self._object_type = object_type
+
+    @property
+    def __class__(self):
+        # isinstance checks of the object type pass as for the mock objects with spec
+        return self._object_type
+
+    def __getattr__(self, attribute: str):
+        if attribute.startswith('_'):
+            raise AttributeError(attribute)
+        method = getattr(self._object_type, attribute)
+        if inspect.iscoroutinefunction(method) or inspect.isasyncgenfunction(method):
+            return functools.partial(_RemoteCall, self._client, self._name, attribute)
+        if callable(method):
+            return method.__get__(self, self._object_type)
+        raise AttributeError('{} is not a method of {}'.format(attribute, self._object_type.__name__))
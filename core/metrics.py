@@ -0,0 +1,107 @@
+import bisect
+import math
+
+
+# Lightweight metrics which are cheap enough to be updated on every device driver call. Values are updated from the
+# device executor thread without locks: each histogram has a single writer (the device thread), readers may observe
+# a value which lags behind by one call.
+
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ('_buckets', '_counts', 'count', 'sum', 'max', 'errors')
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self._buckets = tuple(buckets)
+        self._counts = [0] * (len(self._buckets) + 1)  # the last counter is the +Inf bucket
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.errors = {}  # error code -> count
+
+    def observe(self, value: float, error_code=None):
+        self._counts[bisect.bisect_left(self._buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+        if error_code is not None:
+            self.errors[error_code] = self.errors.get(error_code, 0) + 1
+
+    @property
+    def errors_count(self) -> int:
+        return sum(self.errors.values())
+
+    def get_cumulative_counts(self) -> list:
+        # (upper bound, number of observations less or equal to the bound) pairs, the last bound is +Inf
+        result, total = [], 0
+        for bound, count in zip(self._buckets + (math.inf,), self._counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def get_quantile(self, quantile: float) -> float:
+        # The upper bound of the bucket which contains the quantile, the maximum value for the +Inf bucket
+        if not self.count:
+            return 0.0
+        rank = quantile * self.count
+        for bound, count in self.get_cumulative_counts():
+            if count >= rank:
+                return bound if bound != math.inf else self.max
+        return self.max
+
+    def as_dict(self):
+        return dict(count=self.count, sum=self.sum, max=self.max, average=self.sum / self.count if self.count else 0.0,
+                    p50=self.get_quantile(0.5), p95=self.get_quantile(0.95), p99=self.get_quantile(0.99),
+                    errors={str(code): count for code, count in self.errors.items()},
+                    buckets=[[str(bound), count] for bound, count in self.get_cumulative_counts()])
+
+
+class HistogramSet:
+    # Histograms of one metric keyed by the operation name, a histogram is created on the first observation
+    __slots__ = ('_histograms', '_buckets')
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self._histograms = {}
+        self._buckets = buckets
+
+    def get_histogram(self, operation: str) -> Histogram:
+        histogram = self._histograms.get(operation)
+        if histogram is None:
+            histogram = self._histograms[operation] = Histogram(self._buckets)
+        return histogram
+
+    def items(self):
+        return list(self._histograms.items())
+
+    def as_dict(self):
+        return {operation: histogram.as_dict() for operation, histogram in self.items()}
+
+
+def _format_labels(labels: dict) -> str:
+    return ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                    for name, value in labels.items())
+
+
+def render_prometheus(metric_name: str, description: str, histogram_sets) -> str:
+    # Renders histograms in the Prometheus text exposition format. histogram_sets is an iterable of
+    # (labels dict, HistogramSet) pairs, the operation name is added to the labels as the "operation" label.
+    lines = ['# HELP {} {}'.format(metric_name, description), '# TYPE {} histogram'.format(metric_name)]
+    errors_lines = []
+    for labels, histogram_set in histogram_sets:
+        for operation, histogram in histogram_set.items():
+            operation_labels = dict(labels, operation=operation)
+            label_str = _format_labels(operation_labels)
+            for bound, count in histogram.get_cumulative_counts():
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(metric_name, label_str,
+                                                                '+Inf' if bound == math.inf else bound, count))
+            lines.append('{}_sum{{{}}} {}'.format(metric_name, label_str, histogram.sum))
+            lines.append('{}_count{{{}}} {}'.format(metric_name, label_str, histogram.count))
+            for code, count in histogram.errors.items():
+                errors_lines.append('{}_errors_total{{{}}} {}'.format(
+                    metric_name, _format_labels(dict(operation_labels, code=code)), count))
+    if errors_lines:
+        lines.append('# TYPE {}_errors_total counter'.format(metric_name))
+        lines.extend(errors_lines)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,39 @@
+import datetime
+import decimal
+import json
+
+
+# JSON encoding which keeps Decimal, date and datetime values. Such values are written as one key objects
+# {"$decimal": "10.50"}, {"$date": "2020-01-31"}, {"$datetime": "2020-01-31T10:00:00"} and restored on decoding.
+
+
+def _encode_value(value):
+    if isinstance(value, decimal.Decimal):
+        return {'$decimal': str(value)}
+    if isinstance(value, datetime.datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'$date': value.isoformat()}
+    raise TypeError('The value of type {} is not JSON serializable'.format(type(value).__name__))
+
+
+_decoders = {'$decimal': decimal.Decimal,
+             '$datetime': datetime.datetime.fromisoformat,
+             '$date': datetime.date.fromisoformat}
+
+
+def _decode_object(obj: dict):
+    if len(obj) == 1:
+        key, value = next(iter(obj.items()))
+        decoder = _decoders.get(key)
+        if decoder:
+            return decoder(value)
+    return obj
+
+
+def dumps(obj) -> str:
+    return json.dumps(obj, default=_encode_value, ensure_ascii=False, separators=(',', ':'))
+
+
+def loads(data):
+    return json.loads(data, object_hook=_decode_object)
@@ -1,33 +1,41 @@
+import argparse
+import asyncio
 from aiohttp import web
 import logging
-from apps.service_group import create_app as create_service_group_app
-from apps.admin import create_app as create_admin_app
 from core.loaders import DefaultModuleLoader
 from .settings import CONFIGURATION, HOST
+from .workers import create_admin, create_service_group, run_owner, run_worker, serve
 
 
-logging.basicConfig(filename="log.log", level=logging.DEBUG)
+def parse_args():
+    parser = argparse.ArgumentParser(prog='cr_server')
+    parser.add_argument('--host', default=HOST['host'])
+    parser.add_argument('--port', type=int, default=HOST['port'])
+    parser.add_argument('--configuration', default=CONFIGURATION, help='the configurations package module name')
+    parser.add_argument('--log-file', default='log.log')
+    parser.add_argument('--log-level', default='DEBUG')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='HTTP worker processes sharing the port, 0 - the server works in one process')
+    parser.add_argument('--admin-port', type=int, help='the port of the admin app with --workers, port + 1 by default')
+    # Used by the owner process to start the workers
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--ipc-path', help=argparse.SUPPRESS)
+    parser.add_argument('--event-log-dir', help=argparse.SUPPRESS)
+    return parser.parse_args()
 
 
 if __name__ == '__main__':
-    container = DefaultModuleLoader().load('configurations', CONFIGURATION)  # Dependency injection container
-    app = web.Application(loop=container.loop())
-    admin_app = create_admin_app(container.device_group_manager(),  container.service_group_facade(),
-                                 container.users_management_service(),
-                                 container.access_administration_service(),
-                                 container.authentication_service(),
-                                 container.authorization_policy(),  container.identity_policy(),
-                                 container.device_creation_service(),
-                                 session_storage= container.session_storage())
-    admin_app.cleanup_ctx.append(container.admin_app_context)
-    app.add_subapp('/admin/', admin_app)
-    service_group_app = create_service_group_app(container.authentication_service(),
-                                                 container.authorization_policy(),
-                                                 container.receipt_read_repository(),
-                                                 container.receipt_processing_service(),
-                                                 container.service_group_facade(),
-                                                 container.registrator_info_storage(),
-                                                 container.device_group_manager(),
-                                                 container.event_dispatcher())
-    app.add_subapp('/service_groups/', service_group_app)
-    web.run_app(app, **HOST)
+    args = parse_args()
+    logging.basicConfig(filename=args.log_file, level=args.log_level.upper())
+    container = DefaultModuleLoader().load('configurations', args.configuration)  # Dependency injection container
+    if args.worker:
+        run_worker(container, args)
+    elif args.workers > 0:
+        run_owner(container, args)
+    else:
+        loop = container.loop()
+        app = web.Application(loop=loop)
+        app.add_subapp('/admin/', create_admin(container, container.projection_monitor(), container.credential_cache()))
+        app.add_subapp('/service_groups/', create_service_group(container))
+        # web.run_app would cancel the tasks of the event dispatcher before the queued events are handled
+        serve(app, loop, args.host, args.port, asyncio.Event())
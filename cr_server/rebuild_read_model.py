@@ -0,0 +1,74 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from core.events.event_storages import FileEventStorage, MergedEventStorage
+from core.loaders import DefaultModuleLoader
+from receipt.receipt_read import ProjectionRebuilder, ProjectionRebuildError
+from .settings import CONFIGURATION
+from .workers import WORKER_EVENT_LOG_PREFIX
+
+
+# Rebuilds the receipt read model from the event log, e.g. after the receipt collection is lost or the document
+# schema is changed. The rebuild continues from the checkpoint of the previous run unless --reset is given.
+# The logs of the worker processes of python -m cr_server --workers N are replayed together with the event log, the
+# checkpoint keeps the position of every log.
+# Usage: python -m cr_server.rebuild_read_model --workers 8 --batch-size 1000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='cr_server.rebuild_read_model')
+    parser.add_argument('--configuration', default=CONFIGURATION, help='the configurations package module name')
+    parser.add_argument('--workers', type=int, default=4, help='receipts are applied by this number of tasks')
+    parser.add_argument('--batch-size', type=int, default=1000, help='events replayed between the checkpoints')
+    parser.add_argument('--reset', action='store_true', help='replay the event log from the beginning')
+    parser.add_argument('--log-file', default=None)
+    parser.add_argument('--log-level', default='INFO')
+    return parser.parse_args()
+
+
+def get_event_storage(container):
+    event_storage = container.event_storage()
+    directory = getattr(event_storage, 'directory', None)
+    if directory is None or not os.path.isdir(directory):
+        return event_storage
+    names = sorted((name for name in os.listdir(directory) if name.startswith(WORKER_EVENT_LOG_PREFIX) and
+                    os.path.isdir(os.path.join(directory, name))), key=lambda name: (len(name), name))
+    if not names:
+        return event_storage
+    storages = {'.': event_storage}
+    for name in names:
+        storages[name] = FileEventStorage(os.path.join(directory, name), container.loop())
+    return MergedEventStorage(storages)
+
+
+async def rebuild(container, workers: int, batch_size: int, reset: bool):
+    event_storage = get_event_storage(container)
+    rebuilder = ProjectionRebuilder(event_storage, container.receipt_read_storage(),
+                                    container.registrator_info_storage(), container.projection_checkpoint_storage(),
+                                    container.loop(), workers=workers, batch_size=batch_size)
+    started_at = time.monotonic()
+
+    def print_progress(count, position):
+        elapsed = time.monotonic() - started_at
+        print('{} events replayed, {:.1f} events/s, position {}'.format(count, count / elapsed if elapsed else 0,
+                                                                        position))
+
+    try:
+        count = await rebuilder.rebuild(reset, print_progress)
+    finally:
+        await event_storage.close()
+    print('The read model is rebuilt: {} events in {:.1f} s'.format(count, time.monotonic() - started_at))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    logging.basicConfig(filename=args.log_file, level=args.log_level.upper())
+    container = DefaultModuleLoader().load('configurations', args.configuration)  # Dependency injection container
+    try:
+        container.loop().run_until_complete(rebuild(container, args.workers, args.batch_size, args.reset))
+    except ProjectionRebuildError as e:
+        print('The read model is not rebuilt: {}'.format(e), file=sys.stderr)
+        sys.exit(1)
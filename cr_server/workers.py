@@ -0,0 +1,252 @@
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+from aiohttp import web
+from dependency_injector import providers
+from apps.service_group import create_app as create_service_group_app
+from apps.admin import create_app as create_admin_app
+from core.ipc import IpcServer, IpcClient, IpcObjectProxy
+from hardware.remote import CommandEventPublisher, DeviceCommandReceiver, RemoteDeviceGroupManager
+
+
+# The server with several HTTP worker processes (python -m cr_server --workers N):
+# - the owner process holds the device group manager with the fiscal device adapters and the command journals, serves
+#   the admin app on the admin port and the IPC server on a Unix socket (see core.ipc, hardware.remote);
+# - the worker processes serve the service group app on the shared port (SO_REUSEPORT, the kernel distributes the
+#   connections), validate the receipts and forward the commands to the owner. The results of the commands come back
+#   as events to the worker which accepted the command, it writes them to its own event log <event log>/worker-<n>.
+# The objects listed in container.shared_objects (e.g. the in-memory storages of the test configuration) live in the
+# owner process, the workers call them over IPC. The storages of the other configurations are shared by the database.
+# Every worker has its own cache of the verified API credentials and of the service group states, the users and the
+# service groups are changed by the admin app of the owner which broadcasts the ids of the changed ones to the workers.
+
+logger = logging.getLogger(__name__)
+
+IPC_SOCKET_NAME = 'cr_server.sock'
+CREDENTIALS_TOPIC = 'credentials'
+SERVICE_GROUPS_TOPIC = 'service_groups'
+WORKER_EVENT_LOG_PREFIX = 'worker-'  # the event logs of the workers are <event log>/worker-<n>
+
+
+def create_admin(container, projection_monitor=None, credential_cache=None) -> web.Application:
+    admin_app = create_admin_app(container.device_group_manager(), container.service_group_facade(),
+                                 container.users_management_service(),
+                                 container.access_administration_service(),
+                                 container.authentication_service(),
+                                 container.authorization_policy(), container.identity_policy(),
+                                 container.device_creation_service(),
+                                 session_storage=container.session_storage(),
+                                 projection_monitor=projection_monitor,
+                                 credential_cache=credential_cache)
+    admin_app.cleanup_ctx.append(container.admin_app_context)
+    return admin_app
+
+
+def create_service_group(container) -> web.Application:
+    return create_service_group_app(container.authentication_service(),
+                                    container.authorization_policy(),
+                                    container.receipt_read_repository(),
+                                    container.receipt_processing_service(),
+                                    container.service_group_facade(),
+                                    container.registrator_info_storage(),
+                                    container.device_group_manager(),
+                                    container.event_dispatcher(),
+                                    container.receipt_document_cache(),
+                                    container.receipt_notification_hub(),
+                                    container.receipt_notification_heartbeat(),
+                                    container.webhook_dispatcher(),
+                                    container.receipt_bulk_max_size(),
+                                    container.receipt_bulk_max_body_size(),
+                                    container.projection_monitor(),
+                                    container.receipt_id_allocator(),
+                                    container.credential_cache(),
+                                    container.service_group_state_cache())
+
+
+def serve(app: web.Application, loop: asyncio.AbstractEventLoop, host: str, port: int, stopping: asyncio.Event,
+          reuse_port: bool = False):
+    # Serves the app until SIGINT, SIGTERM or stopping is set. Unlike web.run_app the tasks are not cancelled before
+    # the cleanup of the app, the cleanup handlers use the IPC connections.
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stopping.set)
+
+    async def run():
+        runner = web.AppRunner(app, handle_signals=False)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, host, port, reuse_port=reuse_port).start()
+            logger.info('The server is listening on %s:%d', host, port)
+            await stopping.wait()
+        finally:
+            await runner.cleanup()
+
+    try:
+        loop.run_until_complete(run())
+    finally:
+        tasks = asyncio.all_tasks(loop)
+        for task in tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+def get_shared_objects(container) -> tuple:
+    return tuple(getattr(container, 'shared_objects', ()))
+
+
+class WorkerProcesses:
+    # Starts the worker processes and restarts a worker which exited while the server is running. If event_log_dir is
+    # given, the worker n writes its events to the log event_log_dir/worker-<n>.
+    def __init__(self, args, ipc_path: str, loop: asyncio.AbstractEventLoop, event_log_dir: str = None,
+                 check_interval: float = 1.0):
+        self._args = args
+        self._ipc_path = ipc_path
+        self._loop = loop
+        self._event_log_dir = event_log_dir
+        self._check_interval = check_interval
+        self._processes = {}
+        self._task = None
+
+    def _start(self, index: int):
+        args = self._args
+        command = [sys.executable, '-m', 'cr_server', '--worker', '--ipc-path', self._ipc_path, '--host', args.host,
+                   '--port', str(args.port), '--configuration', args.configuration, '--log-level', args.log_level]
+        if args.log_file:
+            command += ['--log-file', '{}.worker-{}'.format(args.log_file, index)]
+        if self._event_log_dir:
+            command += ['--event-log-dir',
+                        os.path.join(self._event_log_dir, '{}{}'.format(WORKER_EVENT_LOG_PREFIX, index))]
+        # The workers are stopped by the owner, not by the signals of the terminal
+        self._processes[index] = subprocess.Popen(command, start_new_session=True)
+
+    def start(self):
+        for index in range(1, self._args.workers + 1):
+            self._start(index)
+        self._task = self._loop.create_task(self._watch())
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self._check_interval)
+            for index, process in list(self._processes.items()):
+                if process.poll() is not None:
+                    logger.error('The worker process %d exited with the code %s, it is restarted', index,
+                                 process.returncode)
+                    self._start(index)
+
+    async def stop(self, timeout: float = 30):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        for process in self._processes.values():
+            if process.poll() is None:
+                process.terminate()
+        deadline = self._loop.time() + timeout
+        for process in self._processes.values():
+            while process.poll() is None and self._loop.time() < deadline:
+                await asyncio.sleep(0.05)
+            if process.poll() is None:
+                process.kill()
+
+
+def run_owner(container, args):
+    loop = container.loop()
+    directory = tempfile.TemporaryDirectory(prefix='cr_server-')
+    ipc_server = IpcServer(os.path.join(directory.name, IPC_SOCKET_NAME), loop=loop)
+    event_publisher = CommandEventPublisher(ipc_server)
+    # The commands restored from the journal and the commands of the workers publish their events to the workers
+    container.event_dispatcher.override(providers.Object(event_publisher))
+    receiver = DeviceCommandReceiver(container.device_group_manager(), container.command_serializer(),
+                                     event_publisher, ipc_server, loop)
+    for name in get_shared_objects(container):
+        ipc_server.register(name, getattr(container, name)())
+    container.credential_cache().on_user_invalidated.append(
+        lambda user_id: ipc_server.broadcast(CREDENTIALS_TOPIC, user_id))
+    container.service_group_state_cache().on_invalidated.append(
+        lambda service_group_id: ipc_server.broadcast(SERVICE_GROUPS_TOPIC, service_group_id))
+    # The event storages which are not files are shared by the workers
+    workers = WorkerProcesses(args, ipc_server.path, loop, getattr(container.event_storage(), 'directory', None))
+
+    async def start_workers(app):
+        await ipc_server.start()
+        receiver.start()
+        workers.start()
+
+    async def stop_workers(app):
+        await workers.stop()
+        await receiver.close()
+        await ipc_server.close()
+        directory.cleanup()
+
+    app = web.Application(loop=loop)
+    app.on_startup.append(start_workers)
+    app.add_subapp('/admin/', create_admin(container))
+    # The workers are stopped after the admin app, the shared objects are used by the workers until they exit
+    app.on_cleanup.append(stop_workers)
+    serve(app, loop, args.host, args.admin_port or args.port + 1, asyncio.Event())
+
+
+def run_worker(container, args):
+    loop = container.loop()
+    stopping = asyncio.Event()
+    client = IpcClient(args.ipc_path, loop)
+    if args.event_log_dir:
+        event_storage = container.event_storage
+        event_storage.override(providers.Singleton(event_storage.cls, args.event_log_dir, loop, **event_storage.kwargs))
+    for name in get_shared_objects(container):
+        provider = getattr(container, name)
+        provider.override(providers.Object(IpcObjectProxy(client, name, provider.cls)))
+    document_cache = container.receipt_document_cache()
+    notification_hub = container.receipt_notification_hub()
+
+    async def handle_replicated_event(event):
+        # The read model is updated by the worker which accepted the receipt
+        document_cache.invalidate(event.entity_id)
+        await notification_hub.handle(event)
+
+    device_group_manager = RemoteDeviceGroupManager(client, container.command_serializer(),
+                                                    container.event_dispatcher(), loop, handle_replicated_event)
+    container.device_group_manager.override(providers.Object(device_group_manager))
+    credential_cache = container.credential_cache()
+    service_group_state_cache = container.service_group_state_cache()
+
+    def handle_push(topic, payload):
+        if topic == CREDENTIALS_TOPIC:
+            credential_cache.invalidate_user(payload)
+        elif topic == SERVICE_GROUPS_TOPIC:
+            service_group_state_cache.invalidate(payload)
+        else:
+            device_group_manager.handle_push(topic, payload)
+
+    client.on_push = handle_push
+
+    def stop():
+        # The worker can not accept commands without the owner process
+        logger.error('The connection to the owner process is lost, the worker stops')
+        stopping.set()
+
+    async def connect(app):
+        await client.connect()
+        client.on_disconnected = stop
+
+    async def close_device_group_manager(app):
+        # The events of the accepted commands are handled before the event dispatcher of the app is closed
+        await device_group_manager.close()
+
+    async def disconnect(app):
+        await client.close()
+
+    app = web.Application(loop=loop)
+    app.on_startup.append(connect)
+    app.on_shutdown.append(close_device_group_manager)
+    app.add_subapp('/service_groups/', create_service_group(container))
+    # The buffered changes of the read model are written to the shared storages before the connection is closed
+    app.on_cleanup.append(disconnect)
+    serve(app, loop, args.host, args.port, stopping, reuse_port=True)
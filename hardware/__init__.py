@@ -1,3 +1,4 @@
-from .fiscal_device_group_managers import DeviceGroupManager, AbstractDeviceGroupManager, CommandProcessorInterface
+from .fiscal_device_group_managers import (DeviceGroupManager, AbstractDeviceGroupManager, CommandProcessorInterface,
+                                          CommandQueueOverflow, CommandQueueIsFull, CommandWaitTimeExceeded)
 from .services import (AbstractAvailableDriversInformationService, AbstractDeviceCreationService,
                        DefaultFiscalDeviceCreationService)
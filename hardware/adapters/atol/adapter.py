@@ -1,4 +1,5 @@
 import datetime
+import json
 import logging
 import time
 from receipt import Receipt, Cashier, ReceiptRegistratorData, Commodity, Payment
@@ -32,10 +33,30 @@ class AtlCashRegister(AbstractRegistratorDriverAdapter):
     # LIBFPTR_RT_BUY_RETURN - чек возврата расхода
     # LIBFPTR_RT_BUY_CORRECTION - чек коррекции расхода
 
-    def __init__(self, driver_object, time_counter: AbstractTimeCounter, test_mode=False):
+    # Значения для JSON-задания processJson
+    _json_receipt_types = {1: 'sell', 2: 'sellReturn', 7: 'sellCorrection', 8: 'sellReturnCorrection', 4: 'buy',
+                           5: 'buyReturn', 9: 'buyCorrection', 10: 'buyReturnCorrection'}
+    _json_tax_systems = {1: 'osn', 2: 'usnIncome', 4: 'usnIncomeOutcome', 8: 'envd', 16: 'esn', 32: 'patent'}
+    _json_tax_types = {0: 'department', 1: 'vat18', 2: 'vat10', 3: 'vat118', 4: 'vat110', 5: 'vat0', 6: 'none',
+                       7: 'vat20', 8: 'vat120'}
+    _json_payment_types = {0: 'cash', 1: 'electronically', 2: 'prepaid', 3: 'credit'}
+    _json_payment_methods = {1: 'fullPrepayment', 2: 'prepayment', 3: 'advance', 4: 'fullPayment'}
+    _json_payment_objects = {1: 'commodity', 4: 'service'}
+
+    # Способы регистрации чека:
+    # json - чек целиком передается в кассу одним JSON-заданием (processJson),
+    # classic - каждый реквизит, товар и оплата передаются в кассу отдельным вызовом драйвера
+    REGISTRATION_MODE_JSON = 'json'
+    REGISTRATION_MODE_CLASSIC = 'classic'
+
+    def __init__(self, driver_object, time_counter: AbstractTimeCounter, test_mode=False,
+                 registration_mode=REGISTRATION_MODE_JSON):
         self.driver = driver_object
         self._time_counter = time_counter
         self._test_mode = test_mode
+        if registration_mode not in (self.REGISTRATION_MODE_JSON, self.REGISTRATION_MODE_CLASSIC):
+            raise ValueError('Неизвестный способ регистрации чека: {}'.format(registration_mode))
+        self._registration_mode = registration_mode
         if not self.driver.isOpened():
             logger.error('Unable to connect to the fiscal device %s', self)
             raise RuntimeError('Невозможно подключиться к кассовому аппарату')
@@ -46,18 +67,26 @@ class AtlCashRegister(AbstractRegistratorDriverAdapter):
         self.driver.checkDocumentClosed()
 
     def close_shift(self, electronary=True):
-        self._setparam('LIBFPTR_PARAM_REPORT_TYPE', 'LIBFPTR_RT_CLOSE_SHIFT')
-        if electronary:  # Если True, то не печатать отчет о закрытии смены
-            self._setparam('LIBFPTR_PARAM_REPORT_ELECTRONICALLY', True)
-        self.driver.report()
+        # Закрытие смены с ожиданием закрытия документа в текущем потоке. AsyncRegistrator использует
+        # request_close_shift и is_document_closed, чтобы не занимать поток устройства во время ожидания
+        self.request_close_shift(electronary)
         counter = 0
-        while self.driver.checkDocumentClosed() < 0:  # проверка закрыт ли документ      
+        while not self.is_document_closed():
             time.sleep(0.5)
             counter += 1
             if counter >= 10:
                 logger.error('Unable to close the shift %s', self)
                 raise FiscalDeviceOperationError('Невозможно закрыть смену')
 
+    def request_close_shift(self, electronary=True):
+        self._setparam('LIBFPTR_PARAM_REPORT_TYPE', 'LIBFPTR_RT_CLOSE_SHIFT')
+        if electronary:  # Если True, то не печатать отчет о закрытии смены
+            self._setparam('LIBFPTR_PARAM_REPORT_ELECTRONICALLY', True)
+        self.driver.report()
+
+    def is_document_closed(self) -> bool:
+        return self.driver.checkDocumentClosed() >= 0
+
     def get_shift_info(self) -> ShiftInformation:
         self._setparam('LIBFPTR_PARAM_DATA_TYPE', 'LIBFPTR_DT_SHIFT_STATE')
         self._querydata()
@@ -111,9 +140,20 @@ class AtlCashRegister(AbstractRegistratorDriverAdapter):
         return ReceiptRegistratorData(registration_number, registrator_serial, fn_serial, ffd_version, ofd_name,
                                       ffd_inn, company_name, company_inn, operations_address, operations_place)
 
+    @property
+    def registration_mode(self):
+        return self._registration_mode
+
+    def get_driver_call_statistics(self):
+        # Заполняется, если драйвер обернут в TracingDriverProxy
+        return getattr(self.driver, 'call_statistics', None)
+
     def register_receipt(self, receipt: Receipt):
         try:
-            self._register_receipt(receipt)
+            if self._is_json_registration_available(receipt):
+                self._register_receipt_json(receipt)
+            else:
+                self._register_receipt(receipt)
         except FiscalDeviceOperationError as e:
             logger.error('{} {} receipt_id = '.format(str(e), self, receipt.id))
             raise e
@@ -156,7 +196,7 @@ class AtlCashRegister(AbstractRegistratorDriverAdapter):
         # self.driver.receiptTax()
 
         # Регистрируем итог
-        self._setparam('LIBFPTR_PARAM_SUM', float(receipt.get_commodities_total_cost()))
+        self._setparam('LIBFPTR_PARAM_SUM', receipt.get_commodities_total_cost_kopecks() / 100)
 
         if self.driver.receiptTotal() < 0:
             self.driver.cancelReceipt()
@@ -170,6 +210,86 @@ class AtlCashRegister(AbstractRegistratorDriverAdapter):
         # Достаем фискальные данные из кассы и переносим их в объект чека
         self._set_receipt_fiscal_data(receipt)
 
+    def _is_json_registration_available(self, receipt: Receipt):
+        # В тестовом режиме чек отменяется перед закрытием, а JSON-задание закрывает чек сразу, поэтому в тестовом
+        # режиме и для чеков с реквизитом 1192 используется поочередная передача реквизитов
+        return self._registration_mode == self.REGISTRATION_MODE_JSON and not self._test_mode and \
+            not receipt.mistaken_receipt_number
+
+    def _register_receipt_json(self, receipt: Receipt):
+        if not self.driver.isOpened():
+            raise FiscalDeviceOperationError('Касса недоступна')
+        self._setparam('LIBFPTR_PARAM_JSON_DATA', json.dumps(self._create_json_task(receipt), ensure_ascii=False))
+        if self.driver.processJson() < 0:
+            error_code = self.driver.errorCode()
+            if error_code == self.driver.LIBFPTR_ERROR_NOT_SUPPORTED:
+                # Прошивка кассы не поддерживает JSON-задания, переходим на поочередную передачу реквизитов
+                logger.warning('JSON tasks are not supported by the fiscal device %s, the classic registration '
+                               'mode is used', self)
+                self._registration_mode = self.REGISTRATION_MODE_CLASSIC
+                return self._register_receipt(receipt)
+            error_description = self._errordescription()
+            if error_code == self.driver.LIBFPTR_ERROR_DENIED_IN_OPENED_RECEIPT:
+                # В кассе остался открытый чек после сбоя, отменяем его и повторяем задание. Драйвер очищает
+                # входные параметры после каждого вызова, поэтому задание передается заново
+                self.cancel_receipt()
+                self._setparam('LIBFPTR_PARAM_JSON_DATA', json.dumps(self._create_json_task(receipt),
+                                                                     ensure_ascii=False))
+                if self.driver.processJson() >= 0:
+                    return self._set_receipt_fiscal_data_json(receipt)
+                error_description = self._errordescription()
+            self.cancel_receipt()
+            raise FiscalDeviceOperationError('Ошибка регистрации чека: {}'.format(error_description))
+        self._set_receipt_fiscal_data_json(receipt)
+
+    def _create_json_task(self, receipt: Receipt) -> dict:
+        try:
+            receipt_type = self._json_receipt_types[receipt.get_type_int()]
+        except KeyError:
+            raise FiscalDeviceOperationError('Недопустимый тип чека')
+        task = {'type': receipt_type, 'electronically': not receipt.need_print,
+                'clientInfo': {'emailOrPhone': str(receipt.email) if receipt.email else str(receipt.phone_number)},
+                'items': [self._create_json_item(product) for product in receipt.commodities],
+                'payments': [{'type': self._json_payment_types[payment.get_type_int()],
+                              'sum': float(payment)} for payment in receipt.payments],
+                'total': receipt.get_commodities_total_cost_kopecks() / 100}
+        if receipt.cashier:
+            task['operator'] = {'name': receipt.cashier.name}
+            if receipt.cashier.inn:
+                task['operator']['vatin'] = receipt.cashier.inn
+        if receipt.tax_system:
+            if receipt.tax_system.get_value_int() not in self._allowed_tax_types:
+                raise FiscalDeviceOperationError('Недопустимое значение типа применяемой налоговой системы')
+            task['taxationType'] = self._json_tax_systems[receipt.tax_system.get_value_int()]
+        if receipt.is_correcting():
+            correction_data = receipt.correction_data
+            task['correctionType'] = 'instruction' if correction_data.precept else 'self'
+            task['correctionBaseName'] = str(correction_data.correction_reason)
+            task['correctionBaseDate'] = correction_data.correction_date.strftime('%Y.%m.%d')
+            if correction_data.correction_doc_number:
+                task['correctionBaseNumber'] = str(correction_data.correction_doc_number)
+        return task
+
+    def _create_json_item(self, product: Commodity) -> dict:
+        tax_type = product.tax_type.get_value_int() if product.tax_type else 6
+        return {'type': 'position', 'name': product.name.get_value(), 'price': float(product.price),
+                'quantity': float(product.quantity), 'amount': product.get_total_cost_kopecks() / 100,
+                'tax': {'type': self._json_tax_types[tax_type]},
+                'paymentMethod': self._json_payment_methods[product.payment_state.get_value()],
+                'paymentObject': self._json_payment_objects[product.get_type_int()]}
+
+    def _set_receipt_fiscal_data_json(self, receipt: Receipt):
+        # Фискальные данные возвращаются в результате задания, дополнительные запросы к ФН не нужны
+        try:
+            fiscal_params = json.loads(self._getparamstring('LIBFPTR_PARAM_JSON_DATA'))['fiscalParams']
+            receipt.set_fiscal_data(fiscal_params['fiscalDocumentSign'],
+                                    datetime.datetime.fromisoformat(fiscal_params['fiscalDocumentDateTime']),
+                                    self._id, fiscal_params['shiftNumber'], fiscal_params['fiscalReceiptNumber'],
+                                    fiscal_params['fiscalDocumentNumber'])
+        except (ValueError, KeyError, TypeError):
+            # Старые версии драйвера не возвращают фискальные параметры
+            self._set_receipt_fiscal_data(receipt)
+
     def _set_receipt_type(self, receipt):
         try:
             receipttype = self._allowed_receipttypes[receipt.get_type_int()]
@@ -211,7 +331,7 @@ class AtlCashRegister(AbstractRegistratorDriverAdapter):
 
     def _register_payment(self, payment: Payment):
         self._setparam('LIBFPTR_PARAM_PAYMENT_TYPE', payment.get_type_int())
-        self._setparam('LIBFPTR_PARAM_PAYMENT_SUM', float(payment.get_value()))
+        self._setparam('LIBFPTR_PARAM_PAYMENT_SUM', float(payment))
         if self.driver.payment() < 0:
             self.cancel_receipt()
             raise FiscalDeviceOperationError('Ошибка регистрации оплаты: {}'.format(self._errordescription()))
@@ -224,8 +344,8 @@ class AtlCashRegister(AbstractRegistratorDriverAdapter):
 
     def _register_product(self, product: Commodity):
         self._setparam('LIBFPTR_PARAM_COMMODITY_NAME', product.name.get_value())
-        self._setparam('LIBFPTR_PARAM_PRICE', float(product.price.get_value()))
-        self._setparam('LIBFPTR_PARAM_QUANTITY', float(product.quantity.get_value()))
+        self._setparam('LIBFPTR_PARAM_PRICE', float(product.price))
+        self._setparam('LIBFPTR_PARAM_QUANTITY', float(product.quantity))
         if not product.tax_type:
             # Если НДС не определен, то указываем
             self._setparam('LIBFPTR_PARAM_TAX_TYPE', 'LIBFPTR_TAX_NO')
@@ -4,6 +4,7 @@ import json
 from logging import getLogger
 from core.loaders import AbstractModuleLoader
 from hardware.adapters.base import DefaultTimeCounter
+from hardware.adapters.tracing import TracingDriverProxy
 from .adapter import AtlCashRegister
 from .libfptr10 import IFptr
 from ..exceptions import DriverLoadError
@@ -42,7 +43,11 @@ class Loader(AbstractModuleLoader):
         driver.open()
         return driver
 
-    def load(self, cr_model, cr_port, cr_ofd_channel, cr_baudrate, cr_passwd, test_mode=False):
+    def load(self, cr_model, cr_port, cr_ofd_channel, cr_baudrate, cr_passwd, test_mode=False,
+             registration_mode=AtlCashRegister.REGISTRATION_MODE_JSON, trace_driver_calls=False):
         driver = self.get_driver(cr_model, cr_port, cr_ofd_channel, cr_baudrate, cr_passwd)
+        if trace_driver_calls:
+            # Измерение длительности и кодов ошибок вызовов драйвера
+            driver = TracingDriverProxy(driver)
         counter = DefaultTimeCounter()
-        return AtlCashRegister(driver, counter, test_mode=test_mode)
+        return AtlCashRegister(driver, counter, test_mode=test_mode, registration_mode=registration_mode)
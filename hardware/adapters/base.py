@@ -5,6 +5,7 @@ import datetime
 import time
 from logging import getLogger
 from receipt import AbstractReceiptRegistrator, Receipt
+from .exceptions import FiscalDeviceOperationError
 
 
 logger = getLogger(__name__)
@@ -94,7 +95,20 @@ class AbstractFiscalDeviceManager(ABC):
 
 #  Управление устройством и регистрация чеков
 class AbstractRegistratorDriverAdapter(AbstractReceiptRegistrator, AbstractFiscalDeviceManager, ABC):
-    pass
+    def request_close_shift(self):
+        # Отправляет устройству команду закрытия смены без ожидания закрытия документа. Ожидание выполняется
+        # асинхронным декоратором с помощью is_document_closed. Адаптер, у которого нет отдельной команды, закрывает
+        # смену полностью
+        self.close_shift()
+
+    def is_document_closed(self) -> bool:
+        # Одна короткая проверка, закрыт ли текущий документ в устройстве
+        return True
+
+    def get_driver_call_statistics(self):
+        # Гистограммы длительности вызовов драйвера по операциям (core.metrics.HistogramSet), None - если
+        # измерение вызовов драйвера выключено либо не поддерживается адаптером
+        return None
 
 
 # Состояние смены
@@ -171,12 +185,20 @@ class AsyncTreadPoolExecutor(AbstractAsyncExecutor):
         return await self._loop.run_in_executor(self._executor, func, *args)
 
 
-# Асинхронный декоратор для адаптера кассового устройства, с состоянием смены
+# Асинхронный декоратор для адаптера кассового устройства, с состоянием смены.
+# После команды закрытия смены закрытие документа проверяется отдельными вызовами в потоке устройства с паузами между
+# ними в цикле событий: первая пауза document_check_interval, каждая следующая в два раза длиннее, но не более
+# max_document_check_interval. Если документ не закрыт за document_close_timeout секунд, закрытие смены завершается
+# ошибкой.
 class AsyncRegistrator(AbstractRegistratorDriverAdapter, ShiftStateDrivenAbstract):
     def __init__(self, adapter: AbstractRegistratorDriverAdapter, state_factory: ShiftStateFactory,
-                 loop: asyncio.AbstractEventLoop, executor: AbstractAsyncExecutor):
+                 loop: asyncio.AbstractEventLoop, executor: AbstractAsyncExecutor, document_close_timeout: float = 5,
+                 document_check_interval: float = 0.05, max_document_check_interval: float = 0.5):
         self._loop = loop
         self._executor = executor
+        self._document_close_timeout = document_close_timeout
+        self._document_check_interval = document_check_interval
+        self._max_document_check_interval = max_document_check_interval
         self._adapter = adapter
         self._state_factory = state_factory
         self._state = state_factory.create_default_state(self)
@@ -210,6 +232,9 @@ class AsyncRegistrator(AbstractRegistratorDriverAdapter, ShiftStateDrivenAbstrac
                      str(self._state))
         await self._state.register_receipt(receipt)
 
+    def get_driver_call_statistics(self):
+        return self._adapter.get_driver_call_statistics()
+
     async def get_registrator_info(self):
         if self._registrator_info is None:
             self._registrator_info = await self._executor.execute(self._adapter.get_registrator_info)
@@ -228,7 +253,21 @@ class AsyncRegistrator(AbstractRegistratorDriverAdapter, ShiftStateDrivenAbstrac
         return await self._executor.execute(self._adapter.close)
 
     async def do_close_shift(self):
-        await self._executor.execute(self._adapter.close_shift)
+        await self._executor.execute(self._adapter.request_close_shift)
+        await self._wait_document_closed()
+
+    async def _wait_document_closed(self):
+        deadline = self._loop.time() + self._document_close_timeout
+        interval = self._document_check_interval
+        while not await self._executor.execute(self._adapter.is_document_closed):
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                logger.error('The document was not closed in %s seconds on the fiscal device %s',
+                             self._document_close_timeout, self)
+                raise FiscalDeviceOperationError('Невозможно закрыть смену')
+            # Последняя проверка выполняется в момент окончания ожидания
+            await asyncio.sleep(min(interval, remaining))
+            interval = min(interval * 2, self._max_document_check_interval)
 
     async def do_register_receipt(self, receipt):
         await self._executor.execute(self._adapter.register_receipt, receipt)
@@ -1,6 +1,6 @@
 from hardware.adapters.base import AbstractRegistratorDriverAdapter, ShiftInformation, DefaultTimeCounter
 from receipt import ReceiptRegistratorData
-from time import sleep
+from .simulation import DeviceSimulator
 import datetime
 import random
 from logging import getLogger
@@ -17,7 +17,9 @@ class TestRegistrator(AbstractRegistratorDriverAdapter):
                                                operations_address='Ленина 55, Москва',
                                                operations_place='http://www.sale.ru')
 
-    def __init__(self):
+    def __init__(self, simulator: DeviceSimulator = None):
+        # simulator задает длительность операций, ошибки и зависания устройства
+        self._simulator = simulator or DeviceSimulator()
         self._shift_is_open = False
         self._shift_number = 10
         self._shift_documents_count = 0
@@ -41,7 +43,7 @@ class TestRegistrator(AbstractRegistratorDriverAdapter):
         self._registrator_info = registrator_info
 
     def open_shift(self):
-        sleep(0.1)
+        self._simulator.simulate('open_shift')
         self._shift_opened()
 
     def _shift_opened(self):
@@ -51,13 +53,14 @@ class TestRegistrator(AbstractRegistratorDriverAdapter):
             self._shift_datetime_open = datetime.datetime.now()
 
     def close_shift(self):
-        sleep(0.1)
+        self._simulator.simulate('close_shift')
         if self._shift_is_open:
             self._shift_is_open = False
             self._shift_datetime_open = None
             self._shift_documents_count = 0
 
     def get_shift_info(self) -> ShiftInformation:
+        self._simulator.simulate('get_shift_info')
         shift_number = self._shift_number if self._shift_datetime_open else None
         return ShiftInformation(self._shift_is_open, datetime.datetime.now(), self._time_counter,
                                 self._time_counter.get_time_value(), number=shift_number,
@@ -65,6 +68,7 @@ class TestRegistrator(AbstractRegistratorDriverAdapter):
 
     def register_receipt(self, receipt):
         logger.debug('Receipt %d registration on %s', receipt.id, str(self))
+        self._simulator.simulate('register_receipt', receipt.get_commodities_count())
         self._shift_opened()
         values = [str(i) for i in range(10)]
         fiscal_sign = ''.join(random.choices(values, k=8))
@@ -81,6 +85,7 @@ class TestRegistrator(AbstractRegistratorDriverAdapter):
         self._indepetdent_time = self._time_counter.get_time_value()
 
     def get_date_time(self):
+        self._simulator.simulate('get_date_time')
         return self._datetime + datetime.timedelta(seconds=self._time_counter.get_time_value() - self._indepetdent_time)
 
     def reboot(self):
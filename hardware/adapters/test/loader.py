@@ -1,7 +1,17 @@
 from core.loaders import AbstractModuleLoader
+from receipt import ReceiptRegistratorData
 from .adapter import TestRegistrator
+from .simulation import DeviceSimulator
 
 
 class Loader(AbstractModuleLoader):
-    def load(self):
-        return TestRegistrator()
\ No newline at end of file
+    def load(self, latency=None, per_item_cost=0, failure_rate=0, hang_rate=0, hang_duration=30, seed=None,
+             serial_number=None):
+        simulator = DeviceSimulator(latency, per_item_cost, failure_rate, hang_rate, hang_duration, seed)
+        registrator = TestRegistrator(simulator)
+        if serial_number:
+            # Устройства с разными заводскими номерами получают разные идентификаторы, например в пуле устройств
+            registrator.set_registrator_info(
+                ReceiptRegistratorData(**dict(TestRegistrator._registrator_info.as_dict(),
+                                              registrator_serial=serial_number)))
+        return registrator
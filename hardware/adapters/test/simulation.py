@@ -0,0 +1,133 @@
+from abc import ABC, abstractmethod
+import itertools
+import json
+import math
+import random
+from time import sleep
+from ..exceptions import FiscalDeviceOperationError
+
+
+# Имитация поведения кассового аппарата для нагрузочного тестирования: длительность операций по заданному
+# распределению, ошибки и зависания устройства с заданной вероятностью, дополнительное время на каждый товар чека.
+
+
+class AbstractLatencyModel(ABC):
+    @abstractmethod
+    def get_latency(self) -> float:
+        # Длительность очередной операции в секундах
+        pass
+
+
+class FixedLatency(AbstractLatencyModel):
+    def __init__(self, value: float):
+        self._value = value
+
+    def get_latency(self):
+        return self._value
+
+
+class NormalLatency(AbstractLatencyModel):
+    # Нормальное распределение, отрицательные значения заменяются нулем
+    def __init__(self, mean: float, stddev: float, random_generator: random.Random = None):
+        self._mean = mean
+        self._stddev = stddev
+        self._random = random_generator or random.Random()
+
+    def get_latency(self):
+        return max(self._random.normalvariate(self._mean, self._stddev), 0.0)
+
+
+class LogNormalLatency(AbstractLatencyModel):
+    # Логнормальное распределение, задается медианой и параметром sigma (стандартное отклонение логарифма). Хорошо
+    # описывает длительность операций устройства: большинство операций быстрые, но есть длинный хвост медленных
+    def __init__(self, median: float, sigma: float, random_generator: random.Random = None):
+        self._mu = math.log(median)
+        self._sigma = sigma
+        self._random = random_generator or random.Random()
+
+    def get_latency(self):
+        return self._random.lognormvariate(self._mu, self._sigma)
+
+
+class TraceLatency(AbstractLatencyModel):
+    # Повторяет по кругу записанные длительности операций. Запись задается списком значений или путем к файлу, в
+    # котором по одному значению в секундах на строке
+    def __init__(self, values: list = None, path: str = None):
+        if path:
+            with open(path, 'r') as file:
+                values = [float(line) for line in file if line.strip()]
+        if not values:
+            raise ValueError('Запись длительностей операций пуста')
+        self._values = itertools.cycle([float(value) for value in values])
+
+    def get_latency(self):
+        return next(self._values)
+
+
+def create_latency_model(spec, random_generator: random.Random = None) -> AbstractLatencyModel:
+    # spec - число (фиксированная длительность) либо словарь с ключом type и параметрами распределения:
+    # {"type": "fixed", "value": 0.2}, {"type": "normal", "mean": 0.2, "stddev": 0.05},
+    # {"type": "lognormal", "median": 0.2, "sigma": 0.5}, {"type": "trace", "values": [0.1, 0.3]} либо
+    # {"type": "trace", "path": "trace.txt"}
+    if isinstance(spec, (int, float)):
+        return FixedLatency(float(spec))
+    if not isinstance(spec, dict):
+        raise ValueError('Неверное описание длительности операции: {}'.format(spec))
+    spec = dict(spec)
+    latency_type = spec.pop('type', 'fixed')
+    try:
+        if latency_type == 'fixed':
+            return FixedLatency(float(spec['value']))
+        if latency_type == 'normal':
+            return NormalLatency(float(spec['mean']), float(spec['stddev']), random_generator)
+        if latency_type == 'lognormal':
+            return LogNormalLatency(float(spec['median']), float(spec['sigma']), random_generator)
+        if latency_type == 'trace':
+            return TraceLatency(spec.get('values'), spec.get('path'))
+    except (KeyError, TypeError) as e:
+        raise ValueError('Неверные параметры распределения {}: {}'.format(latency_type, str(e)))
+    raise ValueError('Неизвестный тип распределения длительности операции: {}'.format(latency_type))
+
+
+class DeviceSimulator:
+    # latency - длительность операций: словарь имя операции -> описание распределения (см. create_latency_model)
+    # либо JSON-строка с таким словарем. Операции: register_receipt, open_shift, close_shift, get_shift_info,
+    # get_date_time; ключ default задает длительность остальных операций.
+    # per_item_cost - дополнительная длительность регистрации чека на каждый товар, секунд.
+    # failure_rate - вероятность ошибки операции (ошибки имитируются только для операций из _failing_operations, чтобы
+    # запросы состояния смены при подключении устройства выполнялись), hang_rate - вероятность зависания устройства
+    # на hang_duration секунд перед выполнением операции. seed - начальное значение генератора случайных чисел для
+    # воспроизводимости.
+    _default_latency = {'open_shift': 0.1, 'close_shift': 0.1}
+    _failing_operations = ('register_receipt', 'open_shift', 'close_shift')
+
+    def __init__(self, latency=None, per_item_cost: float = 0, failure_rate: float = 0, hang_rate: float = 0,
+                 hang_duration: float = 30, seed: int = None, sleep_function=sleep):
+        self._random = random.Random(seed)
+        if isinstance(latency, str):
+            latency = json.loads(latency) if latency.strip() else None
+        if latency is not None and not isinstance(latency, dict):
+            raise ValueError('Длительность операций задается словарем: имя операции -> распределение')
+        latency = dict(self._default_latency, **(latency or {}))
+        default_spec = latency.pop('default', 0)
+        self._default_model = create_latency_model(default_spec, self._random)
+        self._models = {operation: create_latency_model(spec, self._random) for operation, spec in latency.items()}
+        # Незаполненные в настройках значения равны None
+        self._per_item_cost = per_item_cost or 0
+        self._failure_rate = failure_rate or 0
+        self._hang_rate = hang_rate or 0
+        self._hang_duration = hang_duration if hang_duration is not None else 30
+        for name, rate in (('failure_rate', self._failure_rate), ('hang_rate', self._hang_rate)):
+            if not 0 <= rate <= 1:
+                raise ValueError('Значение {} должно быть от 0 до 1'.format(name))
+        self._sleep = sleep_function
+
+    def simulate(self, operation: str, items_count: int = 0):
+        # Выполняется в потоке устройства вместо обращения к кассовому аппарату
+        if self._hang_rate and self._random.random() < self._hang_rate:
+            self._sleep(self._hang_duration)
+        latency = self._models.get(operation, self._default_model).get_latency() + items_count * self._per_item_cost
+        if latency > 0:
+            self._sleep(latency)
+        if self._failure_rate and operation in self._failing_operations and self._random.random() < self._failure_rate:
+            raise FiscalDeviceOperationError('Имитация ошибки устройства при выполнении операции {}'.format(operation))
@@ -0,0 +1,47 @@
+import time
+from core.metrics import HistogramSet
+
+
+class TracingDriverProxy:
+    # Заместитель объекта драйвера кассы, который измеряет длительность каждого вызова метода драйвера и сохраняет ее
+    # в гистограмму операции. Если метод вернул отрицательный результат, вместе с длительностью сохраняется код
+    # ошибки драйвера. Атрибуты, которые не являются методами (константы драйвера), возвращаются без изменений.
+    # Обертка метода создается при первом обращении и сохраняется в атрибутах заместителя, поэтому следующие
+    # обращения к методу не проходят через __getattr__.
+    def __init__(self, driver, call_statistics: HistogramSet = None, error_code_method: str = 'errorCode',
+                 time_counter=time.perf_counter):
+        self._driver = driver
+        self.call_statistics = call_statistics if call_statistics is not None else HistogramSet()
+        self._get_error_code = getattr(driver, error_code_method, None)
+        self._time_counter = time_counter
+
+    @property
+    def driver(self):
+        return self._driver
+
+    def __getattr__(self, name):
+        attribute = getattr(self._driver, name)
+        if not callable(attribute):
+            return attribute
+        traced_method = self._trace(attribute, self.call_statistics.get_histogram(name))
+        setattr(self, name, traced_method)
+        return traced_method
+
+    def _trace(self, method, histogram):
+        time_counter = self._time_counter
+        get_error_code = self._get_error_code
+
+        def traced_method(*args):
+            started_at = time_counter()
+            try:
+                result = method(*args)
+            except Exception:
+                histogram.observe(time_counter() - started_at, 'exception')
+                raise
+            elapsed = time_counter() - started_at
+            if get_error_code is not None and isinstance(result, int) and result < 0:
+                histogram.observe(elapsed, get_error_code())
+            else:
+                histogram.observe(elapsed)
+            return result
+        return traced_method
@@ -14,10 +14,14 @@ class DefaultDeviceFactory(AbstractDeviceFactory):
         self._loop = loop
 
     def create_device(self, device_adapter_name, settings) -> AbstractRegistratorDriverAdapter:
+        settings = dict(settings)
         shift_duration = settings.pop('shift_duration')
+        # Максимальное время ожидания закрытия документа после команды закрытия смены, секунд
+        document_close_timeout = settings.pop('document_close_timeout', None) or 5
         general_adapter = DefaultModuleLoader().load('hardware.adapters', device_adapter_name, **settings)
         async_decorator = AsyncRegistrator(general_adapter, DefaultStateFactory(shift_duration), self._loop,
-                                           AsyncTreadPoolExecutor(self._loop))
+                                           AsyncTreadPoolExecutor(self._loop),
+                                           document_close_timeout=document_close_timeout)
 
         return async_decorator
 
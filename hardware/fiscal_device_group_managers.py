@@ -1,7 +1,13 @@
 from abc import ABC, abstractmethod
 import asyncio
+import math
+from functools import partial
 from .adapters import ShiftInformation, AbstractRegistratorDriverAdapter
+from .adapters.base import AbstractTimeCounter, DefaultTimeCounter
 from core.commands import AbstractInvoker, AbstractCommand
+from core.metrics import HistogramSet
+from .schedulers import FairCommandScheduler
+from .journals import AbstractCommandJournalFactory
 from logging import getLogger
 
 logger = getLogger(__name__)
@@ -19,6 +25,88 @@ class DeviceIsNotAttached(Exception):
     pass
 
 
+class DevicePoolError(Exception):
+    pass
+
+
+class CommandQueueOverflow(Exception):
+    # Очередь команд устройства перегружена, retry_after - через сколько секунд имеет смысл повторить запрос
+    def __init__(self, message, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    def __reduce__(self):
+        # Исключение передается другим процессам сервера
+        return type(self), (str(self), self.retry_after)
+
+
+class CommandQueueIsFull(CommandQueueOverflow):
+    pass
+
+
+class CommandWaitTimeExceeded(CommandQueueOverflow):
+    pass
+
+
+class InvokerStatistics:
+    # Статистика исполнения команд: количество обработанных команд, время ожидания команды в очереди и время ее
+    # исполнения (последнее значение и скользящее среднее)
+    __slots__ = ('_processed_count', '_failed_count', '_last_wait_time', '_last_execution_time', '_average_wait_time',
+                 '_average_execution_time', '_smoothing')
+
+    def __init__(self, smoothing: float = 0.2):
+        self._processed_count = 0
+        self._failed_count = 0
+        self._last_wait_time = None
+        self._last_execution_time = None
+        self._average_wait_time = None
+        self._average_execution_time = None
+        self._smoothing = smoothing
+
+    def _moving_average(self, average, value):
+        if average is None:
+            return value
+        return average + self._smoothing * (value - average)
+
+    def add(self, wait_time: float, execution_time: float, failed: bool = False):
+        self._processed_count += 1
+        if failed:
+            self._failed_count += 1
+        self._last_wait_time = wait_time
+        self._last_execution_time = execution_time
+        self._average_wait_time = self._moving_average(self._average_wait_time, wait_time)
+        self._average_execution_time = self._moving_average(self._average_execution_time, execution_time)
+
+    @property
+    def processed_count(self) -> int:
+        return self._processed_count
+
+    @property
+    def failed_count(self) -> int:
+        return self._failed_count
+
+    @property
+    def last_wait_time(self):
+        return self._last_wait_time
+
+    @property
+    def last_execution_time(self):
+        return self._last_execution_time
+
+    @property
+    def average_wait_time(self):
+        return self._average_wait_time
+
+    @property
+    def average_execution_time(self):
+        return self._average_execution_time
+
+    def as_dict(self):
+        return dict(processed_count=self.processed_count, failed_count=self.failed_count,
+                    last_wait_time=self.last_wait_time, last_execution_time=self.last_execution_time,
+                    average_wait_time=self.average_wait_time, average_execution_time=self.average_execution_time)
+
+
 class DeviceAvailabilityCheck(ABC):
     @abstractmethod
     def is_device_provided_for_group(self, service_group_id):
@@ -30,6 +118,15 @@ class CommandProcessorInterface(ABC):
     def process_command(self, service_group_id, command: AbstractCommand):
         pass
 
+    async def process_commands(self, service_group_id, commands: list):
+        for command in commands:
+            await self.process_command(service_group_id, command)
+
+    @abstractmethod
+    def check_capacity(self, service_group_id, count: int = 1):
+        # Must raise CommandQueueOverflow if the device of the service group can not accept count new commands now
+        pass
+
 
 class AbstractDeviceGroupManager(ABC):
     @property
@@ -42,7 +139,16 @@ class AbstractDeviceGroupManager(ABC):
         pass
 
     @abstractmethod
-    async def replace_device(self, service_group_id, device_adapter: AbstractRegistratorDriverAdapter):
+    async def replace_device(self, service_group_id, device_adapter: AbstractRegistratorDriverAdapter,
+                             device_id=None):
+        pass
+
+    @abstractmethod
+    async def add_pool_member(self, service_group_id, device_adapter: AbstractRegistratorDriverAdapter):
+        pass
+
+    @abstractmethod
+    async def remove_pool_member(self, service_group_id, device_id):
         pass
 
     @abstractmethod
@@ -54,7 +160,7 @@ class AbstractDeviceGroupManager(ABC):
         pass
 
     @abstractmethod
-    async def get_shift_info(self, service_group_id) -> ShiftInformation:
+    async def get_shift_info(self, service_group_id, device_id=None) -> ShiftInformation:
         pass
 
     @abstractmethod
@@ -77,24 +183,66 @@ class AbstractDeviceGroupManager(ABC):
     async def detach_device(self, service_group_id):
         pass
 
+    @abstractmethod
+    def get_pool_information(self, service_group_id) -> list:
+        pass
+
     @abstractmethod
     async def close(self):
         pass
 
 
+class QueuedCommand:
+    # Элемент очереди команд: команда и момент ее постановки в очередь
+    __slots__ = ('command', 'enqueued_at')
+
+    def __init__(self, command: AbstractCommand, enqueued_at: float):
+        self.command = command
+        self.enqueued_at = enqueued_at
+
+    def __lt__(self, other):
+        return self.command < other.command
+
+    def __gt__(self, other):
+        return self.command > other.command
+
+
 class Invoker(AbstractInvoker):
-    # реализует очередь с приоритетами для команд и обеспечивает их последовательное исполнение
-    def __init__(self, fr_adapter, loop):
-        self._commands_queue = asyncio.PriorityQueue()
+    # Реализует очередь команд и обеспечивает их последовательное исполнение. Порядок исполнения команд определяет
+    # планировщик (по умолчанию FairCommandScheduler). Команды из очереди исполняет одна долгоживущая задача, которая
+    # запускается и останавливается вместе с устройством. Блокировка берется один раз на batch_size команд подряд, но
+    # команды забираются из планировщика по одной перед исполнением, поэтому команда высокого приоритета, поступившая
+    # во время исполнения, исполняется следующей.
+    # on_executed - корутинная функция, которая вызывается с командой после ее исполнения
+    def __init__(self, fr_adapter, loop, batch_size: int = 10, time_counter: AbstractTimeCounter = None,
+                 scheduler: FairCommandScheduler = None, on_executed=None):
+        self._on_executed = on_executed
+        self._time_counter = time_counter if time_counter else DefaultTimeCounter()
+        self._commands_queue = scheduler if scheduler else FairCommandScheduler(time_counter=self._time_counter)
         self.lock = asyncio.Lock()
         self.loop = loop
         self._fr_adapter = fr_adapter
+        self._batch_size = batch_size
+        self._statistics = InvokerStatistics()
+        self._pending_count = 0  # Команды в очереди вместе с уже забранными из нее, но еще не исполненными
         self.current_task = None
 
     @property
     def fr_adapter(self):
         return self._fr_adapter
 
+    @property
+    def statistics(self) -> InvokerStatistics:
+        return self._statistics
+
+    @property
+    def wait_statistics(self) -> dict:
+        return self._commands_queue.get_wait_statistics()
+
+    @property
+    def is_running(self) -> bool:
+        return self.current_task is not None and not self.current_task.done()
+
     async def set_fr_adapter(self, fr_adapter):
         async with self.lock:
             self._fr_adapter = fr_adapter
@@ -105,22 +253,67 @@ class Invoker(AbstractInvoker):
     def resume(self):
         self.lock.release()
 
-    async def _execute(self):
-        async with self.lock:
-            command = await self._commands_queue.get()
-            try:
-                await command.execute(self.fr_adapter)
-            except Exception as e:
-                logger.error(str(e))
-            self._commands_queue.task_done()
+    def start(self):
+        if self.is_running:
+            return
+        self.current_task = self.loop.create_task(self._drain())
 
-        if self._commands_queue.qsize() > 0:
-            self.current_task = self.loop.create_task(self._execute())
+    async def stop(self):
+        await self.wait_all_executed()
+        if not self.is_running:
+            return
+        self.current_task.cancel()
+        try:
+            await self.current_task
+        except asyncio.CancelledError:
+            pass
+
+    async def _drain(self):
+        while True:
+            item = await self._commands_queue.get()
+            async with self.lock:
+                # Следующие команды забираются уже под блокировкой, чтобы во время паузы команды оставались в очереди и
+                # сохраняли порядок приоритетов
+                await self._execute(item)
+                for i in range(self._batch_size - 1):
+                    if self._commands_queue.empty():
+                        break
+                    await self._execute(self._commands_queue.get_nowait())
+
+    async def _execute(self, item: QueuedCommand):
+        started_at = self._time_counter.get_time_value()
+        failed = False
+        try:
+            await item.command.execute(self.fr_adapter)
+        except Exception as e:
+            failed = True
+            logger.error(str(e))
+        finally:
+            finished_at = self._time_counter.get_time_value()
+            self._statistics.add(started_at - item.enqueued_at, finished_at - started_at, failed)
+            if self._on_executed:
+                try:
+                    await self._on_executed(item.command)
+                except Exception as e:
+                    logger.error(str(e))
+            self._pending_count -= 1
+            self._commands_queue.task_done()
 
     def put(self, command: AbstractCommand):
-        self._commands_queue.put_nowait(command)
-        if self._commands_queue.qsize() == 1:
-            self.current_task = self.loop.create_task(self._execute())
+        self._commands_queue.put_nowait(QueuedCommand(command, self._time_counter.get_time_value()))
+        self._pending_count += 1
+
+    @property
+    def pending_count(self) -> int:
+        return self._pending_count
+
+    @property
+    def estimated_wait_time(self) -> float:
+        # Расчетное время ожидания исполнения новой команды по средней длительности исполнения последних команд
+        average_execution_time = self._statistics.average_execution_time
+        if not average_execution_time:
+            return 0.0
+        return self._pending_count * average_execution_time
 
     def __str__(self):
         return self._commands_queue.__str__()
@@ -129,69 +322,320 @@ class Invoker(AbstractInvoker):
         await self._commands_queue.join()
 
 
+class PoolMemberInformation:
+    # Состояние устройства пула: идентификатор устройства, количество ожидающих исполнения команд, расчетное время
+    # ожидания, статистика исполнения команд, статистика ожидания команд по классам приоритета и гистограммы
+    # длительности вызовов драйвера устройства (None, если вызовы драйвера не измеряются)
+    __slots__ = ('device_id', 'pending_count', 'estimated_wait_time', 'statistics', 'wait_statistics',
+                 'driver_call_statistics')
+
+    def __init__(self, device_id, pending_count: int, estimated_wait_time: float, statistics: InvokerStatistics,
+                 wait_statistics: dict, driver_call_statistics: HistogramSet = None):
+        self.device_id = device_id
+        self.pending_count = pending_count
+        self.estimated_wait_time = estimated_wait_time
+        self.statistics = statistics
+        self.wait_statistics = wait_statistics
+        self.driver_call_statistics = driver_call_statistics
+
+    def as_dict(self):
+        driver_call_statistics = self.driver_call_statistics
+        return dict(device_id=self.device_id, pending_count=self.pending_count,
+                    estimated_wait_time=self.estimated_wait_time, statistics=self.statistics.as_dict(),
+                    wait_statistics=self.wait_statistics,
+                    driver_calls=driver_call_statistics.as_dict() if driver_call_statistics else None)
+
+
+class CapacityState:
+    # Загрузка пула устройств, по которой проверяется возможность принять новые команды. Снимок состояния передается
+    # процессам, которые не владеют устройствами (см. hardware.remote)
+    __slots__ = ('pending_count', 'estimated_wait_time', 'pool_execution_time', 'max_size', 'max_wait_time')
+
+    def __init__(self, pending_count: int, estimated_wait_time: float, pool_execution_time: float,
+                 max_size: int = None, max_wait_time: float = None):
+        self.pending_count = pending_count
+        self.estimated_wait_time = estimated_wait_time
+        self.pool_execution_time = pool_execution_time
+        self.max_size = max_size
+        self.max_wait_time = max_wait_time
+
+    def add_pending(self, count: int):
+        # Команды, принятые после снимка состояния
+        self.pending_count += count
+        self.estimated_wait_time += count * self.pool_execution_time
+
+    @staticmethod
+    def _get_retry_after(excess_time: float) -> int:
+        return max(1, math.ceil(excess_time))
+
+    def check(self, count: int = 1):
+        pending_count = self.pending_count
+        if self.max_size is not None and pending_count + count > self.max_size:
+            retry_after = self._get_retry_after((pending_count + count - self.max_size) * self.pool_execution_time)
+            raise CommandQueueIsFull('The command queue is full ({} commands)'.format(pending_count), retry_after)
+        estimated_wait_time = self.estimated_wait_time
+        if count > 1:
+            # Расчетное время ожидания последней из принимаемых команд
+            estimated_wait_time += (count - 1) * self.pool_execution_time
+        if self.max_wait_time is not None and estimated_wait_time > self.max_wait_time:
+            raise CommandWaitTimeExceeded('The estimated wait time {:.1f}s exceeds {}s'.format(
+                estimated_wait_time, self.max_wait_time), self._get_retry_after(
+                estimated_wait_time - self.max_wait_time))
+
+
+class DevicePool:
+    # Пул кассовых устройств группы сервисов. У каждого устройства собственный исполнитель команд, новая команда
+    # передается исполнителю с наименьшим расчетным временем завершения (по количеству ожидающих команд и средней
+    # длительности исполнения команды на устройстве).
+    # max_size - максимальное количество ожидающих исполнения команд в пуле, max_wait_time - максимальное расчетное
+    # время ожидания исполнения новой команды в секундах. None - без ограничений.
+    def __init__(self, invoker_factory, max_size: int = None, max_wait_time: float = None):
+        self._invoker_factory = invoker_factory
+        self._invokers = []
+        self._max_size = max_size
+        self._max_wait_time = max_wait_time
+        self._paused = False
+
+    @property
+    def invokers(self) -> tuple:
+        return tuple(self._invokers)
+
+    @property
+    def devices(self) -> tuple:
+        return tuple(invoker.fr_adapter for invoker in self._invokers)
+
+    @property
+    def pending_count(self) -> int:
+        return sum(invoker.pending_count for invoker in self._invokers)
+
+    @property
+    def estimated_wait_time(self) -> float:
+        return min(invoker.estimated_wait_time for invoker in self._invokers)
+
+    @staticmethod
+    def _get_device_id(device):
+        # Идентификатор устанавливается сервисом создания устройств, у устройства, созданного иначе, его может не быть
+        return getattr(device, 'id', None)
+
+    def get_invoker(self, device_id=None) -> Invoker:
+        # Без идентификатора возвращает исполнитель первого (основного) устройства пула
+        if device_id is None:
+            return self._invokers[0]
+        for invoker in self._invokers:
+            if self._get_device_id(invoker.fr_adapter) == device_id:
+                return invoker
+        raise DeviceIsNotAttached('There is not a fiscal device with id {} in the pool'.format(device_id))
+
+    def add(self, device: AbstractRegistratorDriverAdapter):
+        invoker = self._invoker_factory(device)
+        self._invokers.append(invoker)
+        invoker.start()
+        return invoker
+
+    async def add_member(self, device: AbstractRegistratorDriverAdapter):
+        device_id = self._get_device_id(device)
+        if device_id is not None and device_id in map(self._get_device_id, self.devices):
+            raise DeviceIsRunning('The device with id {} has been already added to the pool'.format(device_id))
+        invoker = self.add(device)
+        if self._paused:
+            await invoker.pause()
+
+    async def remove_member(self, device_id) -> AbstractRegistratorDriverAdapter:
+        invoker = self.get_invoker(device_id)
+        if len(self._invokers) == 1:
+            raise DevicePoolError('The last device of the pool can not be removed, detach the device instead')
+        if self._paused:
+            # Команды приостановленного устройства не исполнились бы до его остановки
+            raise DevicePoolError('The device can not be removed while the command execution is paused')
+        # Новые команды устройству больше не передаются, уже полученные им команды исполняются до его остановки
+        self._invokers.remove(invoker)
+        await invoker.stop()
+        return invoker.fr_adapter
+
+    def _get_expected_completion_time(self, invoker: Invoker):
+        average_execution_time = invoker.statistics.average_execution_time or 0
+        return (invoker.pending_count + 1) * average_execution_time, invoker.pending_count
+
+    def put(self, command: AbstractCommand):
+        min(self._invokers, key=self._get_expected_completion_time).put(command)
+
+    def _get_pool_execution_time(self) -> float:
+        # Среднее время исполнения команды пулом: устройства пула исполняют команды параллельно
+        execution_times = [invoker.statistics.average_execution_time or 0 for invoker in self._invokers]
+        return sum(execution_times) / len(execution_times) / len(self._invokers)
+
+    def get_capacity_state(self) -> 'CapacityState':
+        return CapacityState(self.pending_count, self.estimated_wait_time, self._get_pool_execution_time(),
+                             self._max_size, self._max_wait_time)
+
+    def check_capacity(self, count: int = 1):
+        # count - количество команд, которые должны быть приняты вместе
+        self.get_capacity_state().check(count)
+
+    async def pause(self):
+        self._paused = True
+        for invoker in self._invokers:
+            await invoker.pause()
+
+    def resume(self):
+        self._paused = False
+        for invoker in self._invokers:
+            invoker.resume()
+
+    async def stop(self):
+        for invoker in self._invokers:
+            await invoker.stop()
+
+    @staticmethod
+    def _get_driver_call_statistics(device):
+        get_driver_call_statistics = getattr(device, 'get_driver_call_statistics', None)
+        return get_driver_call_statistics() if get_driver_call_statistics else None
+
+    def get_information(self) -> list:
+        return [PoolMemberInformation(self._get_device_id(invoker.fr_adapter), invoker.pending_count,
+                                      invoker.estimated_wait_time, invoker.statistics, invoker.wait_statistics,
+                                      self._get_driver_call_statistics(invoker.fr_adapter))
+                for invoker in self._invokers]
+
+
 class DeviceGroupManager(AbstractDeviceGroupManager, CommandProcessorInterface, DeviceAvailabilityCheck):
-    def __init__(self, name, loop):
+    # journal_factory - фабрика журналов команд, если она задана, команды каждой группы сервисов записываются в журнал
+    # и неисполненные команды восстанавливаются в очереди при подключении устройства.
+    # on_pools_changed - функции, которые вызываются без аргументов после подключения и отключения устройства группы
+    def __init__(self, name, loop, journal_factory: AbstractCommandJournalFactory = None):
         self._name = name
-        self._invokers = {}
-        self._fiscal_devices = {}
+        self._pools = {}
+        self._journals = {}
         self._loop = loop
+        self._journal_factory = journal_factory
+        self.on_pools_changed = []
+
+    def _notify_pools_changed(self):
+        for callback in self.on_pools_changed:
+            callback()
 
     @property
     def name(self):
         return self._name.lower()
 
-    def _invoker_factory(self, device):
-        return Invoker(device, self._loop)
+    def _invoker_factory(self, device, user_priorities=None, user_weights=None, on_executed=None):
+        return Invoker(device, self._loop, scheduler=FairCommandScheduler(user_priorities, user_weights),
+                       on_executed=on_executed)
+
+    def _pool_factory(self, max_size=None, max_wait_time=None, user_priorities=None, user_weights=None,
+                      on_executed=None):
+        return DevicePool(partial(self._invoker_factory, user_priorities=user_priorities, user_weights=user_weights,
+                                  on_executed=on_executed), max_size, max_wait_time)
 
-    def add_device(self, service_group_id, device_adapter: AbstractRegistratorDriverAdapter):
-        if self._fiscal_devices.get(service_group_id, None):
+    def _get_pool(self, service_group_id) -> DevicePool:
+        try:
+            return self._pools[service_group_id]
+        except KeyError:
+            raise DeviceIsNotAttached('There is not a fiscal device adapter attached to service group {}'. \
+                                      format(service_group_id))
+
+    def add_device(self, service_group_id, device_adapter: AbstractRegistratorDriverAdapter, max_queue_size=None,
+                   max_wait_time=None, user_priorities: dict = None, user_weights: dict = None):
+        # user_priorities - классы приоритета команд пользователей по умолчанию, user_weights - веса пользователей
+        # при распределении очереди между ними
+        if self._pools.get(service_group_id, None):
             raise DeviceIsRunning('The device with group id {} has been already provided'.format(service_group_id))
-        self._fiscal_devices[service_group_id] = device_adapter
-        self._invokers[service_group_id] = self._invoker_factory(device_adapter)
+        journal = self._journal_factory.create_journal(service_group_id) if self._journal_factory else None
+        unfinished_commands = journal.load() if journal else []
+        pool = self._pool_factory(max_queue_size, max_wait_time, user_priorities, user_weights,
+                                  journal.complete if journal else None)
+        pool.add(device_adapter)
+        # Неисполненные до остановки команды ставятся в очередь раньше новых команд
+        for command in unfinished_commands:
+            pool.put(command)
+        if unfinished_commands:
+            logger.info('%d unfinished commands of service group %s were restored from the journal',
+                        len(unfinished_commands), service_group_id)
+        if journal:
+            self._journals[service_group_id] = journal
+        self._pools[service_group_id] = pool
+        self._notify_pools_changed()
+
+    async def add_pool_member(self, service_group_id, device_adapter: AbstractRegistratorDriverAdapter):
+        await self._get_pool(service_group_id).add_member(device_adapter)
+
+    async def remove_pool_member(self, service_group_id, device_id):
+        adapter = await self._get_pool(service_group_id).remove_member(device_id)
+        await adapter.close()
 
-    async def replace_device(self, service_group_id, device_adapter):
-        await self._invokers[service_group_id].set_fr_adapter(device_adapter)
-        old_adapter = self._fiscal_devices[service_group_id]
-        self._fiscal_devices[service_group_id] = device_adapter
+    async def replace_device(self, service_group_id, device_adapter, device_id=None):
+        invoker = self._get_pool(service_group_id).get_invoker(device_id)
+        old_adapter = invoker.fr_adapter
+        await invoker.set_fr_adapter(device_adapter)
         await old_adapter.close()
 
     async def process_command(self, service_group_id, command):
-        self._invokers[service_group_id].put(command)
+        pool = self._pools[service_group_id]
+        journal = self._journals.get(service_group_id)
+        if journal:
+            await journal.append(command)
+        pool.put(command)
+
+    async def process_commands(self, service_group_id, commands: list):
+        # Команды записываются в журнал одной записью на диск и ставятся в очередь вместе
+        pool = self._pools[service_group_id]
+        journal = self._journals.get(service_group_id)
+        if journal:
+            await journal.append_many(commands)
+        for command in commands:
+            pool.put(command)
+
+    def check_capacity(self, service_group_id, count: int = 1):
+        self._get_pool(service_group_id).check_capacity(count)
+
+    def get_capacity_states(self) -> dict:
+        # Идентификатор группы сервисов -> CapacityState ее пула
+        return {service_group_id: pool.get_capacity_state() for service_group_id, pool in self._pools.items()}
 
     async def open_shift(self, service_group_id):
-        await self._fiscal_devices[service_group_id].open_shift()
+        for device in self._pools[service_group_id].devices:
+            await device.open_shift()
 
     async def close_shift(self, service_group_id):
-        await self._fiscal_devices[service_group_id].close_shift()
+        for device in self._pools[service_group_id].devices:
+            await device.close_shift()
 
-    async def get_shift_info(self, service_group_id) -> ShiftInformation:
-        return await self._fiscal_devices[service_group_id].get_shift_info()
+    async def get_shift_info(self, service_group_id, device_id=None) -> ShiftInformation:
+        return await self._pools[service_group_id].get_invoker(device_id).fr_adapter.get_shift_info()
 
     async def close_device(self, service_group_id):
-        await self._fiscal_devices[service_group_id].close()
+        for device in self._pools[service_group_id].devices:
+            await device.close()
 
     async def pause_command_execution(self, service_group_id):
-        await self._invokers[service_group_id].pause()
+        await self._pools[service_group_id].pause()
 
     async def resume_command_execution(self, service_group_id):
-        await self._invokers[service_group_id].resume()
+        self._pools[service_group_id].resume()
+
+    def get_pool_information(self, service_group_id) -> list:
+        return self._get_pool(service_group_id).get_information()
 
     async def reboot(self, service_group_id):
-        await self._fiscal_devices[service_group_id].reboot()
+        for device in self._pools[service_group_id].devices:
+            await device.reboot()
 
     async def detach_device(self, service_group_id):
-        try:
-            adapter = self._fiscal_devices.pop(service_group_id)
-        except KeyError:
-            raise DeviceIsNotAttached('There is not a fiscal device adapter attached to service group {}'. \
-                                      format(service_group_id))
-        invoker = self._invokers.pop(service_group_id)
-        await invoker.wait_all_executed()
-        await adapter.close()
+        pool = self._get_pool(service_group_id)
+        self._pools.pop(service_group_id)
+        self._notify_pools_changed()
+        await pool.stop()
+        logger.info('The device pool of service group %s stopped, statistics: %s', service_group_id,
+                    [item.as_dict() for item in pool.get_information()])
+        journal = self._journals.pop(service_group_id, None)
+        if journal:
+            await journal.close()
+        for device in pool.devices:
+            await device.close()
 
     def is_device_provided_for_group(self, service_group_id):
-        return self._fiscal_devices.get(service_group_id, False)
+        return service_group_id in self._pools
 
     async def close(self):
-        for gr_id in list(self._fiscal_devices.keys()):
+        for gr_id in list(self._pools.keys()):
             await self.detach_device(gr_id)
@@ -0,0 +1,291 @@
+import asyncio
+import json
+import os
+from abc import ABC, abstractmethod
+from logging import getLogger
+from core.commands import AbstractCommand, AbstractCommandSerializer
+from core.serialization import dumps, loads
+
+
+logger = getLogger(__name__)
+
+
+class AbstractCommandJournal(ABC):
+    # Журнал упреждающей записи команд очереди устройства. Команда записывается в журнал до постановки в очередь,
+    # после исполнения в журнал записывается отметка о завершении. Неисполненные команды восстанавливаются из журнала
+    # после перезапуска.
+    @abstractmethod
+    def load(self) -> list:
+        # Открывает журнал и возвращает неисполненные команды в порядке их записи
+        pass
+
+    @abstractmethod
+    async def append(self, command: AbstractCommand):
+        # Возвращает управление после того, как запись сохранена на диске
+        pass
+
+    async def append_many(self, commands: list):
+        # Команды записываются в журнал вместе, управление возвращается после сохранения всех записей
+        await asyncio.gather(*(self.append(command) for command in commands))
+
+    @abstractmethod
+    async def complete(self, command: AbstractCommand):
+        pass
+
+    @abstractmethod
+    async def close(self):
+        pass
+
+
+class AbstractCommandJournalFactory(ABC):
+    @abstractmethod
+    def create_journal(self, service_group_id) -> AbstractCommandJournal:
+        pass
+
+
+class FileCommandJournal(AbstractCommandJournal):
+    # Журнал в виде сегментов - файлов с записями в формате JSON по одной на строке:
+    # {"t":"e","id":1,"d":{...}} - команда поставлена в очередь, {"t":"c","id":1} - команда исполнена.
+    # Записи, добавленные за время предыдущей записи на диск, записываются вместе с одним вызовом fsync
+    # (group commit). Когда размер текущего сегмента превышает segment_size, создается новый сегмент. Старые сегменты
+    # без неисполненных команд удаляются, а если закрытых сегментов больше compaction_threshold, неисполненные команды
+    # из них переписываются в новый сегмент со следующим номером. Старые сегменты удаляются только после того, как
+    # новый сегмент сохранен на диске, поэтому после аварийной остановки на любом шаге уплотнения в журнале есть либо
+    # старые сегменты, либо новый целиком. Повторные записи о команде при чтении журнала ничего не меняют.
+    _segment_suffix = '.log'
+    _temp_suffix = '.tmp'
+
+    def __init__(self, directory: str, serializer: AbstractCommandSerializer, loop: asyncio.AbstractEventLoop,
+                 segment_size: int = 4 * 1024 * 1024, compaction_threshold: int = 4, commit_delay: float = 0):
+        self._directory = directory
+        self._serializer = serializer
+        self._loop = loop
+        self._segment_size = segment_size
+        self._compaction_threshold = compaction_threshold
+        self._commit_delay = commit_delay
+        self._segments = []  # номера закрытых сегментов
+        self._current_segment = None
+        self._file = None
+        self._next_id = 1
+        self._live = {}  # id неисполненной команды -> (номер сегмента, строка записи)
+        self._segment_live_counts = {}
+        self._buffer = []
+        self._waiters = []
+        self._flush_task = None
+
+    def _get_segment_path(self, segment: int) -> str:
+        return os.path.join(self._directory, '{:010d}{}'.format(segment, self._segment_suffix))
+
+    def _get_segment_numbers(self) -> list:
+        return sorted(int(name[:-len(self._segment_suffix)]) for name in os.listdir(self._directory)
+                      if name.endswith(self._segment_suffix) and name[:-len(self._segment_suffix)].isdigit())
+
+    @staticmethod
+    def _read_segment(path):
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    yield line, json.loads(line)
+                except ValueError:
+                    # Запись, которую не успели дописать до конца при аварийной остановке
+                    logger.warning('The broken record was skipped in the command journal %s', path)
+
+    def load(self) -> list:
+        os.makedirs(self._directory, exist_ok=True)
+        for name in os.listdir(self._directory):
+            if name.endswith(self._segment_suffix + self._temp_suffix):
+                # Сегмент уплотнения, который не успели сохранить при аварийной остановке
+                os.remove(os.path.join(self._directory, name))
+        self._segments = self._get_segment_numbers()
+        for segment in self._segments:
+            for line, record in self._read_segment(self._get_segment_path(segment)):
+                self._next_id = max(self._next_id, record['id'] + 1)
+                if record['t'] == 'e':
+                    self._live[record['id']] = (segment, line if line.endswith('\n') else line + '\n')
+                else:
+                    self._live.pop(record['id'], None)
+        commands = []
+        for command_id in sorted(self._live.keys()):
+            segment, line = self._live[command_id]
+            self._segment_live_counts[segment] = self._segment_live_counts.get(segment, 0) + 1
+            command = self._serializer.deserialize(loads(line)['d'])
+            command.journal_id = command_id
+            commands.append(command)
+        self._open_segment(self._segments[-1] + 1 if self._segments else 1)
+        self._remove_completed_segments()
+        return commands
+
+    def _open_segment(self, segment: int):
+        self._current_segment = segment
+        self._file = open(self._get_segment_path(segment), 'a', encoding='utf-8')
+
+    def _create_entry(self, command: AbstractCommand):
+        command_id = self._next_id
+        self._next_id += 1
+        line = dumps({'t': 'e', 'id': command_id, 'd': self._serializer.serialize(command)}) + '\n'
+        command.journal_id = command_id
+        return command_id, line
+
+    async def append(self, command: AbstractCommand):
+        command_id, line = self._create_entry(command)
+        await self._write(line, command_id)
+
+    async def append_many(self, commands: list):
+        # Все записи попадают в одну запись на диск
+        if not commands:
+            return
+        waiter = self._loop.create_future()
+        self._buffer.extend(self._create_entry(command) for command in commands)
+        self._waiters.append(waiter)
+        if self._flush_task is None:
+            self._flush_task = self._loop.create_task(self._flush())
+        await waiter
+
+    async def complete(self, command: AbstractCommand):
+        command_id = getattr(command, 'journal_id', None)
+        if command_id not in self._live:
+            return
+        segment, line = self._live.pop(command_id)
+        self._segment_live_counts[segment] -= 1
+        await self._write(dumps({'t': 'c', 'id': command_id}) + '\n')
+
+    async def _write(self, line: str, command_id=None):
+        # command_id передается для записи о постановке команды в очередь
+        waiter = self._loop.create_future()
+        self._buffer.append((command_id, line))
+        self._waiters.append(waiter)
+        if self._flush_task is None:
+            self._flush_task = self._loop.create_task(self._flush())
+        await waiter
+
+    def _write_lines(self, lines: list):
+        self._file.write(''.join(line for command_id, line in lines))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    async def _flush(self):
+        try:
+            while self._buffer:
+                if self._commit_delay:
+                    await asyncio.sleep(self._commit_delay)
+                lines, waiters = self._buffer, self._waiters
+                self._buffer, self._waiters = [], []
+                for command_id, line in lines:
+                    if command_id is not None:
+                        self._live[command_id] = (self._current_segment, line)
+                        self._segment_live_counts[self._current_segment] = \
+                            self._segment_live_counts.get(self._current_segment, 0) + 1
+                try:
+                    await self._loop.run_in_executor(None, self._write_lines, lines)
+                except Exception as e:
+                    logger.error('The command journal %s write failed: %s', self._directory, str(e))
+                    for command_id, line in lines:
+                        if command_id is not None and self._live.pop(command_id, None):
+                            self._segment_live_counts[self._current_segment] -= 1
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_exception(e)
+                    continue
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+                if self._file.tell() >= self._segment_size:
+                    # Сегменты переключаются, пока нет незавершенной записи на диск
+                    await self._rotate()
+        finally:
+            self._flush_task = None
+
+    async def _rotate(self):
+        self._file.close()
+        self._segments.append(self._current_segment)
+        next_segment = self._current_segment + 1
+        self._remove_completed_segments()
+        if len(self._segments) > self._compaction_threshold and await self._compact(next_segment):
+            next_segment += 1
+        self._open_segment(next_segment)
+
+    def _remove_completed_segments(self):
+        # Отметки о завершении находятся в том же или в более позднем сегменте, чем запись о команде, поэтому
+        # удаляются только первые по порядку сегменты без неисполненных команд
+        while self._segments and not self._segment_live_counts.get(self._segments[0], 0):
+            segment = self._segments.pop(0)
+            self._segment_live_counts.pop(segment, None)
+            os.remove(self._get_segment_path(segment))
+
+    def _write_segment(self, segment: int, data: str):
+        path = self._get_segment_path(segment)
+        with open(path + self._temp_suffix, 'w', encoding='utf-8') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + self._temp_suffix, path)
+        self._sync_directory()
+
+    def _sync_directory(self):
+        descriptor = os.open(self._directory, os.O_RDONLY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+    def _remove_segments(self, segments: list):
+        for segment in segments:
+            os.remove(self._get_segment_path(segment))
+        self._sync_directory()
+
+    async def _compact(self, target_segment: int) -> bool:
+        # Неисполненные команды закрытых сегментов записываются в сегмент target_segment, номер которого больше
+        # номеров закрытых сегментов и меньше номера следующего текущего сегмента. Команды, исполненные во время
+        # записи, отмечаются в следующем текущем сегменте.
+        closed_segments = self._segments
+        live_items = sorted((command_id, line) for command_id, (segment, line) in self._live.items()
+                            if segment in set(closed_segments))
+        try:
+            await self._loop.run_in_executor(None, self._write_segment, target_segment,
+                                             ''.join(line for command_id, line in live_items))
+        except Exception as e:
+            logger.error('The command journal %s compaction failed: %s', self._directory, str(e))
+            return False
+        live_count = 0
+        for command_id, line in live_items:
+            if command_id in self._live:
+                self._live[command_id] = (target_segment, line)
+                live_count += 1
+        for segment in closed_segments:
+            self._segment_live_counts.pop(segment, None)
+        self._segment_live_counts[target_segment] = live_count
+        self._segments = [target_segment]
+        try:
+            await self._loop.run_in_executor(None, self._remove_segments, closed_segments)
+        except Exception as e:
+            # Оставшиеся сегменты содержат только повторы записей нового сегмента и отметки о завершении
+            logger.error('The command journal %s segments were not removed: %s', self._directory, str(e))
+        return True
+
+    @property
+    def unfinished_count(self) -> int:
+        return len(self._live)
+
+    @property
+    def segments_count(self) -> int:
+        return len(self._segments) + 1
+
+    async def close(self):
+        if self._flush_task:
+            await self._flush_task
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class FileCommandJournalFactory(AbstractCommandJournalFactory):
+    def __init__(self, directory: str, serializer: AbstractCommandSerializer, loop: asyncio.AbstractEventLoop,
+                 **journal_settings):
+        self._directory = directory
+        self._serializer = serializer
+        self._loop = loop
+        self._journal_settings = journal_settings
+
+    def create_journal(self, service_group_id) -> FileCommandJournal:
+        return FileCommandJournal(os.path.join(self._directory, str(service_group_id)), self._serializer, self._loop,
+                                  **self._journal_settings)
@@ -0,0 +1,223 @@
+import asyncio
+from logging import getLogger
+from core.commands import AbstractCommandSerializer
+from core.events import AbstractEventDispatcher
+from core.ipc import IpcClient, IpcServer, IpcConnection, current_connection, pack_message
+from .fiscal_device_group_managers import (CommandProcessorInterface, DeviceAvailabilityCheck, DeviceGroupManager,
+                                           DeviceIsNotAttached, CapacityState)
+
+logger = getLogger(__name__)
+
+# Работа с устройствами из нескольких процессов сервера. Устройствами владеет один процесс (владелец), HTTP-запросы
+# обрабатывают процессы-исполнители. Исполнитель передает принятые команды владельцу по IPC (см. core.ipc), владелец
+# ставит их в очереди устройств и возвращает события исполнения команд исполнителю, который принял команду.
+
+DEVICE_GROUP_MANAGER = 'device_group_manager'
+CAPACITY_TOPIC = 'capacity'
+EVENT_TOPIC = 'event'
+
+
+class CommandEventPublisher(AbstractEventDispatcher):
+    # Диспетчер событий команд в процессе-владельце. Событие передается исполнителю, который принял команду, с
+    # признаком origin = True: он записывает событие в журнал событий и передает его подписчикам (модель чтения,
+    # webhooks). Остальные исполнители получают событие с origin = False, чтобы сбросить кэши и уведомить своих
+    # клиентов. Если принявший команду исполнитель завершился, событие обрабатывает другой исполнитель. Пока нет ни
+    # одного исполнителя, события накапливаются (не более max_undelivered) и передаются первому подключившемуся.
+    # Останавливающийся исполнитель отписывается от событий, после этого события его команд обрабатывают другие.
+    def __init__(self, server: IpcServer, max_undelivered: int = 10000):
+        self._server = server
+        self._max_undelivered = max_undelivered
+        self._origins = {}  # идентификатор сущности -> IpcConnection исполнителя, который принял команду
+        self._unsubscribed = set()  # идентификаторы соединений исполнителей
+        self._undelivered = []
+        server.on_connected.append(self._on_connected)
+        server.on_disconnected.append(self._on_disconnected)
+
+    def add_subscriber(self, event_type: type, subscriber):
+        raise NotImplementedError('The events are handled by the subscribers of the worker processes')
+
+    def detach_subscriber(self, event_type, subscriber):
+        pass
+
+    def set_origin(self, entity_id, connection: IpcConnection):
+        self._origins[entity_id] = connection
+
+    def discard_origin(self, entity_id):
+        self._origins.pop(entity_id, None)
+
+    def unsubscribe(self, connection: IpcConnection):
+        self._unsubscribed.add(connection.id)
+
+    def _on_connected(self, connection: IpcConnection):
+        undelivered, self._undelivered = self._undelivered, []
+        for event in undelivered:
+            self.publish(event)
+
+    def _on_disconnected(self, connection: IpcConnection):
+        self._unsubscribed.discard(connection.id)
+
+    def publish(self, event):
+        # Событие команды последнее для сущности, поэтому исполнитель, принявший команду, больше не нужен
+        origin = self._origins.pop(event.entity_id, None)
+        connections = [connection for connection in self._server.connections
+                       if not connection.is_closed and connection.id not in self._unsubscribed]
+        if not connections:
+            if len(self._undelivered) < self._max_undelivered:
+                self._undelivered.append(event)
+            else:
+                logger.error('There are not worker processes, the event %s of %s %s is lost', type(event).__name__,
+                             event.entity, event.entity_id)
+            return
+        if origin not in connections:
+            origin = connections[0]
+        replica = pack_message(('push', EVENT_TOPIC, (event, False)))
+        for connection in connections:
+            if connection is origin:
+                connection.push(EVENT_TOPIC, (event, True))
+            else:
+                connection.write(replica)
+
+    async def handle(self, event):
+        self.publish(event)
+
+
+class DeviceCommandReceiver:
+    # Объект процесса-владельца, который вызывают исполнители: команды восстанавливаются сериализатором, диспетчер
+    # событий которого - CommandEventPublisher, и передаются менеджеру устройств. Снимки загрузки пулов (CapacityState)
+    # рассылаются исполнителям каждые capacity_interval секунд, сразу после подключения исполнителя и после
+    # подключения и отключения устройств.
+    def __init__(self, device_group_manager: DeviceGroupManager, command_serializer: AbstractCommandSerializer,
+                 event_publisher: CommandEventPublisher, server: IpcServer, loop: asyncio.AbstractEventLoop = None,
+                 capacity_interval: float = 0.05):
+        self._device_group_manager = device_group_manager
+        self._serializer = command_serializer
+        self._event_publisher = event_publisher
+        self._server = server
+        self._loop = loop or asyncio.get_event_loop()
+        self._capacity_interval = capacity_interval
+        self._task = None
+        server.register(DEVICE_GROUP_MANAGER, self)
+        server.on_connected.append(self._on_connected)
+        device_group_manager.on_pools_changed.append(self._broadcast_capacity_states)
+
+    def _on_connected(self, connection: IpcConnection):
+        connection.push(CAPACITY_TOPIC, self._device_group_manager.get_capacity_states())
+
+    async def process_commands(self, service_group_id, data: list):
+        commands = [self._serializer.deserialize(item) for item in data]
+        connection = current_connection.get()
+        for command in commands:
+            self._event_publisher.set_origin(command.receipt.id, connection)
+        try:
+            await self._device_group_manager.process_commands(service_group_id, commands)
+        except Exception:
+            for command in commands:
+                self._event_publisher.discard_origin(command.receipt.id)
+            raise
+
+    async def unsubscribe(self):
+        self._event_publisher.unsubscribe(current_connection.get())
+
+    def start(self):
+        if self._task is None:
+            self._task = self._loop.create_task(self._publish_capacity_states())
+
+    def _broadcast_capacity_states(self):
+        if self._server.connections:
+            self._server.broadcast(CAPACITY_TOPIC, self._device_group_manager.get_capacity_states())
+
+    async def _publish_capacity_states(self):
+        while True:
+            await asyncio.sleep(self._capacity_interval)
+            self._broadcast_capacity_states()
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+class RemoteDeviceGroupManager(CommandProcessorInterface, DeviceAvailabilityCheck):
+    # Менеджер устройств процесса-исполнителя. Проверки наличия устройства и загрузки пула синхронны, поэтому
+    # выполняются по последнему снимку загрузки пулов от владельца, команды, принятые исполнителем после снимка,
+    # учитываются в нем сразу. События команд, принятых этим исполнителем, передаются event_dispatcher, события
+    # остальных исполнителей - корутинной функции on_replicated_event. События обрабатываются одной задачей в порядке
+    # получения, чтобы не задерживать чтение ответов владельца.
+    def __init__(self, client: IpcClient, command_serializer: AbstractCommandSerializer,
+                 event_dispatcher: AbstractEventDispatcher, loop: asyncio.AbstractEventLoop = None,
+                 on_replicated_event=None):
+        self._client = client
+        self._serializer = command_serializer
+        self._event_dispatcher = event_dispatcher
+        self._loop = loop or asyncio.get_event_loop()
+        self._on_replicated_event = on_replicated_event
+        self._capacity_states = {}
+        self._events = asyncio.Queue()
+        self._task = None
+        client.on_push = self.handle_push
+
+    def handle_push(self, topic: str, payload):
+        if topic == CAPACITY_TOPIC:
+            self._capacity_states = payload
+        elif topic == EVENT_TOPIC:
+            self._events.put_nowait(payload)
+            if self._task is None:
+                self._task = self._loop.create_task(self._handle_events())
+
+    async def _handle_events(self):
+        while True:
+            event, origin = await self._events.get()
+            try:
+                if origin:
+                    await self._event_dispatcher.handle(event)
+                elif self._on_replicated_event:
+                    await self._on_replicated_event(event)
+            except Exception as e:
+                logger.error('Error during handling the event %s of %s %s: %s', type(event).__name__, event.entity,
+                             event.entity_id, str(e))
+            finally:
+                self._events.task_done()
+
+    def _get_capacity_state(self, service_group_id) -> CapacityState:
+        try:
+            return self._capacity_states[service_group_id]
+        except KeyError:
+            raise DeviceIsNotAttached('There is not a fiscal device adapter attached to service group {}'.format(
+                service_group_id))
+
+    def is_device_provided_for_group(self, service_group_id):
+        return service_group_id in self._capacity_states
+
+    def check_capacity(self, service_group_id, count: int = 1):
+        self._get_capacity_state(service_group_id).check(count)
+
+    async def process_command(self, service_group_id, command):
+        await self.process_commands(service_group_id, [command])
+
+    async def process_commands(self, service_group_id, commands: list):
+        await self._client.call(DEVICE_GROUP_MANAGER, 'process_commands', service_group_id,
+                                [self._serializer.serialize(command) for command in commands])
+        capacity_state = self._capacity_states.get(service_group_id)
+        if capacity_state is not None:
+            capacity_state.add_pending(len(commands))
+
+    async def close(self):
+        # Исполнитель отписывается от событий, уже полученные события обрабатываются до его остановки
+        try:
+            await self._client.call(DEVICE_GROUP_MANAGER, 'unsubscribe')
+        except ConnectionError:
+            pass
+        if self._task is None:
+            return
+        await self._events.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
@@ -0,0 +1,164 @@
+import asyncio
+from heapq import heappush, heappop
+from itertools import count
+from core.commands import CommandPriority
+from .adapters.base import AbstractTimeCounter, DefaultTimeCounter
+
+
+class WaitTimeStatistics:
+    # Статистика времени ожидания команд класса приоритета в очереди
+    __slots__ = ('_count', '_last_wait_time', '_average_wait_time', '_max_wait_time', '_smoothing')
+
+    def __init__(self, smoothing: float = 0.2):
+        self._count = 0
+        self._last_wait_time = None
+        self._average_wait_time = None
+        self._max_wait_time = None
+        self._smoothing = smoothing
+
+    def add(self, wait_time: float):
+        self._count += 1
+        self._last_wait_time = wait_time
+        if self._average_wait_time is None:
+            self._average_wait_time = wait_time
+        else:
+            self._average_wait_time += self._smoothing * (wait_time - self._average_wait_time)
+        if self._max_wait_time is None or wait_time > self._max_wait_time:
+            self._max_wait_time = wait_time
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def last_wait_time(self):
+        return self._last_wait_time
+
+    @property
+    def average_wait_time(self):
+        return self._average_wait_time
+
+    @property
+    def max_wait_time(self):
+        return self._max_wait_time
+
+    def as_dict(self):
+        return dict(count=self.count, last_wait_time=self.last_wait_time, average_wait_time=self.average_wait_time,
+                    max_wait_time=self.max_wait_time)
+
+
+class PriorityClassQueue:
+    # Очередь одного класса приоритета. Команды пользователей чередуются по алгоритму взвешенной справедливой очереди
+    # (weighted fair queueing): каждой команде назначается виртуальное время завершения, которое растет для
+    # пользователя тем медленнее, чем больше его вес. Первой исполняется команда с наименьшим временем завершения.
+    __slots__ = ('_heap', '_virtual_time', '_user_finish_tags', '_counter')
+
+    def __init__(self):
+        self._heap = []
+        self._virtual_time = 0.0
+        self._user_finish_tags = {}
+        self._counter = count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __iter__(self):
+        return (element[3] for element in self._heap)
+
+    def push(self, item, user_id, weight: float):
+        start_tag = max(self._virtual_time, self._user_finish_tags.get(user_id, 0.0))
+        finish_tag = start_tag + 1 / weight
+        self._user_finish_tags[user_id] = finish_tag
+        heappush(self._heap, (finish_tag, next(self._counter), start_tag, item))
+
+    def head(self):
+        return self._heap[0][3]
+
+    def pop(self):
+        finish_tag, _, start_tag, item = heappop(self._heap)
+        self._virtual_time = start_tag
+        if not self._heap:
+            # Очередь пуста, накопленные пользователями виртуальные времена больше не нужны
+            self._user_finish_tags.clear()
+        return item
+
+
+class ScheduledCommands:
+    # Очереди классов приоритета планировщика, ключ - значение приоритета
+    __slots__ = ('classes', '_size')
+
+    def __init__(self):
+        self.classes = {}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for queue in self.classes.values():
+            yield from queue
+
+    def __repr__(self):
+        return repr({CommandPriority.get_name(priority): len(queue) for priority, queue in self.classes.items()})
+
+    def push(self, priority: int, item, user_id, weight: float):
+        try:
+            queue = self.classes[priority]
+        except KeyError:
+            queue = self.classes[priority] = PriorityClassQueue()
+        queue.push(item, user_id, weight)
+        self._size += 1
+
+    def pop(self, priority: int):
+        self._size -= 1
+        return self.classes[priority].pop()
+
+
+class FairCommandScheduler(asyncio.Queue):
+    # Очередь команд устройства. Классы приоритета обслуживаются в порядке приоритета с учетом старения: каждые
+    # aging_interval секунд ожидания повышают приоритет первой команды класса на единицу, поэтому команды низких классов
+    # не ждут бесконечно. Внутри класса команды разных пользователей чередуются в соответствии с весами пользователей.
+    # Элементы очереди должны иметь атрибуты command и enqueued_at (см. QueuedCommand).
+    # user_priorities - классы приоритета пользователей по умолчанию, user_weights - веса пользователей (по умолчанию 1)
+    def __init__(self, user_priorities: dict = None, user_weights: dict = None, aging_interval: float = 10.0,
+                 time_counter: AbstractTimeCounter = None):
+        self._user_priorities = user_priorities or {}
+        self._user_weights = user_weights or {}
+        self._aging_interval = aging_interval
+        self._time_counter = time_counter if time_counter else DefaultTimeCounter()
+        self._wait_statistics = {}
+        super().__init__()
+
+    def _init(self, maxsize):
+        self._queue = ScheduledCommands()
+
+    def _get_priority(self, command) -> int:
+        if command.is_priority_requested:
+            return command.priority
+        return self._user_priorities.get(command.user_id, command.priority)
+
+    def _put(self, item):
+        command = item.command
+        self._queue.push(self._get_priority(command), item, command.user_id,
+                         self._user_weights.get(command.user_id, 1))
+
+    def _get_effective_priority(self, priority, now):
+        waited = now - self._queue.classes[priority].head().enqueued_at
+        return priority - waited / self._aging_interval, priority
+
+    def _get(self):
+        now = self._time_counter.get_time_value()
+        not_empty_classes = [priority for priority, queue in self._queue.classes.items() if queue]
+        priority = min(not_empty_classes, key=lambda item: self._get_effective_priority(item, now))
+        item = self._queue.pop(priority)
+        try:
+            statistics = self._wait_statistics[priority]
+        except KeyError:
+            statistics = self._wait_statistics[priority] = WaitTimeStatistics()
+        statistics.add(now - item.enqueued_at)
+        return item
+
+    def get_wait_statistics(self) -> dict:
+        # Статистика времени ожидания команд по классам приоритета
+        return {CommandPriority.get_name(priority): statistics.as_dict()
+                for priority, statistics in sorted(self._wait_statistics.items())}
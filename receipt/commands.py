@@ -1,20 +1,30 @@
 import datetime
 from logging import getLogger
-from core.commands import AbstractCommand, ExecutionFailedError
+from core.commands import AbstractCommand, ExecutionFailedError, CommandPriority, AbstractCommandSerializer
+from core.events import AbstractEventDispatcher
 from .events import ReceiptRegistationFailed, ReceiptRegistered
 from .domain.receipt import ReceiptRegistrationError
+from .domain.factories import AbstractReceiptFromDictFactory, ReceiptToDictConverter, get_default_receipt_factory
 
 
 logger = getLogger(__name__)
 
 
 class RegisterReceiptCommand(AbstractCommand):
-    _priority = 5
+    _priority = CommandPriority.NORMAL
 
-    def __init__(self, receipt, event_distatcher):
+    def __init__(self, receipt, event_distatcher, priority: int = None):
         self.datetime = datetime.datetime.now()
         self._receipt = receipt
         self._event_dispatcher = event_distatcher
+        self.user_id = receipt.user_id
+        if priority is not None:
+            self._priority = priority
+            self.is_priority_requested = True
+
+    @property
+    def receipt(self):
+        return self._receipt
 
     async def execute(self, fiscal_machine):
         logger.debug('The command %s started executing on fiscal device %s, receipt_id %d', str(self),
@@ -34,4 +44,23 @@ class RegisterReceiptCommand(AbstractCommand):
 
         await self._event_dispatcher.handle(ReceiptRegistered(self._receipt))
         logger.debug('The command %s executed on fiscal device %s, receipt_id %d', str(self),
-                     str(fiscal_machine), self._receipt.id)
\ No newline at end of file
+                     str(fiscal_machine), self._receipt.id)
+
+
+class RegisterReceiptCommandSerializer(AbstractCommandSerializer):
+    def __init__(self, event_dispatcher: AbstractEventDispatcher, receipt_factory: AbstractReceiptFromDictFactory = None):
+        self._event_dispatcher = event_dispatcher
+        self._receipt_factory = receipt_factory if receipt_factory else get_default_receipt_factory()
+        self._receipt_converter = ReceiptToDictConverter()
+
+    def serialize(self, command: RegisterReceiptCommand) -> dict:
+        receipt = command.receipt
+        return dict(user_id=receipt.user_id, service_id=receipt.service_id,
+                    priority=command.priority if command.is_priority_requested else None,
+                    datetime=command.datetime, receipt=self._receipt_converter.convert(receipt))
+
+    def deserialize(self, data: dict) -> RegisterReceiptCommand:
+        receipt = self._receipt_factory.create_receipt(data['user_id'], data['service_id'], data['receipt'])
+        command = RegisterReceiptCommand(receipt, self._event_dispatcher, data['priority'])
+        command.datetime = data['datetime']
+        return command
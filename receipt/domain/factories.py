@@ -56,7 +56,8 @@ class ReceiptFromDictFactory(AbstractReceiptFromDictFactory):
 
     def _set_tax_system(self, receipt, data):
         if data.get('tax_system', None):
-            receipt.tax_system = self._tax_system_map[(data['tax_system'])]
+            # Значение приходит числом после проверки запроса, ключи таблицы - строки
+            receipt.tax_system = self._tax_system_map.get(str(data['tax_system']))
             if receipt.tax_system is None:
                 msg = 'Системы налогообложения соответствующей значению tax_system = {} не предусмотрено'
                 raise ValueError(msg.format(data['tax_system']))
@@ -84,5 +85,38 @@ class ReceiptFromDictFactory(AbstractReceiptFromDictFactory):
                 raise ValueError('Ошибка в платеже с порядковым номером {}. {}'.format(i, error))
 
 
+class ReceiptToDictConverter:
+    # Преобразует чек в словарь входных данных, из которого ReceiptFromDictFactory создаст такой же чек
+    def convert(self, receipt: Receipt) -> dict:
+        data = dict(id=receipt.id, receiptType=receipt.get_type_int(), order_id=receipt.order_id,
+                    products=[self._convert_commodity(item) for item in receipt.commodities],
+                    payments=[dict(payment_type_int=item.get_type_int(), payment_sum=item.get_value())
+                              for item in receipt.payments])
+        if receipt.mistaken_receipt_number:
+            data['mistaken_receipt_number'] = receipt.mistaken_receipt_number.get_value()
+        if receipt.tax_system:
+            data['tax_system'] = str(receipt.tax_system.get_value_int())
+        if receipt.email:
+            data['email'] = receipt.email.get_value()
+        if receipt.phone_number:
+            data['phone_number'] = receipt.phone_number.get_value()
+        if receipt.correction_data:
+            correction_data = receipt.correction_data
+            data['correction_reason'] = correction_data.correction_reason.get_value()
+            data['correction_date'] = correction_data.correction_date
+            if correction_data.correction_doc_number:
+                data['doc_number'] = correction_data.correction_doc_number.get_value()
+            data['percept'] = correction_data.precept
+        return data
+
+    @staticmethod
+    def _convert_commodity(commodity) -> dict:
+        return dict(name=commodity.name.get_value(), quantity=commodity.quantity.get_value(),
+                    price=commodity.price.get_value(), commodity_type_int=commodity.get_type_int(),
+                    payment_state_int=commodity.payment_state.get_value(),
+                    quantity_prec=commodity.quantity.get_precision(), quantity_unit=commodity.quantity.get_str_unit(),
+                    tax_type_int=commodity.tax_type.get_value_int())
+
+
 def get_default_receipt_factory() -> ReceiptFromDictFactory:
     return ReceiptFromDictFactory(CommodityFactory(), PaymentFactory())
\ No newline at end of file
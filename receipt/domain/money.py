@@ -0,0 +1,62 @@
+import decimal
+
+
+# Денежные суммы и количества хранятся в домене целыми числами: суммы в копейках, количество умноженным на
+# 10 ** точность. Decimal используется только на границах домена: при разборе входного значения (округление
+# совпадает с прежним decimal.Decimal(value).quantize(..., rounding=decimal.ROUND_HALF_UP), в том числе ошибки) и
+# при выдаче значения наружу (get_value). Расчет итогов и проверка чека выполняются над целыми числами.
+# Предполагается точность контекста Decimal по умолчанию (28 знаков).
+
+_LIMIT = 10 ** decimal.DefaultContext.prec  # значения с большим числом цифр quantize не может представить
+_POWERS_OF_TEN = tuple(10 ** i for i in range(decimal.DefaultContext.prec + 1))
+_DECIMAL_POWERS_OF_TEN = tuple(decimal.Decimal(value) for value in _POWERS_OF_TEN)
+_EXPONENTS = tuple(decimal.Decimal(1).scaleb(-i) for i in range(decimal.DefaultContext.prec + 1))
+_Decimal = decimal.Decimal
+_ROUND_HALF_UP = decimal.ROUND_HALF_UP
+
+
+def _round_half_up(numerator: int, denominator: int) -> int:
+    # Деление с округлением половины от нуля, denominator > 0
+    quotient, remainder = divmod(abs(numerator), denominator)
+    if remainder * 2 >= denominator:
+        quotient += 1
+    return quotient if numerator >= 0 else -quotient
+
+
+def _check_digits(value: int) -> int:
+    if not -_LIMIT < value < _LIMIT:
+        raise decimal.InvalidOperation
+    return value
+
+
+def to_scaled_int(value, precision: int) -> int:
+    # Значение, умноженное на 10 ** precision и округленное до целого
+    if type(value) is int and precision < len(_POWERS_OF_TEN):
+        return _check_digits(value * _POWERS_OF_TEN[precision])
+    try:
+        exponent = _EXPONENTS[precision]
+    except IndexError:
+        raise decimal.InvalidOperation
+    value = _Decimal(value).quantize(exponent, _ROUND_HALF_UP)
+    if value.is_nan():
+        raise decimal.InvalidOperation
+    return int(value * _DECIMAL_POWERS_OF_TEN[precision])
+
+
+def from_scaled_int(value: int, precision: int) -> decimal.Decimal:
+    # Произведение на 10 ** -precision точное, показатель степени результата равен -precision, как после quantize
+    return _Decimal(value) * _EXPONENTS[precision]
+
+
+def multiply_scaled(first: int, first_precision: int, second: int, second_precision: int, precision: int) -> int:
+    # Произведение двух значений, округленное до precision знаков после запятой. Decimal округляет само произведение
+    # до точности контекста, для таких больших значений расчет выполняется через Decimal
+    product = first * second
+    if not -_LIMIT < product < _LIMIT:
+        result = (from_scaled_int(first, first_precision) * from_scaled_int(second, second_precision)).quantize(
+            _EXPONENTS[precision], rounding=decimal.ROUND_HALF_UP)
+        return int(result * _DECIMAL_POWERS_OF_TEN[precision])
+    shift = first_precision + second_precision - precision
+    if shift <= 0:
+        return _check_digits(product * _POWERS_OF_TEN[-shift])
+    return _round_half_up(product, _POWERS_OF_TEN[shift])
@@ -1,11 +1,13 @@
 from abc import ABC, abstractmethod
 import decimal
+from .money import to_scaled_int, from_scaled_int
 
 
 class Payment(ABC):
     def __init__(self, payment_sum):
+        # Сумма хранится в копейках
         try:
-            self._sum = decimal.Decimal(payment_sum).quantize(decimal.Decimal('0.01'), decimal.ROUND_HALF_UP)
+            self._sum = to_scaled_int(payment_sum, 2)
         except decimal.InvalidOperation:
             raise ValueError('Неверный тип суммы оплаты')
 
@@ -13,14 +15,20 @@ class Payment(ABC):
     def get_type_int(self) -> int:
         pass
 
-    def get_value(self):
+    def get_value(self) -> decimal.Decimal:
+        return from_scaled_int(self._sum, 2)
+
+    def get_kopecks(self) -> int:
         return self._sum
 
+    def __float__(self):
+        return self._sum / 100
+
     def __str__(self):
-        return str(self._sum)
+        return str(self.get_value())
 
     def __repr__(self):
-        return '{} {}'.format(self.__class__.__name__, self._sum)
+        return '{} {}'.format(self.__class__.__name__, self.get_value())
 
     def as_dict(self):
         return dict(paymetn_sum=self.get_value(), payment_type_int=self.get_type_int())
@@ -1,34 +1,49 @@
 from abc import ABC, abstractmethod
+from array import array
+from sys import intern
 import decimal
+from .money import to_scaled_int, from_scaled_int, multiply_scaled
 
 
 class CommodityPaymentState(ABC):  # признак расчета за предмет расчета (товар, услугу) в чеке
+    __slots__ = ()
+
     @abstractmethod
     def get_value(self) -> int:
         pass
 
 
 class CommodityFullPrepayment(CommodityPaymentState):  # Предоплата 100%
+    __slots__ = ()
+
     def get_value(self):
         return 1
 
 
 class CommodityPrepayment(CommodityPaymentState):  # Предоплата (не полная)
+    __slots__ = ()
+
     def get_value(self):
         return 2
 
 
 class CommodityAdvance(CommodityPaymentState):  # Аванс
+    __slots__ = ()
+
     def get_value(self):
         return 3
 
 
 class CommodityFullPayment(CommodityPaymentState):  # Полный расчет
+    __slots__ = ()
+
     def get_value(self):
         return 4
 
 
 class CommodityName:  # наименование предмета расчета (товара, услуги и т.д.)
+    __slots__ = ('_name',)
+
     def __init__(self, name: str):
         self._name = name
 
@@ -43,24 +58,40 @@ class CommodityName:  # наименование предмета расчета
 
 
 class Quantity:
+    __slots__ = ('_value', '_str_unit', '_precision')
+
     def __init__(self, value, precision: int, str_unit: str = None):
         # value - значение, precision - точность (знаков после запятой), str_unit - единицы изм. (шт., литры, тонны...)
-        prec_str = '0.'
-        for i in range(precision):
-            prec_str = prec_str + '0'
+        # Значение хранится целым числом, умноженным на 10 ** precision
         try:
-            self._value = decimal.Decimal(value).quantize(decimal.Decimal(prec_str), rounding=decimal.ROUND_HALF_UP)
+            self._value = to_scaled_int(value, max(precision, 0))
         except decimal.InvalidOperation:
             raise ValueError('Неверный тип значения количества')
 
         self._str_unit = str_unit
         self._precision = precision
 
+    @classmethod
+    def from_scaled_value(cls, value: int, precision: int, str_unit: str = None) -> 'Quantity':
+        # Создание из уже масштабированного значения (см. get_scaled_value) без разбора и округления
+        quantity = cls.__new__(cls)
+        quantity._value = value
+        quantity._precision = precision
+        quantity._str_unit = str_unit
+        return quantity
+
     def __str__(self):
         unit_str = self._str_unit if self._str_unit else ''
-        return '{} {}'.format(str(self._str_unit), unit_str).rstrip()
+        return '{} {}'.format(self.get_value(), unit_str).rstrip()
+
+    def __float__(self):
+        return self._value / 10 ** max(self._precision, 0)
 
     def get_value(self) -> decimal.Decimal:
+        return from_scaled_int(self._value, max(self._precision, 0))
+
+    def get_scaled_value(self) -> int:
+        # Количество, умноженное на 10 ** точность
         return self._value
 
     def get_str_unit(self) -> str:
@@ -71,20 +102,36 @@ class Quantity:
 
 
 class Price:
+    __slots__ = ('_value',)
+
     def __init__(self, price):
+        # Цена хранится в копейках
         try:
-            self._value = decimal.Decimal(price).quantize(decimal.Decimal('0.01'), decimal.ROUND_HALF_UP)
+            self._value = to_scaled_int(price, 2)
         except decimal.InvalidOperation:
             raise ValueError('Неверный тип стоимости')
 
+    @classmethod
+    def from_kopecks(cls, kopecks: int) -> 'Price':
+        price = cls.__new__(cls)
+        price._value = kopecks
+        return price
+
     def __str__(self):
-        return str(self._value)
+        return str(self.get_value())
+
+    def __float__(self):
+        return self._value / 100
 
     def get_value(self) -> decimal.Decimal:
+        return from_scaled_int(self._value, 2)
+
+    def get_kopecks(self) -> int:
         return self._value
 
 
 class CommodityTaxType(ABC):
+    __slots__ = ()
     _value: int
 
     def get_value_int(self):
@@ -93,50 +140,61 @@ class CommodityTaxType(ABC):
 
 class TaxDepartment(CommodityTaxType):
     # тип, привязанный к секции товара
+    __slots__ = ()
     _value = 0
 
 
 class Tax18(CommodityTaxType):
     # НДС 18%
+    __slots__ = ()
     _value = 1
 
 
 class Tax10(CommodityTaxType):
     # НДС 10%
+    __slots__ = ()
     _value = 2
 
 
 class Tax118(CommodityTaxType):
     # НДС расчитанный 18/118
+    __slots__ = ()
     _value = 3
 
 
 class Tax110(CommodityTaxType):
     # НДС расчитанный 10/110
+    __slots__ = ()
     _value = 4
 
 
 class Tax0(CommodityTaxType):
     # НДС 0%
+    __slots__ = ()
     _value = 5
 
 
 class TaxNo(CommodityTaxType):
     # Без НДС
+    __slots__ = ()
     _value = 6
 
 
 class Tax20(CommodityTaxType):
     # НДС 20%
+    __slots__ = ()
     _value = 7
 
 
 class Tax120(CommodityTaxType):
     # НДС расчитанный 20/120
+    __slots__ = ()
     _value = 8
 
 
 class Commodity(ABC):  # предмет расчета. Наследниками будут товар, услуга и т.д.
+    __slots__ = ('_name', '_quantity', '_price', '_payment_state', '_tax_type')
+
     def __init__(self, name: CommodityName, quantity: Quantity, price: Price, payment_state: CommodityPaymentState,
                  tax_type: CommodityTaxType = None):
         self._name = name
@@ -166,8 +224,13 @@ class Commodity(ABC):  # предмет расчета. Наследниками
         return self._payment_state
 
     def get_total_cost(self) -> decimal.Decimal:
-        return (self.quantity.get_value() * self.price.get_value()).quantize(decimal.Decimal('.00'),
-                                                                             rounding=decimal.ROUND_HALF_UP)
+        return from_scaled_int(self.get_total_cost_kopecks(), 2)
+
+    def get_total_cost_kopecks(self) -> int:
+        # Стоимость, округленная до копеек
+        quantity = self._quantity
+        return multiply_scaled(quantity.get_scaled_value(), max(quantity.get_precision(), 0),
+                               self._price.get_kopecks(), 2, 2)
 
     @property
     def tax_type(self) -> CommodityTaxType:
@@ -181,11 +244,15 @@ class Commodity(ABC):  # предмет расчета. Наследниками
 
 
 class Product(Commodity):  # Предмет расчета - продукт
+    __slots__ = ()
+
     def get_type_int(self):
         return 1
 
 
 class Service(Commodity):  # Предмет расчета - услуга
+    __slots__ = ()
+
     def get_type_int(self):
         return 4
 
@@ -197,12 +264,23 @@ class AbstractCommodityFactory(ABC):
         pass
 
 
+# Классы предметов расчета и единственные экземпляры признаков расчета и типов налога по их кодам
+COMMODITY_CLASSES = {1: Product, 4: Service}
+PAYMENT_STATES = {item.get_value(): item for item in (CommodityFullPrepayment(), CommodityPrepayment(),
+                                                       CommodityAdvance(), CommodityFullPayment())}
+TAX_TYPES = {item.get_value_int(): item for item in (TaxDepartment(), Tax18(), Tax10(), Tax118(), Tax110(), Tax0(),
+                                                      TaxNo(), Tax20(), Tax120())}
+
+# Точные классы, экземпляры которых CommodityList восстанавливает по кодам
+_COMPACT_COMMODITY_CLASSES = frozenset(COMMODITY_CLASSES.values())
+_COMPACT_PAYMENT_STATES = frozenset(type(item) for item in PAYMENT_STATES.values())
+_COMPACT_TAX_TYPES = frozenset([type(None)] + [type(item) for item in TAX_TYPES.values()])
+
+
 class CommodityFactory(AbstractCommodityFactory):
-    _PaymentStateMap = {str(item.get_value()): item for item in (CommodityFullPrepayment(), CommodityPrepayment(),
-                                                                 CommodityAdvance(), CommodityFullPayment())}
-    _CommodityClsMap = {'1': Product, '4': Service}
-    _taxTypeMap = {str(item.get_value_int()): item for item in (TaxDepartment(), Tax18(), Tax10(), Tax118(), Tax110(),
-                                                                Tax0(), TaxNo(), Tax20(), Tax120())}
+    _PaymentStateMap = {str(key): item for key, item in PAYMENT_STATES.items()}
+    _CommodityClsMap = {str(key): item for key, item in COMMODITY_CLASSES.items()}
+    _taxTypeMap = {str(key): item for key, item in TAX_TYPES.items()}
 
     def _create_prepayment_state(self, value):
         payment_state = self._PaymentStateMap.get(str(value), None)
@@ -226,3 +304,101 @@ class CommodityFactory(AbstractCommodityFactory):
             raise ValueError('Тип чека с индексом {} не предусмотрен'.format(str(commodity_type_int)))
         return commodity_cls(CommodityName(name), Quantity(quantity, quantity_prec, quantity_unit), Price(price),
                              self._create_prepayment_state(payment_state_int), self._create_tax_type(tax_type_int))
+
+
+class CommodityList:
+    # Компактное хранение предметов расчета чека. Значения хранятся в параллельных массивах: цена в копейках,
+    # масштабированное количество и коды (точность, тип предмета расчета, признак расчета и тип налога, по четыре кода
+    # на предмет расчета в одном массиве); наименования и единицы измерения интернируются. Объекты Commodity создаются
+    # заново при каждом обращении, признаки расчета и типы налога в них - единственные экземпляры из PAYMENT_STATES и
+    # TAX_TYPES. Предметы расчета, которые нельзя восстановить по кодам (неизвестные классы, значения за пределами
+    # 64-битных массивов), хранятся как есть.
+    __slots__ = ('_names', '_units', '_prices', '_quantities', '_codes', '_others')
+    _no_tax_type = -1
+
+    def __init__(self, commodities=()):
+        self._names = []
+        self._units = []
+        self._prices = array('q')
+        self._quantities = array('q')
+        self._codes = array('b')
+        self._others = None  # порядковый номер -> объект Commodity
+        for commodity in commodities:
+            self.append(commodity)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __iter__(self):
+        others = self._others or {}
+        codes = self._codes
+        for index, (name, unit, price, quantity) in enumerate(zip(self._names, self._units, self._prices,
+                                                                  self._quantities)):
+            if index in others:
+                yield others[index]
+                continue
+            precision, commodity_type, payment_state, tax_type = codes[index * 4:index * 4 + 4]
+            yield self._create_commodity(name, unit, price, quantity, precision, commodity_type, payment_state,
+                                         tax_type)
+
+    def _create_commodity(self, name, unit, price, quantity, precision, commodity_type, payment_state, tax_type):
+        commodity = COMMODITY_CLASSES[commodity_type].__new__(COMMODITY_CLASSES[commodity_type])
+        commodity._name = CommodityName(name)
+        commodity._quantity = Quantity.from_scaled_value(quantity, precision, unit)
+        commodity._price = Price.from_kopecks(price)
+        commodity._payment_state = PAYMENT_STATES[payment_state]
+        commodity._tax_type = TAX_TYPES[tax_type] if tax_type != self._no_tax_type else None
+        return commodity
+
+    def append(self, commodity: Commodity):
+        name, quantity, price, tax_type = commodity._name, commodity._quantity, commodity._price, commodity._tax_type
+        if (type(commodity) in _COMPACT_COMMODITY_CLASSES and type(commodity._payment_state) in _COMPACT_PAYMENT_STATES
+                and type(tax_type) in _COMPACT_TAX_TYPES and type(name) is CommodityName and type(quantity) is Quantity
+                and type(price) is Price):
+            count = len(self._names)
+            try:
+                self._prices.append(price._value)
+                self._quantities.append(quantity._value)
+                self._codes.extend((quantity._precision, commodity.get_type_int(), commodity._payment_state.get_value(),
+                                    tax_type._value if tax_type is not None else self._no_tax_type))
+            except OverflowError:
+                # Значение не помещается в массив
+                del self._prices[count:], self._quantities[count:], self._codes[count * 4:]
+            else:
+                name, unit = name._name, quantity._str_unit
+                self._names.append(intern(name) if type(name) is str else name)
+                self._units.append(intern(unit) if type(unit) is str else unit)
+                return
+        if self._others is None:
+            self._others = {}
+        self._others[len(self._names)] = commodity
+        self._names.append(None)
+        self._units.append(None)
+        self._prices.append(0)
+        self._quantities.append(0)
+        self._codes.extend((0, 0, 0, 0))
+
+    def __getitem__(self, index: int) -> Commodity:
+        if index < 0:
+            index += len(self._names)
+        if self._others is not None and index in self._others:
+            return self._others[index]
+        return self._create_commodity(self._names[index], self._units[index], self._prices[index],
+                                      self._quantities[index], *self._codes[index * 4:index * 4 + 4])
+
+    def as_dicts(self) -> list:
+        # То же, что [commodity.as_dict() for commodity in self], без создания объектов Commodity
+        result = []
+        others = self._others or {}
+        codes = self._codes
+        for index, (name, unit, price, quantity) in enumerate(zip(self._names, self._units, self._prices,
+                                                                  self._quantities)):
+            if index in others:
+                result.append(others[index].as_dict())
+                continue
+            precision, commodity_type, payment_state, tax_type = codes[index * 4:index * 4 + 4]
+            result.append(dict(name=str(name), quantity=from_scaled_int(quantity, max(precision, 0)),
+                               price=from_scaled_int(price, 2), commodity_type_int=commodity_type,
+                               payment_state_int=payment_state, quantity_prec=precision, quantity_unit=unit,
+                               tax_type_int=tax_type if tax_type != self._no_tax_type else None))
+        return result
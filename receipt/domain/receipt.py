@@ -1,8 +1,9 @@
 from abc import ABC, abstractmethod
 import decimal
 import re
-from .products import Commodity
+from .products import Commodity, CommodityList
 from .payments import Payment
+from .money import from_scaled_int
 import datetime
 from collections import namedtuple
 import random
@@ -197,6 +198,12 @@ class CorrectionData:
                     correction_doc_number=str(self._correction_doc_number))
 
 
+# Модульного уровня, чтобы данные регистратора можно было передать другому процессу сервера
+RegistratorValues = namedtuple('RegistratorValues', ['registration_number', 'registrator_serial', 'fn_serial',
+                                                     'ffd_version', 'ofd_name', 'ffd_inn', 'company_name',
+                                                     'company_inn', 'operations_address', 'operations_place'])
+
+
 class ReceiptRegistratorData:
     # Данные регистрирующего устройства (кассы): серийные номера, регистрационные данные, ОФД
     __slots__ = '_values', '_id'
@@ -204,11 +211,9 @@ class ReceiptRegistratorData:
     def __init__(self, registration_number: str, registrator_serial: str, fn_serial: str, ffd_version: str,
                  ofd_name: str, ffd_inn: str, company_name: str, company_inn: str, operations_address: str,
                  operations_place: str):
-        Values = namedtuple('Values', ['registration_number', 'registrator_serial', 'fn_serial', 'ffd_version',
-                                       'ofd_name', 'ffd_inn', 'company_name', 'company_inn', 'operations_address',
-                                       'operations_place'])
-        self._values = Values(registration_number, registrator_serial, fn_serial, ffd_version,
-                              ofd_name, ffd_inn, company_name, company_inn, operations_address, operations_place)
+        self._values = RegistratorValues(registration_number, registrator_serial, fn_serial, ffd_version,
+                                         ofd_name, ffd_inn, company_name, company_inn, operations_address,
+                                         operations_place)
         self._id = None
 
     def set_id(self, id: int):
@@ -303,10 +308,10 @@ class Receipt:  # чек ффд 105
         # (заполняется в случае исправления ошибок в ранее произведенных расчетах
         self._email = None
         self._phone_number = None
-        self._commodities = []
+        self._commodities = CommodityList()
         self._payments = []
-        self._commodities_total_cost = decimal.Decimal('0.00')
-        self._payments_total = decimal.Decimal('0.00')
+        self._commodities_total_cost = 0  # в копейках
+        self._payments_total = 0  # в копейках
         self._validator = None
         self._is_valid = False
         self._registrator_id = None  # id кассового аппарата
@@ -350,19 +355,22 @@ class Receipt:  # чек ффд 105
         return self._order_id
 
     def add_commodity(self, commodity: Commodity):
-        self._commodities_total_cost += commodity.get_total_cost()
+        self._commodities_total_cost += commodity.get_total_cost_kopecks()
         self._commodities.append(commodity)
 
     def add_payment(self, payment: Payment):
-        self._payments_total += payment.get_value()
+        self._payments_total += payment.get_kopecks()
         self._payments.append(payment)
 
     @property
     def commodities(self):
-        # Предметы расчета: товары, услуги
+        # Предметы расчета: товары, услуги. Объекты создаются по мере обхода, см. CommodityList
         for commodity in self._commodities:
             yield commodity
 
+    def get_commodities_count(self) -> int:
+        return len(self._commodities)
+
     @property
     def payments(self):
         for payment in self._payments:
@@ -458,12 +466,18 @@ class Receipt:  # чек ффд 105
     def registrator_id(self):
         return self._registrator_id
 
-    def get_payments_total(self):
+    def get_payments_total(self) -> decimal.Decimal:
         # Общая суммма оплаты
+        return from_scaled_int(self._payments_total, 2)
+
+    def get_payments_total_kopecks(self) -> int:
         return self._payments_total
 
-    def get_commodities_total_cost(self):
+    def get_commodities_total_cost(self) -> decimal.Decimal:
         # Общая стоимость товаров
+        return from_scaled_int(self._commodities_total_cost, 2)
+
+    def get_commodities_total_cost_kopecks(self) -> int:
         return self._commodities_total_cost
 
     @property
@@ -489,12 +503,12 @@ class Receipt:  # чек ффд 105
                     phone_number=str(self.phone_number), registrator_id=self.registrator_id,
                     fiscal_sign=self.fiscal_sign, registration_datetime=self.registration_datetime,
                     cashier= self.cashier.as_dict() if self.cashier else None, shift_num=self.shift_num,
-                    tax_system=self.tax_system,
+                    tax_system=self.tax_system.get_value_int() if self.tax_system else None,
                     correction_data=self.correction_data.as_dict() if self.correction_data else None,
                     receipt_in_shift_num=self.receipt_in_shift_num, need_print=self.need_print,
                     receipt_num=self.receipt_num, payments_total=self.get_payments_total(),
                     commodities_total_cost=self.get_commodities_total_cost(),
-                    commodities=[item.as_dict() for item in self.commodities],
+                    commodities=self._commodities.as_dicts(),
                     payments=[item.as_dict() for item in self.payments])
 
 
@@ -567,7 +581,7 @@ class ReceiptDefaultValidator(ReceiptValidatorABC):
         return bool(receipt.email or receipt.phone_number)
 
     def _check_totals(self, receipt):
-        if receipt.get_payments_total() == receipt.get_commodities_total_cost():
+        if receipt.get_payments_total_kopecks() == receipt.get_commodities_total_cost_kopecks():
             return True
         self._error_handler.handle_error('Сумма оплаты и сумма стоимостей товаров по чеку не совпадают')
         return False
@@ -22,10 +22,11 @@ class ReceiptRegistered(Event):
         self._entity_id = receipt.id
         self._data = {'registrator_id': receipt.registrator_id, 'fiscal_sign': receipt.fiscal_sign,
                       'registration_datetime': receipt.registration_datetime,
-                      'self._cashier': receipt.cashier,'shift_num': receipt.shift_num,
-                      'receipt_in_shift_num': receipt.receipt_in_shift_num, 'tax_system': receipt.tax_system,
+                      'cashier': receipt.cashier.as_dict() if receipt.cashier else None,
+                      'shift_num': receipt.shift_num, 'receipt_in_shift_num': receipt.receipt_in_shift_num,
+                      'tax_system': receipt.tax_system.get_value_int() if receipt.tax_system else None,
                       'state': 'success'}
-        self._date_time = datetime.datetime.now()
+        self._date_time = datetime.datetime.utcnow()
 
 
 class ReceiptRegistationFailed(Event):
@@ -35,4 +36,19 @@ class ReceiptRegistationFailed(Event):
         self._entity = 'receipt'
         self._entity_id = receipt.id
         self._data = {'state': 'failed'}
-        self._date_time = datetime.datetime.now()
\ No newline at end of file
+        self._date_time = datetime.datetime.utcnow()
+
+
+class ReceiptsCreated(Event):
+    # Receipts of one service group accepted by one bulk request, the read model saves them together
+    def __init__(self, receipts: list):
+        self._entity = 'receipt'
+        self._entity_id = None
+        self._date_time = datetime.datetime.utcnow()
+        self._data = {'receipts': []}
+        for receipt in receipts:
+            receipt_data = receipt.as_dict()
+            receipt_data['state'] = 'created'
+            self._data['receipts'].append(receipt_data)
+        self._user_id = receipts[0].user_id if receipts else None
+        self._client_id = receipts[0].service_id if receipts else None
@@ -1,2 +1,7 @@
 from .repositories import (MongoMotorReceiptRepository, AbstractReceiptRepository, InMemoryReceiptRepository,
-                           ReceiptNotExists)
\ No newline at end of file
+                           ReceiptNotExists, WriteBehindReceiptRepository)
+from .caches import ReceiptDocumentCache, CachedReceiptDocument
+from .notifications import ReceiptNotificationHub, ReceiptSubscription, ReceiptNotification
+from .monitors import ProjectionLagMonitor
+from .projections import (ProjectionRebuilder, ProjectionRebuildError, AbstractCheckpointStorage,
+                          InMemoryCheckpointStorage, FileCheckpointStorage)
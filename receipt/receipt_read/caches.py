@@ -0,0 +1,62 @@
+import hashlib
+import json
+from lru import LRU
+
+
+class CachedReceiptDocument:
+    __slots__ = ('service_group_id', 'body', 'etag')
+
+    def __init__(self, service_group_id: int, body: str):
+        self.service_group_id = service_group_id
+        self.body = body
+        # Strong validator: the body is the exact representation which is sent to the client
+        self.etag = '"{}"'.format(hashlib.sha1(body.encode()).hexdigest())
+
+
+class ReceiptDocumentCache:
+    # LRU cache of serialized receipt documents, clients poll a receipt until its state becomes final and the
+    # document changes only when the registration result is saved. The read model event handlers invalidate the
+    # document after the repository is updated.
+    # Every receipt which is being loaded has a version, it is incremented by invalidation. A loaded document is
+    # cached only if the version did not change while it was loaded, otherwise an invalidation that happened
+    # during the repository request would be lost. Versions are kept only while loads are in progress.
+    def __init__(self, capacity: int = 10000):
+        self._documents = LRU(capacity)
+        self._loading = {}  # receipt id -> [version, number of loads in progress]
+
+    def get(self, receipt_id: int, service_group_id: int):
+        document = self._documents.get(receipt_id)
+        if document is None or document.service_group_id != service_group_id:
+            return None
+        return document
+
+    async def load(self, receipt_id: int, service_group_id: int, load_document) -> CachedReceiptDocument:
+        # load_document is a coroutine function which returns the document from the repository
+        document = self.get(receipt_id, service_group_id)
+        if document is not None:
+            return document
+        loading = self._loading.get(receipt_id)
+        if loading is None:
+            loading = self._loading[receipt_id] = [0, 0]
+        version = loading[0]
+        loading[1] += 1
+        try:
+            data = await load_document()
+        finally:
+            loading[1] -= 1
+            if not loading[1]:
+                del self._loading[receipt_id]
+        document = CachedReceiptDocument(service_group_id, json.dumps(data, default=str))
+        if loading[0] == version and receipt_id not in self._documents:
+            self._documents[receipt_id] = document
+        return document
+
+    def invalidate(self, receipt_id: int):
+        if receipt_id in self._documents:
+            del self._documents[receipt_id]
+        loading = self._loading.get(receipt_id)
+        if loading is not None:
+            loading[0] += 1
+
+    def clear(self):
+        self._documents.clear()
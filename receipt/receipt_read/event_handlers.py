@@ -1,7 +1,9 @@
 from core.events.events import AbstractEventHandler
 from core.events import AbstractEventDispatcher
-from receipt.events import ReceiptRegistered, ReceiptCreated, ReceiptRegistationFailed
+from receipt.events import ReceiptRegistered, ReceiptCreated, ReceiptRegistationFailed, ReceiptsCreated
 from receipt.registrator_info_storages import AbstractRegistratorDataStorage
+from .caches import ReceiptDocumentCache
+from .monitors import ProjectionLagMonitor
 from logging import getLogger
 
 
@@ -9,8 +11,12 @@ logger = getLogger(__name__)
 
 
 class ReceiptCreatedHandler(AbstractEventHandler):
-    def __init__(self, receipt_read_repository):
+    # The receipt is saved before its location is returned to the client
+    synchronous = True
+
+    def __init__(self, receipt_read_repository, projection_monitor: ProjectionLagMonitor = None):
         self._repository = receipt_read_repository
+        self._projection_monitor = projection_monitor
 
     def subscribe(self, event_dispatcher: AbstractEventDispatcher):
         event_dispatcher.add_subscriber(ReceiptCreated, self)
@@ -18,24 +24,54 @@ class ReceiptCreatedHandler(AbstractEventHandler):
     async def handle(self, event: ReceiptCreated):
         logger.debug('ReceiptCreated event handled')
         await self._repository.save(event.data)
+        if self._projection_monitor is not None:
+            self._projection_monitor.observe(event)
+
+
+class ReceiptsCreatedHandler(AbstractEventHandler):
+    synchronous = True
+
+    def __init__(self, receipt_read_repository, projection_monitor: ProjectionLagMonitor = None):
+        self._repository = receipt_read_repository
+        self._projection_monitor = projection_monitor
+
+    def subscribe(self, event_dispatcher: AbstractEventDispatcher):
+        event_dispatcher.add_subscriber(ReceiptsCreated, self)
+
+    async def handle(self, event: ReceiptsCreated):
+        logger.debug('ReceiptsCreated event handled')
+        await self._repository.save_many(event.data['receipts'])
+        if self._projection_monitor is not None:
+            self._projection_monitor.observe(event)
 
 
 class ReceiptReceiptRegistationFailedHandler(AbstractEventHandler):
-    def __init__(self, receipt_read_repository):
+    def __init__(self, receipt_read_repository, document_cache: ReceiptDocumentCache = None,
+                 projection_monitor: ProjectionLagMonitor = None):
         self._repository = receipt_read_repository
+        self._document_cache = document_cache
+        self._projection_monitor = projection_monitor
 
     def subscribe(self, event_dispatcher: AbstractEventDispatcher):
         event_dispatcher.add_subscriber(ReceiptRegistationFailed, self)
 
     async def handle(self, event: ReceiptRegistationFailed):
         logger.debug('ReceiptRegistationFailed event handled')
-        await self._repository.update(event.data)
+        await self._repository.update(dict(event.data, id=event.entity_id))
+        # The cached document is invalidated after the update, so it can't be loaded again from the old state
+        if self._document_cache is not None:
+            self._document_cache.invalidate(event.entity_id)
+        if self._projection_monitor is not None:
+            self._projection_monitor.observe(event)
 
 
 class ReceiptReceiptRegisteredHandler(AbstractEventHandler):
-    def __init__(self, receipt_read_repository, registrator_data_storage: AbstractRegistratorDataStorage):
+    def __init__(self, receipt_read_repository, registrator_data_storage: AbstractRegistratorDataStorage,
+                 document_cache: ReceiptDocumentCache = None, projection_monitor: ProjectionLagMonitor = None):
         self._repository = receipt_read_repository
         self._registrator_data_storage = registrator_data_storage
+        self._document_cache = document_cache
+        self._projection_monitor = projection_monitor
 
     def subscribe(self, event_dispatcher: AbstractEventDispatcher):
         event_dispatcher.add_subscriber(ReceiptRegistered, self)
@@ -46,4 +82,8 @@ class ReceiptReceiptRegisteredHandler(AbstractEventHandler):
         data = data.as_dict()
         data.update(event.data)
         data['id'] = event.entity_id
-        await self._repository.update(data)
\ No newline at end of file
+        await self._repository.update(data)
+        if self._document_cache is not None:
+            self._document_cache.invalidate(event.entity_id)
+        if self._projection_monitor is not None:
+            self._projection_monitor.observe(event)
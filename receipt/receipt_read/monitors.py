@@ -0,0 +1,52 @@
+import time
+from core.events import AbstractEventDispatcher
+from core.events.events import AbstractEventHandler, get_timestamp
+from core.metrics import HistogramSet
+from receipt.events import ReceiptCreated, ReceiptsCreated, ReceiptRegistered, ReceiptRegistationFailed
+
+
+PROJECTED_EVENT_TYPES = (ReceiptCreated, ReceiptsCreated, ReceiptRegistered, ReceiptRegistationFailed)
+
+
+class ProjectionLagMonitor(AbstractEventHandler):
+    # Shows how far the read model trails the event stream. The monitor is a synchronous subscriber, it sees the
+    # events when they are dispatched, the read model handlers report the events they have applied.
+    # statistics contains the histogram "apply" of the time from the event to its change in the read model.
+    synchronous = True
+
+    def __init__(self, time_counter=time.time):
+        self._time_counter = time_counter
+        self.dispatched_count = 0
+        self.applied_count = 0
+        self._last_dispatched_at = None
+        self._last_applied_at = None
+        self.statistics = HistogramSet()
+
+    def subscribe(self, event_dispatcher: AbstractEventDispatcher):
+        for event_type in PROJECTED_EVENT_TYPES:
+            event_dispatcher.add_subscriber(event_type, self)
+
+    async def handle(self, event):
+        self.dispatched_count += 1
+        self._last_dispatched_at = event.date_time
+
+    def observe(self, event):
+        # Called by the read model handlers after the change is made
+        self.applied_count += 1
+        if self._last_applied_at is None or event.date_time > self._last_applied_at:
+            self._last_applied_at = event.date_time
+        self.statistics.get_histogram('apply').observe(
+            max(0.0, self._time_counter() - get_timestamp(event.date_time)))
+
+    @property
+    def pending_count(self) -> int:
+        return max(0, self.dispatched_count - self.applied_count)
+
+    @property
+    def lag(self) -> float:
+        # Seconds between the last dispatched event and the last applied one, 0 when nothing is pending
+        if not self.pending_count or self._last_dispatched_at is None:
+            return 0.0
+        if self._last_applied_at is None:
+            return max(0.0, self._time_counter() - get_timestamp(self._last_dispatched_at))
+        return max(0.0, (self._last_dispatched_at - self._last_applied_at).total_seconds())
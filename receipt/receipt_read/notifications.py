@@ -0,0 +1,141 @@
+import asyncio
+import collections
+import json
+import secrets
+from logging import getLogger
+from core.events import AbstractEventDispatcher
+from core.events.events import AbstractEventHandler
+from receipt.events import ReceiptRegistered, ReceiptRegistationFailed
+
+
+logger = getLogger(__name__)
+
+
+class ReceiptNotification:
+    # The body is serialized once and sent to every subscriber. The id sent to the client is <epoch>-<number>, where
+    # number grows monotonically in the process and epoch is the token of the hub (see ReceiptNotificationHub)
+    __slots__ = ('id', 'number', 'service_group_id', 'receipt_id', 'event', 'body')
+
+    def __init__(self, number: int, service_group_id: int, receipt_id, event: str, body: str, epoch: str = None):
+        self.number = number
+        self.id = '{}-{}'.format(epoch, number) if number is not None else None
+        self.service_group_id = service_group_id
+        self.receipt_id = receipt_id
+        self.event = event
+        self.body = body
+
+
+# The notification which is sent when the client can't be resumed from its last event id: the notifications it
+# missed are not retained any more, or its buffer overflowed. The client has to read the receipts state again.
+RESYNC = ReceiptNotification(None, None, None, 'resync', '{}')
+
+
+class ReceiptSubscription:
+    # Notifications of one service group or of one receipt of the group. The queue is bounded by buffer_size: a
+    # subscriber which doesn't read its notifications is closed after the RESYNC notification, the client reconnects
+    # and resumes from the last event id it received.
+    def __init__(self, service_group_id: int, receipt_id=None, buffer_size: int = 100):
+        self.service_group_id = service_group_id
+        self.receipt_id = receipt_id
+        self.is_closed = False
+        self._buffer_size = buffer_size
+        self._queue = asyncio.Queue()
+
+    def matches(self, notification: ReceiptNotification) -> bool:
+        return self.receipt_id is None or self.receipt_id == notification.receipt_id
+
+    def put(self, notification: ReceiptNotification):
+        if self.is_closed:
+            return
+        if self._queue.qsize() >= self._buffer_size:
+            self.close(RESYNC)
+            return
+        self._queue.put_nowait(notification)
+
+    def close(self, notification: ReceiptNotification = None):
+        # None is the end of the stream, it is put after the notification regardless of the buffer size
+        if self.is_closed:
+            return
+        self.is_closed = True
+        if notification is not None:
+            self._queue.put_nowait(notification)
+        self._queue.put_nowait(None)
+
+    async def get(self):
+        # Returns the next notification or None when the subscription is closed
+        return await self._queue.get()
+
+
+class ReceiptNotificationHub(AbstractEventHandler):
+    # Publishes the results of receipt registration to the subscribers of service groups. The last history_size
+    # notifications of every group are retained to resume subscribers which were disconnected. The notification
+    # numbers restart with the process, so the ids are prefixed with the random epoch of the hub: an id of another
+    # epoch was issued before a restart or by another worker process, and the client is sent RESYNC.
+    def __init__(self, history_size: int = 1000, buffer_size: int = 100, epoch: str = None):
+        self._history_size = history_size
+        self._buffer_size = buffer_size
+        self.epoch = epoch or secrets.token_hex(6)
+        self._history = {}  # service group id -> deque of notifications
+        self._dropped_numbers = {}  # service group id -> number of the last notification removed from the history
+        self._subscriptions = {}  # service group id -> set of subscriptions
+        self._last_number = 0
+
+    def subscribe(self, event_dispatcher: AbstractEventDispatcher):
+        event_dispatcher.add_subscriber(ReceiptRegistered, self)
+        event_dispatcher.add_subscriber(ReceiptRegistationFailed, self)
+
+    async def handle(self, event):
+        self.publish(event.client_id, event.entity_id, dict(event.data, receipt_id=event.entity_id))
+
+    def publish(self, service_group_id: int, receipt_id, data: dict) -> ReceiptNotification:
+        self._last_number += 1
+        notification = ReceiptNotification(self._last_number, service_group_id, receipt_id, 'receipt',
+                                           json.dumps(data, default=str), self.epoch)
+        history = self._history.get(service_group_id)
+        if history is None:
+            history = self._history[service_group_id] = collections.deque(maxlen=self._history_size)
+        if len(history) == self._history_size:
+            self._dropped_numbers[service_group_id] = history[0].number
+        history.append(notification)
+        for subscription in tuple(self._subscriptions.get(service_group_id, ())):
+            if subscription.matches(notification):
+                subscription.put(notification)
+                if subscription.is_closed:
+                    logger.warning('The receipt notifications buffer of the service group %s subscriber is full',
+                                   service_group_id)
+                    self.unsubscribe(subscription)
+        return notification
+
+    def open_subscription(self, service_group_id: int, receipt_id=None, last_event_id: str = None):
+        subscription = ReceiptSubscription(service_group_id, receipt_id, self._buffer_size)
+        if last_event_id is not None:
+            self._resume(subscription, last_event_id)
+        if not subscription.is_closed:
+            self._subscriptions.setdefault(service_group_id, set()).add(subscription)
+        return subscription
+
+    def _resume(self, subscription: ReceiptSubscription, last_event_id: str):
+        service_group_id = subscription.service_group_id
+        epoch, separator, number = last_event_id.rpartition('-')
+        if epoch != self.epoch or not number.isdigit() or \
+                not self._dropped_numbers.get(service_group_id, 0) <= int(number) <= self._last_number:
+            subscription.close(RESYNC)
+            return
+        number = int(number)
+        for notification in self._history.get(service_group_id, ()):
+            if notification.number > number and subscription.matches(notification):
+                subscription.put(notification)
+
+    def unsubscribe(self, subscription: ReceiptSubscription):
+        subscriptions = self._subscriptions.get(subscription.service_group_id)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscriptions[subscription.service_group_id]
+
+    def close(self):
+        for subscriptions in tuple(self._subscriptions.values()):
+            for subscription in tuple(subscriptions):
+                subscription.close()
+        self._subscriptions.clear()
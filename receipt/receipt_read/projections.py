@@ -0,0 +1,189 @@
+import asyncio
+import copy
+import json
+import os
+from abc import ABC, abstractmethod
+from logging import getLogger
+from core.events import EventDispatcher
+from core.events.event_storages import AbstractEventStorage
+from receipt.events import ReceiptsCreated
+from receipt.registrator_info_storages import AbstractRegistratorDataStorage
+from .event_handlers import (ReceiptCreatedHandler, ReceiptsCreatedHandler, ReceiptReceiptRegisteredHandler,
+                             ReceiptReceiptRegistationFailedHandler)
+from .repositories import AbstractReceiptRepository, WriteBehindReceiptRepository
+from .monitors import PROJECTED_EVENT_TYPES
+
+
+logger = getLogger(__name__)
+
+
+class AbstractCheckpointStorage(ABC):
+    # The position of the event storage up to which the read model is rebuilt
+    @abstractmethod
+    async def get(self):
+        pass
+
+    @abstractmethod
+    async def save(self, position):
+        pass
+
+    @abstractmethod
+    async def reset(self):
+        pass
+
+
+class InMemoryCheckpointStorage(AbstractCheckpointStorage):
+    def __init__(self):
+        self._position = None
+
+    async def get(self):
+        return self._position
+
+    async def save(self, position):
+        self._position = position
+
+    async def reset(self):
+        self._position = None
+
+
+class FileCheckpointStorage(AbstractCheckpointStorage):
+    def __init__(self, path: str):
+        self._path = path
+
+    async def get(self):
+        try:
+            with open(self._path, 'r', encoding='utf-8') as file:
+                return json.load(file)['position']
+        except FileNotFoundError:
+            return None
+
+    async def save(self, position):
+        # The checkpoint is replaced atomically, a crash leaves the previous one
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self._path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({'position': position}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self._path)
+
+    async def reset(self):
+        try:
+            os.remove(self._path)
+        except FileNotFoundError:
+            pass
+
+
+class _NullEventStorage(AbstractEventStorage):
+    # The replayed events are already stored
+    async def add(self, event):
+        pass
+
+    async def get_by_time(self, datetime_start, datetime_finish, event_types: list = None):
+        return []
+
+    async def get_last_record(self):
+        return None
+
+
+class _ReplayEventDispatcher(EventDispatcher):
+    # Unlike EventDispatcher the errors of the handlers are raised, the event is not applied to the read model
+    async def handle(self, event):
+        for subscriber in self._event_subscribers.get(type(event), ()):
+            await subscriber.handle(event)
+
+
+class ProjectionRebuildError(Exception):
+    pass
+
+
+class ProjectionRebuilder:
+    # Rebuilds the receipt read model by replaying the stored events through the read model event handlers. The
+    # events are partitioned by the receipt id between `workers` tasks, so the events of a receipt are applied in
+    # order while different receipts are applied concurrently; ReceiptsCreated is split by the partitions of its
+    # receipts. The changes are merged and written by bulk requests of the write-behind repository. After every
+    # batch_size events the changes are written and the position of the event storage is saved to the checkpoint
+    # storage, an interrupted rebuild continues from there. The events after the checkpoint may be applied twice,
+    # the read model changes are idempotent. If a handler fails, the rebuild stops with ProjectionRebuildError
+    # without saving the checkpoint of the batch, so the next run replays the failed events again.
+    def __init__(self, event_storage: AbstractEventStorage, repository: AbstractReceiptRepository,
+                 registrator_data_storage: AbstractRegistratorDataStorage,
+                 checkpoint_storage: AbstractCheckpointStorage, loop: asyncio.AbstractEventLoop = None,
+                 workers: int = 4, batch_size: int = 1000, max_buffer_size: int = 1000):
+        self._event_storage = event_storage
+        self._loop = loop or asyncio.get_event_loop()
+        self._repository = WriteBehindReceiptRepository(repository, self._loop, max_buffer_size,
+                                                        flush_interval=3600)
+        self._checkpoint_storage = checkpoint_storage
+        self._workers = workers
+        self._batch_size = batch_size
+        self._dispatcher = _ReplayEventDispatcher(_NullEventStorage())
+        for handler in (ReceiptCreatedHandler(self._repository), ReceiptsCreatedHandler(self._repository),
+                        ReceiptReceiptRegisteredHandler(self._repository, registrator_data_storage),
+                        ReceiptReceiptRegistationFailedHandler(self._repository)):
+            handler.subscribe(self._dispatcher)
+        self.replayed_count = 0
+        self.failed_count = 0
+
+    def _partition(self, event) -> list:
+        # (worker number, event) pairs
+        if not isinstance(event, ReceiptsCreated):
+            return [(hash(event.entity_id) % self._workers, event)]
+        receipts = {}
+        for receipt in event.data['receipts']:
+            receipts.setdefault(hash(receipt['id']) % self._workers, []).append(receipt)
+        parts = []
+        for worker, items in receipts.items():
+            part = copy.copy(event)
+            part._data = {'receipts': items}
+            parts.append((worker, part))
+        return parts
+
+    async def _work(self, queue: asyncio.Queue):
+        while True:
+            event = await queue.get()
+            try:
+                await self._dispatcher.handle(event)
+            except Exception as e:
+                self.failed_count += 1
+                logger.error('Error during replaying the event %s: %s', str(event), str(e))
+            finally:
+                queue.task_done()
+
+    async def rebuild(self, reset: bool = False, progress=None):
+        # progress(replayed events count, position) is called after every checkpoint
+        if reset:
+            await self._checkpoint_storage.reset()
+        position = await self._checkpoint_storage.get()
+        queues = [asyncio.Queue(self._batch_size) for i in range(self._workers)]
+        tasks = [self._loop.create_task(self._work(queue)) for queue in queues]
+        try:
+            while True:
+                events, next_position = await self._event_storage.read(position, self._batch_size)
+                if not events:
+                    break
+                for event in events:
+                    if type(event) not in PROJECTED_EVENT_TYPES:
+                        continue
+                    for worker, part in self._partition(event):
+                        await queues[worker].put(part)
+                await asyncio.gather(*(queue.join() for queue in queues))
+                await self._repository.flush()
+                if self.failed_count:
+                    raise ProjectionRebuildError('{} events of the batch after the position {} are not replayed'.format(
+                        self.failed_count, position))
+                position = next_position
+                await self._checkpoint_storage.save(position)
+                self.replayed_count += len(events)
+                logger.info('The read model is rebuilt up to the position %s, %d events are replayed', position,
+                            self.replayed_count)
+                if progress is not None:
+                    progress(self.replayed_count, position)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._repository.close()
+        return self.replayed_count
@@ -1,6 +1,10 @@
+import asyncio
+import time
 from abc import ABC, abstractmethod
 from datetime import datetime
 from logging import getLogger
+from pymongo import ReplaceOne, UpdateOne
+from core.metrics import HistogramSet
 
 
 logger = getLogger(__name__)
@@ -10,15 +14,41 @@ class ReceiptNotExists(Exception):
     pass
 
 
+SAVE = 'save'
+UPDATE = 'update'
+
+
 class AbstractReceiptRepository(ABC):
     @abstractmethod
     def save(self, data: dict):
         pass
 
+    async def save_many(self, documents: list):
+        for data in documents:
+            await self.save(data)
+
     @abstractmethod
     def update(self, data: dict):
         pass
 
+    async def write_many(self, operations: list):
+        # operations - list of (SAVE or UPDATE, data) pairs, the operations of one receipt are already merged
+        for kind, data in operations:
+            try:
+                if kind == SAVE:
+                    await self.save(data)
+                else:
+                    await self.update(data)
+            except ReceiptNotExists:
+                pass
+
+    def to_document(self, data: dict) -> dict:
+        # The document as get returns it
+        return data.copy()
+
+    async def close(self):
+        pass
+
     @abstractmethod
     def get(self, receipt_id, company_id) -> dict:
         pass
@@ -41,6 +71,34 @@ class MongoMotorReceiptRepository(AbstractReceiptRepository):
         receipt_id = data.pop('id')
         await self._collection.replace_one({'_id': receipt_id}, data, True)
 
+    async def save_many(self, documents: list):
+        # One request for all documents, the replacement is idempotent like save
+        if not documents:
+            return
+        requests = []
+        for data in documents:
+            data = data.copy()
+            requests.append(ReplaceOne({'_id': data.pop('id')}, data, upsert=True))
+        await self._collection.bulk_write(requests, ordered=False)
+
+    async def write_many(self, operations: list):
+        if not operations:
+            return
+        requests = []
+        for kind, data in operations:
+            data = data.copy()
+            receipt_id = data.pop('id')
+            if kind == SAVE:
+                requests.append(ReplaceOne({'_id': receipt_id}, data, upsert=True))
+            else:
+                requests.append(UpdateOne({'_id': receipt_id}, {'$set': data}))
+        await self._collection.bulk_write(requests, ordered=False)
+
+    def to_document(self, data: dict) -> dict:
+        data = data.copy()
+        data['_id'] = data.pop('id')
+        return data
+
     async def update(self, data: dict):
         data = data.copy()
         receipt_id = data.pop('id')
@@ -98,3 +156,149 @@ class InMemoryReceiptRepository(AbstractReceiptRepository):
 
     async def get_last_id(self):
         return self._max_id
+
+
+def merge_operations(first: tuple, second: tuple) -> tuple:
+    # One operation with the effect of the first operation followed by the second one
+    kind, data = second
+    if kind == SAVE:
+        return second
+    first_kind, first_data = first
+    merged = first_data.copy()
+    merged.update(data)
+    return first_kind, merged
+
+
+class WriteBehindReceiptRepository(AbstractReceiptRepository):
+    # Buffers the changes of the read model in front of the repository. The operations of one receipt are merged:
+    # an update after a save changes the saved document, so a receipt which is registered before the flush is
+    # written once. The buffer is written by one write_many call (bulk_write for Mongo) when it contains
+    # max_buffer_size receipts or flush_interval seconds after the first change. get returns buffered documents
+    # (read-your-writes in this process), the listing methods and get_last_id flush the buffer first. A failed
+    # write is retried with the next flush, close writes everything.
+    # Metrics: buffer_depth - receipts waiting to be written, statistics - the flush latency histogram.
+    def __init__(self, repository: AbstractReceiptRepository, loop: asyncio.AbstractEventLoop = None,
+                 max_buffer_size: int = 500, flush_interval: float = 0.1, time_counter=time.perf_counter):
+        self._repository = repository
+        self._loop = loop or asyncio.get_event_loop()
+        self._max_buffer_size = max_buffer_size
+        self._flush_interval = flush_interval
+        self._time_counter = time_counter
+        self._pending = {}  # receipt id -> (SAVE or UPDATE, data)
+        self._flushing = {}  # the operations which are being written
+        self._flush_task = None
+        self._flush_requested = None
+        self._write_lock = asyncio.Lock()
+        self.statistics = HistogramSet()
+        self.flushed_count = 0
+
+    @property
+    def buffer_depth(self) -> int:
+        return len(self._pending) + len(self._flushing)
+
+    def _add(self, kind: str, data: dict):
+        receipt_id = data['id']
+        operation = (kind, data.copy())
+        previous = self._pending.get(receipt_id)
+        self._pending[receipt_id] = merge_operations(previous, operation) if previous else operation
+        if self._flush_task is None:
+            self._flush_requested = self._loop.create_future()
+            self._flush_task = self._loop.create_task(self._flush_loop())
+        if len(self._pending) >= self._max_buffer_size and not self._flush_requested.done():
+            self._flush_requested.set_result(None)
+
+    async def save(self, data: dict):
+        self._add(SAVE, data)
+
+    async def save_many(self, documents: list):
+        for data in documents:
+            self._add(SAVE, data)
+
+    async def update(self, data: dict):
+        self._add(UPDATE, data)
+
+    async def _flush_loop(self):
+        try:
+            while self._pending:
+                try:
+                    await asyncio.wait_for(asyncio.shield(self._flush_requested), self._flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_requested = self._loop.create_future()
+                try:
+                    await self._write_pending()
+                except Exception:
+                    # Logged by _write_pending, the operations are written with the next flush
+                    pass
+        finally:
+            self._flush_task = None
+
+    async def _write_pending(self):
+        # One write at a time, the operations which are being written are served by get from _flushing
+        async with self._write_lock:
+            if not self._pending:
+                return
+            self._flushing, self._pending = self._pending, {}
+            started_at = self._time_counter()
+            try:
+                await self._repository.write_many([(kind, dict(data, id=receipt_id)) for receipt_id, (kind, data)
+                                                   in self._flushing.items()])
+            except Exception as e:
+                self.statistics.get_histogram('flush').observe(self._time_counter() - started_at, 'exception')
+                logger.error('Unable to write %d receipts to the read model: %s', len(self._flushing), str(e))
+                # The newer operations of the receipts are applied after the failed ones
+                for receipt_id, operation in self._flushing.items():
+                    newer = self._pending.get(receipt_id)
+                    self._pending[receipt_id] = merge_operations(operation, newer) if newer else operation
+                raise
+            else:
+                self.statistics.get_histogram('flush').observe(self._time_counter() - started_at)
+                self.flushed_count += len(self._flushing)
+            finally:
+                self._flushing = {}
+
+    async def flush(self):
+        # Writes everything which was buffered before the call, raises the error of a failed write
+        while self._pending or self._flushing:
+            await self._write_pending()
+
+    async def close(self):
+        await self.flush()
+        if self._flush_task is not None:
+            # The buffer is empty, the flush loop finishes without waiting for the interval
+            if not self._flush_requested.done():
+                self._flush_requested.set_result(None)
+            await self._flush_task
+        await self._repository.close()
+
+    def _get_operation(self, receipt_id):
+        operation = self._flushing.get(receipt_id)
+        pending = self._pending.get(receipt_id)
+        if pending is not None:
+            operation = merge_operations(operation, pending) if operation else pending
+        return operation
+
+    async def get(self, receipt_id, company_id):
+        operation = self._get_operation(receipt_id)
+        if operation is None:
+            return await self._repository.get(receipt_id, company_id)
+        kind, data = operation
+        if kind == SAVE:
+            # The group of the receipt is service_id in the documents created from the events
+            if company_id not in (data.get('service_id'), data.get('company_id')):
+                return await self._repository.get(receipt_id, company_id)
+            return self._repository.to_document(dict(data, id=receipt_id))
+        document = await self._repository.get(receipt_id, company_id)
+        if document is None:
+            return None
+        document = dict(document)
+        document.update(self._repository.to_document(dict(data, id=receipt_id)))
+        return document
+
+    async def get_receipt_list(self, company_id, date_start, date_end, order_id=None, asc=True):
+        await self.flush()
+        return await self._repository.get_receipt_list(company_id, date_start, date_end, order_id, asc)
+
+    async def get_last_id(self):
+        await self.flush()
+        return await self._repository.get_last_id()
@@ -97,7 +97,8 @@ class InMemoryRegistratorInfoStorage(AbstractRegistratorDataStorage):
         for item in self._collection.values():
             if item['hash'] == data_hash:
                 raise RegistratorDataExists
-        data = {'data': registrator_data, 'hash': data_hash, 'id': (await self.get_last_id()) + 1}
+        self._current_id += 1
+        data = {'data': registrator_data, 'hash': data_hash, 'id': self._current_id}
         self._collection[data['id']] = data
         return data['id']
 
@@ -106,15 +107,14 @@ class InMemoryRegistratorInfoStorage(AbstractRegistratorDataStorage):
             data = self._collection[registrator_id]
         except KeyError:
             raise RegistratorDataNotExists
-        return ReceiptRegistratorData(data['registration_number'], data['registrator_serial'], data['fn_serial'],
-                                      data['ffd_version'], data['ofd_name'], data['ffd_inn'], data['company_name'],
-                                      data['company_inn'], data['operations_address'], data['operations_place'])
+        return ReceiptRegistratorData(*data['data'])
 
     async def get_id(self, registrator_data):
-        result = list(filter(lambda x: x['data'] == registrator_data, self._collection.values()))
+        data_hash = self._hash(registrator_data)
+        result = list(filter(lambda x: x['hash'] == data_hash, self._collection.values()))
         assert len(result) < 2, 'There must not be more than one item in the result'
         if len(result) == 1:
-            return result[0]
+            return result[0]['id']
         raise RegistratorDataNotExists
 
     async def get_last_id(self):
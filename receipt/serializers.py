@@ -1,3 +1,5 @@
+import datetime
+import decimal
 from wtforms import (Form, IntegerField, FormField, FieldList, StringField, DecimalField, DateField, validators,
                      BooleanField)
 from wtforms.fields.html5 import EmailField
@@ -40,3 +42,152 @@ class ReceiptSerializer(Form):
 
 
 
+
+
+# Validation of the receipt request without building WTForms objects. The rules are compiled once from the form
+# classes above, the compiled validator walks the decoded JSON in a single pass and returns the same data and the
+# same errors payload as Form.from_json(data) followed by validate(). Inputs of an unexpected shape (a list or an
+# object in place of a scalar value, a non-list value of a list field, etc.) are rare, they are passed to the form
+# itself so the result stays identical in every case.
+
+_REQUIRED_MESSAGE = 'This field is required.'
+_INTEGER_MESSAGE = 'Not a valid integer value'
+_DECIMAL_MESSAGE = 'Not a valid decimal value'
+_DATE_MESSAGE = 'Not a valid date value'
+
+
+class _UnsupportedData(Exception):
+    pass
+
+
+def _convert_integer(value):
+    try:
+        return int(value), None
+    except ValueError:
+        return None, _INTEGER_MESSAGE
+
+
+def _convert_decimal(value):
+    try:
+        return decimal.Decimal(value), None
+    except (decimal.InvalidOperation, ValueError):
+        return None, _DECIMAL_MESSAGE
+
+
+def _create_date_converter(date_format: str):
+    def convert(value):
+        if not isinstance(value, str):
+            raise _UnsupportedData
+        try:
+            return datetime.datetime.strptime(value, date_format).date(), None
+        except ValueError:
+            return None, _DATE_MESSAGE
+    return convert
+
+
+def _create_boolean_converter(false_values: tuple):
+    def convert(value):
+        return value not in false_values, None
+    return convert
+
+
+def _create_string_converter(default):
+    def convert(value):
+        return (str(value) if value else default), None
+    return convert
+
+
+class CompiledFormValidator:
+    def __init__(self, form_class):
+        self._form_class = form_class
+        self._fields = []  # (name, is_required, missing value, converter or nested validator, is list)
+        form = form_class()
+        for name, field in form._fields.items():
+            is_required = self._is_required(field)
+            if isinstance(field, FieldList):
+                if not issubclass(field.unbound_field.field_class, FormField):
+                    raise TypeError('Unsupported list field {}'.format(name))
+                nested_validator = CompiledFormValidator(field.unbound_field.args[0])
+                self._fields.append((name, is_required, None, nested_validator, True))
+            else:
+                self._fields.append((name, is_required, field.data, self._get_converter(field), False))
+        self._field_names = frozenset(name for name, *_ in self._fields)
+
+    @staticmethod
+    def _is_required(field) -> bool:
+        for validator in field.validators:
+            if type(validator) is not validators.DataRequired or validator.message is not None:
+                raise TypeError('Unsupported validator {!r} of the field {}'.format(validator, field.name))
+        return bool(field.validators)
+
+    @staticmethod
+    def _get_converter(field):
+        # Subclasses are checked before their base classes
+        if isinstance(field, DateField):
+            return _create_date_converter(field.format)
+        if isinstance(field, DecimalField):
+            if field.use_locale:
+                raise TypeError('Locale aware decimal field {} is not supported'.format(field.name))
+            return _convert_decimal
+        if isinstance(field, IntegerField):
+            return _convert_integer
+        if isinstance(field, BooleanField):
+            return _create_boolean_converter(field.false_values)
+        if type(field) in (StringField, EmailField):
+            return _create_string_converter(field.data)
+        raise TypeError('Unsupported field {} of type {}'.format(field.name, type(field).__name__))
+
+    def has_fields(self, json_data: dict) -> bool:
+        # Items without any known field are dropped from the form data by wtforms_json
+        return not self._field_names.isdisjoint(json_data)
+
+    def _validate(self, json_data: dict) -> tuple:
+        data, errors = {}, {}
+        for name, is_required, missing_value, converter, is_list in self._fields:
+            if is_list:
+                items = json_data.get(name, [])
+                if type(items) is not list:
+                    raise _UnsupportedData
+                value, field_errors = [], []
+                for item in items:
+                    if type(item) is not dict:
+                        raise _UnsupportedData
+                    if not converter.has_fields(item):
+                        continue
+                    item_data, item_errors = converter._validate(item)
+                    value.append(item_data)
+                    field_errors.append(item_errors)
+                if not any(field_errors):
+                    field_errors = None
+            else:
+                field_errors = None
+                if name not in json_data:
+                    value = missing_value
+                else:
+                    value = json_data[name]
+                    if value is not None:
+                        if isinstance(value, (list, dict)):
+                            raise _UnsupportedData
+                        value, field_errors = converter(value)
+            if is_required and (not value or isinstance(value, str) and not value.strip()):
+                field_errors = [_REQUIRED_MESSAGE]
+            elif field_errors and not is_list:
+                field_errors = [field_errors]
+            data[name] = value
+            if field_errors:
+                errors[name] = field_errors
+        return data, errors
+
+    def validate(self, json_data) -> tuple:
+        # Returns (data, errors), errors is an empty dict if the data is valid
+        if type(json_data) is dict:
+            try:
+                return self._validate(json_data)
+            except _UnsupportedData:
+                pass
+        form = self._form_class.from_json(json_data)
+        form.validate()
+        return form.data, form.errors
+
+
+receipt_validator = CompiledFormValidator(ReceiptSerializer)
@@ -22,29 +22,49 @@ class ReceiptCreationService:
 
 class AbstractReceiptProcessingService(ABC):
     @abstractmethod
-    async def proccess(self, receipt: Receipt):
+    async def proccess(self, receipt: Receipt, priority: int = None):
+        # priority - the priority class chosen by the client, if it is None the default class of the user is used
         pass
 
     @abstractmethod
     def is_service_provided(self, service_group_id):
         pass
 
+    async def proccess_many(self, receipts: list, priority: int = None):
+        # The receipts of one service group are put to the device queue together
+        for receipt in receipts:
+            await self.proccess(receipt, priority)
+
+    @abstractmethod
+    def check_capacity(self, service_group_id, count: int = 1):
+        # Raises CommandQueueOverflow if count receipts can not be accepted for processing now
+        pass
+
 
 class ReceiptProcessingService(AbstractReceiptProcessingService):
     def __init__(self, device_manager: CommandProcessorInterface, event_dispatcher: AbstractEventDispatcher):
         self._event_dispatcher = event_dispatcher
         self._device_manager = device_manager
 
-    def _create_command(self, receipt):
-        return RegisterReceiptCommand(receipt, self._event_dispatcher)
+    def _create_command(self, receipt, priority=None):
+        return RegisterReceiptCommand(receipt, self._event_dispatcher, priority)
 
-    async def proccess(self, receipt):
-        command = self._create_command(receipt)
+    async def proccess(self, receipt, priority=None):
+        command = self._create_command(receipt, priority)
         await self._device_manager.process_command(receipt.service_id, command)
 
+    async def proccess_many(self, receipts: list, priority=None):
+        if not receipts:
+            return
+        commands = [self._create_command(receipt, priority) for receipt in receipts]
+        await self._device_manager.process_commands(receipts[0].service_id, commands)
+
     def is_service_provided(self, service_group_id):
         return self._device_manager.is_device_provided_for_group(service_group_id)
 
+    def check_capacity(self, service_group_id, count=1):
+        self._device_manager.check_capacity(service_group_id, count)
+
 
 
 
@@ -0,0 +1,273 @@
+import asyncio
+import collections
+import datetime
+import hashlib
+import hmac
+import json
+import random
+import time
+from abc import ABC, abstractmethod
+from logging import getLogger
+from typing import Optional
+import aiohttp
+from core.events import AbstractEventDispatcher
+from core.events.events import AbstractEventHandler
+from core.metrics import HistogramSet
+from .events import ReceiptRegistered, ReceiptRegistationFailed
+
+
+logger = getLogger(__name__)
+
+
+class WebhookEndpoint:
+    __slots__ = ('url', 'secret')
+
+    def __init__(self, url: str, secret: str = ''):
+        self.url = url
+        self.secret = secret
+
+
+class AbstractWebhookEndpointProvider(ABC):
+    @abstractmethod
+    async def get_endpoint(self, service_group_id) -> Optional[WebhookEndpoint]:
+        # None if the results are not delivered to the service group
+        pass
+
+
+class DeadLetter:
+    __slots__ = ('service_group_id', 'url', 'payloads', 'error', 'failed_at')
+
+    def __init__(self, service_group_id, url: str, payloads: list, error: str):
+        self.service_group_id = service_group_id
+        self.url = url
+        self.payloads = payloads
+        self.error = error
+        self.failed_at = datetime.datetime.utcnow()
+
+    def as_dict(self):
+        return {'service_group_id': self.service_group_id, 'url': self.url, 'payloads': self.payloads,
+                'error': self.error, 'failed_at': self.failed_at}
+
+
+class AbstractDeadLetterStorage(ABC):
+    # Deliveries which failed after all attempts, kept to be inspected and sent again
+    @abstractmethod
+    async def add(self, dead_letter: DeadLetter):
+        pass
+
+    @abstractmethod
+    async def get_all(self) -> list:
+        pass
+
+
+class InMemoryDeadLetterStorage(AbstractDeadLetterStorage):
+    def __init__(self, max_size: int = 10000):
+        self._dead_letters = collections.deque(maxlen=max_size)
+
+    async def add(self, dead_letter: DeadLetter):
+        self._dead_letters.append(dead_letter)
+
+    async def get_all(self):
+        return list(self._dead_letters)
+
+
+class WebhookDeliveryError(Exception):
+    def __init__(self, message: str, is_retriable: bool):
+        super().__init__(message)
+        self.is_retriable = is_retriable
+
+
+def sign(secret: str, timestamp: str, body: bytes) -> str:
+    # The receiver computes HMAC-SHA256 of "<timestamp>.<body>" with the shared secret and compares it with the
+    # X-Webhook-Signature header, the timestamp lets it reject replayed requests
+    message = timestamp.encode() + b'.' + body
+    return 'sha256=' + hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+class WebhookDispatcher(AbstractEventHandler):
+    # Delivers the results of receipt registration to the webhook endpoints of service groups. The events are
+    # handled in the device command without waiting for the network: a result is only added to the pending batch
+    # of its service group. The batch is sent batch_window seconds after its first result in one signed POST
+    # request {"events": [...]}, large batches are split by max_batch_size. The requests share one keep-alive
+    # client session, max_concurrency requests are sent to one endpoint URL at the same time. Failed requests are
+    # retried with exponential backoff and jitter, a batch which was not delivered after max_attempts or was
+    # rejected by the endpoint with a client error is saved to the dead letter storage.
+    # statistics contains the histograms delivery_lag (from the event to the successful delivery) and request.
+    def __init__(self, endpoint_provider: AbstractWebhookEndpointProvider,
+                 dead_letter_storage: AbstractDeadLetterStorage, loop: asyncio.AbstractEventLoop = None,
+                 batch_window: float = 0.5, max_batch_size: int = 100,
+                 max_concurrency: int = 4, max_attempts: int = 5, backoff: float = 1.0, max_backoff: float = 60.0,
+                 request_timeout: float = 10.0, max_pending: int = 10000, endpoint_ttl: float = 30.0,
+                 connection_limit: int = 100, session: aiohttp.ClientSession = None, time_counter=time.monotonic):
+        self._endpoint_provider = endpoint_provider
+        self._dead_letters = dead_letter_storage
+        self._loop = loop or asyncio.get_event_loop()
+        self._batch_window = batch_window
+        self._max_batch_size = max_batch_size
+        self._max_concurrency = max_concurrency
+        self._max_attempts = max_attempts
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._request_timeout = request_timeout
+        self._max_pending = max_pending
+        self._endpoint_ttl = endpoint_ttl
+        self._connection_limit = connection_limit
+        self._session = session
+        self._time_counter = time_counter
+        self._pending = {}  # service group id -> list of (enqueued at, payload)
+        self._pending_count = 0
+        self._flush_tasks = {}  # service group id -> the task which waits for the end of the batch window
+        self._tasks = set()
+        self._endpoints = {}  # service group id -> (expires at, endpoint)
+        self._semaphores = {}  # endpoint url -> semaphore
+        self.statistics = HistogramSet()
+        self.delivered_count = 0
+        self.dropped_count = 0
+
+    def subscribe(self, event_dispatcher: AbstractEventDispatcher):
+        event_dispatcher.add_subscriber(ReceiptRegistered, self)
+        event_dispatcher.add_subscriber(ReceiptRegistationFailed, self)
+
+    async def handle(self, event):
+        event_name = 'receipt.registered' if isinstance(event, ReceiptRegistered) else 'receipt.failed'
+        self.enqueue(event.client_id, {'event': event_name, 'receipt_id': event.entity_id,
+                                       'service_group_id': event.client_id, 'data': dict(event.data)})
+
+    def enqueue(self, service_group_id, payload: dict):
+        if self._pending_count >= self._max_pending:
+            self.dropped_count += 1
+            logger.warning('The webhook delivery queue is full, the result of the service group %s is dropped',
+                           service_group_id)
+            return
+        items = self._pending.get(service_group_id)
+        if items is None:
+            items = self._pending[service_group_id] = []
+        items.append((self._time_counter(), payload))
+        self._pending_count += 1
+        if service_group_id not in self._flush_tasks:
+            self._flush_tasks[service_group_id] = self._start_task(self._flush(service_group_id))
+
+    def _start_task(self, coroutine) -> asyncio.Task:
+        task = self._loop.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _flush(self, service_group_id):
+        await asyncio.sleep(self._batch_window)
+        endpoint = await self._get_endpoint(service_group_id)
+        # The next result starts a new batch window while this batch is delivered
+        del self._flush_tasks[service_group_id]
+        items = self._pending.pop(service_group_id)
+        self._pending_count -= len(items)
+        if endpoint is None:
+            return
+        batch_size = self._max_batch_size
+        await asyncio.gather(*(self._deliver(service_group_id, endpoint, items[start:start + batch_size])
+                               for start in range(0, len(items), batch_size)))
+
+    async def _get_endpoint(self, service_group_id) -> Optional[WebhookEndpoint]:
+        now = self._time_counter()
+        cached = self._endpoints.get(service_group_id)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        try:
+            endpoint = await self._endpoint_provider.get_endpoint(service_group_id)
+        except Exception as e:
+            logger.error('Unable to get the webhook endpoint of the service group %s: %s', service_group_id, str(e))
+            endpoint = None
+        self._endpoints[service_group_id] = (now + self._endpoint_ttl, endpoint)
+        return endpoint
+
+    def _get_semaphore(self, url: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(url)
+        if semaphore is None:
+            semaphore = self._semaphores[url] = asyncio.Semaphore(self._max_concurrency)
+        return semaphore
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._connection_limit),
+                timeout=aiohttp.ClientTimeout(total=self._request_timeout))
+        return self._session
+
+    def _get_backoff(self, attempt: int) -> float:
+        return min(self._max_backoff, self._backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+    async def _deliver(self, service_group_id, endpoint: WebhookEndpoint, items: list):
+        body = json.dumps({'events': [payload for enqueued_at, payload in items]}, default=str).encode()
+        semaphore = self._get_semaphore(endpoint.url)
+        try:
+            for attempt in range(1, self._max_attempts + 1):
+                async with semaphore:
+                    try:
+                        await self._post(endpoint, body)
+                    except WebhookDeliveryError as e:
+                        error = e
+                    else:
+                        self._observe_delivery(items)
+                        return
+                if not error.is_retriable or attempt == self._max_attempts:
+                    break
+                logger.warning('Webhook delivery to %s failed (attempt %d): %s', endpoint.url, attempt, str(error))
+                # The semaphore is released while waiting, other batches of the endpoint are not delayed
+                await asyncio.sleep(self._get_backoff(attempt))
+        except asyncio.CancelledError:
+            await self._add_dead_letter(service_group_id, endpoint.url, items, 'The delivery was cancelled')
+            raise
+        await self._add_dead_letter(service_group_id, endpoint.url, items, str(error))
+
+    async def _post(self, endpoint: WebhookEndpoint, body: bytes):
+        timestamp = str(int(time.time()))
+        headers = {'Content-Type': 'application/json', 'X-Webhook-Timestamp': timestamp,
+                   'X-Webhook-Signature': sign(endpoint.secret, timestamp, body)}
+        histogram = self.statistics.get_histogram('request')
+        started_at = self._time_counter()
+        try:
+            async with self._get_session().post(endpoint.url, data=body, headers=headers) as response:
+                # The body is read to return the connection to the pool
+                await response.read()
+                status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            histogram.observe(self._time_counter() - started_at, 'exception')
+            raise WebhookDeliveryError(str(e) or type(e).__name__, True)
+        elapsed = self._time_counter() - started_at
+        if 200 <= status < 300:
+            histogram.observe(elapsed)
+            return
+        histogram.observe(elapsed, status)
+        raise WebhookDeliveryError('The endpoint responded with the status {}'.format(status),
+                                   status >= 500 or status in (408, 429))
+
+    def _observe_delivery(self, items: list):
+        histogram = self.statistics.get_histogram('delivery_lag')
+        now = self._time_counter()
+        for enqueued_at, payload in items:
+            histogram.observe(now - enqueued_at)
+        self.delivered_count += len(items)
+
+    async def _add_dead_letter(self, service_group_id, url: str, items: list, error: str):
+        logger.error('Webhook delivery of %d results to %s failed: %s', len(items), url, error)
+        try:
+            await self._dead_letters.add(DeadLetter(service_group_id, url, [payload for enqueued_at, payload in items],
+                                                    error))
+        except Exception as e:
+            logger.error('Unable to save the failed webhook delivery to %s: %s', url, str(e))
+
+    async def close(self):
+        # Deliveries in progress and pending batches are saved to the dead letter storage
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        pending, self._pending = self._pending, {}
+        self._flush_tasks.clear()
+        self._pending_count = 0
+        for service_group_id, items in pending.items():
+            endpoint = await self._get_endpoint(service_group_id)
+            if endpoint is not None:
+                await self._add_dead_letter(service_group_id, endpoint.url, items, 'The server was stopped')
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,135 @@
+import pytest
+from aiohttp import web, BasicAuth
+from aiohttp.test_utils import TestServer, TestClient
+from mock import Mock, AsyncMock
+from access_control.auth import (CredentialCache, UserManagementService, UserInMemoryRepository, AuthService,
+                                 EncryptionService)
+from access_control.auth.domain import UserDescriptor
+from access_control.middlewares import BasicAuthMiddleware
+
+pytestmark = pytest.mark.asyncio
+
+
+def create_user(user_id):
+    return UserDescriptor(user_id, 'user{}'.format(user_id), 'user@mail.ru', '', True)
+
+
+class Clock:
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+class TestCredentialCache:
+    def test_get(self):
+        cache = CredentialCache()
+        digest = cache.get_digest(BasicAuth('user1', 'password').encode())
+        assert digest != cache.get_digest(BasicAuth('user1', 'other').encode())
+        assert digest != CredentialCache().get_digest(BasicAuth('user1', 'password').encode())
+        assert cache.get(digest) is None
+        cache.put(digest, create_user(1), cache.generation)
+        assert cache.get(digest) == create_user(1)
+        assert (cache.hit_count, cache.miss_count, cache.hit_ratio) == (1, 1, 0.5)
+
+    def test_ttl(self):
+        clock = Clock()
+        cache = CredentialCache(ttl=10, time_counter=clock)
+        cache.put(b'a', create_user(1), cache.generation)
+        clock.time = 9.9
+        assert cache.get(b'a') == create_user(1)
+        clock.time = 10
+        assert cache.get(b'a') is None
+        assert cache.size == 0
+
+    def test_max_size(self):
+        cache = CredentialCache(max_size=2)
+        cache.put(b'a', create_user(1), cache.generation)
+        cache.put(b'b', create_user(2), cache.generation)
+        cache.get(b'a')
+        cache.put(b'c', create_user(3), cache.generation)
+        assert cache.get(b'b') is None
+        assert cache.get(b'a') == create_user(1)
+        assert cache.get(b'c') == create_user(3)
+        assert cache._user_digests == {1: {b'a'}, 3: {b'c'}}
+
+    def test_invalidate_user(self):
+        cache = CredentialCache()
+        invalidated = []
+        cache.on_user_invalidated.append(invalidated.append)
+        cache.put(b'a', create_user(1), cache.generation)
+        cache.put(b'b', create_user(1), cache.generation)
+        cache.put(b'c', create_user(2), cache.generation)
+        cache.invalidate_user(1)
+        assert cache.get(b'a') is None and cache.get(b'b') is None
+        assert cache.get(b'c') == create_user(2)
+        assert invalidated == [1]
+
+    def test_invalidation_during_authentication(self):
+        cache = CredentialCache()
+        generation = cache.generation
+        cache.invalidate_user(1)
+        cache.put(b'a', create_user(1), generation)
+        assert cache.size == 0
+
+
+class TestUserManagementService:
+    async def test_invalidation(self):
+        cache = CredentialCache()
+        service = UserManagementService(UserInMemoryRepository(), EncryptionService('salt'), cache)
+        user = await service.create_new_user('user', 'user@mail.ru', 'password', '', True)
+        cache.put(b'a', user.get_descriptor(), cache.generation)
+        await service.update_user(user.id, email='other@mail.ru')
+        assert cache.get(b'a') is None
+        cache.put(b'a', user.get_descriptor(), cache.generation)
+        await service.delete_user(user.id)
+        assert cache.get(b'a') is None
+
+
+async def get_login(request):
+    return web.json_response(request['user'].login)
+
+
+@pytest.fixture
+async def client():
+    repository = UserInMemoryRepository()
+    encryption_service = EncryptionService('salt')
+    app = web.Application(middlewares=[BasicAuthMiddleware()])
+    app['credential_cache'] = CredentialCache()
+    app['user_management_service'] = UserManagementService(repository, encryption_service, app['credential_cache'])
+    app['authentication_service'] = AuthService(repository, encryption_service)
+    app['authentication_service'].authenticate = AsyncMock(wraps=app['authentication_service'].authenticate)
+    app['authorization_policy'] = Mock(permits=AsyncMock(return_value=True))
+    app['access_attr_calc_strategy'] = Mock()
+    app.router.add_get('/', get_login)
+    async with TestClient(TestServer(app)) as client:
+        yield client
+
+
+class TestBasicAuthMiddleware:
+    async def test_cached_credentials(self, client):
+        app = client.server.app
+        user = await app['user_management_service'].create_new_user('user', 'user@mail.ru', 'password', '', True)
+        auth = BasicAuth('user', 'password')
+        for i in range(3):
+            response = await client.get('/', auth=auth)
+            assert await response.json() == 'user'
+        assert app['authentication_service'].authenticate.call_count == 1
+        # The access is checked every request
+        assert app['authorization_policy'].permits.call_count == 3
+        await app['user_management_service'].update_user(user.id, login='renamed')
+        response = await client.get('/', auth=auth)
+        assert response.status != 200
+        response = await client.get('/', auth=BasicAuth('renamed', 'password'))
+        assert await response.json() == 'renamed'
+        assert app['credential_cache'].hit_count == 2
+
+    async def test_forbidden(self, client):
+        app = client.server.app
+        await app['user_management_service'].create_new_user('user', 'user@mail.ru', 'password', '', True)
+        app['authorization_policy'].permits.return_value = False
+        for i in range(2):
+            response = await client.get('/', auth=BasicAuth('user', 'password'))
+            assert response.status == 403
+        assert app['authentication_service'].authenticate.call_count == 1
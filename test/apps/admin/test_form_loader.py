@@ -10,4 +10,10 @@ class Test:
                                                                   'cr_ofd_channel': 2, 'cr_baudrate': '115200',
                                                                   'cr_passwd': '30', 'test_mode': 'False'})
         assert isinstance(form, Form)
-        assert form.validate()
\ No newline at end of file
+        assert form.validate()
+
+    def test_unreadable_latency_trace(self, tmp_path):
+        form = create_fiscal_device_config_form('test', settings={
+            'shift_duration': 80000, 'latency': '{"default": {"type": "trace", "path": "%s"}}' % (tmp_path / 'missing')})
+        assert not form.validate()
+        assert form.errors['latency']
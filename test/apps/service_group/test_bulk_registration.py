@@ -0,0 +1,98 @@
+import asyncio
+import json
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer, TestClient
+from mock import Mock, AsyncMock
+from core.events import EventDispatcher
+from core.id_allocators import BlockIdAllocator, InMemoryIdBlockStorage
+from core.events.event_storages import InMemoryEventStorage
+from hardware import CommandQueueIsFull
+from receipt.receipt_read import InMemoryReceiptRepository
+from receipt.receipt_read.event_handlers import ReceiptsCreatedHandler
+from receipt.services import ReceiptCreationService
+from apps.service_group.urls import get_routes
+
+pytestmark = pytest.mark.asyncio
+
+
+RECEIPT = {'email': 'ivan@mail.ru', 'tax_system': '2', 'receiptType': 1,
+           'products': [{'name': 'Product', 'payment_state_int': 1, 'price': 100.5, 'commodity_type_int': 1,
+                         'quantity': '1.0'}],
+           'payments': [{'payment_type_int': 1, 'payment_sum': 100.5}]}
+
+
+@web.middleware
+async def user_middleware(request, handler):
+    request['user'] = Mock(id=1)
+    return await handler(request)
+
+
+@pytest.fixture
+async def client():
+    app = web.Application(middlewares=[user_middleware])
+    repository = InMemoryReceiptRepository()
+    dispatcher = EventDispatcher(InMemoryEventStorage())
+    ReceiptsCreatedHandler(repository).subscribe(dispatcher)
+    app['receipt_read_repository'] = repository
+    app['event_dispatcher'] = dispatcher
+    app['receipt_creation_service'] = ReceiptCreationService()
+    app['receipt_processing_service'] = Mock(is_service_provided=Mock(return_value=True), check_capacity=Mock(),
+                                             proccess_many=AsyncMock())
+    app['receipt_id_allocator'] = BlockIdAllocator(InMemoryIdBlockStorage(), 'receipt', asyncio.get_event_loop())
+    app['receipt_id_allocator'].set_minimum(9)
+    app['receipt_bulk_max_size'] = 3
+    app['receipt_bulk_max_body_size'] = 1024 * 1024
+    app.add_routes(get_routes())
+    async with TestClient(TestServer(app)) as client:
+        yield client
+
+
+class TestBulkRegistration:
+    async def test_json_array(self, client):
+        invalid_receipt = dict(RECEIPT, email='invalid')
+        response = await client.post('/1/receipts/bulk', json=[RECEIPT, invalid_receipt, RECEIPT])
+        assert response.status == 200
+        body = await response.json()
+        assert body['accepted'] == 2
+        results = body['results']
+        assert [item['status'] for item in results] == ['accepted', 'error', 'accepted']
+        assert [results[0]['receipt_id'], results[2]['receipt_id']] == [10, 11]
+        assert results[0]['location'].endswith('/1/receipts/10')
+        assert 'email' in results[1]['errors']
+        app = client.server.app
+        app['receipt_processing_service'].check_capacity.assert_called_once_with(1, 2)
+        receipts, priority = app['receipt_processing_service'].proccess_many.call_args[0]
+        assert [receipt.id for receipt in receipts] == [10, 11]
+        document = await app['receipt_read_repository'].get(11, 1)
+        assert document['state'] == 'created'
+
+    async def test_ndjson(self, client):
+        lines = [json.dumps(RECEIPT), '', 'not json', json.dumps(RECEIPT)]
+        response = await client.post('/1/receipts/bulk', data='\n'.join(lines).encode(),
+                                     headers={'Content-Type': 'application/x-ndjson'})
+        assert response.status == 200
+        results = (await response.json())['results']
+        assert [(item['index'], item['status']) for item in results] == [(0, 'accepted'), (1, 'error'),
+                                                                        (2, 'accepted')]
+
+    async def test_too_many_receipts(self, client):
+        response = await client.post('/1/receipts/bulk', json=[RECEIPT] * 4)
+        assert response.status == 413
+        lines = '\n'.join([json.dumps(RECEIPT)] * 4)
+        response = await client.post('/1/receipts/bulk', data=lines.encode(),
+                                     headers={'Content-Type': 'application/x-ndjson'})
+        assert response.status == 413
+
+    async def test_nothing_is_accepted(self, client):
+        response = await client.post('/1/receipts/bulk', json=[{'email': 'invalid'}])
+        assert response.status == 400
+        response = await client.post('/1/receipts/bulk', json={'receipts': []})
+        assert response.status == 400
+
+    async def test_queue_is_full(self, client):
+        client.server.app['receipt_processing_service'].check_capacity.side_effect = CommandQueueIsFull('full', 3)
+        response = await client.post('/1/receipts/bulk', json=[RECEIPT])
+        assert response.status == 503
+        assert response.headers['Retry-After'] == '3'
+        assert await client.server.app['receipt_id_allocator'].allocate() == [10]
@@ -0,0 +1,79 @@
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer, TestClient
+from mock import Mock, AsyncMock
+from apps.service_group import FiscalServiceGroupFacade, ServiceGroupStateCache
+from apps.service_group.storages.in_memory import ServiceGroupInMemoryStorage
+from apps.service_group.urls import get_routes
+from receipt.receipt_read import InMemoryReceiptRepository, ReceiptDocumentCache
+
+pytestmark = pytest.mark.asyncio
+
+
+class Clock:
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+class TestServiceGroupStateCache:
+    def test_ttl(self):
+        clock = Clock()
+        cache = ServiceGroupStateCache(ttl=5, time_counter=clock)
+        assert cache.get(1) is None
+        cache.put(1, True, cache.generation)
+        cache.put(2, False, cache.generation)
+        clock.time = 4.9
+        assert (cache.get(1), cache.get(2)) == (True, False)
+        clock.time = 5
+        assert cache.get(1) is None
+
+    def test_invalidation_during_loading(self):
+        cache = ServiceGroupStateCache()
+        invalidated = []
+        cache.on_invalidated.append(invalidated.append)
+        generation = cache.generation
+        cache.invalidate(1)
+        cache.put(1, True, generation)
+        assert cache.get(1) is None
+        assert invalidated == [1]
+
+
+@pytest.fixture
+async def client():
+    storage = ServiceGroupInMemoryStorage()
+    storage.get = AsyncMock(wraps=storage.get)
+    app = web.Application()
+    app['service_group_state_cache'] = ServiceGroupStateCache()
+    app['fiscal_service_group_facade'] = FiscalServiceGroupFacade(storage, app['service_group_state_cache'])
+    app['receipt_read_repository'] = InMemoryReceiptRepository()
+    app['receipt_document_cache'] = ReceiptDocumentCache()
+    app['receipt_processing_service'] = Mock()
+    app.add_routes(get_routes())
+    async with TestClient(TestServer(app)) as client:
+        yield client
+
+
+class TestReceiptReading:
+    async def test_service_group_state_is_cached(self, client):
+        app = client.server.app
+        facade = app['fiscal_service_group_facade']
+        service_group = await facade.register_new_service_group('first', True, {})
+        await app['receipt_read_repository'].save({'id': 1, 'service_id': service_group.id, 'state': 'created'})
+        url = '/{}/receipts/1'.format(service_group.id)
+        for i in range(3):
+            response = await client.get(url)
+            assert response.status == 200
+        storage = facade._storage
+        assert storage.get.call_count == 1
+        await facade.update_service_group_information(service_group.id, 'first', False, {})
+        response = await client.get(url)
+        assert response.status == 404
+        await facade.delete_service_group(service_group.id)
+        for i in range(2):
+            response = await client.get(url)
+            assert response.status == 404
+        # The missing group is cached too
+        assert storage.get.call_count == 4
@@ -0,0 +1,181 @@
+import asyncio
+import datetime
+import decimal
+import os
+import pytest
+from core.events import Event
+from core.events.event_storages import FileEventStorage, InMemoryEventStorage, MergedEventStorage, StoredEvent
+
+
+pytestmark = pytest.mark.asyncio
+
+
+START = datetime.datetime(2020, 1, 1)
+
+
+class SomeEntityEvent(Event):
+    def __init__(self, entity_id, date_time):
+        self._data = {'sum': decimal.Decimal('10.50'), 'created': date_time}
+        self._entity = 'some_entity'
+        self._entity_id = entity_id
+        self._date_time = date_time
+        self._user_id = 10
+        self._client_id = 30
+
+
+class OtherEntityEvent(SomeEntityEvent):
+    pass
+
+
+def create_storage(directory, **kwargs):
+    return FileEventStorage(str(directory), asyncio.get_event_loop(), **kwargs)
+
+
+async def add_events(storage, count, event_type=SomeEntityEvent, first_id=0):
+    for i in range(first_id, first_id + count):
+        await storage.add(event_type(i, START + datetime.timedelta(seconds=i)))
+
+
+def get_time(seconds):
+    return START + datetime.timedelta(seconds=seconds)
+
+
+class TestInMemoryEventStorage:
+    async def test_get_by_time(self):
+        storage = InMemoryEventStorage(max_size=8)
+        await add_events(storage, 10)
+        await storage.add(OtherEntityEvent(10, get_time(10)))
+        assert [event.entity_id for event in await storage.get_by_time(get_time(3), get_time(6))] == [3, 4, 5, 6]
+        assert [event.entity_id for event in await storage.get_by_time(get_time(0), get_time(10),
+                                                                        [OtherEntityEvent])] == [10]
+        assert (await storage.get_last_record()).entity_id == 10
+        # The oldest events are removed
+        assert len(await storage.get_by_time(get_time(0), get_time(10))) == 8
+
+
+class TestFileEventStorage:
+    async def test_get_by_time(self, tmpdir):
+        storage = create_storage(tmpdir, segment_size=1024, index_interval=256)
+        await add_events(storage, 50)
+        await add_events(storage, 5, OtherEntityEvent, 50)
+        assert len(os.listdir(str(tmpdir))) > 2
+        events = await storage.get_by_time(get_time(10), get_time(30))
+        assert [event.entity_id for event in events] == list(range(10, 31))
+        assert type(events[0]) is SomeEntityEvent
+        assert events[0].data == {'sum': decimal.Decimal('10.50'), 'created': get_time(10)}
+        assert events[0].date_time == get_time(10)
+        assert (events[0].user_id, events[0].client_id, events[0].entity) == (10, 30, 'some_entity')
+        events = await storage.get_by_time(get_time(0), get_time(100), [OtherEntityEvent])
+        assert [event.entity_id for event in events] == list(range(50, 55))
+        assert await storage.get_by_time(get_time(100), get_time(200)) == []
+        assert (await storage.get_last_record()).entity_id == 54
+        await storage.close()
+
+    async def test_events_are_loaded_after_restart(self, tmpdir):
+        storage = create_storage(tmpdir, segment_size=1024, index_interval=256)
+        await add_events(storage, 20)
+        await storage.close()
+        # The record which was not written completely
+        last_segment = sorted(os.listdir(str(tmpdir)))[-1]
+        with open(os.path.join(str(tmpdir), last_segment), 'ab') as file:
+            file.write(b'{"k":1577836900.0,"e":')
+        storage = create_storage(tmpdir, segment_size=1024, index_interval=256)
+        assert (await storage.get_last_record()).entity_id == 19
+        await add_events(storage, 5, first_id=20)
+        events = await storage.get_by_time(get_time(15), get_time(30))
+        assert [event.entity_id for event in events] == list(range(15, 25))
+        await storage.close()
+
+    async def test_late_events(self, tmpdir):
+        storage = create_storage(tmpdir, index_interval=1)
+        await add_events(storage, 10)
+        # The event is written a half of second after the next events
+        await storage.add(SomeEntityEvent(100, get_time(8.5)))
+        await storage.add(SomeEntityEvent(101, get_time(10)))
+        events = await storage.get_by_time(get_time(8.5), get_time(9))
+        assert [event.entity_id for event in events] == [9, 100]
+        await storage.close()
+
+    async def test_retention_by_size(self, tmpdir):
+        storage = create_storage(tmpdir, segment_size=1024, max_size=3000)
+        await add_events(storage, 100)
+        assert sum(os.path.getsize(os.path.join(str(tmpdir), name)) for name in os.listdir(str(tmpdir))) <= 3000
+        events = await storage.get_by_time(get_time(0), get_time(100))
+        assert events and [event.entity_id for event in events] == list(range(events[0].entity_id, 100))
+        assert events[0].entity_id > 0
+        await storage.close()
+
+    async def test_retention_by_age(self, tmpdir):
+        storage = create_storage(tmpdir, segment_size=512, max_age=3600)
+        await add_events(storage, 10)
+        now = datetime.datetime.utcnow()
+        for i in range(10):
+            await storage.add(SomeEntityEvent(i, now))
+        events = await storage.get_by_time(START, now)
+        old_events = [event.entity_id for event in events if event.date_time < now]
+        # Only the segment which contains the recent events is kept
+        assert len(old_events) < 4 and old_events == list(range(10 - len(old_events), 10))
+        assert len(events) - len(old_events) == 10
+        await storage.close()
+
+    async def test_unknown_event_type(self, tmpdir):
+        storage = create_storage(tmpdir)
+        await add_events(storage, 1)
+        storage._event_types.clear()
+        storage._get_event_type = lambda name: None
+        event, = await storage.get_by_time(get_time(0), get_time(1))
+        assert isinstance(event, StoredEvent)
+        assert event.event_type.endswith('SomeEntityEvent')
+        assert event.entity_id == 0
+        await storage.close()
+
+    async def test_read(self, tmpdir):
+        storage = create_storage(tmpdir, segment_size=1024)
+        await add_events(storage, 30)
+        position, entity_ids = None, []
+        while True:
+            events, position = await storage.read(position, 7)
+            if not events:
+                break
+            entity_ids.extend(event.entity_id for event in events)
+        assert entity_ids == list(range(30))
+        await add_events(storage, 2, first_id=30)
+        events, position = await storage.read(position)
+        assert [event.entity_id for event in events] == [30, 31]
+        await storage.close()
+
+    async def test_read_in_memory(self):
+        storage = InMemoryEventStorage(max_size=5)
+        await add_events(storage, 3)
+        events, position = await storage.read(None, 2)
+        assert [event.entity_id for event in events] == [0, 1]
+        await add_events(storage, 5, first_id=3)
+        # The events removed from the storage are skipped
+        events, position = await storage.read(position)
+        assert [event.entity_id for event in events] == [3, 4, 5, 6, 7]
+        assert (await storage.read(position)) == ([], 8)
+
+
+class TestMergedEventStorage:
+    async def test_read(self, tmpdir):
+        first = create_storage(tmpdir.mkdir('first'), segment_size=1024)
+        second = create_storage(tmpdir.mkdir('second'), segment_size=1024)
+        for i in range(20):
+            await (first if i % 3 else second).add(SomeEntityEvent(i, get_time(i)))
+        events, first_position = await first.read(None, 2)
+        assert [event.entity_id for event in events] == [1, 2]
+        storage = MergedEventStorage({'first': first, 'second': second})
+        # The position of the first storage continues the reading of the first log
+        position, entity_ids = first_position, []
+        while True:
+            events, position = await storage.read(position, 4)
+            if not events:
+                break
+            entity_ids.extend(event.entity_id for event in events)
+        assert entity_ids == [i for i in range(20) if i not in (1, 2)]
+        await second.add(SomeEntityEvent(20, get_time(20)))
+        events, position = await storage.read(position)
+        assert [event.entity_id for event in events] == [20]
+        assert (await storage.get_last_record()).entity_id == 20
+        assert [event.entity_id for event in await storage.get_by_time(get_time(2), get_time(4))] == [2, 3, 4]
+        await storage.close()
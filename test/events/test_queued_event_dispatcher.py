@@ -0,0 +1,136 @@
+import asyncio
+import datetime
+import pytest
+from mock import AsyncMock
+from core.events import Event, QueuedEventDispatcher, OVERFLOW_DROP
+from core.events.event_storages import InMemoryEventStorage
+
+
+pytestmark = pytest.mark.asyncio
+
+
+class SomeEntityEvent(Event):
+    def __init__(self, entity_id, number):
+        self._data = {'number': number}
+        self._entity = 'some_entity'
+        self._entity_id = entity_id
+        self._date_time = datetime.datetime.now()
+        self._user_id = 10
+        self._client_id = 30
+
+
+class RecordingHandler:
+    def __init__(self, delay=0.0, synchronous=False):
+        self.handled = []
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        self.release.set()
+        self._delay = delay
+        self.synchronous = synchronous
+
+    def subscribe(self, event_dispatcher):
+        event_dispatcher.add_subscriber(SomeEntityEvent, self)
+
+    async def handle(self, event):
+        self.started.set()
+        await self.release.wait()
+        await asyncio.sleep(self._delay)
+        self.handled.append((event.entity_id, event.data['number']))
+
+
+def create_dispatcher(**kwargs):
+    return QueuedEventDispatcher(InMemoryEventStorage(), asyncio.get_event_loop(), **kwargs)
+
+
+class TestQueuedEventDispatcher:
+    async def test_events_of_entity_are_ordered(self):
+        dispatcher = create_dispatcher(workers=3)
+        handler = RecordingHandler(delay=0.001)
+        handler.subscribe(dispatcher)
+        for number in range(5):
+            for entity_id in range(4):
+                await dispatcher.handle(SomeEntityEvent(entity_id, number))
+        await dispatcher.close()
+        assert len(handler.handled) == 20
+        for entity_id in range(4):
+            assert [number for item_id, number in handler.handled if item_id == entity_id] == list(range(5))
+        assert dispatcher.statistics.get_histogram('RecordingHandler').count == 20
+
+    async def test_handle_does_not_wait_for_subscriber(self):
+        dispatcher = create_dispatcher()
+        handler = RecordingHandler()
+        handler.release.clear()
+        handler.subscribe(dispatcher)
+        await asyncio.wait_for(dispatcher.handle(SomeEntityEvent(1, 1)), 1)
+        await handler.started.wait()
+        assert handler.handled == []
+        handler.release.set()
+        await dispatcher.join()
+        assert handler.handled == [(1, 1)]
+        await dispatcher.close()
+
+    async def test_synchronous_subscriber(self):
+        dispatcher = create_dispatcher()
+        handler = RecordingHandler(synchronous=True)
+        handler.subscribe(dispatcher)
+        await dispatcher.handle(SomeEntityEvent(1, 1))
+        assert handler.handled == [(1, 1)]
+        assert dispatcher.queue_depth == 0
+        await dispatcher.close()
+
+    async def test_overflow_drop(self):
+        dispatcher = create_dispatcher(workers=1, max_queue_size=1, overflow=OVERFLOW_DROP)
+        handler = RecordingHandler()
+        handler.release.clear()
+        handler.subscribe(dispatcher)
+        for number in range(3):
+            await dispatcher.handle(SomeEntityEvent(1, number))
+            await asyncio.sleep(0)
+        # The first event is handled, the second one is queued
+        assert dispatcher.dropped_count == 1
+        handler.release.set()
+        await dispatcher.close()
+        assert handler.handled == [(1, 0), (1, 1)]
+
+    async def test_overflow_wait(self):
+        dispatcher = create_dispatcher(workers=1, max_queue_size=1)
+        handler = RecordingHandler()
+        handler.release.clear()
+        handler.subscribe(dispatcher)
+        await dispatcher.handle(SomeEntityEvent(1, 0))
+        await handler.started.wait()
+        await dispatcher.handle(SomeEntityEvent(1, 1))
+        blocked = asyncio.ensure_future(dispatcher.handle(SomeEntityEvent(1, 2)))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        handler.release.set()
+        await asyncio.wait_for(blocked, 1)
+        await dispatcher.close()
+        assert handler.handled == [(1, 0), (1, 1), (1, 2)]
+
+    async def test_errors_are_logged_and_events_are_handled_after_close(self):
+        dispatcher = create_dispatcher()
+        handler = AsyncMock()
+        handler.handle.side_effect = [ValueError('error'), None]
+        dispatcher.add_subscriber(SomeEntityEvent, handler)
+        await dispatcher.handle(SomeEntityEvent(1, 1))
+        await dispatcher.close()
+        assert dispatcher.statistics.get_histogram('AsyncMock').errors_count == 1
+        await dispatcher.handle(SomeEntityEvent(1, 2))
+        assert handler.handle.call_count == 2
+
+    async def test_close_after_tasks_are_cancelled(self):
+        # web.run_app cancels all the tasks while the cleanup of the app closes the dispatcher
+        dispatcher = create_dispatcher(workers=1)
+        handler = RecordingHandler()
+        handler.release.clear()
+        handler.subscribe(dispatcher)
+        for number in range(4):
+            await dispatcher.handle(SomeEntityEvent(1, number))
+        await handler.started.wait()
+        for task in dispatcher._tasks.values():
+            task.cancel()
+        handler.release.set()
+        await asyncio.wait_for(dispatcher.close(), 1)
+        # The event which was handled by the cancelled task is lost, the queued events are handled
+        assert handler.handled == [(1, 1), (1, 2), (1, 3)]
@@ -4,6 +4,7 @@ from hardware.adapters.base import (AsyncTreadPoolExecutor, AsyncRegistrator, Ab
 import asyncio
 from time import sleep
 from mock import Mock, AsyncMock
+from hardware.adapters.exceptions import FiscalDeviceOperationError
 
 pytestmark = pytest.mark.asyncio
 
@@ -81,7 +82,7 @@ class TestCrRegistrator:
         assert sync_device_adapter.register_receipt.called
 
         await registrator.do_close_shift()
-        assert sync_device_adapter.close_shift.called
+        assert sync_device_adapter.request_close_shift.called and sync_device_adapter.is_document_closed.called
 
         await registrator.do_open_shift()
         assert sync_device_adapter.open_shift.called
@@ -92,6 +93,50 @@ class TestCrRegistrator:
         assert old_state.state_changed.called
 
 
+class ClosingAdapter:
+    # Документ закрытия смены закрывается после заданного количества проверок
+    def __init__(self, checks_count):
+        self.checks_count = checks_count
+        self.request_close_shift = Mock()
+        self.get_shift_info = Mock()
+
+    def is_document_closed(self):
+        self.checks_count -= 1
+        return self.checks_count <= 0
+
+
+class TestDocumentClosedWait:
+    async def test_wait(self):
+        loop = asyncio.get_event_loop()
+        executor = AsyncTreadPoolExecutor(loop)
+        adapter = ClosingAdapter(3)
+        registrator = AsyncRegistrator(adapter, MockStateFactory(), loop, executor, document_check_interval=0.05)
+        task = loop.create_task(registrator.do_close_shift())
+        await asyncio.sleep(0.01)
+        # Между проверками поток устройства свободен
+        assert await asyncio.wait_for(executor.execute(lambda: 1), 0.02) == 1
+        await task
+        assert adapter.request_close_shift.called and adapter.checks_count == 0
+
+    async def test_timeout(self):
+        loop = asyncio.get_event_loop()
+        adapter = ClosingAdapter(100)
+        registrator = AsyncRegistrator(adapter, MockStateFactory(), loop, AsyncTreadPoolExecutor(loop),
+                                       document_close_timeout=0.2, document_check_interval=0.05)
+        with pytest.raises(FiscalDeviceOperationError):
+            await registrator.do_close_shift()
+        assert adapter.checks_count > 95
+
+    async def test_last_check_at_deadline(self):
+        loop = asyncio.get_event_loop()
+        # Проверки через 0, 0.05 и 0.15 секунды, следующий интервал 0.2 сокращается до окончания ожидания
+        adapter = ClosingAdapter(4)
+        registrator = AsyncRegistrator(adapter, MockStateFactory(), loop, AsyncTreadPoolExecutor(loop),
+                                       document_close_timeout=0.2, document_check_interval=0.05)
+        await registrator.do_close_shift()
+        assert adapter.checks_count == 0
+
+
 # Тестирование состояний смены
 class MockStateFull(ShiftStateDrivenAbstract):
     # Класс объекта, управляемого состоянием
@@ -1,4 +1,9 @@
+import datetime
+import json
+import pytest
 from hardware.adapters.atol.adapter import AtlCashRegister
+from hardware.adapters.atol.libfptr10 import IFptr
+from hardware.adapters.exceptions import FiscalDeviceOperationError
 from hardware.adapters.atol import Loader
 from hardware.adapters.base import DefaultTimeCounter
 from receipt import get_default_receipt_factory
@@ -30,4 +35,80 @@ class TestAtolAdapter:
 
         cash_reg = AtlCashRegister(driver_object, DefaultTimeCounter(), test_mode=True)
         receipt = get_receipt()
-        cash_reg.register_receipt(receipt)
\ No newline at end of file
+        cash_reg.register_receipt(receipt)
+
+
+class FakeDriver:
+    # Драйвер без устройства: запоминает параметры и вызовы, результаты вызовов задаются в results. Как и libfptr,
+    # очищает параметры после каждого вызова, параметры вызовов сохраняются в call_params
+    def __init__(self, results=None):
+        self.params = {}
+        self.calls = []
+        self.call_params = []
+        self.results = results or {}
+
+    def __getattr__(self, name):
+        if name.startswith('LIBFPTR_'):
+            return getattr(IFptr, name)
+
+        def call(*args):
+            self.calls.append(name)
+            self.call_params.append((name, self.params))
+            self.params = {}
+            result = self.results.get(name, 0)
+            return result.pop(0) if isinstance(result, list) else result
+        return call
+
+    def setParam(self, param, value):
+        self.params[param] = value
+
+    def getParamString(self, param):
+        return self.params.get(param, '')
+
+    def getParamInt(self, param):
+        return 1
+
+    def getParamDateTime(self, param):
+        return datetime.datetime(2020, 1, 31, 10, 0)
+
+
+class TestAtolJsonRegistration:
+    def test_json_task(self):
+        driver = FakeDriver({'isOpened': 1})
+        cash_reg = AtlCashRegister(driver, DefaultTimeCounter())
+        receipt = get_receipt()
+        cash_reg.register_receipt(receipt)
+        assert driver.calls.count('processJson') == 1
+        assert 'registration' not in driver.calls and 'openReceipt' not in driver.calls
+        params, = [params for name, params in driver.call_params if name == 'processJson']
+        task = json.loads(params[IFptr.LIBFPTR_PARAM_JSON_DATA])
+        assert task['type'] == 'sell' and task['total'] == 200
+        assert [item['paymentObject'] for item in task['items']] == ['commodity', 'service']
+        assert task['payments'] == [{'type': 'electronically', 'sum': 200}]
+        assert task['clientInfo'] == {'emailOrPhone': 'dvil@mail.ru'}
+        # Старый драйвер не вернул фискальные параметры, они запрошены у ФН
+        assert receipt.shift_num == 1
+
+    def test_not_supported_fallback(self):
+        driver = FakeDriver({'isOpened': 1, 'processJson': -1, 'errorCode': IFptr.LIBFPTR_ERROR_NOT_SUPPORTED})
+        cash_reg = AtlCashRegister(driver, DefaultTimeCounter())
+        cash_reg.register_receipt(get_receipt())
+        assert driver.calls.count('registration') == 2 and 'closeReceipt' in driver.calls
+        assert cash_reg.registration_mode == AtlCashRegister.REGISTRATION_MODE_CLASSIC
+
+    def test_operation_error(self):
+        driver = FakeDriver({'isOpened': 1, 'processJson': -1, 'errorCode': IFptr.LIBFPTR_ERROR_INVALID_SUM,
+                             'errorDescription': 'error'})
+        cash_reg = AtlCashRegister(driver, DefaultTimeCounter())
+        with pytest.raises(FiscalDeviceOperationError):
+            cash_reg.register_receipt(get_receipt())
+        assert 'cancelReceipt' in driver.calls and 'registration' not in driver.calls
+
+    def test_opened_receipt_retry(self):
+        driver = FakeDriver({'isOpened': 1, 'processJson': [-1, 0],
+                             'errorCode': IFptr.LIBFPTR_ERROR_DENIED_IN_OPENED_RECEIPT})
+        cash_reg = AtlCashRegister(driver, DefaultTimeCounter())
+        cash_reg.register_receipt(get_receipt())
+        assert driver.calls.count('cancelReceipt') == 1
+        first, second = [params for name, params in driver.call_params if name == 'processJson']
+        assert second[IFptr.LIBFPTR_PARAM_JSON_DATA] == first[IFptr.LIBFPTR_PARAM_JSON_DATA]
@@ -4,6 +4,7 @@ from receipt import AbstractReceiptRegistrator
 from receipt.events import ReceiptRegistered, ReceiptRegistationFailed
 from receipt.commands import  RegisterReceiptCommand
 from hardware.fiscal_device_group_managers import Invoker
+from core.commands import CommandPriority
 from mock import Mock,  AsyncMock
 
 
@@ -29,11 +30,12 @@ class MockReceiptRegistrator(AbstractReceiptRegistrator):
 class TestCommands:
     async def test_register_receipt_command(self):
         invoker = Invoker(MockReceiptRegistrator(), asyncio.get_event_loop())
+        invoker.start()
         event_dispatcher = Mock()
         receipt = Mock()
         command = RegisterReceiptCommand(receipt, event_dispatcher)
         invoker.put(command)
-        await invoker.current_task
+        await invoker.wait_all_executed()
         assert ReceiptRegistered in map(type, event_dispatcher.handle.call_args.args)
 
         async def mock_method(*args, **kwargs):
@@ -43,5 +45,77 @@ class TestCommands:
         invoker.fr_adapter.register_receipt = mock_method
 
         invoker.put(command)
-        await invoker.current_task
-        assert ReceiptRegistationFailed in map(type, event_dispatcher.handle.call_args.args)
\ No newline at end of file
+        await invoker.wait_all_executed()
+        assert ReceiptRegistationFailed in map(type, event_dispatcher.handle.call_args.args)
+        await invoker.stop()
+
+
+class TestInvoker:
+    async def test_drain_worker(self):
+        invoker = Invoker(MockReceiptRegistrator(), asyncio.get_event_loop(), batch_size=3)
+        executed = []
+
+        def create_command(i):
+            command = Mock(priority=CommandPriority.NORMAL, user_id=None, is_priority_requested=False)
+            command.execute = AsyncMock(side_effect=lambda adapter: executed.append(i))
+            return command
+
+        for i in range(7):
+            invoker.put(create_command(i))
+        assert not executed  # пока задача-исполнитель не запущена, команды остаются в очереди
+
+        invoker.start()
+        drain_task = invoker.current_task
+        await invoker.wait_all_executed()
+        assert sorted(executed) == list(range(7))
+        assert invoker.statistics.processed_count == 7
+        assert invoker.statistics.average_execution_time is not None
+        assert invoker.statistics.last_wait_time >= 0
+
+        # Новые команды исполняет та же самая задача
+        invoker.put(create_command(7))
+        await invoker.wait_all_executed()
+        assert invoker.current_task is drain_task
+        assert invoker.statistics.processed_count == 8
+
+        await invoker.stop()
+        assert not invoker.is_running
+
+    async def test_high_priority_command_during_batch(self):
+        invoker = Invoker(MockReceiptRegistrator(), asyncio.get_event_loop(), batch_size=10)
+        executed = []
+
+        def create_command(name, priority=CommandPriority.NORMAL):
+            command = Mock(priority=priority, user_id=None, is_priority_requested=False)
+
+            async def execute(adapter):
+                executed.append(name)
+                if name == 0:
+                    # Команда высокого приоритета поступает во время исполнения первой команды
+                    invoker.put(create_command('high', CommandPriority.HIGH))
+                await asyncio.sleep(0)
+            command.execute = execute
+            return command
+
+        for i in range(5):
+            invoker.put(create_command(i))
+        invoker.start()
+        await invoker.wait_all_executed()
+        assert executed == [0, 'high', 1, 2, 3, 4]
+        await invoker.stop()
+
+    async def test_pause(self):
+        invoker = Invoker(MockReceiptRegistrator(), asyncio.get_event_loop())
+        invoker.start()
+        await invoker.pause()
+        command = Mock(priority=CommandPriority.NORMAL, user_id=None, is_priority_requested=False)
+        command.execute = AsyncMock()
+        invoker.put(command)
+        await asyncio.sleep(0.05)
+        assert not command.execute.called
+        assert invoker.pending_count == 1
+        invoker.resume()
+        await invoker.wait_all_executed()
+        assert command.execute.called
+        assert invoker.pending_count == 0
+        await invoker.stop()
@@ -1,17 +1,21 @@
-from hardware.fiscal_device_group_managers import DeviceGroupManager
+from hardware.fiscal_device_group_managers import (DeviceGroupManager, DevicePool, Invoker, DeviceIsNotAttached,
+                                                   DeviceIsRunning, DevicePoolError, CommandQueueIsFull,
+                                                   CommandWaitTimeExceeded)
 from hardware.adapters import AbstractRegistratorDriverAdapter
 import pytest
 import asyncio
 from mock import Mock, AsyncMock
-from core.commands import AbstractCommand
+from core.commands import AbstractCommand, CommandPriority
 import datetime
 
 pytestmark = pytest.mark.asyncio
 
 
 @pytest.fixture
-def manager():
-    return DeviceGroupManager('name', asyncio.get_event_loop())
+async def manager():
+    manager = DeviceGroupManager('name', asyncio.get_event_loop())
+    yield manager
+    await manager.close()
 
 
 class Command(AbstractCommand):
@@ -101,4 +105,122 @@ class TestDeviceGroupManager:
         assert device.reboot.called
 
         await manager.detach_device(service_group_id)
-        assert not manager.is_device_provided_for_group(service_group_id)
\ No newline at end of file
+        assert not manager.is_device_provided_for_group(service_group_id)
+
+    async def test_check_capacity(self, manager: DeviceGroupManager):
+        service_group_id = 1
+        with pytest.raises(DeviceIsNotAttached):
+            manager.check_capacity(service_group_id)
+        manager.add_device(service_group_id, Device(), max_queue_size=1)
+        await manager.pause_command_execution(service_group_id)
+        manager.check_capacity(service_group_id)
+        await manager.process_command(service_group_id, Command())
+        with pytest.raises(CommandQueueIsFull):
+            manager.check_capacity(service_group_id)
+        await manager.resume_command_execution(service_group_id)
+        await manager.detach_device(service_group_id)
+
+    async def test_check_capacity_of_several_commands(self, manager: DeviceGroupManager):
+        service_group_id = 1
+        manager.add_device(service_group_id, Device(), max_queue_size=3)
+        await manager.pause_command_execution(service_group_id)
+        manager.check_capacity(service_group_id, 3)
+        await manager.process_commands(service_group_id, [Command(), Command()])
+        assert manager.get_pool_information(service_group_id)[0].pending_count == 2
+        manager.check_capacity(service_group_id, 1)
+        with pytest.raises(CommandQueueIsFull):
+            manager.check_capacity(service_group_id, 2)
+        await manager.resume_command_execution(service_group_id)
+        await manager.detach_device(service_group_id)
+
+    async def test_pool_members(self, manager: DeviceGroupManager):
+        service_group_id = 1
+        device = Device()
+        manager.add_device(service_group_id, device)
+        device2 = Device()
+        device2.id = 2
+        await manager.add_pool_member(service_group_id, device2)
+        with pytest.raises(DeviceIsRunning):
+            await manager.add_pool_member(service_group_id, device2)
+        assert len(manager.get_pool_information(service_group_id)) == 2
+        for i in range(10):
+            await manager.process_command(service_group_id, Command())
+        # Без статистики исполнения команды распределяются по количеству ожидающих команд
+        assert [item.pending_count for item in manager.get_pool_information(service_group_id)] == [5, 5]
+        await manager.open_shift(service_group_id)
+        assert device2.open_shift.called
+
+        await manager.remove_pool_member(service_group_id, 2)
+        assert len(manager.get_pool_information(service_group_id)) == 1
+        with pytest.raises(DevicePoolError):
+            await manager.remove_pool_member(service_group_id, None)
+        await manager.detach_device(service_group_id)
+
+    async def test_remove_pool_member_while_paused(self, manager: DeviceGroupManager):
+        service_group_id = 1
+        manager.add_device(service_group_id, Device())
+        device2 = Device()
+        device2.id = 2
+        await manager.add_pool_member(service_group_id, device2)
+        await manager.pause_command_execution(service_group_id)
+        for i in range(4):
+            await manager.process_command(service_group_id, Command())
+        with pytest.raises(DevicePoolError):
+            await asyncio.wait_for(manager.remove_pool_member(service_group_id, 2), 1)
+        assert len(manager.get_pool_information(service_group_id)) == 2
+        await manager.resume_command_execution(service_group_id)
+        await asyncio.wait_for(manager.remove_pool_member(service_group_id, 2), 1)
+        assert len(manager.get_pool_information(service_group_id)) == 1
+        await manager.detach_device(service_group_id)
+
+
+def create_command():
+    return Mock(priority=CommandPriority.NORMAL, user_id=None, is_priority_requested=False)
+
+
+class TestDevicePool:
+    @staticmethod
+    def create_pool(**kwargs):
+        return DevicePool(lambda device: Invoker(device, asyncio.get_event_loop()), **kwargs)
+
+    async def test_least_loaded_dispatch(self):
+        pool = self.create_pool()
+        slow_invoker = pool.add(Device())
+        fast_invoker = pool.add(Device())
+        await pool.pause()
+        slow_invoker.statistics.add(0, 3.0)
+        fast_invoker.statistics.add(0, 1.0)
+        for i in range(8):
+            pool.put(create_command())
+        # Расчетное время завершения: 2 команды по 3 секунды на медленном устройстве, 6 команд по 1 секунде на быстром
+        assert (slow_invoker.pending_count, fast_invoker.pending_count) == (2, 6)
+        pool.resume()
+        await pool.stop()
+
+    async def test_capacity(self):
+        pool = self.create_pool(max_size=3, max_wait_time=5)
+        invoker = pool.add(Device())
+        await pool.pause()
+        pool.check_capacity()
+        invoker.statistics.add(0, 2.0)  # средняя длительность исполнения команды - 2 секунды
+        for i in range(3):
+            pool.put(create_command())
+        # 3 команды по 2 секунды - расчетное время ожидания больше 5 секунд
+        assert pool.estimated_wait_time == 6.0
+        with pytest.raises(CommandQueueIsFull) as exc_info:
+            pool.check_capacity()
+        assert exc_info.value.retry_after == 2
+        pool.resume()
+        await pool.stop()
+
+        pool = self.create_pool(max_wait_time=5)
+        invoker = pool.add(Device())
+        await pool.pause()
+        invoker.statistics.add(0, 2.0)
+        for i in range(4):
+            pool.put(create_command())
+        with pytest.raises(CommandWaitTimeExceeded) as exc_info:
+            pool.check_capacity()
+        assert exc_info.value.retry_after == 3
+        pool.resume()
+        await pool.stop()
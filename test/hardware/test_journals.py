@@ -0,0 +1,162 @@
+import asyncio
+import decimal
+import os
+import pytest
+from mock import Mock
+from core.commands import AbstractCommand, AbstractCommandSerializer
+from core.serialization import dumps, loads
+from hardware.journals import FileCommandJournal, FileCommandJournalFactory
+from hardware.fiscal_device_group_managers import DeviceGroupManager
+from receipt.commands import RegisterReceiptCommand, RegisterReceiptCommandSerializer
+from receipt.domain.factories import get_default_receipt_factory
+from test.hardware.test_device_group_manager import Device
+
+pytestmark = pytest.mark.asyncio
+
+
+class Command(AbstractCommand):
+    _priority = 5
+
+    def __init__(self, number):
+        self.number = number
+        self.datetime = number
+
+    async def execute(self, executor):
+        pass
+
+
+class CommandSerializer(AbstractCommandSerializer):
+    def serialize(self, command):
+        return {'number': command.number, 'sum': decimal.Decimal('10.50')}
+
+    def deserialize(self, data):
+        assert data['sum'] == decimal.Decimal('10.50')
+        return Command(data['number'])
+
+
+def create_journal(directory, **kwargs):
+    return FileCommandJournal(str(directory), CommandSerializer(), asyncio.get_event_loop(), **kwargs)
+
+
+class TestFileCommandJournal:
+    async def test_replay(self, tmp_path):
+        journal = create_journal(tmp_path)
+        assert journal.load() == []
+        commands = [Command(i) for i in range(10)]
+        await asyncio.gather(*[journal.append(command) for command in commands])
+        for command in commands[:7]:
+            await journal.complete(command)
+        await journal.close()
+
+        journal = create_journal(tmp_path)
+        assert [command.number for command in journal.load()] == [7, 8, 9]
+        await journal.close()
+
+    async def test_broken_record(self, tmp_path):
+        journal = create_journal(tmp_path)
+        journal.load()
+        await journal.append(Command(1))
+        await journal.close()
+        segment_name = os.listdir(str(tmp_path))[0]
+        with open(os.path.join(str(tmp_path), segment_name), 'a') as file:
+            file.write('{"t":"e","id":2,"d":{"num')
+
+        journal = create_journal(tmp_path)
+        assert [command.number for command in journal.load()] == [1]
+        await journal.append(Command(3))
+        await journal.close()
+        journal = create_journal(tmp_path)
+        assert [command.number for command in journal.load()] == [1, 3]
+        await journal.close()
+
+    async def test_rotation_and_compaction(self, tmp_path):
+        journal = create_journal(tmp_path, segment_size=200, compaction_threshold=2)
+        journal.load()
+        long_command = Command(0)
+        await journal.append(long_command)
+        for i in range(1, 50):
+            command = Command(i)
+            await journal.append(command)
+            await journal.complete(command)
+        # Сегменты без неисполненных команд удалены, единственная неисполненная команда перенесена при уплотнении
+        assert len(os.listdir(str(tmp_path))) <= 4
+        await journal.close()
+
+        journal = create_journal(tmp_path, segment_size=200, compaction_threshold=2)
+        commands = journal.load()
+        assert [command.number for command in commands] == [0]
+        await journal.complete(commands[0])
+        await journal.append(Command(50))
+        await journal.close()
+        journal = create_journal(tmp_path)
+        assert [command.number for command in journal.load()] == [50]
+        await journal.close()
+
+    async def test_crash_during_compaction(self, tmp_path):
+        journal = create_journal(tmp_path, segment_size=200, compaction_threshold=2)
+        journal.load()
+        # Аварийная остановка после сохранения нового сегмента, но до удаления старых
+        journal._remove_segments = Mock()
+        commands = [Command(i) for i in range(20)]
+        for command in commands:
+            await journal.append(command)
+        for command in commands[1::2]:
+            await journal.complete(command)
+        assert journal._remove_segments.called
+        await journal.close()
+
+        journal = create_journal(tmp_path, segment_size=200, compaction_threshold=2)
+        assert [command.number for command in journal.load()] == list(range(0, 20, 2))
+        await journal.close()
+
+
+class TestJournalBatch:
+    async def test_append_many(self, tmp_path):
+        journal = create_journal(tmp_path)
+        journal.load()
+        commands = [Command(i) for i in range(3)]
+        await journal.append_many(commands)
+        await journal.complete(commands[1])
+        await journal.close()
+        journal = create_journal(tmp_path)
+        assert [command.number for command in journal.load()] == [0, 2]
+        await journal.close()
+
+
+class TestJournalReplay:
+    async def test_manager_replay(self, tmp_path):
+        journal_factory = FileCommandJournalFactory(str(tmp_path), CommandSerializer(), asyncio.get_event_loop())
+        manager = DeviceGroupManager('name', asyncio.get_event_loop(), journal_factory)
+        manager.add_device(1, Device())
+        await manager.pause_command_execution(1)
+        for i in range(3):
+            await manager.process_command(1, Command(i))
+        # Аварийная остановка: команды остались неисполненными
+        await manager._journals[1].close()
+
+        manager = DeviceGroupManager('name', asyncio.get_event_loop(), journal_factory)
+        manager.add_device(1, Device())
+        assert manager.get_pool_information(1)[0].pending_count == 3
+        await manager.close()
+
+        manager = DeviceGroupManager('name', asyncio.get_event_loop(), journal_factory)
+        manager.add_device(1, Device())
+        assert manager.get_pool_information(1)[0].pending_count == 0
+        await manager.close()
+
+    async def test_register_receipt_command_serializer(self):
+        data = {'receiptType': 1, 'order_id': '15', 'tax_system': '2', 'email': 'ivan@mail.ru',
+                'products': [{'name': 'Товар', 'quantity': decimal.Decimal('1.5'), 'price': decimal.Decimal('10.20'),
+                              'commodity_type_int': 1, 'payment_state_int': 4, 'quantity_prec': 1,
+                              'quantity_unit': 'кг', 'tax_type_int': 6}],
+                'payments': [{'payment_type_int': 1, 'payment_sum': decimal.Decimal('15.30')}]}
+        receipt = get_default_receipt_factory().create_receipt(3, 1, data)
+        receipt.id = 25
+        event_dispatcher = Mock()
+        serializer = RegisterReceiptCommandSerializer(event_dispatcher)
+        command = RegisterReceiptCommand(receipt, event_dispatcher, 1)
+        restored = serializer.deserialize(loads(dumps(serializer.serialize(command))))
+        assert restored.receipt.as_dict() == receipt.as_dict()
+        assert restored.priority == 1 and restored.is_priority_requested
+        assert restored.user_id == 3
+        assert restored.datetime == command.datetime
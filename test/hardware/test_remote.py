@@ -0,0 +1,156 @@
+import asyncio
+import datetime
+import types
+import pytest
+from mock import Mock, AsyncMock
+from core.commands import AbstractCommand, AbstractCommandSerializer
+from core.events import Event
+from core.ipc import IpcServer, IpcClient
+from hardware.fiscal_device_group_managers import DeviceGroupManager, DeviceIsNotAttached, CommandQueueIsFull
+from hardware.remote import CommandEventPublisher, DeviceCommandReceiver, RemoteDeviceGroupManager
+from .test_device_group_manager import Device
+
+pytestmark = pytest.mark.asyncio
+
+
+class Executed(Event):
+    def __init__(self, receipt_id):
+        self._date_time = datetime.datetime.utcnow()
+        self._entity = 'receipt'
+        self._entity_id = receipt_id
+        self._data = {}
+        self._user_id = 1
+        self._client_id = 1
+
+
+class Command(AbstractCommand):
+    _priority = 5
+
+    def __init__(self, receipt_id, event_dispatcher):
+        self.datetime = datetime.datetime.now()
+        self.receipt = types.SimpleNamespace(id=receipt_id)
+        self._event_dispatcher = event_dispatcher
+
+    async def execute(self, fiscal_machine):
+        await self._event_dispatcher.handle(Executed(self.receipt.id))
+
+
+class Serializer(AbstractCommandSerializer):
+    def __init__(self, event_dispatcher=None):
+        self._event_dispatcher = event_dispatcher
+
+    def serialize(self, command: Command) -> dict:
+        return {'receipt_id': command.receipt.id}
+
+    def deserialize(self, data: dict) -> Command:
+        return Command(data['receipt_id'], self._event_dispatcher)
+
+
+async def wait_for(condition, timeout=2.0):
+    for i in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError('The condition is not met')
+
+
+class Worker:
+    def __init__(self, path):
+        self.client = IpcClient(path)
+        self.event_dispatcher = Mock(handle=AsyncMock())
+        self.on_replicated_event = AsyncMock()
+        self.manager = RemoteDeviceGroupManager(self.client, Serializer(), self.event_dispatcher,
+                                                on_replicated_event=self.on_replicated_event)
+
+    def get_handled(self):
+        return [call[0][0].entity_id for call in self.event_dispatcher.handle.call_args_list]
+
+    def get_replicated(self):
+        return [call[0][0].entity_id for call in self.on_replicated_event.call_args_list]
+
+    async def close(self):
+        await self.manager.close()
+        await self.client.close()
+
+
+@pytest.fixture
+async def owner(tmp_path):
+    loop = asyncio.get_event_loop()
+    server = IpcServer(str(tmp_path / 'ipc.sock'))
+    publisher = CommandEventPublisher(server)
+    manager = DeviceGroupManager('name', loop)
+    receiver = DeviceCommandReceiver(manager, Serializer(publisher), publisher, server, capacity_interval=0.01)
+    await server.start()
+    receiver.start()
+    yield types.SimpleNamespace(server=server, manager=manager, publisher=publisher)
+    await receiver.close()
+    await manager.close()
+    await server.close()
+
+
+@pytest.fixture
+async def workers(owner):
+    workers = [Worker(owner.server.path), Worker(owner.server.path)]
+    for worker in workers:
+        await worker.client.connect()
+    yield workers
+    for worker in workers:
+        await worker.close()
+
+
+class TestRemoteDeviceGroupManager:
+    async def test_events_are_returned_to_origin(self, owner, workers):
+        first, second = workers
+        owner.manager.add_device(1, Device())
+        await wait_for(lambda: first.manager.is_device_provided_for_group(1))
+        await first.manager.process_commands(1, [Command(10, None), Command(11, None)])
+        await second.manager.process_command(1, Command(12, None))
+        await wait_for(lambda: len(first.get_handled() + first.get_replicated()) == 3)
+        await wait_for(lambda: len(second.get_handled() + second.get_replicated()) == 3)
+        assert first.get_handled() == [10, 11]
+        assert first.get_replicated() == [12]
+        assert second.get_handled() == [12]
+        assert second.get_replicated() == [10, 11]
+
+    async def test_events_of_unsubscribed_worker(self, owner, workers):
+        first, second = workers
+        owner.manager.add_device(1, Device())
+        await wait_for(lambda: first.manager.is_device_provided_for_group(1))
+        await owner.manager.pause_command_execution(1)
+        await first.manager.process_command(1, Command(10, None))
+        await first.manager.close()
+        await owner.manager.resume_command_execution(1)
+        await wait_for(lambda: second.get_handled() == [10])
+        assert first.get_handled() == first.get_replicated() == []
+
+    async def test_events_are_kept_without_workers(self, owner):
+        await owner.publisher.handle(Executed(10))
+        worker = Worker(owner.server.path)
+        await worker.client.connect()
+        await wait_for(lambda: worker.get_handled() == [10])
+        await worker.close()
+
+    async def test_capacity(self, owner, workers):
+        first, second = workers
+        assert not first.manager.is_device_provided_for_group(1)
+        with pytest.raises(DeviceIsNotAttached):
+            first.manager.check_capacity(1)
+        owner.manager.add_device(1, Device(), max_queue_size=1)
+        await wait_for(lambda: first.manager.is_device_provided_for_group(1))
+        await owner.manager.pause_command_execution(1)
+        first.manager.check_capacity(1)
+        await first.manager.process_command(1, Command(10, None))
+        # The accepted command is counted before the next state of the pool is received
+        with pytest.raises(CommandQueueIsFull):
+            first.manager.check_capacity(1)
+        await wait_for(lambda: second.manager._capacity_states[1].pending_count == 1)
+        with pytest.raises(CommandQueueIsFull):
+            second.manager.check_capacity(1)
+        await owner.manager.resume_command_execution(1)
+        await owner.manager.detach_device(1)
+        await wait_for(lambda: not second.manager.is_device_provided_for_group(1))
+
+    async def test_error_of_owner(self, owner, workers):
+        with pytest.raises(KeyError):
+            await workers[0].manager.process_command(1, Command(10, None))
+        assert owner.publisher._origins == {}
@@ -0,0 +1,67 @@
+import pytest
+from mock import Mock
+from core.commands import CommandPriority
+from hardware.adapters.base import AbstractTimeCounter
+from hardware.fiscal_device_group_managers import QueuedCommand
+from hardware.schedulers import FairCommandScheduler
+
+pytestmark = pytest.mark.asyncio
+
+
+class TimeCounter(AbstractTimeCounter):
+    def __init__(self):
+        self.value = 0
+
+    def get_time_value(self):
+        return self.value
+
+
+def create_item(user_id, priority=CommandPriority.NORMAL, is_priority_requested=False, enqueued_at=0):
+    command = Mock(user_id=user_id, priority=priority, is_priority_requested=is_priority_requested)
+    return QueuedCommand(command, enqueued_at)
+
+
+def get_user_ids(scheduler, count):
+    return [scheduler.get_nowait().command.user_id for i in range(count)]
+
+
+class TestFairCommandScheduler:
+    async def test_users_fairness(self):
+        scheduler = FairCommandScheduler(user_weights={3: 2}, time_counter=TimeCounter())
+        # Пользователь 1 ставит в очередь большой пакет команд раньше остальных
+        for i in range(100):
+            scheduler.put_nowait(create_item(1))
+        scheduler.put_nowait(create_item(2))
+        assert get_user_ids(scheduler, 2) == [1, 2]
+
+        for i in range(4):
+            scheduler.put_nowait(create_item(3))
+        # Вес пользователя 3 в два раза больше, он получает две команды из трех
+        user_ids = get_user_ids(scheduler, 6)
+        assert user_ids.count(3) == 4 and user_ids.count(1) == 2
+        assert scheduler.qsize() == 97
+
+    async def test_priority_classes(self):
+        time_counter = TimeCounter()
+        scheduler = FairCommandScheduler(user_priorities={2: CommandPriority.LOW}, aging_interval=10,
+                                         time_counter=time_counter)
+        scheduler.put_nowait(create_item(2))
+        scheduler.put_nowait(create_item(1))
+        scheduler.put_nowait(create_item(2, CommandPriority.HIGH, True))
+        assert get_user_ids(scheduler, 3) == [2, 1, 2]
+        statistics = scheduler.get_wait_statistics()
+        assert set(statistics.keys()) == {'high', 'normal', 'low'}
+        assert statistics['low']['count'] == 1
+
+    async def test_aging(self):
+        time_counter = TimeCounter()
+        scheduler = FairCommandScheduler(aging_interval=10, time_counter=time_counter)
+        scheduler.put_nowait(create_item(1, CommandPriority.LOW, True, enqueued_at=0))
+        time_counter.value = 50
+        scheduler.put_nowait(create_item(2, CommandPriority.NORMAL, True, enqueued_at=50))
+        # За 50 секунд ожидания команда низкого класса обогнала только что поставленную команду обычного класса
+        time_counter.value = 51
+        assert get_user_ids(scheduler, 2) == [1, 2]
+        statistics = scheduler.get_wait_statistics()
+        assert statistics['low']['last_wait_time'] == 51
+        assert statistics['normal']['last_wait_time'] == 1
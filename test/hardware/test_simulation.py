@@ -0,0 +1,52 @@
+import pytest
+from hardware.adapters.exceptions import FiscalDeviceOperationError
+from hardware.adapters.test.simulation import DeviceSimulator, create_latency_model, TraceLatency
+
+
+class Sleep:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, seconds):
+        self.calls.append(seconds)
+
+
+class TestDeviceSimulator:
+    def test_latency_models(self, tmp_path):
+        assert create_latency_model(0.5).get_latency() == 0.5
+        values = [create_latency_model({'type': 'normal', 'mean': 1, 'stddev': 0.1}).get_latency() for i in range(100)]
+        assert 0.5 < sum(values) / len(values) < 1.5
+        values = sorted(create_latency_model({'type': 'lognormal', 'median': 0.2, 'sigma': 0.5}).get_latency()
+                        for i in range(1001))
+        assert 0.1 < values[500] < 0.4 and min(values) > 0
+        trace_path = tmp_path / 'trace.txt'
+        trace_path.write_text('0.1\n0.3\n')
+        trace = TraceLatency(path=str(trace_path))
+        assert [trace.get_latency() for i in range(3)] == [0.1, 0.3, 0.1]
+        with pytest.raises(ValueError):
+            create_latency_model({'type': 'uniform'})
+
+    def test_simulate(self):
+        sleep = Sleep()
+        simulator = DeviceSimulator('{"register_receipt": 0.5}', per_item_cost=0.1, sleep_function=sleep)
+        simulator.simulate('register_receipt', 10)
+        simulator.simulate('get_date_time')
+        simulator.simulate('open_shift')
+        assert sleep.calls == [1.5, 0.1]
+
+    def test_failures_and_hangs(self):
+        sleep = Sleep()
+        simulator = DeviceSimulator(failure_rate=1, hang_rate=1, hang_duration=60, sleep_function=sleep)
+        with pytest.raises(FiscalDeviceOperationError):
+            simulator.simulate('register_receipt')
+        assert sleep.calls == [60]
+        simulator.simulate('get_shift_info')
+
+        simulator = DeviceSimulator(failure_rate=0.3, seed=1, sleep_function=sleep)
+        failures = 0
+        for i in range(1000):
+            try:
+                simulator.simulate('register_receipt')
+            except FiscalDeviceOperationError:
+                failures += 1
+        assert 200 < failures < 400
@@ -0,0 +1,57 @@
+import pytest
+from core.metrics import HistogramSet, render_prometheus
+from hardware.adapters.tracing import TracingDriverProxy
+
+
+class Driver:
+    LIBFPTR_PARAM_SUM = 10
+
+    def __init__(self):
+        self.result = 0
+
+    def openReceipt(self):
+        return self.result
+
+    def registration(self):
+        raise RuntimeError
+
+    def errorCode(self):
+        return 45
+
+
+class TimeCounter:
+    def __init__(self):
+        self.value = 0
+
+    def __call__(self):
+        self.value += 0.02
+        return self.value
+
+
+class TestTracingDriverProxy:
+    def test_call_statistics(self):
+        driver = Driver()
+        proxy = TracingDriverProxy(driver, time_counter=TimeCounter())
+        assert proxy.LIBFPTR_PARAM_SUM == 10
+        assert proxy.openReceipt() == 0
+        driver.result = -1
+        assert proxy.openReceipt() == -1
+        with pytest.raises(RuntimeError):
+            proxy.registration()
+
+        statistics = proxy.call_statistics.as_dict()
+        assert set(statistics.keys()) == {'openReceipt', 'registration'}
+        assert statistics['openReceipt']['count'] == 2
+        assert statistics['openReceipt']['errors'] == {'45': 1}
+        assert statistics['openReceipt']['p50'] == 0.025
+        assert statistics['registration']['errors'] == {'exception': 1}
+
+    def test_prometheus_export(self):
+        histogram_set = HistogramSet()
+        histogram_set.get_histogram('processJson').observe(0.2)
+        histogram_set.get_histogram('processJson').observe(20, 45)
+        text = render_prometheus('driver_call_seconds', 'Driver call latency', [({'device': 1}, histogram_set)])
+        assert 'driver_call_seconds_bucket{device="1",operation="processJson",le="0.25"} 1' in text
+        assert 'driver_call_seconds_bucket{device="1",operation="processJson",le="+Inf"} 2' in text
+        assert 'driver_call_seconds_count{device="1",operation="processJson"} 2' in text
+        assert 'driver_call_seconds_errors_total{device="1",operation="processJson",code="45"} 1' in text
@@ -0,0 +1,77 @@
+import decimal
+import random
+import pytest
+from receipt.domain.money import to_scaled_int, from_scaled_int, multiply_scaled
+from receipt.domain.products import Quantity, Price, Product, CommodityName, CommodityFullPayment
+from receipt.domain.payments import CardPayment
+
+
+def quantize(value, precision):
+    # Прежний способ округления
+    return decimal.Decimal(value).quantize(decimal.Decimal(1).scaleb(-precision), rounding=decimal.ROUND_HALF_UP)
+
+
+def get_values():
+    rnd = random.Random(1)
+    values = [0, 1, -1, 5, 0.005, 0.015, 2.675, -2.675, 1.005, 0.1 + 0.2, '0.005', '-0.005', '2.675', '0.0049999',
+              '1e-30', '1E+3', ' 12.345 ', decimal.Decimal('99.995'), decimal.Decimal('-0.0050'), True,
+              10 ** 25, 1e25, '9' * 26 + '.995']
+    for i in range(500):
+        values.append(round(rnd.uniform(-10000, 10000), rnd.randint(0, 5)))
+        values.append('{:.{}f}'.format(rnd.uniform(0, 1000), rnd.randint(0, 6)))
+    return values
+
+
+class TestScaledInt:
+    @pytest.mark.parametrize('precision', [0, 2, 3])
+    def test_rounding_parity(self, precision):
+        for value in get_values():
+            try:
+                expected = quantize(value, precision)
+            except decimal.InvalidOperation:
+                with pytest.raises(decimal.InvalidOperation):
+                    to_scaled_int(value, precision)
+                continue
+            result = from_scaled_int(to_scaled_int(value, precision), precision)
+            assert result == expected and result.as_tuple().exponent == expected.as_tuple().exponent, value
+
+    def test_invalid_values(self):
+        for value in ('abc', 'NaN', float('inf'), float('nan'), decimal.Decimal('Infinity'), 10 ** 27, '1e40'):
+            with pytest.raises(decimal.InvalidOperation):
+                to_scaled_int(value, 2)
+
+    def test_multiplication_parity(self):
+        rnd = random.Random(2)
+        for i in range(2000):
+            precision = rnd.randint(0, 3)
+            quantity, price = quantize(rnd.uniform(0, 100), precision), quantize(rnd.uniform(-1000, 1000), 2)
+            expected = (quantity * price).quantize(decimal.Decimal('.00'), rounding=decimal.ROUND_HALF_UP)
+            result = multiply_scaled(to_scaled_int(quantity, precision), precision, to_scaled_int(price, 2), 2, 2)
+            assert from_scaled_int(result, 2) == expected
+        # Произведение больше точности контекста Decimal
+        quantity, price = decimal.Decimal('1234567890123.456'), decimal.Decimal('9876543210987.65')
+        expected = (quantity * price).quantize(decimal.Decimal('1.00'), rounding=decimal.ROUND_HALF_UP)
+        assert from_scaled_int(multiply_scaled(to_scaled_int(quantity, 3), 3, to_scaled_int(price, 2), 2, 2), 2) \
+            == expected
+
+
+class TestDomainValues:
+    def test_values(self):
+        quantity, price, payment = Quantity('1.2345', 3, 'кг'), Price(100.345), CardPayment('10.005')
+        assert quantity.get_value() == decimal.Decimal('1.235') and quantity.get_scaled_value() == 1235
+        assert str(quantity) == '1.235 кг' and float(quantity) == 1.235
+        assert price.get_kopecks() == 10034 and float(price) == 100.34
+        assert payment.get_value() == decimal.Decimal('10.01') and payment.get_kopecks() == 1001
+        product = Product(CommodityName('Товар'), quantity, price, CommodityFullPayment())
+        assert product.get_total_cost() == (quantity.get_value() * price.get_value()).quantize(
+            decimal.Decimal('.00'), rounding=decimal.ROUND_HALF_UP)
+
+    def test_invalid_values(self):
+        with pytest.raises(ValueError):
+            Price('abc')
+        with pytest.raises(ValueError):
+            Quantity(float('nan'), 0)
+        with pytest.raises(ValueError):
+            CardPayment('1e40')
+        with pytest.raises(ValueError):
+            Quantity(1, 40)
@@ -67,3 +67,48 @@ class TestProduct:
 
 
 
+
+
+class TestCommodityList:
+    def get_commodities(self):
+        factory = CommodityFactory()
+        return [factory.get_commodity('Чайник', '1.5', 100.35, 1, 4, 1, 'шт'),
+                factory.get_commodity('Доставка', 1, 200, 4, 1, tax_type_int=None),
+                factory.get_commodity('Вода', 2.125, '30', 1, 2, 3, 'л', 7)]
+
+    def test_commodities(self):
+        commodities = self.get_commodities()
+        commodity_list = CommodityList(commodities)
+        assert len(commodity_list) == 3
+        for original, commodity in zip(commodities, commodity_list):
+            assert type(commodity) is type(original)
+            assert commodity.payment_state is original.payment_state and commodity.tax_type is original.tax_type
+            assert commodity.get_total_cost() == original.get_total_cost()
+        assert commodity_list[-1].quantity.get_value() == decimal.Decimal('2.125')
+        assert commodity_list.as_dicts()[0] == commodities[0].as_dict()
+        assert commodity_list.as_dicts()[2] == commodities[2].as_dict()
+        assert commodity_list.as_dicts()[1]['tax_type_int'] is None
+
+    def test_negative_precision(self):
+        # Отрицательная точность считается нулевой, как в Quantity.get_value
+        commodity = CommodityFactory().get_commodity('Чайник', 3, 100, 1, 4, -28, 'шт')
+        commodity_list = CommodityList([commodity])
+        assert commodity_list[0].quantity.get_value() == decimal.Decimal('3')
+        assert commodity_list.as_dicts() == [commodity.as_dict()]
+        assert commodity_list.as_dicts()[0]['quantity'] == decimal.Decimal('3')
+
+    def test_unknown_commodities_are_kept(self):
+        class Gift(Product):
+            pass
+
+        gift = Gift(CommodityName('Подарок'), Quantity(1, 0), Price(0), CommodityFullPayment(), TaxNo())
+        expensive = CommodityFactory().get_commodity('Остров', 1, 10 ** 20, 1, 4)
+        commodity_list = CommodityList(self.get_commodities()[:1] + [gift, expensive])
+        assert commodity_list[1] is gift and commodity_list[2] is expensive
+        assert [item['name'] for item in commodity_list.as_dicts()] == ['Чайник', 'Подарок', 'Остров']
+
+    def test_slots(self):
+        commodity = self.get_commodities()[0]
+        for item in (commodity, commodity.name, commodity.quantity, commodity.price, commodity.payment_state,
+                     commodity.tax_type):
+            assert not hasattr(item, '__dict__')
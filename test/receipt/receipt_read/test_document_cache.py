@@ -0,0 +1,113 @@
+import asyncio
+import json
+import pytest
+from aiohttp.test_utils import make_mocked_request
+from aiohttp.web import Application, HTTPNotModified, HTTPNotFound
+from mock import Mock, AsyncMock
+from receipt.receipt_read import ReceiptDocumentCache, InMemoryReceiptRepository, ReceiptNotExists
+from receipt.receipt_read.event_handlers import ReceiptReceiptRegistationFailedHandler
+from apps.service_group.views import ReceiptReadServiceView
+
+pytestmark = pytest.mark.asyncio
+
+
+class TestReceiptDocumentCache:
+    async def test_document_is_loaded_once(self):
+        cache = ReceiptDocumentCache()
+        load = AsyncMock(return_value={'id': 1, 'state': 'created'})
+        first = await cache.load(1, 10, load)
+        second = await cache.load(1, 10, load)
+        assert first is second
+        assert json.loads(first.body) == {'id': 1, 'state': 'created'}
+        assert first.etag.startswith('"') and first.etag.endswith('"')
+        load.assert_awaited_once()
+
+    async def test_invalidation(self):
+        cache = ReceiptDocumentCache()
+        await cache.load(1, 10, AsyncMock(return_value={'state': 'created'}))
+        cache.invalidate(1)
+        assert cache.get(1, 10) is None
+        document = await cache.load(1, 10, AsyncMock(return_value={'state': 'success'}))
+        assert json.loads(document.body) == {'state': 'success'}
+
+    async def test_document_of_other_service_group_is_not_returned(self):
+        cache = ReceiptDocumentCache()
+        await cache.load(1, 10, AsyncMock(return_value={'state': 'created'}))
+        assert cache.get(1, 11) is None
+        load = AsyncMock(return_value={'state': 'other'})
+        await cache.load(1, 11, load)
+        load.assert_awaited_once()
+        assert json.loads(cache.get(1, 10).body) == {'state': 'created'}
+
+    async def test_invalidation_during_load_is_not_lost(self):
+        cache = ReceiptDocumentCache()
+        loaded = asyncio.Event()
+        release = asyncio.Event()
+
+        async def load_document():
+            loaded.set()
+            await release.wait()
+            return {'state': 'created'}
+
+        task = asyncio.ensure_future(cache.load(1, 10, load_document))
+        await loaded.wait()
+        cache.invalidate(1)
+        release.set()
+        document = await task
+        assert json.loads(document.body) == {'state': 'created'}
+        assert cache.get(1, 10) is None
+
+    async def test_failed_load_is_not_cached(self):
+        cache = ReceiptDocumentCache()
+        with pytest.raises(ReceiptNotExists):
+            await cache.load(1, 10, AsyncMock(side_effect=ReceiptNotExists))
+        assert cache.get(1, 10) is None
+
+    async def test_capacity(self):
+        cache = ReceiptDocumentCache(capacity=2)
+        for receipt_id in range(3):
+            await cache.load(receipt_id, 10, AsyncMock(return_value={'id': receipt_id}))
+        assert cache.get(0, 10) is None
+        assert cache.get(2, 10) is not None
+
+    async def test_registration_failed_handler_invalidates_document(self):
+        cache = ReceiptDocumentCache()
+        repository = InMemoryReceiptRepository()
+        await repository.save({'id': 1, 'service_id': 10, 'state': 'created'})
+        await cache.load(1, 10, lambda: repository.get(1, 10))
+        event = Mock(entity_id=1, data={'state': 'failed'})
+        await ReceiptReceiptRegistationFailedHandler(repository, cache).handle(event)
+        document = await cache.load(1, 10, lambda: repository.get(1, 10))
+        assert json.loads(document.body)['state'] == 'failed'
+
+
+class TestReceiptReadView:
+    def _create_request(self, receipt_id, headers=None):
+        app = Application()
+        service_group = Mock(is_enabled=True)
+        app['fiscal_service_group_facade'] = Mock(get_service_group=AsyncMock(return_value=service_group))
+        app['receipt_read_repository'] = AsyncMock(get=AsyncMock(return_value={'id': 1, 'state': 'created'}))
+        app['receipt_document_cache'] = ReceiptDocumentCache()
+        request = make_mocked_request('GET', '/10/receipts/{}'.format(receipt_id), headers=headers, app=app,
+                                      match_info={'service_group_id': '10', 'receipt_id': str(receipt_id)})
+        return request
+
+    async def test_etag_and_not_modified(self):
+        view = ReceiptReadServiceView()
+        request = self._create_request(1)
+        response = await view.get_receipt(request)
+        assert json.loads(response.text) == {'id': 1, 'state': 'created'}
+        etag = response.headers['ETag']
+        conditional_request = make_mocked_request('GET', '/10/receipts/1', headers={'If-None-Match': etag},
+                                                  app=request.app,
+                                                  match_info={'service_group_id': '10', 'receipt_id': '1'})
+        with pytest.raises(HTTPNotModified) as e:
+            await view.get_receipt(conditional_request)
+        assert e.value.headers['ETag'] == etag
+        request.app['receipt_read_repository'].get.assert_awaited_once()
+
+    async def test_missing_receipt(self):
+        request = self._create_request(2)
+        request.app['receipt_read_repository'].get = AsyncMock(return_value=None)
+        with pytest.raises(HTTPNotFound):
+            await ReceiptReadServiceView().get_receipt(request)
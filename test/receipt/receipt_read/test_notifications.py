@@ -0,0 +1,96 @@
+import asyncio
+import json
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer, TestClient
+from mock import Mock, AsyncMock
+from core.events import EventDispatcher
+from core.events.event_storages import InMemoryEventStorage
+from receipt.events import ReceiptRegistered, ReceiptRegistationFailed
+from receipt.receipt_read import ReceiptNotificationHub
+from receipt.receipt_read.notifications import RESYNC
+from apps.service_group.urls import get_routes
+
+pytestmark = pytest.mark.asyncio
+
+
+def create_receipt(receipt_id, service_id=1):
+    return Mock(id=receipt_id, service_id=service_id, user_id=1, registrator_id=1, fiscal_sign='1',
+                registration_datetime=None, cashier='', shift_num=1, receipt_in_shift_num=1, tax_system=0)
+
+
+async def read_all(subscription):
+    notifications = []
+    while True:
+        notification = await subscription.get()
+        if notification is None:
+            return notifications
+        notifications.append(notification)
+
+
+class TestReceiptNotificationHub:
+    async def test_events_are_published_to_subscribers(self):
+        hub = ReceiptNotificationHub()
+        dispatcher = EventDispatcher(InMemoryEventStorage())
+        hub.subscribe(dispatcher)
+        group_subscription = hub.open_subscription(1)
+        receipt_subscription = hub.open_subscription(1, receipt_id=2)
+        other_group_subscription = hub.open_subscription(2)
+        await dispatcher.handle(ReceiptRegistered(create_receipt(1)))
+        await dispatcher.handle(ReceiptRegistationFailed(create_receipt(2)))
+        hub.close()
+        notifications = await read_all(group_subscription)
+        assert [json.loads(item.body)['receipt_id'] for item in notifications] == [1, 2]
+        assert json.loads(notifications[0].body)['state'] == 'success'
+        assert [item.receipt_id for item in await read_all(receipt_subscription)] == [2]
+        assert await read_all(other_group_subscription) == []
+
+    async def test_resume_from_last_event_id(self):
+        hub = ReceiptNotificationHub()
+        ids = [hub.publish(1, receipt_id, {}).id for receipt_id in range(5)]
+        subscription = hub.open_subscription(1, last_event_id=ids[2])
+        hub.close()
+        assert [item.id for item in await read_all(subscription)] == ids[3:]
+
+    async def test_resync_when_history_is_truncated(self):
+        hub = ReceiptNotificationHub(history_size=2)
+        ids = [hub.publish(1, receipt_id, {}).id for receipt_id in range(4)]
+        assert await read_all(hub.open_subscription(1, last_event_id=ids[0])) == [RESYNC]
+        subscription = hub.open_subscription(1, last_event_id=ids[1])
+        hub.close()
+        assert [item.id for item in await read_all(subscription)] == ids[2:]
+        # The id issued before a restart of the server or by another worker process
+        other_id = ReceiptNotificationHub().publish(1, 0, {}).id
+        assert other_id.endswith('-1') and ids[0].endswith('-1')
+        assert await read_all(hub.open_subscription(1, last_event_id=other_id)) == [RESYNC]
+        assert await read_all(hub.open_subscription(1, last_event_id='unknown')) == [RESYNC]
+
+    async def test_buffer_overflow_closes_subscription(self):
+        hub = ReceiptNotificationHub(buffer_size=2)
+        subscription = hub.open_subscription(1)
+        for receipt_id in range(3):
+            hub.publish(1, receipt_id, {})
+        notifications = await read_all(subscription)
+        assert [item.receipt_id for item in notifications[:2]] == [0, 1]
+        assert notifications[2] is RESYNC
+        hub.publish(1, 4, {})
+        assert subscription.is_closed
+
+
+class TestNotificationStream:
+    async def test_stream(self):
+        app = web.Application()
+        app['fiscal_service_group_facade'] = Mock(get_service_group=AsyncMock(return_value=Mock(is_enabled=True)))
+        app['receipt_notification_hub'] = hub = ReceiptNotificationHub()
+        app['receipt_notification_heartbeat'] = 0.05
+        app.add_routes(get_routes())
+        async with TestClient(TestServer(app)) as client:
+            response = await client.get('/1/receipts/events?receipt_id=7')
+            assert response.headers['Content-Type'] == 'text/event-stream'
+            assert await response.content.readline() == b': heartbeat\n'
+            notification = hub.publish(1, 7, {'state': 'success'})
+            hub.publish(1, 8, {'state': 'failed'})
+            hub.close()
+            body = await asyncio.wait_for(response.text(), 1)
+        assert body.lstrip('\n').replace(': heartbeat\n\n', '') == \
+            'id: {}\nevent: receipt\ndata: {{"state": "success"}}\n\n'.format(notification.id)
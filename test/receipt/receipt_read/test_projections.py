@@ -0,0 +1,132 @@
+import asyncio
+import datetime
+import decimal
+import pytest
+from mock import Mock, AsyncMock
+from core.events import EventDispatcher
+from core.events.event_storages import InMemoryEventStorage, FileEventStorage
+from receipt.domain.factories import get_default_receipt_factory
+from receipt.events import ReceiptCreated, ReceiptsCreated, ReceiptRegistered, ReceiptRegistationFailed
+from receipt.receipt_read import (InMemoryReceiptRepository, ProjectionRebuilder, ProjectionRebuildError,
+                                  ProjectionLagMonitor, InMemoryCheckpointStorage, FileCheckpointStorage)
+from receipt.registrator_info_storages import RegistratorDataNotExists
+from receipt.receipt_read.event_handlers import ReceiptCreatedHandler, ReceiptReceiptRegisteredHandler
+
+pytestmark = pytest.mark.asyncio
+
+
+RECEIPT = {'receiptType': 1, 'tax_system': '2', 'email': 'ivan@mail.ru',
+           'products': [{'name': 'Товар', 'quantity': decimal.Decimal('1'), 'price': decimal.Decimal('10.20'),
+                         'commodity_type_int': 1, 'payment_state_int': 4}],
+           'payments': [{'payment_type_int': 1, 'payment_sum': decimal.Decimal('10.20')}]}
+
+
+def create_receipt(receipt_id, registrator_id=None):
+    receipt = get_default_receipt_factory().create_receipt(1, 2, RECEIPT)
+    receipt.id = receipt_id
+    if registrator_id:
+        receipt.set_fiscal_data(str(receipt_id), datetime.datetime(2020, 1, 1), registrator_id, '1', str(receipt_id),
+                                str(receipt_id))
+    return receipt
+
+
+def create_registrator_data_storage():
+    return Mock(get=AsyncMock(return_value=Mock(as_dict=Mock(return_value={'fn_serial': '123'}))))
+
+
+async def store_events(storage, first_id, count):
+    for receipt_id in range(first_id, first_id + count):
+        await storage.add(ReceiptCreated(create_receipt(receipt_id)))
+    await storage.add(ReceiptsCreated([create_receipt(receipt_id) for receipt_id in range(100 + first_id,
+                                                                                          100 + first_id + 3)]))
+    for receipt_id in range(first_id, first_id + count):
+        if receipt_id % 2:
+            await storage.add(ReceiptRegistationFailed(create_receipt(receipt_id)))
+        else:
+            await storage.add(ReceiptRegistered(create_receipt(receipt_id, registrator_id=1)))
+    await storage.add(ReceiptRegistered(create_receipt(100 + first_id, registrator_id=1)))
+
+
+class TestProjectionRebuilder:
+    async def test_rebuild_and_resume(self):
+        event_storage = InMemoryEventStorage()
+        repository = InMemoryReceiptRepository()
+        checkpoints = InMemoryCheckpointStorage()
+        await store_events(event_storage, 1, 10)
+
+        def create_rebuilder():
+            return ProjectionRebuilder(event_storage, repository, create_registrator_data_storage(), checkpoints,
+                                       asyncio.get_event_loop(), workers=3, batch_size=4)
+
+        progress = Mock()
+        assert await create_rebuilder().rebuild(progress=progress) == 22
+        assert progress.call_count == 6
+        assert await checkpoints.get() == 22
+        for receipt_id in range(1, 11):
+            document = await repository.get(receipt_id, 2)
+            assert document['state'] == ('failed' if receipt_id % 2 else 'success')
+        document = await repository.get(101, 2)
+        assert (document['state'], document['fn_serial'], document['fiscal_sign']) == ('success', '123', '101')
+        assert (await repository.get(102, 2))['state'] == 'created'
+
+        # Only the new events are replayed
+        await store_events(event_storage, 11, 2)
+        assert await create_rebuilder().rebuild() == 6
+        assert (await repository.get(12, 2))['state'] == 'success'
+        assert await create_rebuilder().rebuild() == 0
+        assert await create_rebuilder().rebuild(reset=True) == 28
+
+    async def test_handler_error(self):
+        event_storage = InMemoryEventStorage()
+        repository = InMemoryReceiptRepository()
+        checkpoints = InMemoryCheckpointStorage()
+        await store_events(event_storage, 1, 10)
+        registrator_data_storage = create_registrator_data_storage()
+        registrator_data_storage.get.side_effect = RegistratorDataNotExists()
+        rebuilder = ProjectionRebuilder(event_storage, repository, registrator_data_storage, checkpoints,
+                                        asyncio.get_event_loop(), workers=3, batch_size=14)
+        with pytest.raises(ProjectionRebuildError):
+            await rebuilder.rebuild()
+        # The first batch contains ReceiptRegistered of the receipt 2
+        assert await checkpoints.get() is None
+        assert (await repository.get(2, 2))['state'] == 'created'
+        registrator_data_storage.get.side_effect = None
+        rebuilder = ProjectionRebuilder(event_storage, repository, registrator_data_storage, checkpoints,
+                                        asyncio.get_event_loop(), workers=3, batch_size=14)
+        assert await rebuilder.rebuild() == 22
+        assert (await repository.get(2, 2))['state'] == 'success'
+
+    async def test_rebuild_from_file_event_storage(self, tmpdir):
+        event_storage = FileEventStorage(str(tmpdir.join('events')), asyncio.get_event_loop(), segment_size=2048)
+        await store_events(event_storage, 1, 6)
+        repository = InMemoryReceiptRepository()
+        checkpoints = FileCheckpointStorage(str(tmpdir.join('checkpoint.json')))
+        rebuilder = ProjectionRebuilder(event_storage, repository, create_registrator_data_storage(), checkpoints,
+                                        asyncio.get_event_loop(), workers=2, batch_size=5)
+        assert await rebuilder.rebuild() == 14
+        assert [(await repository.get(receipt_id, 2))['state'] for receipt_id in (1, 2, 101)] == \
+            ['failed', 'success', 'success']
+        position = await FileCheckpointStorage(str(tmpdir.join('checkpoint.json'))).get()
+        assert (await event_storage.read(position))[0] == []
+        await event_storage.close()
+
+
+class TestProjectionLagMonitor:
+    async def test_lag(self):
+        monitor = ProjectionLagMonitor()
+        repository = InMemoryReceiptRepository()
+        dispatcher = EventDispatcher(InMemoryEventStorage())
+        monitor.subscribe(dispatcher)
+        ReceiptCreatedHandler(repository, monitor).subscribe(dispatcher)
+        await dispatcher.handle(ReceiptCreated(create_receipt(1)))
+        assert (monitor.dispatched_count, monitor.applied_count, monitor.lag) == (1, 1, 0.0)
+        assert monitor.statistics.get_histogram('apply').count == 1
+
+        # The registered receipt is not applied while the registrator data is not available
+        registrator_data_storage = Mock(get=AsyncMock(side_effect=KeyError))
+        ReceiptReceiptRegisteredHandler(repository, registrator_data_storage,
+                                        projection_monitor=monitor).subscribe(dispatcher)
+        registered = ReceiptRegistered(create_receipt(1, registrator_id=1))
+        await dispatcher.handle(registered)
+        assert monitor.pending_count == 1
+        assert monitor.lag > 0
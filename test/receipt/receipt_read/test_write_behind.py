@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+from mock import AsyncMock
+from receipt.receipt_read import InMemoryReceiptRepository, WriteBehindReceiptRepository, ReceiptNotExists
+from receipt.receipt_read.repositories import SAVE, UPDATE, merge_operations
+
+pytestmark = pytest.mark.asyncio
+
+
+def create_repository(storage=None, **kwargs):
+    storage = storage or InMemoryReceiptRepository()
+    return WriteBehindReceiptRepository(storage, asyncio.get_event_loop(), **kwargs), storage
+
+
+class TestMergeOperations:
+    def test_merge(self):
+        assert merge_operations((SAVE, {'a': 1, 'b': 1}), (UPDATE, {'b': 2})) == (SAVE, {'a': 1, 'b': 2})
+        assert merge_operations((UPDATE, {'a': 1}), (UPDATE, {'b': 2})) == (UPDATE, {'a': 1, 'b': 2})
+        assert merge_operations((UPDATE, {'a': 1}), (SAVE, {'b': 2})) == (SAVE, {'b': 2})
+
+
+class TestWriteBehindReceiptRepository:
+    async def test_operations_of_receipt_are_merged(self):
+        storage = InMemoryReceiptRepository()
+        storage.write_many = AsyncMock(wraps=storage.write_many)
+        repository, storage = create_repository(storage, flush_interval=0.01)
+        await repository.save({'id': 1, 'service_id': 10, 'state': 'created'})
+        await repository.update({'id': 1, 'state': 'success'})
+        assert repository.buffer_depth == 1
+        # Read-your-writes before the flush
+        assert (await repository.get(1, 10))['state'] == 'success'
+        await asyncio.sleep(0.05)
+        storage.write_many.assert_awaited_once_with([(SAVE, {'id': 1, 'service_id': 10, 'state': 'success'})])
+        assert repository.buffer_depth == 0
+        assert (await storage.get(1, 10))['state'] == 'success'
+        assert repository.statistics.get_histogram('flush').count == 1
+        await repository.close()
+
+    async def test_buffered_update_is_applied_to_stored_document(self):
+        repository, storage = create_repository(flush_interval=10)
+        await storage.save({'id': 1, 'service_id': 10, 'state': 'created', 'email': 'a@b.c'})
+        await repository.update({'id': 1, 'state': 'failed'})
+        assert await repository.get(1, 10) == {'id': 1, 'service_id': 10, 'state': 'failed', 'email': 'a@b.c'}
+        assert (await storage.get(1, 10))['state'] == 'created'
+        await repository.close()
+        assert (await storage.get(1, 10))['state'] == 'failed'
+
+    async def test_flush_on_size(self):
+        repository, storage = create_repository(max_buffer_size=2, flush_interval=10)
+        await repository.save_many([{'id': 1, 'service_id': 10}, {'id': 2, 'service_id': 10}])
+        for i in range(100):
+            if repository.flushed_count:
+                break
+            await asyncio.sleep(0.001)
+        assert await storage.get_last_id() == 2
+        await repository.close()
+
+    async def test_failed_write_is_retried(self):
+        storage = InMemoryReceiptRepository()
+        repository, storage = create_repository(storage, flush_interval=0.01)
+        write_many = storage.write_many
+        storage.write_many = AsyncMock(side_effect=ConnectionError)
+        await repository.save({'id': 1, 'service_id': 10, 'state': 'created'})
+        await asyncio.sleep(0.03)
+        assert storage.write_many.await_count >= 1
+        await repository.update({'id': 1, 'state': 'success'})
+        with pytest.raises(ConnectionError):
+            await repository.flush()
+        assert (await repository.get(1, 10))['state'] == 'success'
+        storage.write_many = write_many
+        await repository.close()
+        assert (await storage.get(1, 10))['state'] == 'success'
+        assert repository.statistics.get_histogram('flush').errors_count >= 1
+
+    async def test_get_of_other_service_group(self):
+        repository, storage = create_repository(flush_interval=10)
+        await repository.save({'id': 1, 'service_id': 10})
+        with pytest.raises(ReceiptNotExists):
+            await repository.get(1, 11)
+        assert await repository.get_last_id() == 1
+        await repository.close()
@@ -1,5 +1,6 @@
+import random
 import pytest
-from receipt.serializers import ReceiptSerializer
+from receipt.serializers import ReceiptSerializer, ProductForm, receipt_validator
 
 
 class TestForms:
@@ -14,3 +15,54 @@ class TestForms:
         form = ReceiptSerializer.from_json(data)
         assert form.validate()
 
+
+
+def validate_with_form(data):
+    form = ReceiptSerializer.from_json(data)
+    form.validate()
+    return form.data, form.errors
+
+
+class TestCompiledFormValidator:
+    values = [None, '', ' ', 0, 1, -3, 2.5, True, False, 'false', 'abc', '12', ' 7 ', '1.5', '2020-01-31',
+              '2020-13-01', 'Товар']
+
+    def _create_item(self, rnd, fields):
+        return {name: rnd.choice(self.values) for name in fields if rnd.random() < 0.6}
+
+    def test_valid_receipt(self):
+        data = {'email': 'dvil@mail.ru', 'tax_system': '2', 'precept': 'false', 'correction_date': '2020-01-31',
+                'products': [{'name': 'Поилка ниппельная', 'payment_state_int': 1, 'price': 100.5,
+                              'commodity_type_int': 1, 'quantity': '1.0', 'quantity_unit': 'шт'}],
+                'receiptType': 1, 'payments': [{'payment_type_int': 1, 'payment_sum': 100.5}]}
+        result = receipt_validator.validate(data)
+        assert result == validate_with_form(data)
+        assert result[1] == {}
+
+    def test_errors(self):
+        data = {'products': [{'name': ' ', 'payment_state_int': 'x', 'price': 'abc', 'quantity': 1}, {'junk': 1},
+                             {'name': 'a', 'quantity': 1, 'price': 1, 'commodity_type_int': 1, 'payment_state_int': 1,
+                              'quantity_prec': '1.5'}],
+                'payments': [], 'receiptType': 0, 'tax_system': 'a', 'correction_date': '2020-13-01'}
+        data_, errors = receipt_validator.validate(data)
+        assert (data_, errors) == validate_with_form(data)
+        assert errors['products'][1] == {'quantity_prec': ['Not a valid integer value']}
+        assert errors['payments'] == ['This field is required.']
+
+    def test_unsupported_data_is_validated_by_form(self):
+        for data in ({}, [], {'products': {'name': 'a'}, 'payments': None}, {'products': [1], 'order_id': [1]}):
+            assert receipt_validator.validate(data) == validate_with_form(data)
+
+    def test_random_data(self):
+        rnd = random.Random(1)
+        product_fields = list(ProductForm()._fields) + ['junk']
+        receipt_fields = [name for name in ReceiptSerializer()._fields if name not in ('products', 'payments')]
+        for i in range(300):
+            data = self._create_item(rnd, receipt_fields)
+            data['products'] = [self._create_item(rnd, product_fields) for j in range(rnd.randint(0, 3))]
+            data['payments'] = [self._create_item(rnd, ['payment_type_int', 'payment_sum'])
+                                for j in range(rnd.randint(0, 2))]
+            if not isinstance(data.get('correction_date', ''), str):
+                # The form itself fails with TypeError on a date which is not a string
+                del data['correction_date']
+            assert receipt_validator.validate(data) == validate_with_form(data)
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from mock import Mock, AsyncMock
+from receipt.events import ReceiptRegistered, ReceiptRegistationFailed
+from receipt.webhooks import WebhookDispatcher, WebhookEndpoint, InMemoryDeadLetterStorage, sign
+from apps.service_group.service_group import ServiceGroup
+from apps.service_group.webhooks import ServiceGroupWebhookEndpointProvider
+
+pytestmark = pytest.mark.asyncio
+
+
+def create_receipt(receipt_id, service_id=1):
+    return Mock(id=receipt_id, service_id=service_id, user_id=1, registrator_id=1, fiscal_sign='1',
+                registration_datetime=None, cashier='', shift_num=1, receipt_in_shift_num=1, tax_system=0)
+
+
+class Receiver:
+    def __init__(self, statuses=()):
+        self.requests = []
+        self._statuses = list(statuses)
+        self.app = web.Application()
+        self.app.router.add_post('/hook', self.handle)
+
+    async def handle(self, request):
+        self.requests.append((dict(request.headers), await request.read()))
+        return web.Response(status=self._statuses.pop(0) if self._statuses else 200)
+
+
+async def wait_for(condition, timeout=2.0):
+    for i in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError('The condition is not met')
+
+
+def create_dispatcher(url, dead_letters=None, **kwargs):
+    provider = Mock(get_endpoint=AsyncMock(return_value=WebhookEndpoint(url, 'secret')))
+    return WebhookDispatcher(provider, dead_letters or InMemoryDeadLetterStorage(), asyncio.get_event_loop(),
+                             batch_window=0.05, backoff=0.01, **kwargs)
+
+
+class TestWebhookDispatcher:
+    async def test_results_are_batched_and_signed(self):
+        receiver = Receiver()
+        async with TestServer(receiver.app) as server:
+            dispatcher = create_dispatcher(str(server.make_url('/hook')))
+            await dispatcher.handle(ReceiptRegistered(create_receipt(1)))
+            await dispatcher.handle(ReceiptRegistationFailed(create_receipt(2)))
+            await wait_for(lambda: dispatcher.delivered_count == 2)
+            await dispatcher.close()
+        assert len(receiver.requests) == 1
+        headers, body = receiver.requests[0]
+        assert headers['X-Webhook-Signature'] == sign('secret', headers['X-Webhook-Timestamp'], body)
+        events = json.loads(body)['events']
+        assert [(item['event'], item['receipt_id']) for item in events] == [('receipt.registered', 1),
+                                                                            ('receipt.failed', 2)]
+        assert dispatcher.statistics.get_histogram('delivery_lag').count == 2
+
+    async def test_large_batch_is_split(self):
+        receiver = Receiver()
+        async with TestServer(receiver.app) as server:
+            dispatcher = create_dispatcher(str(server.make_url('/hook')), max_batch_size=2)
+            for receipt_id in range(5):
+                dispatcher.enqueue(1, {'receipt_id': receipt_id})
+            await wait_for(lambda: dispatcher.delivered_count == 5)
+            await dispatcher.close()
+        assert sorted(len(json.loads(body)['events']) for headers, body in receiver.requests) == [1, 2, 2]
+
+    async def test_retry_and_dead_letter(self):
+        receiver = Receiver(statuses=[503, 200, 400])
+        dead_letters = InMemoryDeadLetterStorage()
+        async with TestServer(receiver.app) as server:
+            dispatcher = create_dispatcher(str(server.make_url('/hook')), dead_letters)
+            dispatcher.enqueue(1, {'receipt_id': 1})
+            await wait_for(lambda: dispatcher.delivered_count == 1)
+            # The client error is not retried
+            dispatcher.enqueue(1, {'receipt_id': 2})
+            await wait_for(lambda: len(dead_letters._dead_letters) == 1)
+            await dispatcher.close()
+        dead_letter, = await dead_letters.get_all()
+        assert dead_letter.payloads == [{'receipt_id': 2}]
+        assert '400' in dead_letter.error
+
+    async def test_attempts_are_limited(self):
+        dead_letters = InMemoryDeadLetterStorage()
+        dispatcher = create_dispatcher('http://127.0.0.1:1/hook', dead_letters, max_attempts=2)
+        dispatcher.enqueue(1, {'receipt_id': 1})
+        await wait_for(lambda: dispatcher.statistics.get_histogram('request').count == 2)
+        await wait_for(lambda: dispatcher._tasks == set())
+        await dispatcher.close()
+        assert len(await dead_letters.get_all()) == 1
+
+    async def test_pending_results_are_saved_on_close(self):
+        dead_letters = InMemoryDeadLetterStorage()
+        dispatcher = create_dispatcher('http://127.0.0.1:1/hook', dead_letters)
+        dispatcher.enqueue(1, {'receipt_id': 1})
+        await dispatcher.close()
+        dead_letter, = await dead_letters.get_all()
+        assert dead_letter.payloads == [{'receipt_id': 1}]
+
+    async def test_pending_results_are_limited(self):
+        dispatcher = create_dispatcher('http://127.0.0.1:1/hook', max_pending=1)
+        dispatcher.enqueue(1, {'receipt_id': 1})
+        dispatcher.enqueue(1, {'receipt_id': 2})
+        assert dispatcher.dropped_count == 1
+        await dispatcher.close()
+
+
+class TestServiceGroupWebhookEndpointProvider:
+    async def test_endpoint(self):
+        settings = {'webhook': {'url': 'http://example.com/hook', 'secret': 'key'}}
+        facade = Mock(get_service_group=AsyncMock(return_value=ServiceGroup(1, 'first', True, settings)))
+        endpoint = await ServiceGroupWebhookEndpointProvider(facade).get_endpoint(1)
+        assert (endpoint.url, endpoint.secret) == ('http://example.com/hook', 'key')
+        facade.get_service_group.return_value = ServiceGroup(1, 'first', True, {'webhook': {'url': ''}})
+        assert await ServiceGroupWebhookEndpointProvider(facade).get_endpoint(1) is None
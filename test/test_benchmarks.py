@@ -0,0 +1,29 @@
+import asyncio
+import pytest
+from benchmarks.harness import BenchmarkCase, BenchmarkRunner, compare_results
+from benchmarks.receipt_path import create_cases
+from benchmarks import receipt_validation
+
+
+class TestBenchmarks:
+    def test_receipt_path_cases(self, event_loop):
+        # Каждый этап пути регистрации чека выполняется без ошибок
+        for case in create_cases('typical', 10):
+            if case.setup:
+                case.setup()
+            result = case.func()
+            if asyncio.iscoroutine(result):
+                event_loop.run_until_complete(result)
+
+    def test_receipt_validation_cases(self):
+        # Оба способа проверки возвращают одинаковый результат
+        form_case, compiled_case = receipt_validation.create_cases('typical', 20)
+        assert form_case.func() == compiled_case.func()
+
+    def test_compare_results(self, event_loop):
+        runner = BenchmarkRunner(repeat=3, min_batch_time=0.001, loop=event_loop)
+        results = runner.run([BenchmarkCase('sum', lambda: sum(range(10)))], verbose=False)
+        assert results['results']['sum']['median'] > 0
+        baseline = {'results': {'sum': dict(results['results']['sum'], median=results['results']['sum']['median'] / 2)}}
+        name, baseline_median, median, change, is_regression = compare_results(results, baseline, 0.1)[0]
+        assert name == 'sum' and is_regression and change == pytest.approx(1)
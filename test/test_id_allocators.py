@@ -0,0 +1,85 @@
+import asyncio
+import multiprocessing
+import pytest
+from mock import AsyncMock
+from core.id_allocators import BlockIdAllocator, InMemoryIdBlockStorage, FileIdBlockStorage
+
+
+pytestmark = pytest.mark.asyncio
+
+
+class Clock:
+    def __init__(self):
+        self.value = 0.0
+
+    def __call__(self):
+        return self.value
+
+
+def reserve_in_process(directory, count, queue):
+    loop = asyncio.new_event_loop()
+    storage = FileIdBlockStorage(directory, loop)
+    queue.put([loop.run_until_complete(storage.reserve('receipt', 10)) for i in range(count)])
+
+
+class TestBlockIdAllocator:
+    async def test_ids_are_unique_and_sequential(self):
+        storage = InMemoryIdBlockStorage()
+        first = BlockIdAllocator(storage, 'receipt', min_block_size=5)
+        second = BlockIdAllocator(storage, 'receipt', min_block_size=5)
+        first.set_minimum(100)
+        ids = []
+        for i in range(20):
+            ids.extend(await first.allocate())
+            ids.extend(await second.allocate(2))
+        assert len(set(ids)) == len(ids) == 60
+        assert min(ids) == 101
+        allocated = await first.allocate(12)
+        assert allocated == sorted(allocated) and len(set(allocated) & set(ids)) == 0
+        await first.close()
+        await second.close()
+
+    async def test_block_size_follows_rate(self):
+        storage = InMemoryIdBlockStorage()
+        storage.reserve = AsyncMock(wraps=storage.reserve)
+        clock = Clock()
+        allocator = BlockIdAllocator(storage, 'receipt', min_block_size=10, max_block_size=1000, block_duration=10,
+                                     time_counter=clock)
+        for i in range(2000):
+            clock.value += 0.01  # 100 ids per second
+            await allocator.allocate()
+            await asyncio.sleep(0)
+        sizes = [call.args[1] for call in storage.reserve.await_args_list]
+        assert sizes[0] == 10 and sizes[-1] == 1000
+        # Most of the allocations don't reserve blocks
+        assert len(sizes) < 15
+        await allocator.close()
+
+    async def test_failed_reservation_is_retried(self):
+        storage = InMemoryIdBlockStorage()
+        reserve = storage.reserve
+        storage.reserve = AsyncMock(side_effect=ConnectionError)
+        allocator = BlockIdAllocator(storage, 'receipt')
+        with pytest.raises(ConnectionError):
+            await allocator.allocate()
+        storage.reserve = reserve
+        assert await allocator.allocate() == [1]
+        await allocator.close()
+
+
+class TestFileIdBlockStorage:
+    async def test_blocks_of_processes_do_not_overlap(self, tmpdir):
+        directory = str(tmpdir)
+        storage = FileIdBlockStorage(directory)
+        assert await storage.reserve('receipt', 10, minimum=5) == 6
+        queue = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=reserve_in_process, args=(directory, 20, queue))
+                     for i in range(3)]
+        for process in processes:
+            process.start()
+        first_ids = [first_id for process in processes for first_id in queue.get(timeout=10)]
+        for process in processes:
+            process.join()
+        assert sorted(first_ids) == list(range(16, 16 + 60 * 10, 10))
+        assert await storage.reserve('receipt', 1) == 616
+        assert await FileIdBlockStorage(directory).reserve('other', 1) == 1
@@ -0,0 +1,119 @@
+import asyncio
+import pytest
+from core.ipc import IpcServer, IpcClient, IpcObjectProxy, RemoteCallError, current_connection
+from hardware import CommandQueueIsFull
+
+pytestmark = pytest.mark.asyncio
+
+
+class UnpicklableError(Exception):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+class Storage:
+    def __init__(self):
+        self.items = {}
+        self.callers = []
+
+    async def add(self, key, value):
+        self.items[key] = value
+        self.callers.append(current_connection.get().id)
+
+    async def get(self, key):
+        return self.items[key]
+
+    async def get_all(self):
+        for key, value in sorted(self.items.items()):
+            yield key, value
+
+    async def fail(self, error_type):
+        if error_type == 'full':
+            raise CommandQueueIsFull('full', 3)
+        raise UnpicklableError('message', 1)
+
+    async def get_lock(self):
+        return asyncio.Lock()
+
+    def to_document(self, key):
+        return {'key': key}
+
+
+@pytest.fixture
+async def server(tmp_path):
+    server = IpcServer(str(tmp_path / 'ipc.sock'), {'storage': Storage()})
+    await server.start()
+    yield server
+    await server.close()
+
+
+@pytest.fixture
+async def client(server):
+    client = IpcClient(server.path)
+    await client.connect()
+    yield client
+    await client.close()
+
+
+class TestIpc:
+    async def test_call(self, server, client):
+        assert await client.call('storage', 'add', 1, value='a') is None
+        assert await client.call('storage', 'get', 1) == 'a'
+        assert await client.call('storage', 'get_all') == [(1, 'a')]
+        with pytest.raises(KeyError):
+            await client.call('storage', 'get', 2)
+        connection, = server.connections
+        assert server._objects['storage'].callers == [connection.id]
+
+    async def test_errors(self, client):
+        with pytest.raises(CommandQueueIsFull) as error_info:
+            await client.call('storage', 'fail', 'full')
+        assert error_info.value.retry_after == 3
+        with pytest.raises(RemoteCallError, match='UnpicklableError'):
+            await client.call('storage', 'fail', 'unpicklable')
+        # The result can not be pickled
+        with pytest.raises(RemoteCallError):
+            await client.call('storage', 'get_lock')
+
+    async def test_concurrent_calls(self, client):
+        await asyncio.gather(*(client.call('storage', 'add', key, key) for key in range(50)))
+        results = await asyncio.gather(*(client.call('storage', 'get', key) for key in range(50)))
+        assert results == list(range(50))
+
+    async def test_push(self, server, client):
+        pushed = []
+        client.on_push = lambda topic, payload: pushed.append((topic, payload))
+        server.broadcast('topic', {'a': 1})
+        await client.call('storage', 'get_all')
+        assert pushed == [('topic', {'a': 1})]
+
+    async def test_disconnect(self, server):
+        disconnected = []
+        client = IpcClient(server.path, on_disconnected=lambda: disconnected.append(True))
+        await client.connect()
+        await client.call('storage', 'get_all')
+        await server.close()
+        with pytest.raises(ConnectionError):
+            for i in range(100):
+                await client.call('storage', 'get_all')
+                await asyncio.sleep(0.01)
+        assert disconnected == [True]
+        assert not client.is_connected
+
+    async def test_connect_timeout(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            await IpcClient(str(tmp_path / 'missing.sock')).connect(timeout=0.05, retry_interval=0.01)
+
+
+class TestIpcObjectProxy:
+    async def test_proxy(self, client):
+        storage = IpcObjectProxy(client, 'storage', Storage)
+        assert isinstance(storage, Storage)
+        await storage.add(1, 'a')
+        await storage.add(2, 'b')
+        assert await storage.get(2) == 'b'
+        assert [item async for item in storage.get_all()] == [(1, 'a'), (2, 'b')]
+        assert storage.to_document(1) == {'key': 1}
+        with pytest.raises(AttributeError):
+            storage.items